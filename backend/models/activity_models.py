@@ -115,4 +115,9 @@ class GPSTrackingLog(BaseModel):
     duration_at_location: Optional[int] = Field(None, description="مدة البقاء بالموقع بالدقائق")
     nearby_clinics: Optional[List[Dict[str, Any]]] = Field(None, description="العيادات القريبة")
     weather_data: Optional[Dict[str, Any]] = Field(None, description="بيانات الطقس")
-    created_at: datetime = Field(default_factory=datetime.utcnow, description="وقت الإنشاء")
\ No newline at end of file
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="وقت الإنشاء")
+
+class GPSPointBatch(BaseModel):
+    """دفعة نقاط GPS من التطبيق (تُخزن على الجهاز وتُرسل معاً)"""
+    points: List[LocationData] = Field(..., min_length=1, max_length=2000, description="النقاط مرتبة أو غير مرتبة زمنياً")
+    activity_id: Optional[str] = Field(None, description="معرف النشاط المرتبط")
@@ -1,6 +1,6 @@
 # CRM System Models - نماذج نظام إدارة العلاقات مع العملاء
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 import uuid
 from enum import Enum
@@ -135,6 +135,13 @@ class ClientProfile(BaseModel):
     average_order_value: float = Field(default=0.0)
     last_order_date: Optional[datetime] = Field(None)
     
+    # Health (batch scoring + analytics) - نقاط الصحة وعلامات المخاطر
+    health_score: Optional[float] = Field(None, ge=0, le=100, description="نقاط صحة العلاقة 0-100")
+    risk_flags: List[str] = Field(default=[], description="علامات المخاطر")
+    recommendations: List[str] = Field(default=[], description="التوصيات")
+    attention_priority: Optional[str] = Field(None, description="أولوية المتابعة حسب الصحة")
+    health_scored_at: Optional[datetime] = Field(None)
+    
     # Satisfaction & Feedback
     satisfaction_score: Optional[float] = Field(None, ge=1, le=5, description="نقاط الرضا 1-5")
     feedback_notes: Optional[str] = Field(None, description="ملاحظات التغذية الراجعة")
@@ -163,6 +170,12 @@ class FollowUpTask(BaseModel):
     due_date: datetime = Field(..., description="تاريخ الاستحقاق")
     reminder_date: Optional[datetime] = Field(None, description="تاريخ التذكير")
     
+    # Reminder Queue - طابور التذكيرات (services/follow_up_scheduler.py)
+    remind_at: Optional[datetime] = Field(None, description="موعد التذكير التالي")
+    reminder_status: Optional[str] = Field(None, description="scheduled, sent, failed, cancelled")
+    reminder_attempts: int = Field(default=0)
+    reminder_sent_at: Optional[datetime] = Field(None)
+    
     status: str = Field(default="pending", description="الحالة")
     completion_notes: Optional[str] = Field(None, description="ملاحظات الإنجاز")
     completed_at: Optional[datetime] = Field(None)
@@ -207,6 +220,7 @@ class ClientAnalytics(BaseModel):
     interactions_this_month: int = 0
     interactions_last_month: int = 0
     interaction_frequency: float = 0.0  # per month
+    interactions_by_month: Dict[str, int] = {}  # "YYYY-MM" → count, last 12 months
     
     # Visit Analytics
     total_visits: int = 0
@@ -221,6 +235,7 @@ class ClientAnalytics(BaseModel):
     average_order_value: float = 0.0
     orders_this_month: int = 0
     order_frequency: float = 0.0  # per month
+    last_order_date: Optional[datetime] = None
     
     # Communication Analytics
     total_communications: int = 0
@@ -277,5 +292,9 @@ class ClientSearchFilter(BaseModel):
     order_value_max: Optional[float] = None
     search_text: Optional[str] = None
     tags: List[str] = []
+    health_score_max: Optional[float] = None
+    risk_flag: Optional[str] = None
+    sort_by: Literal["updated_at", "health_score", "total_order_value", "last_interaction_date"] = "updated_at"
+    sort_order: Literal["asc", "desc"] = "desc"
     limit: int = Field(default=50, le=200)
     offset: int = Field(default=0, ge=0)
\ No newline at end of file
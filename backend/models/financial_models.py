@@ -1,7 +1,8 @@
 # نظام الإدارة الطبية المتكامل - النماذج المالية المتكاملة
 # Medical Management System - Integrated Financial Models
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+from bson.decimal128 import Decimal128
 from typing import List, Dict, Optional, Any, Union, Literal
 from datetime import datetime, date
 from enum import Enum
@@ -116,6 +117,14 @@ class MoneyAmount(BaseModel):
             Decimal: lambda v: float(v)
         }
     
+    @field_validator("amount", mode="before")
+    @classmethod
+    def _decode_decimal128(cls, value: Any) -> Any:
+        """قبول Decimal128 المخزن في MongoDB"""
+        if isinstance(value, Decimal128):
+            return value.to_decimal()
+        return value
+    
     def round(self, precision: int = 2) -> Decimal:
         """تقريب المبلغ"""
         return self.amount.quantize(Decimal(10) ** -precision, rounding=ROUND_HALF_UP)
@@ -587,6 +596,13 @@ class ProcessPaymentRequest(BaseModel):
     reference_number: Optional[str] = None
     notes: Optional[str] = None
 
+class BulkConfirmConvertRequest(BaseModel):
+    """طلب تأكيد وتحويل فواتير جماعي - Bulk confirm & convert request (month-end)"""
+    invoice_ids: Optional[List[str]] = Field(default=None, max_length=5000)
+    issued_before: Optional[date] = None  # بديل عن القائمة: كل الفواتير المؤهلة حتى هذا التاريخ
+    chunk_size: int = Field(default=50, ge=1, le=500)
+    collection_start_date: Optional[date] = None
+
 class FinancialReportRequest(BaseModel):
     """طلب تقرير مالي - Financial Report Request"""
     report_type: Literal["aging", "summary", "transactions", "collection"]
@@ -9,7 +9,7 @@ This module defines the data models for the invoice and debt collection system
 
 from pydantic import BaseModel, Field, validator
 from typing import List, Dict, Optional, Union
-from datetime import datetime
+from datetime import datetime, date
 from enum import Enum
 import uuid
 
@@ -278,6 +278,16 @@ class DebtAssignmentRequest(BaseModel):
     priority: Optional[str] = None
     notes: Optional[str] = None
 
+class StatementBatchRequest(BaseModel):
+    clinic_ids: Optional[List[str]] = Field(default=None, max_length=1000)
+    rep_id: Optional[str] = None  # with route_date: the clinics of the rep's planned route
+    route_date: Optional[date] = None
+    format: str = Field(default="html", pattern="^(html|pdf)$")
+
+class InvoicePrintRequest(BaseModel):
+    invoice_ids: List[str] = Field(min_length=1, max_length=1000)
+    format: str = Field(default="html", pattern="^(html|pdf)$")
+
 # Statistics and Analytics Models
 class InvoiceStatistics(BaseModel):
     total_invoices: int = 0
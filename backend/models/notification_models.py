@@ -18,6 +18,7 @@ class NotificationType(str, Enum):
     APPROVAL_PENDING = "approval_pending" # موافقة معلقة
     TASK_ASSIGNED = "task_assigned"   # مهمة مخصصة
     TASK_COMPLETED = "task_completed" # مهمة مكتملة
+    TASK_DUE = "task_due"             # تذكير مهمة متابعة
     SYSTEM_ALERT = "system_alert"     # تنبيه نظام
     PERFORMANCE_ALERT = "performance_alert" # تنبيه أداء
 
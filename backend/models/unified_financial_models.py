@@ -366,6 +366,27 @@ class VisitCompletionRequest(BaseModel):
     samples_provided: List[Dict[str, Any]] = []
     next_visit_suggestions: Optional[str] = None
     follow_up_required: bool = False
+    gps_latitude: Optional[float] = None
+    gps_longitude: Optional[float] = None
+
+class RoutePlanStop(BaseModel):
+    """عيادة مرشحة لمسار اليوم"""
+    clinic_id: str
+    priority: Literal["high", "normal", "low"] = "normal"
+    service_minutes: int = Field(default=30, ge=5, le=240, description="مدة الزيارة المتوقعة بالدقائق")
+    window_start: Optional[str] = Field(default=None, description="بداية نافذة الزيارة HH:MM")
+    window_end: Optional[str] = Field(default=None, description="نهاية نافذة الزيارة HH:MM")
+
+class RoutePlanRequest(BaseModel):
+    """طلب تخطيط مسار الزيارات اليومي"""
+    date: date
+    stops: Optional[List[RoutePlanStop]] = Field(default=None, description="إن لم تُحدد تُستخدم الزيارات المخططة لليوم")
+    start_latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    start_longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+    day_start: str = "09:00"
+    day_end: str = "18:00"
+    return_to_start: bool = False
+    average_speed_kmh: float = Field(default=30.0, gt=0, le=120)
 
 # ============================================================================
 # FINANCIAL SUMMARY MODELS - نماذج الملخصات المالية
@@ -2,6 +2,13 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.clinic_balance_service import (
+    write_with_clinic_balance, get_clinic_balance, get_clinic_balance_history
+)
+from services.debt_statistics_service import apply_debt_statistics_delta
+from services.crm_service import invalidate_client_analytics
+from services.activity_store import record_activity
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import os
@@ -12,7 +19,7 @@ import jwt
 # إعداد قاعدة البيانات والأمان
 security = HTTPBearer()
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
 # JWT Configuration
@@ -89,37 +96,23 @@ async def get_clinic_overview(clinic_id: str, current_user: dict = Depends(get_c
         })
         
         # إحصائيات الفواتير والمبيعات
-        invoices_cursor = db.invoices.find({"clinic_id": clinic_id})
-        total_invoices = 0
-        total_sales = 0
-        async for invoice in invoices_cursor:
-            total_invoices += 1
-            total_sales += invoice.get("amount", 0)
+        total_invoices = await db.invoices.count_documents({"clinic_id": clinic_id})
         
-        # إحصائيات الديون
-        debts_cursor = db.debts.find({"clinic_id": clinic_id})
-        total_debts = 0
-        pending_debts = 0
-        overdue_debts = 0
-        async for debt in debts_cursor:
-            debt_amount = debt.get("amount", 0)
-            total_debts += debt_amount
-            if debt.get("status") == "pending":
-                pending_debts += debt_amount
-            due_date = debt.get("due_date")
-            if due_date and datetime.fromisoformat(due_date) < datetime.now():
-                overdue_debts += debt_amount
+        # الرصيد الجاري للعيادة: مبيعات، تحصيل، مستحق ومتأخر (مستند واحد)
+        balance = await get_clinic_balance(db, clinic_id)
+        total_sales = float(balance["invoiced"])
+        total_debts = float(balance["outstanding"])
+        overdue_debts = float(balance["overdue"])
+        pending_debts = total_debts - overdue_debts
+        total_collections = float(balance["collected"])
         
-        # إحصائيات التحصيل
-        collections_cursor = db.collections.find({"clinic_id": clinic_id})
-        total_collections = 0
-        collections_this_month = 0
+        # تحصيل الشهر الحالي فقط
         month_start = datetime.now().replace(day=1).isoformat()
-        async for collection in collections_cursor:
-            collection_amount = collection.get("amount", 0)
-            total_collections += collection_amount
-            if collection.get("created_at", "") >= month_start:
-                collections_this_month += collection_amount
+        month_totals = await db.collections.aggregate([
+            {"$match": {"clinic_id": clinic_id, "created_at": {"$gte": month_start}}},
+            {"$group": {"_id": None, "amount": {"$sum": "$amount"}}}
+        ]).to_list(1)
+        collections_this_month = month_totals[0]["amount"] if month_totals else 0
         
         # معلومات المندوب
         rep_info = None
@@ -178,6 +171,7 @@ async def get_clinic_overview(clinic_id: str, current_user: dict = Depends(get_c
                     "overdue_debts": overdue_debts,
                     "total_collections": total_collections,
                     "collections_this_month": collections_this_month,
+                    "last_payment_date": balance["last_payment_date"],
                     "balance": total_sales - total_collections - total_debts
                 }
             }
@@ -241,6 +235,8 @@ async def create_clinic_order(clinic_id: str, order_data: OrderModel, current_us
         if not result.inserted_id:
             raise HTTPException(status_code=500, detail="فشل في حفظ الطلب")
         
+        await invalidate_client_analytics(db, order["clinic_id"])
+        
         # تسجيل النشاط
         activity = {
             "id": str(uuid.uuid4()),
@@ -258,7 +254,7 @@ async def create_clinic_order(clinic_id: str, order_data: OrderModel, current_us
             "timestamp": datetime.utcnow().isoformat(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         # Return clean order data without ObjectId
         clean_order = {
@@ -349,7 +345,17 @@ async def create_clinic_debt(clinic_id: str, debt_data: DebtModel, current_user:
             "created_by": current_user.get("user_id")
         }
         
-        result = await db.debts.insert_one(debt)
+        async def _insert(session):
+            return await db.debts.insert_one(debt, session=session)
+        
+        # حفظ الدين مع تحديث رصيد العيادة الجاري، ثم عدادات الإحصائيات
+        result = await write_with_clinic_balance(
+            db, _insert, clinic_id,
+            outstanding=debt_data.amount,
+            due_date=debt_data.due_date,
+            open_debts=1
+        )
+        await apply_debt_statistics_delta(db, None, debt)
         
         if not result.inserted_id:
             raise HTTPException(status_code=500, detail="فشل في حفظ الدين")
@@ -371,7 +377,7 @@ async def create_clinic_debt(clinic_id: str, debt_data: DebtModel, current_user:
             "timestamp": datetime.utcnow().isoformat(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         # Return clean debt data without ObjectId
         clean_debt = {
@@ -521,7 +527,7 @@ async def create_clinic_collection(clinic_id: str, collection_data: CollectionMo
             "timestamp": datetime.utcnow().isoformat(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         # Return clean collection data without ObjectId
         clean_collection = {
@@ -555,23 +561,38 @@ async def approve_collection(collection_id: str, current_user: dict = Depends(ge
         if user_role not in ["admin", "gm", "manager", "line_manager", "area_manager"]:
             raise HTTPException(status_code=403, detail="غير مسموح - يتطلب صلاحية إدارية")
         
-        # تحديث حالة التحصيل
-        result = await db.collections.update_one(
-            {"id": collection_id},
-            {
-                "$set": {
-                    "status": "approved",
-                    "approved_by": current_user.get("user_id"),
-                    "approved_at": datetime.utcnow().isoformat()
-                }
-            }
-        )
-        
-        if result.matched_count == 0:
+        collection = await db.collections.find_one({"id": collection_id})
+        if not collection:
             raise HTTPException(status_code=404, detail="التحصيل غير موجود")
         
-        # جلب معلومات التحصيل للنشاط
-        collection = await db.collections.find_one({"id": collection_id})
+        approved_at = datetime.utcnow()
+        
+        async def _approve(session):
+            # الموافقة مرة واحدة فقط حتى لا يُحتسب التحصيل مرتين
+            result = await db.collections.update_one(
+                {"id": collection_id, "status": {"$ne": "approved"}},
+                {
+                    "$set": {
+                        "status": "approved",
+                        "approved_by": current_user.get("user_id"),
+                        "approved_at": approved_at.isoformat()
+                    }
+                },
+                session=session
+            )
+            return result if result.modified_count else None
+        
+        # تحديث حالة التحصيل مع رصيد العيادة الجاري
+        approved = await write_with_clinic_balance(
+            db, _approve, collection.get("clinic_id"),
+            collected=collection.get("amount", 0),
+            last_payment_date=approved_at
+        )
+        if approved is None:
+            return {
+                "success": True,
+                "message": "التحصيل معتمد مسبقاً"
+            }
         
         # تسجيل النشاط
         activity = {
@@ -586,7 +607,7 @@ async def approve_collection(collection_id: str, current_user: dict = Depends(ge
             "timestamp": datetime.utcnow().isoformat(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -596,4 +617,33 @@ async def approve_collection(collection_id: str, current_user: dict = Depends(ge
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"خطأ في الموافقة على التحصيل: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"خطأ في الموافقة على التحصيل: {str(e)}")
+
+@router.get("/{clinic_id}/balance")
+async def get_clinic_running_balance(
+    clinic_id: str,
+    history_days: int = 30,
+    current_user: dict = Depends(get_current_user)
+):
+    """الرصيد الجاري للعيادة مع آخر اللقطات اليومية"""
+    try:
+        balance = await get_clinic_balance(db, clinic_id)
+        history = await get_clinic_balance_history(db, clinic_id, limit=max(0, min(history_days, 366)))
+        
+        return {
+            "success": True,
+            "balance": {
+                **balance,
+                **{field: float(balance[field]) for field in ("invoiced", "collected", "outstanding", "overdue")}
+            },
+            "history": [
+                {**snapshot, **{
+                    field: float(snapshot.get(field) or 0)
+                    for field in ("invoiced", "collected", "outstanding", "overdue")
+                }}
+                for snapshot in history
+            ]
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"خطأ في تحميل رصيد العيادة: {str(e)}")
@@ -6,8 +6,11 @@ Comprehensive debt collection system with assignment and tracking
 """
 
 from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi.responses import StreamingResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.activity_store import record_activity
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import uuid
@@ -15,12 +18,25 @@ import jwt
 import os
 from models.financial_system_models import (
     Debt, DebtStatus, PaymentRecord, PaymentMethod,
-    CreateDebtRequest, RecordPaymentRequest, DebtAssignmentRequest, DebtStatistics
+    CreateDebtRequest, RecordPaymentRequest, DebtAssignmentRequest, DebtStatistics,
+    StatementBatchRequest
+)
+from services.payment_ledger_service import (
+    DebtBalanceFields, post_debt_payment, get_debt_payments
+)
+from services.clinic_balance_service import write_with_clinic_balance, payment_balance_hook
+from services.debt_statistics_service import (
+    calculate_aging_category, apply_debt_statistics_delta, payment_statistics_hook,
+    refresh_debt_aging, get_debt_statistics as get_debt_statistics_counters, get_top_collectors
+)
+from services.document_render_service import (
+    PDF_RENDERING_AVAILABLE, MEDIA_TYPES, load_clinic_statements, rep_route_clinic_ids,
+    stream_documents, render_documents
 )
 
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
 # JWT Configuration
@@ -33,6 +49,14 @@ security = HTTPBearer()
 # Create router
 router = APIRouter(prefix="/api", tags=["debts"])
 
+# Balance fields of the flat Debt document used by atomic payment posting
+DEBT_BALANCE_FIELDS = DebtBalanceFields(
+    paid_field="paid_amount",
+    remaining_field="remaining_amount",
+    settled_status=DebtStatus.FULLY_COLLECTED.value,
+    partial_status=DebtStatus.PARTIALLY_COLLECTED.value
+)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current user from JWT token"""
     try:
@@ -50,26 +74,6 @@ def generate_debt_number() -> str:
     random_part = str(uuid.uuid4())[:8].upper()
     return f"DEBT-{timestamp}-{random_part}"
 
-def calculate_aging_category(due_date: datetime) -> tuple[int, str]:
-    """Calculate aging days and category"""
-    if not due_date:
-        return 0, "current"
-    
-    days_overdue = max(0, (datetime.utcnow() - due_date).days)
-    
-    if days_overdue <= 0:
-        category = "current"
-    elif days_overdue <= 30:
-        category = "1-30"
-    elif days_overdue <= 60:
-        category = "31-60"
-    elif days_overdue <= 90:
-        category = "61-90"
-    else:
-        category = "90+"
-    
-    return days_overdue, category
-
 async def create_debt_from_invoice(invoice_id: str, current_user: dict) -> str:
     """Create debt record from approved invoice"""
     try:
@@ -123,11 +127,20 @@ async def create_debt_from_invoice(invoice_id: str, current_user: dict) -> str:
             assigned_at=datetime.utcnow()
         )
         
-        # Save debt to database
-        await db.debts.insert_one(debt.dict())
+        # Save debt to database together with the clinic running balance
+        async def _insert(session):
+            return await db.debts.insert_one(debt.dict(), session=session)
+        
+        await write_with_clinic_balance(
+            db, _insert, debt.clinic_id,
+            outstanding=debt.remaining_amount,
+            due_date=debt.original_due_date,
+            open_debts=1
+        )
+        await apply_debt_statistics_delta(db, None, debt.dict())
         
         # Log activity
-        await db.activities.insert_one({
+        await record_activity(db, {
             "_id": str(uuid.uuid4()),
             "activity_type": "debt_created",
             "description": f"Created debt {debt.debt_number} from invoice {invoice['invoice_number']}",
@@ -327,14 +340,18 @@ async def get_debt(
             days_overdue, aging_category = calculate_aging_category(due_date)
             
             if debt["days_overdue"] != days_overdue or debt["aging_category"] != aging_category:
-                await db.debts.update_one(
-                    {"id": debt_id},
+                result = await db.debts.update_one(
+                    {"id": debt_id, "days_overdue": debt["days_overdue"], "aging_category": debt["aging_category"]},
                     {"$set": {
                         "days_overdue": days_overdue,
                         "aging_category": aging_category,
                         "updated_at": datetime.utcnow()
                     }}
                 )
+                if result.modified_count:
+                    await apply_debt_statistics_delta(
+                        db, debt, {**debt, "days_overdue": days_overdue, "aging_category": aging_category}
+                    )
                 debt["days_overdue"] = days_overdue
                 debt["aging_category"] = aging_category
         
@@ -347,9 +364,13 @@ async def get_debt(
             {"_id": 0}
         ).sort("timestamp", -1).limit(20).to_list(length=20)
         
+        # Payments live in the append-only ledger (legacy ones stay in payment_history)
+        payments = await get_debt_payments(db, debt_id)
+        
         return {
             "success": True,
             "debt": debt,
+            "payments": payments,
             "related_invoice": invoice,
             "recent_activities": activities
         }
@@ -367,22 +388,10 @@ async def record_payment(
 ):
     """Record a payment against a debt"""
     try:
-        # Find debt
-        debt = await db.debts.find_one({"id": debt_id})
-        if not debt:
-            raise HTTPException(status_code=404, detail="Debt not found")
-        
-        # Check permissions
-        if (current_user.get("role") in ["sales_rep", "medical_rep"] and 
-            debt["assigned_to_id"] != current_user.get("user_id")):
-            raise HTTPException(status_code=403, detail="Access denied to record payments")
-        
-        # Validate payment amount
-        if payment_data.amount > debt["remaining_amount"]:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Payment amount ({payment_data.amount}) exceeds remaining balance ({debt['remaining_amount']})"
-            )
+        # Reps may only post against debts assigned to them
+        debt_filter = {"id": debt_id}
+        if current_user.get("role") in ["sales_rep", "medical_rep"]:
+            debt_filter["assigned_to_id"] = current_user.get("user_id")
         
         # Create payment record
         payment = PaymentRecord(
@@ -394,53 +403,61 @@ async def record_payment(
             collected_by=current_user.get("user_id", "unknown")
         )
         
-        # Calculate new amounts
-        new_paid_amount = debt["paid_amount"] + payment_data.amount
-        new_remaining_amount = debt["original_amount"] - new_paid_amount
-        
-        # Determine new status
-        if new_remaining_amount <= 0:
-            new_status = DebtStatus.FULLY_COLLECTED
-        elif new_paid_amount > 0:
-            new_status = DebtStatus.PARTIALLY_COLLECTED
-        else:
-            new_status = debt["status"]
-        
-        # Update debt record
-        update_query = {
-            "$set": {
-                "paid_amount": new_paid_amount,
-                "remaining_amount": max(0, new_remaining_amount),
-                "status": new_status.value,
+        activity_id = str(uuid.uuid4())
+        
+        # Atomic conditional posting: remaining_amount >= amount is checked by the
+        # same write that increments the balances, so concurrent payments never race
+        updated_debt = await post_debt_payment(
+            db,
+            debt_filter,
+            payment_data.amount,
+            DEBT_BALANCE_FIELDS,
+            ledger_entry={
+                **payment.dict(),
+                "source": "debt_management",
+                "recorded_by_role": current_user.get("role")
+            },
+            set_fields={
                 "last_payment_date": payment.payment_date,
                 "updated_at": datetime.utcnow()
             },
-            "$push": {"payment_history": payment.dict()}
-        }
-        
-        await db.debts.update_one({"id": debt_id}, update_query)
-        
-        # Log activity
-        await db.activities.insert_one({
-            "_id": str(uuid.uuid4()),
-            "activity_type": "payment_recorded",
-            "description": f"Payment of {payment_data.amount} recorded for debt {debt['debt_number']}",
-            "user_id": current_user.get("user_id"),
-            "user_name": current_user.get("username"),
-            "user_role": current_user.get("role"),
-            "related_id": debt_id,
-            "details": {
-                "debt_number": debt["debt_number"],
-                "payment_amount": payment_data.amount,
-                "payment_method": payment_data.payment_method.value,
-                "remaining_amount": max(0, new_remaining_amount),
-                "new_status": new_status.value
-            },
-            "timestamp": datetime.utcnow().isoformat()
-        })
+            related_inserts=(
+                ("activities", lambda debt: {
+                    "_id": activity_id,
+                    "activity_type": "payment_recorded",
+                    "description": f"Payment of {payment_data.amount} recorded for debt {debt.get('debt_number') or debt_id}",
+                    "user_id": current_user.get("user_id"),
+                    "user_name": current_user.get("username"),
+                    "user_role": current_user.get("role"),
+                    "related_id": debt_id,
+                    "details": {
+                        "payment_id": payment.id,
+                        "payment_amount": payment_data.amount,
+                        "payment_method": payment_data.payment_method.value
+                    },
+                    "timestamp": datetime.utcnow().isoformat()
+                }),
+            ),
+            on_posted=payment_balance_hook(
+                db, payment_data.amount, DEBT_BALANCE_FIELDS.settled_status, payment.payment_date
+            ),
+            after_commit=payment_statistics_hook(db, payment_data.amount, DEBT_BALANCE_FIELDS)
+        )
         
-        # Get updated debt
-        updated_debt = await db.debts.find_one({"id": debt_id}, {"_id": 0})
+        if updated_debt is None:
+            # Nothing matched: tell apart missing debt, access and balance errors
+            debt = await db.debts.find_one(
+                {"id": debt_id}, {"_id": 0, "assigned_to_id": 1, "remaining_amount": 1}
+            )
+            if not debt:
+                raise HTTPException(status_code=404, detail="Debt not found")
+            if (current_user.get("role") in ["sales_rep", "medical_rep"] and 
+                debt.get("assigned_to_id") != current_user.get("user_id")):
+                raise HTTPException(status_code=403, detail="Access denied to record payments")
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Payment amount ({payment_data.amount}) exceeds remaining balance ({debt.get('remaining_amount')})"
+            )
         
         return {
             "success": True,
@@ -482,10 +499,14 @@ async def assign_debt(debt_id: str, assignment_data: DebtAssignmentRequest, curr
         if assignment_data.notes:
             update_query["collection_notes"] = assignment_data.notes
         
-        await db.debts.update_one({"id": debt_id}, {"$set": update_query})
+        previous = await db.debts.find_one_and_update(
+            {"id": debt_id}, {"$set": update_query}, projection={"_id": 0}
+        )
+        if previous:
+            await apply_debt_statistics_delta(db, previous, {**previous, **update_query})
         
         # Log activity
-        await db.activities.insert_one({
+        await record_activity(db, {
             "_id": str(uuid.uuid4()),
             "activity_type": "debt_assigned",
             "description": f"Debt {debt['debt_number']} assigned to {assignment_data.assigned_to_name}",
@@ -537,39 +558,18 @@ async def assign_debt_endpoint(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error assigning debt: {str(e)}")
 
-async def update_debt_aging():
-    """Update aging information for all debts"""
+# آخر يوم حُدّث فيه التقادم - aging moves with the calendar, so once a day is enough
+_aging_refreshed_on = None
+
+async def update_debt_aging(force: bool = False):
+    """Update aging information for all debts (at most once a day per process)"""
+    global _aging_refreshed_on
+    today = datetime.utcnow().date()
+    if not force and _aging_refreshed_on == today:
+        return
     try:
-        # Get all active debts
-        cursor = db.debts.find({"status": {"$nin": ["fully_collected", "written_off"]}})
-        
-        async for debt in cursor:
-            due_date = debt.get("original_due_date")
-            if due_date:
-                if isinstance(due_date, str):
-                    due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                
-                days_overdue, aging_category = calculate_aging_category(due_date)
-                
-                # Update status if now overdue
-                new_status = debt["status"]
-                if days_overdue > 0 and debt["status"] in ["pending", "assigned"]:
-                    new_status = "overdue"
-                
-                # Update if changed
-                if (debt["days_overdue"] != days_overdue or 
-                    debt["aging_category"] != aging_category or 
-                    debt["status"] != new_status):
-                    
-                    await db.debts.update_one(
-                        {"id": debt["id"]},
-                        {"$set": {
-                            "days_overdue": days_overdue,
-                            "aging_category": aging_category,
-                            "status": new_status,
-                            "updated_at": datetime.utcnow()
-                        }}
-                    )
+        await refresh_debt_aging(db)
+        _aging_refreshed_on = today
         
     except Exception as e:
         print(f"Error updating debt aging: {e}")
@@ -582,10 +582,30 @@ async def get_debt_statistics(
 ):
     """Get comprehensive debt statistics"""
     try:
-        # Update aging before generating statistics
+        # Update aging before generating statistics (once a day)
         await update_debt_aging()
         
-        # Build date filter
+        rep_scope = None
+        if current_user.get("role") in ["sales_rep", "medical_rep"]:
+            rep_scope = current_user.get("user_id")
+        
+        # Without a date range the overview is served from the incremental counters
+        if not start_date and not end_date:
+            statistics = await get_debt_statistics_counters(db, rep_id=rep_scope)
+            statistics.pop("status_amounts", None)
+            statistics["top_collectors"] = (
+                await get_top_collectors(db) if current_user.get("role") in ["admin", "gm"] else []
+            )
+            return {
+                "success": True,
+                "statistics": statistics,
+                "period": {
+                    "start_date": start_date,
+                    "end_date": end_date
+                }
+            }
+        
+        # Date-bounded overview: aggregate the debts created in the range
         date_filter = {}
         if start_date:
             date_filter["$gte"] = datetime.fromisoformat(start_date)
@@ -701,5 +721,89 @@ async def get_debt_statistics(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching debt statistics: {str(e)}")
 
+@router.get("/debts/{debt_id}/print")
+async def print_debt(
+    debt_id: str,
+    format: str = Query("html", pattern="^(html|pdf)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Render one debt as a printable statement page (HTML, or PDF when available)"""
+    try:
+        if format == "pdf" and not PDF_RENDERING_AVAILABLE:
+            raise HTTPException(status_code=501, detail="PDF rendering is not available on this server; use format=html")
+
+        debt = await db.debts.find_one({"id": debt_id}, {"_id": 0, "clinic_id": 1, "assigned_to_id": 1, "debt_number": 1})
+        if not debt:
+            raise HTTPException(status_code=404, detail="Debt not found")
+
+        # Check permissions
+        if (current_user.get("role") in ["sales_rep", "medical_rep"] and
+            debt.get("assigned_to_id") != current_user.get("user_id")):
+            raise HTTPException(status_code=403, detail="Access denied")
+
+        statements = await load_clinic_statements(
+            db, [debt["clinic_id"]], scope={"id": debt_id}, open_only=False,
+            generated_by=current_user.get("username") or current_user.get("user_id")
+        )
+        content = await render_documents("statement", statements, format, title=debt.get("debt_number") or debt_id)
+        return Response(
+            content=content,
+            media_type=MEDIA_TYPES[format],
+            headers={"Content-Disposition": f'inline; filename="debt-{debt.get("debt_number") or debt_id}.{format}"'}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error printing debt: {str(e)}")
+
+@router.post("/debts/statements/print")
+async def print_debt_statements(
+    request: StatementBatchRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Render the debt statements of a clinic list or a rep's route as one merged, streamed file"""
+    try:
+        role = current_user.get("role")
+        user_id = current_user.get("user_id")
+
+        if request.format == "pdf" and not PDF_RENDERING_AVAILABLE:
+            raise HTTPException(status_code=501, detail="PDF rendering is not available on this server; use format=html")
+
+        # Role-based access control (same scope as the debt list)
+        scope = {}
+        if role in ["sales_rep", "medical_rep"]:
+            scope["assigned_to_id"] = user_id
+        elif role == "line_manager":
+            scope["line_id"] = current_user.get("line_id")
+
+        clinic_ids = request.clinic_ids
+        if not clinic_ids:
+            if not request.route_date:
+                raise HTTPException(status_code=400, detail="Provide clinic_ids or a route_date")
+            route_rep = request.rep_id if request.rep_id and role in ["admin", "gm", "line_manager"] else user_id
+            clinic_ids = await rep_route_clinic_ids(db, route_rep, request.route_date)
+
+        statements = await load_clinic_statements(
+            db, clinic_ids, scope=scope, generated_by=current_user.get("username") or user_id
+        )
+        if not statements:
+            raise HTTPException(status_code=404, detail="No statements to print")
+
+        filename = f"statements-{datetime.utcnow():%Y%m%d}.{request.format}"
+        return StreamingResponse(
+            stream_documents("statement", statements, request.format, title="كشوف حساب المديونية"),
+            media_type=MEDIA_TYPES[request.format],
+            headers={
+                "Content-Disposition": f'inline; filename="{filename}"',
+                "X-Document-Count": str(len(statements))
+            }
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error printing statements: {str(e)}")
+
 # Export router
 __all__ = ['router', 'create_debt_from_invoice']
\ No newline at end of file
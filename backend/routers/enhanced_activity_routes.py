@@ -1,20 +1,32 @@
 # Enhanced Activity Tracking Routes - مسارات تتبع الأنشطة المحسنة
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
 from typing import List, Optional
 from datetime import datetime, timedelta
 import uuid
 import json
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import requests
 
+from services.activity_store import (
+    ACTIVITY_HOT_COLLECTION, record_activity as store_activity, get_activity_stats as load_activity_stats,
+    get_hourly_activity, get_recent_activities, get_archived_activities
+)
+
 router = APIRouter(prefix="/api/activities", tags=["Enhanced Activity Tracking"])
 
-# MongoDB connection
-MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-client = MongoClient(MONGO_URL)
-db = client.medical_management
-activities_collection = db.activities
+# MongoDB connection (نفس قاعدة البيانات التي تكتب فيها بقية المسارات أنشطتها)
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME', 'test_database')]
+activities_collection = db[ACTIVITY_HOT_COLLECTION]
+
+def format_timestamps(activity: dict) -> dict:
+    """تحويل التواريخ إلى نص (المسارات القديمة تخزن timestamp كنص بالفعل)"""
+    for field in ("timestamp", "recorded_at"):
+        if isinstance(activity.get(field), datetime):
+            activity[field] = activity[field].isoformat()
+    return activity
 
 def get_client_ip(request: Request) -> str:
     """استخراج IP الحقيقي للمستخدم"""
@@ -146,9 +158,8 @@ async def record_activity(request: Request, activity_data: dict):
             "session_duration": activity_data.get("session_duration")
         }
         
-        # حفظ في قاعدة البيانات
-        result = activities_collection.insert_one(activity_record)
-        activity_record["_id"] = str(result.inserted_id)
+        # حفظ في قاعدة البيانات (المجموعة الحديثة + الأرشيف + عداد الساعة)
+        await store_activity(db, activity_record)
         
         return {
             "success": True,
@@ -169,76 +180,54 @@ async def get_activities(
 ):
     """جلب قائمة الأنشطة مع الفلترة"""
     try:
-        filter_query = {}
-        
-        if user_id:
-            filter_query["user_id"] = user_id
-        if action:
-            filter_query["action"] = action
-            
-        # جلب الأنشطة مع الترتيب حسب التاريخ
-        activities = list(activities_collection.find(
-            filter_query,
-            {"_id": 0}  # استبعاد _id من النتائج
-        ).sort("timestamp", -1).skip(offset).limit(limit))
+        # جلب الأنشطة مع الترتيب حسب التاريخ (فهرس recorded_at)
+        activities = await get_recent_activities(db, user_id=user_id, action=action, limit=limit, offset=offset)
         
         # تحويل التاريخ إلى string للـ JSON
-        for activity in activities:
-            activity["timestamp"] = activity["timestamp"].isoformat()
-            
-        return activities
+        return [format_timestamps(activity) for activity in activities]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في جلب الأنشطة: {str(e)}")
 
 @router.get("/stats", response_model=dict)
-async def get_activity_stats():
-    """إحصائيات الأنشطة"""
+async def get_activity_stats(days: Optional[int] = Query(None, ge=1, le=3650)):
+    """إحصائيات الأنشطة (من العدادات بالساعة، بدون تجميع سجل الأنشطة)"""
     try:
-        # إحصائيات عامة
-        total_activities = activities_collection.count_documents({})
-        
-        # إحصائيات حسب نوع النشاط
-        action_stats = list(activities_collection.aggregate([
-            {"$group": {"_id": "$action", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]))
+        start = datetime.utcnow() - timedelta(days=days) if days else None
+        return await load_activity_stats(db, start=start)
         
-        # إحصائيات حسب المستخدم
-        user_stats = list(activities_collection.aggregate([
-            {"$group": {"_id": "$user_name", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 10}
-        ]))
-        
-        # إحصائيات الأجهزة
-        device_stats = list(activities_collection.aggregate([
-            {"$group": {"_id": "$device_info.device_type", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]))
-        
-        # الأنشطة في آخر 24 ساعة
-        last_24h = datetime.utcnow() - timedelta(hours=24)
-        recent_activities = activities_collection.count_documents({
-            "timestamp": {"$gte": last_24h}
-        })
-        
-        return {
-            "total_activities": total_activities,
-            "recent_activities_24h": recent_activities,
-            "actions": [{"action": item["_id"], "count": item["count"]} for item in action_stats],
-            "users": [{"user": item["_id"], "count": item["count"]} for item in user_stats],
-            "devices": [{"device": item["_id"], "count": item["count"]} for item in device_stats]
-        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@router.get("/stats/hourly", response_model=List[dict])
+async def get_activity_stats_hourly(hours: int = Query(24, ge=1, le=24 * 31)):
+    """عدد الأنشطة لكل ساعة"""
+    try:
+        return await get_hourly_activity(db, hours)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
 
+@router.get("/archive/{user_id}", response_model=List[dict])
+async def get_user_activity_archive(
+    user_id: str,
+    start: datetime,
+    end: Optional[datetime] = None,
+    limit: int = Query(500, le=5000)
+):
+    """سجل أنشطة مستخدم من الأرشيف المضغوط (يشمل ما انتهت صلاحيته من السجل الكامل)"""
+    try:
+        activities = await get_archived_activities(db, user_id, start, end or datetime.utcnow(), limit)
+        return [format_timestamps(activity) for activity in activities]
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الأرشيف: {str(e)}")
+
 @router.delete("/{activity_id}")
 async def delete_activity(activity_id: str):
     """حذف نشاط معين"""
     try:
-        result = activities_collection.delete_one({"id": activity_id})
+        result = await activities_collection.delete_one({"id": activity_id})
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="النشاط غير موجود")
@@ -254,7 +243,7 @@ async def delete_activity(activity_id: str):
 async def bulk_delete_activities(activity_ids: List[str]):
     """حذف عدة أنشطة"""
     try:
-        result = activities_collection.delete_many({"id": {"$in": activity_ids}})
+        result = await activities_collection.delete_many({"id": {"$in": activity_ids}})
         
         return {
             "success": True,
@@ -269,16 +258,10 @@ async def bulk_delete_activities(activity_ids: List[str]):
 async def get_user_activities(user_id: str, limit: int = 20):
     """جلب أنشطة مستخدم معين"""
     try:
-        activities = list(activities_collection.find(
-            {"user_id": user_id},
-            {"_id": 0}
-        ).sort("timestamp", -1).limit(limit))
+        activities = await get_recent_activities(db, user_id=user_id, limit=limit)
         
         # تحويل التاريخ إلى string للـ JSON
-        for activity in activities:
-            activity["timestamp"] = activity["timestamp"].isoformat()
-            
-        return activities
+        return [format_timestamps(activity) for activity in activities]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في جلب أنشطة المستخدم: {str(e)}")
\ No newline at end of file
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.activity_store import record_activity
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import os
@@ -208,7 +209,7 @@ async def create_line(line_data: LineModel, current_user: dict = Depends(get_cur
                 "line_code": line_data.code
             }
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         # Remove MongoDB ObjectId for JSON serialization
         line.pop("_id", None)
@@ -268,7 +269,7 @@ async def create_area(area_data: AreaModel, current_user: dict = Depends(get_cur
                 "line_name": line["name"]
             }
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         # Remove MongoDB ObjectId for JSON serialization
         area.pop("_id", None)
@@ -337,7 +338,7 @@ async def update_line(line_id: str, line_data: LineUpdateModel, current_user: di
                 "changes": update_data
             }
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -415,7 +416,7 @@ async def update_area(area_id: str, area_data: AreaUpdateModel, current_user: di
                 "changes": update_data
             }
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -461,7 +462,7 @@ async def delete_line(line_id: str, current_user: dict = Depends(get_current_use
                 "line_code": line["code"]
             }
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -506,7 +507,7 @@ async def delete_area(area_id: str, current_user: dict = Depends(get_current_use
                 "area_code": area["code"]
             }
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -2,6 +2,10 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.debt_statistics_service import apply_debt_statistics_delta
+from services.clinic_balance_service import write_with_clinic_balance
+from services.activity_store import record_activity
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import os
@@ -13,7 +17,7 @@ from bson import ObjectId
 # إعداد قاعدة البيانات والأمان
 security = HTTPBearer()
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
 # JWT Configuration
@@ -252,7 +256,7 @@ async def create_comprehensive_invoice(invoice_data: InvoiceModel, current_user:
             "timestamp": datetime.utcnow(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -324,7 +328,7 @@ async def delete_invoice(invoice_id: str, current_user: dict = Depends(get_curre
             "timestamp": datetime.utcnow(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -382,8 +386,16 @@ async def create_comprehensive_debt(debt_data: DebtModel, current_user: dict = D
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        # حفظ في قاعدة البيانات
-        result = await db.debts.insert_one(debt)
+        # حفظ في قاعدة البيانات مع رصيد العيادة الجاري
+        result = await write_with_clinic_balance(
+            db,
+            lambda session: db.debts.insert_one(debt, session=session),
+            debt_data.clinic_id,
+            outstanding=debt_data.total_amount,
+            due_date=debt_data.due_date,
+            open_debts=1 if debt_data.total_amount > 0 else 0
+        )
+        await apply_debt_statistics_delta(db, None, debt)
         debt["_id"] = str(result.inserted_id)  # تحويل ObjectId إلى string
         
         # تنظيف البيانات لإرجاعها
@@ -410,7 +422,7 @@ async def create_comprehensive_debt(debt_data: DebtModel, current_user: dict = D
             "timestamp": datetime.utcnow(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -540,7 +552,7 @@ async def create_comprehensive_collection(collection_data: CollectionModel, curr
             "timestamp": datetime.utcnow(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -598,25 +610,33 @@ async def approve_collection(collection_id: str, current_user: dict = Depends(ge
         if user_role not in ["admin", "gm", "manager", "line_manager", "area_manager"]:
             raise HTTPException(status_code=403, detail="غير مسموح - يتطلب صلاحية إدارية")
         
-        # تحديث حالة التحصيل
-        result = await db.collections.update_one(
-            {"id": collection_id},
-            {
-                "$set": {
-                    "status": "approved",
-                    "approved_by": current_user.get("user_id"),
-                    "approved_by_name": current_user.get("full_name", "مستخدم غير معروف"),
-                    "approved_at": datetime.utcnow().isoformat(),
-                    "updated_at": datetime.utcnow().isoformat()
-                }
-            }
-        )
-        
-        if result.matched_count == 0:
+        # جلب معلومات التحصيل (العيادة والمبلغ للرصيد وللنشاط)
+        collection = await db.collections.find_one({"id": collection_id})
+        if not collection:
             raise HTTPException(status_code=404, detail="التحصيل غير موجود")
         
-        # جلب معلومات التحصيل للنشاط
-        collection = await db.collections.find_one({"id": collection_id})
+        # تحديث حالة التحصيل مع رصيد العيادة؛ الموافقة المكررة لا تُحتسب مرتين
+        approved_at = datetime.utcnow()
+        await write_with_clinic_balance(
+            db,
+            lambda session: db.collections.find_one_and_update(
+                {"id": collection_id, "status": {"$ne": "approved"}},
+                {
+                    "$set": {
+                        "status": "approved",
+                        "approved_by": current_user.get("user_id"),
+                        "approved_by_name": current_user.get("full_name", "مستخدم غير معروف"),
+                        "approved_at": approved_at.isoformat(),
+                        "updated_at": approved_at.isoformat()
+                    }
+                },
+                projection={"_id": 1},
+                session=session
+            ),
+            collection.get("clinic_id"),
+            collected=collection.get("amount") or 0,
+            last_payment_date=approved_at
+        )
         
         # تسجيل النشاط
         activity = {
@@ -636,7 +656,7 @@ async def approve_collection(collection_id: str, current_user: dict = Depends(ge
             "timestamp": datetime.utcnow(),
             "success": True
         }
-        await db.activities.insert_one(activity)
+        await record_activity(db, activity)
         
         return {
             "success": True,
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.money_codec import MONEY_TYPE_REGISTRY
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import os
@@ -9,10 +10,12 @@ import uuid
 from pydantic import BaseModel
 import jwt
 
+from services.projection_service import USER_LIST_FIELDS, parse_fields_param, build_projection
+
 # إعداد قاعدة البيانات والأمان
 security = HTTPBearer()
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
 # JWT Configuration
@@ -38,139 +41,137 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     payload = verify_jwt_token(token)
     return payload
 
+# حقول الإحصائيات المحسوبة وكل مجموعة استعلامات تنتجها
+USER_STATISTICS_GROUPS = {
+    "visits": ("visits_count", "visits_this_month"),
+    "clinics": ("clinics_count", "clinics_this_month"),
+    "sales": ("sales_count", "total_sales"),
+    "collections": ("collections_count", "total_collections"),
+    "debts": ("debts_count", "total_debts"),
+    "activities": ("activities_count", "activities_today", "last_activity"),
+    "line": ("line_name",),
+    "area": ("area_name",),
+    "manager": ("manager_name",),
+}
+
+USER_STATISTICS_FIELDS = [name for group in USER_STATISTICS_GROUPS.values() for name in group] + ["status"]
+
 @router.get("/with-statistics")
-async def get_users_with_statistics(current_user: dict = Depends(get_current_user)):
-    """الحصول على جميع المستخدمين مع إحصائياتهم الحقيقية"""
+async def get_users_with_statistics(fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """الحصول على جميع المستخدمين مع إحصائياتهم الحقيقية
+
+    ``fields=`` يحدد الحقول المطلوبة، ولا تُنفذ استعلامات الإحصائيات إلا للحقول المطلوبة.
+    """
     try:
+        try:
+            requested = parse_fields_param(fields, list(USER_LIST_FIELDS) + USER_STATISTICS_FIELDS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        def wants(group: str) -> bool:
+            return requested is None or any(name in requested for name in USER_STATISTICS_GROUPS[group])
+        
+        # الحقول الأساسية المطلوبة من قاعدة البيانات فقط (مع الحقول اللازمة للإحصائيات)
+        required = ["id", "is_active"]
+        if wants("line"):
+            required.append("line_id")
+        if wants("area"):
+            required.append("area_id")
+        if wants("manager"):
+            required.append("manager_id")
+        projection = build_projection(
+            USER_LIST_FIELDS,
+            requested & set(USER_LIST_FIELDS) if requested is not None else None,
+            required=required
+        )
+        
+        month_start = datetime.now().replace(day=1).isoformat()
+        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+        
         users = []
-        cursor = db.users.find({}, {"password": 0, "_id": 0}).sort("full_name", 1)
+        cursor = db.users.find({"id": {"$nin": [None, ""]}}, projection).sort("full_name", 1)
         
         async for user in cursor:
-            user_id = user.get("id")
-            if not user_id:
-                continue
+            user_id = user["id"]
+            user_stats = {name: user.get(name) for name in USER_LIST_FIELDS if name in user}
             
             # إحصائيات الزيارات
-            visits_count = await db.visits.count_documents({"rep_id": user_id})
-            month_start = datetime.now().replace(day=1).isoformat()
-            visits_this_month = await db.visits.count_documents({
-                "rep_id": user_id,
-                "visit_date": {"$gte": month_start}
-            })
+            if wants("visits"):
+                user_stats["visits_count"] = await db.visits.count_documents({"rep_id": user_id})
+                user_stats["visits_this_month"] = await db.visits.count_documents({
+                    "rep_id": user_id,
+                    "visit_date": {"$gte": month_start}
+                })
             
             # إحصائيات العيادات المضافة
-            clinics_count = await db.clinics.count_documents({"rep_id": user_id})
-            clinics_this_month = await db.clinics.count_documents({
-                "rep_id": user_id,
-                "created_at": {"$gte": month_start}
-            })
-            
-            # إحصائيات الفواتير والمبيعات
-            invoices_cursor = db.invoices.find({"rep_id": user_id})
-            total_sales = 0
-            invoices_count = 0
-            async for invoice in invoices_cursor:
-                invoices_count += 1
-                total_sales += invoice.get("amount", 0)
+            if wants("clinics"):
+                user_stats["clinics_count"] = await db.clinics.count_documents({"rep_id": user_id})
+                user_stats["clinics_this_month"] = await db.clinics.count_documents({
+                    "rep_id": user_id,
+                    "created_at": {"$gte": month_start}
+                })
             
-            # إحصائيات التحصيل
-            collections_cursor = db.collections.find({"rep_id": user_id})
-            total_collections = 0
-            collections_count = 0
-            async for collection in collections_cursor:
-                collections_count += 1
-                total_collections += collection.get("amount", 0)
+            # إحصائيات الفواتير والمبيعات والتحصيل والديون
+            for group, collection, count_field, total_field in (
+                ("sales", db.invoices, "sales_count", "total_sales"),
+                ("collections", db.collections, "collections_count", "total_collections"),
+                ("debts", db.debts, "debts_count", "total_debts"),
+            ):
+                if not wants(group):
+                    continue
+                totals = await collection.aggregate([
+                    {"$match": {"rep_id": user_id}},
+                    {"$group": {"_id": None, "count": {"$sum": 1}, "total": {"$sum": "$amount"}}}
+                ]).to_list(1)
+                user_stats[count_field] = totals[0]["count"] if totals else 0
+                user_stats[total_field] = totals[0]["total"] if totals else 0
             
-            # إحصائيات الديون
-            debts_cursor = db.debts.find({"rep_id": user_id})
-            total_debts = 0
-            debts_count = 0
-            async for debt in debts_cursor:
-                debts_count += 1
-                total_debts += debt.get("amount", 0)
+            # إحصائيات الأنشطة وآخر نشاط
+            if wants("activities"):
+                last_activity = await db.activities.find_one(
+                    {"user_id": user_id},
+                    {"_id": 0, "timestamp": 1},
+                    sort=[("timestamp", -1)]
+                )
+                user_stats["activities_count"] = await db.activities.count_documents({"user_id": user_id})
+                user_stats["activities_today"] = await db.activities.count_documents({
+                    "user_id": user_id,
+                    "timestamp": {"$gte": today_start}
+                })
+                user_stats["last_activity"] = last_activity.get("timestamp") if last_activity else None
             
-            # آخر نشاط من سجل الأنشطة
-            last_activity = await db.activities.find_one(
-                {"user_id": user_id},
-                sort=[("timestamp", -1)]
-            )
+            # معلومات الخط والمنطقة والمدير
+            for group, collection, key, source_field in (
+                ("line", db.lines, "line_id", "name"),
+                ("area", db.areas, "area_id", "name"),
+                ("manager", db.users, "manager_id", "full_name"),
+            ):
+                if not wants(group):
+                    continue
+                info = None
+                if user.get(key):
+                    info = await collection.find_one({"id": user[key]}, {"_id": 0, source_field: 1})
+                user_stats[f"{group}_name"] = info.get(source_field) if info else None
             
-            # إحصائيات الأنشطة
-            activities_count = await db.activities.count_documents({"user_id": user_id})
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-            activities_today = await db.activities.count_documents({
-                "user_id": user_id,
-                "timestamp": {"$gte": today_start}
-            })
+            # حالة النشاط
+            user_stats["status"] = "active" if user.get("is_active", True) else "inactive"
             
-            # معلومات الخط والمنطقة
-            line_info = None
-            area_info = None
-            if user.get("line_id"):
-                line_info = await db.lines.find_one({"id": user["line_id"]}, {"_id": 0})
-            if user.get("area_id"):
-                area_info = await db.areas.find_one({"id": user["area_id"]}, {"_id": 0})
+            if requested is not None:
+                user_stats = {name: value for name, value in user_stats.items() if name in requested}
             
-            # معلومات المدير
-            manager_info = None
-            if user.get("manager_id"):
-                manager_info = await db.users.find_one({"id": user["manager_id"]}, {"_id": 0})
-            
-            # إضافة الإحصائيات للمستخدم
-            user_stats = {
-                # Basic user info
-                "id": user.get("id"),
-                "username": user.get("username"),
-                "full_name": user.get("full_name"),
-                "role": user.get("role"),
-                "email": user.get("email"),
-                "phone": user.get("phone"),
-                "is_active": user.get("is_active", True),
-                
-                # إحصائيات الزيارات
-                "visits_count": visits_count,
-                "visits_this_month": visits_this_month,
-                
-                # إحصائيات العيادات
-                "clinics_count": clinics_count,
-                "clinics_this_month": clinics_this_month,
-                
-                # إحصائيات المالية
-                "sales_count": invoices_count,
-                "total_sales": total_sales,
-                "collections_count": collections_count,
-                "total_collections": total_collections,
-                "debts_count": debts_count,
-                "total_debts": total_debts,
-                
-                # إحصائيات النشاط
-                "activities_count": activities_count,
-                "activities_today": activities_today,
-                "last_activity": last_activity.get("timestamp") if last_activity else None,
-                
-                # معلومات إضافية
-                "line_name": line_info.get("name") if line_info else None,
-                "area_name": area_info.get("name") if area_info else None,
-                "manager_name": manager_info.get("full_name") if manager_info else None,
-                
-                # تنسيق التواريخ
-                "created_at": user.get("created_at"),
-                "last_login": user.get("last_login"),
-                
-                # حالة النشاط
-                "status": "active" if user.get("is_active", True) else "inactive"
-            }
-            
-            users.append(user_stats)
+            users.append((user_stats, user.get("is_active", True)))
         
+        active_count = len([1 for _, active in users if active])
         return {
             "success": True,
-            "users": users,
+            "users": [stats for stats, _ in users],
             "total_count": len(users),
-            "active_count": len([u for u in users if u.get("is_active", True)]),
-            "inactive_count": len([u for u in users if not u.get("is_active", True)])
+            "active_count": active_count,
+            "inactive_count": len(users) - active_count
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ خطأ في تحميل المستخدمين مع الإحصائيات: {str(e)}")
         raise HTTPException(status_code=500, detail=f"خطأ في تحميل المستخدمين: {str(e)}")
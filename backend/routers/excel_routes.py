@@ -8,6 +8,8 @@ from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.geofence_service import clinic_geo_index
 import os
 import jwt
 from datetime import datetime, timedelta
@@ -25,7 +27,7 @@ load_dotenv()
 
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
 # JWT Configuration  
@@ -406,8 +408,11 @@ async def import_data(
         collection = collections[data_type]
         
         if import_mode == "overwrite":
-            # Clear existing data first
+            # Clear existing data first (deleted clinics also leave the geofence index)
+            removed_clinic_ids = await collection.distinct("id") if data_type == "clinics" else []
             await collection.delete_many({})
+            for clinic_id in removed_clinic_ids:
+                clinic_geo_index.remove(clinic_id)
             result = await collection.insert_many(imported_data)
             message = f"Overwritten {len(result.inserted_ids)} {data_type} records"
         else:  # append mode
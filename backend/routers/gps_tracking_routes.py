@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+GPS Tracking Routes - مسارات تتبع GPS
+Batched point ingestion from the mobile app and downsampled track queries
+إدخال نقاط الموقع على دفعات من التطبيق واستعلام المسارات المبسطة
+"""
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from motor.motor_asyncio import AsyncIOMotorClient
+from typing import Dict, Any, Optional
+from datetime import datetime, date, timedelta
+import jwt
+import os
+from models.activity_models import GPSPointBatch
+from services.gps_track_service import ingest_points, get_tracks, default_bucket_seconds, DEFAULT_TOLERANCE_M
+from services.gps_analytics_service import get_rep_day_analytics, verify_rep_visits
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ.get('DB_NAME', 'test_database')]
+
+# JWT Configuration
+JWT_SECRET_KEY = "your-secret-key-change-in-production"
+JWT_ALGORITHM = "HS256"
+
+# Security
+security = HTTPBearer()
+
+# Create router
+router = APIRouter(prefix="/api/gps", tags=["gps"])
+
+# Roles that may view other users' tracks
+TRACK_VIEWER_ROLES = ["admin", "gm", "manager", "line_manager", "area_manager"]
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Get current user from JWT token"""
+    try:
+        token = credentials.credentials
+        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        return payload
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+@router.post("/points", response_model=Dict[str, Any])
+async def ingest_gps_points(
+    batch: GPSPointBatch,
+    current_user: dict = Depends(get_current_user)
+):
+    """Store a batch of GPS points for the current user (one write per batch)"""
+    try:
+        result = await ingest_points(
+            db, current_user.get("user_id"),
+            [point.dict() for point in batch.points],
+            activity_id=batch.activity_id
+        )
+        return {"success": True, **result}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error storing GPS points: {str(e)}")
+
+@router.get("/tracks", response_model=Dict[str, Any])
+async def get_gps_tracks(
+    user_ids: Optional[str] = Query(None, description="Comma-separated user ids (all users when omitted)"),
+    day: Optional[date] = Query(None, description="Track day (UTC); default today"),
+    start: Optional[datetime] = Query(None, description="Range start, instead of day"),
+    end: Optional[datetime] = Query(None, description="Range end, instead of day"),
+    tolerance_m: float = Query(DEFAULT_TOLERANCE_M, ge=0, le=1000, description="Douglas-Peucker tolerance in meters"),
+    bucket_seconds: Optional[int] = Query(
+        None, ge=0, le=3600,
+        description="Keep one point per bucket before simplifying (0 = every point; default sized to the request)"
+    ),
+    current_user: dict = Depends(get_current_user)
+):
+    """Downsampled GPS tracks for map display"""
+    try:
+        # Role-based access control: reps see only their own track
+        requested = [user_id for user_id in (user_ids or "").split(",") if user_id]
+        if current_user.get("role") not in TRACK_VIEWER_ROLES:
+            requested = [current_user.get("user_id")]
+
+        if start is None or end is None:
+            start = datetime.combine(day or datetime.utcnow().date(), datetime.min.time())
+            end = start + timedelta(days=1)
+
+        if bucket_seconds is None:
+            bucket_seconds = await default_bucket_seconds(db, requested or None, start, end)
+        tracks = await get_tracks(db, requested or None, start, end, tolerance_m, bucket_seconds)
+        return {
+            "success": True,
+            "start": start,
+            "end": end,
+            "tolerance_m": tolerance_m,
+            "bucket_seconds": bucket_seconds,
+            "raw_points": sum(track["raw_points"] for track in tracks),
+            "points_count": sum(track["points_count"] for track in tracks),
+            "tracks": tracks
+        }
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching GPS tracks: {str(e)}")
+
+def resolve_track_user(current_user: dict, user_id: Optional[str]) -> str:
+    """Reps may only read their own movement data"""
+    if current_user.get("role") not in TRACK_VIEWER_ROLES or not user_id:
+        return current_user.get("user_id")
+    return user_id
+
+@router.get("/analytics", response_model=Dict[str, Any])
+async def get_movement_analytics(
+    user_id: Optional[str] = Query(None, description="Rep id (default: current user)"),
+    day: Optional[date] = Query(None, description="Day (UTC); default today"),
+    include_segments: bool = Query(False, description="Include the movement-type timeline"),
+    refresh: bool = Query(False, description="Recompute instead of using the cached result"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Distance travelled, time per movement type and stops with dwell time for a rep-day"""
+    try:
+        analytics = await get_rep_day_analytics(
+            db, resolve_track_user(current_user, user_id), day or datetime.utcnow().date(), refresh=refresh
+        )
+        if not include_segments:
+            analytics.pop("segments", None)
+        return {"success": True, **analytics}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error computing movement analytics: {str(e)}")
+
+@router.get("/analytics/visits", response_model=Dict[str, Any])
+async def verify_visits_dwell(
+    user_id: Optional[str] = Query(None, description="Rep id (default: current user)"),
+    day: Optional[date] = Query(None, description="Day (UTC); default today"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Recorded visits of a rep-day compared with the actual dwell time at each clinic"""
+    try:
+        result = await verify_rep_visits(db, resolve_track_user(current_user, user_id), day or datetime.utcnow().date())
+        return {"success": True, **result}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error verifying visits: {str(e)}")
+
+# Export router
+__all__ = ['router']
@@ -9,11 +9,12 @@ import traceback
 
 from models.financial_models import (
     IntegratedInvoice, IntegratedDebtRecord, DebtPaymentRecord,
-    CreateInvoiceRequest, ProcessPaymentRequest, FinancialReportRequest,
+    CreateInvoiceRequest, ProcessPaymentRequest, FinancialReportRequest, BulkConfirmConvertRequest,
     InvoiceStatus, DebtStatus, PaymentStatus,
     FinancialSummary, AgingAnalysis
 )
-from services.financial_service import IntegratedFinancialService
+from services.financial_service import IntegratedFinancialService, BULK_CONVERTIBLE_INVOICE_STATUSES
+from services.payment_ledger_service import count_debt_payments
 from models.all_models import User, UserRole
 from routes.auth_routes import get_current_user
 
@@ -220,6 +221,47 @@ async def convert_invoice_to_debt(
         print(f"Error converting invoice to debt: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في تحويل الفاتورة إلى دين")
 
+@router.post("/invoices/bulk-confirm-convert")
+async def bulk_confirm_and_convert_invoices(
+    request: BulkConfirmConvertRequest,
+    current_user: User = Depends(check_financial_permissions(["admin", "accounting", "gm"])),
+    financial_service: IntegratedFinancialService = Depends(get_financial_service)
+):
+    """تأكيد وتحويل فواتير إلى ديون جماعياً (إقفال نهاية الشهر) - committed in chunks"""
+    try:
+        invoice_ids = request.invoice_ids
+        if not invoice_ids:
+            if not request.issued_before:
+                raise ValueError("يجب تحديد قائمة الفواتير أو تاريخ issued_before")
+            invoice_ids = [
+                invoice["id"] async for invoice in financial_service.db.invoices.find(
+                    {
+                        "status": {"$in": BULK_CONVERTIBLE_INVOICE_STATUSES},
+                        "issue_date": {"$lte": datetime.combine(request.issued_before, datetime.max.time())}
+                    },
+                    {"_id": 0, "id": 1}
+                ).sort("issue_date", 1).limit(5000)
+            ]
+        
+        result = await financial_service.bulk_confirm_and_convert(
+            invoice_ids,
+            current_user.id,
+            chunk_size=request.chunk_size,
+            collection_start_date=request.collection_start_date
+        )
+        
+        return {
+            "success": result["failed"] == 0,
+            "message": f"تم تحويل {result['converted']} من {result['requested']} فاتورة إلى ديون",
+            **result
+        }
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error in bulk confirm and convert: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="خطأ في التحويل الجماعي للفواتير")
+
 # ============================================================================
 # DEBT MANAGEMENT APIs - واجهات إدارة الديون
 # ============================================================================
@@ -291,10 +333,11 @@ async def get_debts(
             query_filter["due_date"] = {"$lt": datetime.utcnow()}
         
         # جلب الديون
-        debts_cursor = financial_service.db.debts.find(query_filter).skip(skip).limit(limit)
+        debts_data = await financial_service.db.debts.find(query_filter).skip(skip).limit(limit).to_list(length=limit)
+        ledger_counts = await count_debt_payments(financial_service.db, [debt_data.get("id") for debt_data in debts_data])
         debts = []
         
-        async for debt_data in debts_cursor:
+        for debt_data in debts_data:
             debt = IntegratedDebtRecord(**debt_data)
             aging = debt.calculate_aging()
             
@@ -312,7 +355,7 @@ async def get_debts(
                 "priority": debt.priority,
                 "days_overdue": aging["days_overdue"],
                 "risk_level": aging["risk_level"],
-                "payments_count": len(debt.payments)
+                "payments_count": len(debt.payments) + ledger_counts.get(debt.id, 0)
             })
         
         return debts
@@ -387,7 +430,8 @@ async def process_debt_payment(
 @router.get("/reports/aging-analysis", response_model=List[Dict[str, Any]])
 async def get_aging_analysis(
     clinic_ids: Optional[str] = Query(None, description="معرفات العيادات مفصولة بفاصلة"),
-    as_of_date: Optional[date] = None,
+    as_of_date: Optional[date] = Query(None, description="تاريخ اللقطة (يُحسب مرة ويُعاد استخدامه)"),
+    refresh_snapshot: bool = Query(False, description="إعادة حساب لقطة as_of_date"),
     current_user: User = Depends(check_financial_permissions(["admin", "accounting", "gm"])),
     financial_service: IntegratedFinancialService = Depends(get_financial_service)
 ):
@@ -400,7 +444,8 @@ async def get_aging_analysis(
         
         aging_analysis = await financial_service.generate_aging_analysis(
             clinic_ids=clinic_ids_list,
-            as_of_date=as_of_date
+            as_of_date=as_of_date,
+            refresh_snapshot=refresh_snapshot
         )
         
         return [analysis.dict() for analysis in aging_analysis]
@@ -436,6 +481,29 @@ async def get_financial_summary(
         print(f"Error generating financial summary: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في إنشاء الملخص المالي")
 
+@router.get("/reports/collection-trends")
+async def get_collection_trends(
+    dimension: str = Query("all", description="البعد: all / clinic / rep / area"),
+    key: Optional[str] = Query(None, description="معرف العيادة أو المندوب أو المنطقة"),
+    days: int = Query(90, ge=7, le=730, description="عدد الأيام المعروضة"),
+    window: int = Query(30, ge=7, le=180, description="نافذة DSO ومعدل التحصيل المتحرك"),
+    alpha: float = Query(0.3, gt=0, le=1, description="معامل التنعيم الأسي"),
+    horizon: int = Query(30, ge=1, le=180, description="أيام التوقع"),
+    current_user: User = Depends(check_financial_permissions(["admin", "accounting", "gm"])),
+    financial_service: IntegratedFinancialService = Depends(get_financial_service)
+):
+    """اتجاهات التحصيل: DSO ومعدل التحصيل المتحرك وتوقع التدفق النقدي - Collection trends & forecast"""
+    try:
+        return await financial_service.get_collection_trends(
+            dimension=dimension, key=key, days=days, window=window, alpha=alpha, horizon=horizon
+        )
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error fetching collection trends: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="خطأ في جلب اتجاهات التحصيل")
+
 @router.get("/clinic/{clinic_id}/financial-status")
 async def get_clinic_financial_status(
     clinic_id: str,
@@ -6,8 +6,11 @@ Comprehensive invoice system with full workflow support
 """
 
 from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi.responses import StreamingResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.activity_store import record_activity
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import uuid
@@ -15,12 +18,16 @@ import jwt
 import os
 from models.financial_system_models import (
     Invoice, InvoiceStatus, CreateInvoiceRequest, UpdateInvoiceRequest, 
-    ApproveInvoiceRequest, InvoiceItem, InvoiceStatistics
+    ApproveInvoiceRequest, InvoiceItem, InvoiceStatistics, InvoicePrintRequest
+)
+from services.clinic_balance_service import write_with_clinic_balance
+from services.document_render_service import (
+    PDF_RENDERING_AVAILABLE, MEDIA_TYPES, load_invoice_documents, stream_documents, render_documents
 )
 
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
 # JWT Configuration
@@ -154,7 +161,7 @@ async def create_invoice(
         await db.invoices.insert_one(invoice.dict())
         
         # Log activity
-        await db.activities.insert_one({
+        await record_activity(db, {
             "_id": str(uuid.uuid4()),
             "activity_type": "invoice_created",
             "description": f"Created invoice {invoice.invoice_number} for {invoice.clinic_name}",
@@ -321,7 +328,7 @@ async def update_invoice(
         )
         
         # Log activity
-        await db.activities.insert_one({
+        await record_activity(db, {
             "_id": str(uuid.uuid4()),
             "activity_type": "invoice_updated",
             "description": f"Updated invoice {invoice['invoice_number']}",
@@ -384,10 +391,23 @@ async def approve_invoice(
         if approval_data.approval_notes:
             update_query["internal_notes"] = approval_data.approval_notes
         
-        await db.invoices.update_one(
-            {"id": invoice_id},
-            {"$set": update_query}
+        # Status-guarded update plus the clinic running balance, in one unit
+        async def _approve(session):
+            result = await db.invoices.update_one(
+                {"id": invoice_id, "status": {"$in": ["draft", "pending"]}},
+                {"$set": update_query},
+                session=session
+            )
+            return result if result.modified_count else None
+        
+        approved = await write_with_clinic_balance(
+            db, _approve, invoice.get("clinic_id"), invoiced=invoice.get("total_amount", 0)
         )
+        if approved is None:
+            raise HTTPException(
+                status_code=400, 
+                detail="Invoice cannot be approved in current status"
+            )
         
         # Convert to debt if requested
         debt_id = None
@@ -406,7 +426,7 @@ async def approve_invoice(
             )
         
         # Log activity
-        await db.activities.insert_one({
+        await record_activity(db, {
             "_id": str(uuid.uuid4()),
             "activity_type": "invoice_approved",
             "description": f"Approved invoice {invoice['invoice_number']}",
@@ -464,7 +484,7 @@ async def delete_invoice(
         await db.invoices.delete_one({"id": invoice_id})
         
         # Log activity
-        await db.activities.insert_one({
+        await record_activity(db, {
             "_id": str(uuid.uuid4()),
             "activity_type": "invoice_deleted",
             "description": f"Deleted invoice {invoice['invoice_number']}",
@@ -563,5 +583,79 @@ async def get_invoice_statistics(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching statistics: {str(e)}")
 
+@router.get("/invoices/{invoice_id}/print")
+async def print_invoice(
+    invoice_id: str,
+    format: str = Query("html", pattern="^(html|pdf)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Render one invoice as a printable page (HTML, or PDF when available)"""
+    try:
+        if format == "pdf" and not PDF_RENDERING_AVAILABLE:
+            raise HTTPException(status_code=501, detail="PDF rendering is not available on this server; use format=html")
+
+        scope = {}
+        if current_user.get("role") in ["sales_rep", "medical_rep"]:
+            scope["sales_rep_id"] = current_user.get("user_id")
+
+        documents = await load_invoice_documents(
+            db, [invoice_id], scope=scope,
+            generated_by=current_user.get("username") or current_user.get("user_id")
+        )
+        if not documents:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+
+        number = documents[0]["invoice_number"] or invoice_id
+        content = await render_documents("invoice", documents, format, title=number)
+        return Response(
+            content=content,
+            media_type=MEDIA_TYPES[format],
+            headers={"Content-Disposition": f'inline; filename="invoice-{number}.{format}"'}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error printing invoice: {str(e)}")
+
+@router.post("/invoices/print")
+async def print_invoices(
+    request: InvoicePrintRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Render several invoices as one merged, streamed file (in the requested order)"""
+    try:
+        if request.format == "pdf" and not PDF_RENDERING_AVAILABLE:
+            raise HTTPException(status_code=501, detail="PDF rendering is not available on this server; use format=html")
+
+        # Role-based access control (same scope as the invoice list)
+        scope = {}
+        if current_user.get("role") in ["sales_rep", "medical_rep"]:
+            scope["sales_rep_id"] = current_user.get("user_id")
+        elif current_user.get("role") == "line_manager":
+            scope["line_id"] = current_user.get("line_id")
+
+        documents = await load_invoice_documents(
+            db, request.invoice_ids, scope=scope,
+            generated_by=current_user.get("username") or current_user.get("user_id")
+        )
+        if not documents:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+
+        filename = f"invoices-{datetime.utcnow():%Y%m%d}.{request.format}"
+        return StreamingResponse(
+            stream_documents("invoice", documents, request.format, title="الفواتير"),
+            media_type=MEDIA_TYPES[request.format],
+            headers={
+                "Content-Disposition": f'inline; filename="{filename}"',
+                "X-Document-Count": str(len(documents))
+            }
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error printing invoices: {str(e)}")
+
 # Export router
 __all__ = ['router']
\ No newline at end of file
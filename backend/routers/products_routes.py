@@ -15,6 +15,8 @@ from pydantic import BaseModel, Field
 import uuid
 import json
 
+from services.projection_service import PRODUCT_LIST_FIELDS, parse_fields_param, build_projection
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
@@ -130,6 +132,21 @@ def get_stock_status(stock_quantity: int, minimum_stock: int) -> str:
     else:
         return "good"
 
+def get_stock_status_expr(stock_status: str) -> Optional[Dict[str, Any]]:
+    """Mongo $expr equivalent of get_stock_status for server-side filtering"""
+    quantity = "$stock_quantity"
+    minimum = "$minimum_stock"
+    expressions = {
+        "out_of_stock": {"$eq": [quantity, 0]},
+        "critical": {"$and": [{"$gt": [quantity, 0]}, {"$lte": [quantity, minimum]}]},
+        "low": {"$and": [
+            {"$gt": [quantity, minimum]},
+            {"$lte": [quantity, {"$multiply": [minimum, 2]}]}
+        ]},
+        "good": {"$gt": [quantity, {"$multiply": [minimum, 2]}]}
+    }
+    return expressions.get(stock_status)
+
 # Sample data creation function
 async def ensure_sample_products():
     """Create sample products if none exist"""
@@ -227,6 +244,7 @@ async def get_products(
     medical_category: Optional[str] = Query(None, description="تصفية حسب الفئة الطبية"),
     stock_status: Optional[str] = Query(None, description="تصفية حسب حالة المخزون"),
     is_active: Optional[bool] = Query(None, description="تصفية حسب حالة النشاط"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل (مثال: id,name,price)"),
     skip: int = Query(0, ge=0, description="عدد العناصر المتجاهلة"),
     limit: int = Query(100, ge=1, le=1000, description="الحد الأقصى للعناصر المسترجعة")
 ):
@@ -235,6 +253,11 @@ async def get_products(
         # Ensure sample data exists
         await ensure_sample_products()
         
+        try:
+            requested = parse_fields_param(fields, list(PRODUCT_LIST_FIELDS) + ["stock_status"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         # Build query filter
         query = {}
         
@@ -246,11 +269,8 @@ async def get_products(
             ]
         
         if brand:
-            # Search in both 'brand' and 'category' fields for compatibility
-            query["$or"] = query.get("$or", []) + [
-                {"brand": {"$regex": brand, "$options": "i"}},
-                {"category": {"$regex": brand, "$options": "i"}}
-            ]
+            # Legacy 'category' values are migrated into 'brand' by scripts/normalize_schema.py
+            query["brand"] = {"$regex": brand, "$options": "i"}
         
         if medical_category:
             query["medical_category"] = {"$regex": medical_category, "$options": "i"}
@@ -258,48 +278,39 @@ async def get_products(
         if is_active is not None:
             query["is_active"] = is_active
         
+        # Filter by stock status in the query so skip/limit page over matching rows
+        if stock_status:
+            status_expr = get_stock_status_expr(stock_status)
+            if status_expr is None:
+                raise HTTPException(status_code=400, detail=f"حالة مخزون غير مدعومة: {stock_status}")
+            query["$expr"] = status_expr
+        
+        include_status = requested is None or "stock_status" in requested
+        projection = build_projection(
+            PRODUCT_LIST_FIELDS,
+            requested - {"stock_status"} if requested is not None else None,
+            required=("stock_quantity", "minimum_stock") if include_status else ()
+        )
+        
         # Get products from database
-        products = []
-        async for product in db.products.find(query, {"_id": 0}).skip(skip).limit(limit):
-            # Normalize product data for compatibility with both old and new structures
-            normalized_product = {
-                "id": product.get("id"),
-                "name": product.get("name"),
-                "code": product.get("code", product.get("id", "")[:8]),  # Use first 8 chars of ID if no code
-                "brand": product.get("brand", product.get("category", "Unknown")),  # Map category to brand
-                "description": product.get("description", ""),
-                "price": product.get("price", 0),
-                "cost": product.get("cost", 0),
-                "unit": product.get("unit", "قطعة"),
-                "stock_quantity": product.get("stock_quantity", product.get("current_stock", 0)),  # Map current_stock
-                "minimum_stock": product.get("minimum_stock", 10),
-                "maximum_stock": product.get("maximum_stock", 1000),
-                "is_active": product.get("is_active", True),
-                "created_at": product.get("created_at"),
-                "updated_at": product.get("updated_at"),
-                "created_by": product.get("created_by"),
-                "updated_by": product.get("updated_by"),
-                "expiry_date": product.get("expiry_date"),
-                "batch_number": product.get("batch_number"),
-                "supplier_info": product.get("supplier_info"),
-                "medical_category": product.get("medical_category"),
-                "requires_prescription": product.get("requires_prescription", False)
-            }
-            
-            # Add stock status
-            normalized_product["stock_status"] = get_stock_status(
-                normalized_product["stock_quantity"],
-                normalized_product["minimum_stock"]
-            )
-            
-            # Filter by stock status if requested
-            if stock_status and normalized_product["stock_status"] != stock_status:
-                continue
-                
-            products.append(normalized_product)
+        products = await db.products.find(query, projection).skip(skip).limit(limit).to_list(length=limit)
+        
+        if include_status:
+            for product in products:
+                product["stock_status"] = get_stock_status(
+                    product.get("stock_quantity", 0),
+                    product.get("minimum_stock", 10)
+                )
+                if requested is not None:
+                    # Drop helper fields that were projected only to compute stock_status
+                    for helper in ("stock_quantity", "minimum_stock"):
+                        if helper not in requested:
+                            product.pop(helper, None)
         
         return products
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving products: {str(e)}")
 
@@ -9,11 +9,15 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 import uuid
 
+from services.login_analytics_service import (
+    LOGIN_ANALYTICS_MAX_DAYS, parse_login_time, get_daily_attendance, get_sessions_per_day, get_login_geography
+)
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
@@ -424,14 +428,25 @@ async def get_login_logs(
             # Other users can only see their own logs
             query["user_id"] = current_user.get("user_id")
         
+        # login_time تاريخ BSON (فهرس user_id + login_time)؛ تاريخ بدون وقت في date_to يشمل اليوم كله
+        time_range = {}
         if date_from:
-            query["login_time"] = {"$gte": date_from}
+            start = parse_login_time(date_from)
+            if start is None:
+                raise HTTPException(status_code=400, detail="Invalid date_from")
+            time_range["$gte"] = start
         
         if date_to:
-            if "login_time" in query:
-                query["login_time"]["$lte"] = date_to
+            end = parse_login_time(date_to)
+            if end is None:
+                raise HTTPException(status_code=400, detail="Invalid date_to")
+            if len(date_to) == 10:
+                time_range["$lt"] = end + timedelta(days=1)
             else:
-                query["login_time"] = {"$lte": date_to}
+                time_range["$lte"] = end
+        
+        if time_range:
+            query["login_time"] = time_range
         
         # Get total count
         total_count = await db.login_logs.count_documents(query)
@@ -455,9 +470,101 @@ async def get_login_logs(
             "viewing_own_logs": current_user.get("role") not in ["admin", "gm"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving login logs: {str(e)}")
 
+def login_analytics_scope(
+    current_user: dict,
+    user_id: Optional[str],
+    date_from: Optional[date],
+    date_to: Optional[date]
+) -> Dict[str, Any]:
+    """المستخدم والمدى لتقارير الدخول - المدير والمدير العام لأي مستخدم، والباقي لأنفسهم"""
+    if current_user.get("role") not in ["admin", "gm"]:
+        user_id = current_user.get("user_id")
+    end = date_to or datetime.utcnow().date()
+    start = date_from or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="date_from must be before date_to")
+    if (end - start).days >= LOGIN_ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {LOGIN_ANALYTICS_MAX_DAYS} days")
+    return {"user_id": user_id, "start": start, "end": end}
+
+@router.get("/login-analytics/attendance")
+async def get_login_attendance(
+    current_user: dict = Depends(get_current_user),
+    user_id: Optional[str] = Query(None, description="فلتر حسب المستخدم"),
+    date_from: Optional[date] = Query(None, description="من تاريخ (افتراضياً آخر 30 يوماً)"),
+    date_to: Optional[date] = Query(None, description="إلى تاريخ"),
+    utc_offset_hours: int = Query(0, ge=-12, le=14, description="فرق التوقيت المحلي عن UTC")
+):
+    """First and last login per user per day - أول وآخر دخول يومياً لكل مستخدم"""
+    try:
+        scope = login_analytics_scope(current_user, user_id, date_from, date_to)
+        attendance = await get_daily_attendance(db, scope["start"], scope["end"], scope["user_id"], utc_offset_hours)
+        return {
+            "success": True,
+            "date_from": scope["start"].isoformat(),
+            "date_to": scope["end"].isoformat(),
+            "attendance": attendance
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving login attendance: {str(e)}")
+
+@router.get("/login-analytics/sessions")
+async def get_login_sessions(
+    current_user: dict = Depends(get_current_user),
+    user_id: Optional[str] = Query(None, description="فلتر حسب المستخدم"),
+    date_from: Optional[date] = Query(None, description="من تاريخ (افتراضياً آخر 30 يوماً)"),
+    date_to: Optional[date] = Query(None, description="إلى تاريخ"),
+    utc_offset_hours: int = Query(0, ge=-12, le=14, description="فرق التوقيت المحلي عن UTC")
+):
+    """Sessions and active users per day - عدد الجلسات والمستخدمين يومياً"""
+    try:
+        scope = login_analytics_scope(current_user, user_id, date_from, date_to)
+        sessions = await get_sessions_per_day(db, scope["start"], scope["end"], scope["user_id"], utc_offset_hours)
+        return {
+            "success": True,
+            "date_from": scope["start"].isoformat(),
+            "date_to": scope["end"].isoformat(),
+            "total_sessions": sum(day["sessions"] for day in sessions),
+            "sessions": sessions
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving login sessions: {str(e)}")
+
+@router.get("/login-analytics/geography")
+async def get_login_geography_distribution(
+    current_user: dict = Depends(get_current_user),
+    user_id: Optional[str] = Query(None, description="فلتر حسب المستخدم"),
+    date_from: Optional[date] = Query(None, description="من تاريخ (افتراضياً آخر 30 يوماً)"),
+    date_to: Optional[date] = Query(None, description="إلى تاريخ"),
+    utc_offset_hours: int = Query(0, ge=-12, le=14, description="فرق التوقيت المحلي عن UTC")
+):
+    """Logins by city and country - توزيع عمليات الدخول جغرافياً"""
+    try:
+        scope = login_analytics_scope(current_user, user_id, date_from, date_to)
+        geography = await get_login_geography(db, scope["start"], scope["end"], scope["user_id"], utc_offset_hours)
+        return {
+            "success": True,
+            "date_from": scope["start"].isoformat(),
+            "date_to": scope["end"].isoformat(),
+            **geography
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving login geography: {str(e)}")
+
 @router.get("/stats/representatives")
 async def get_representatives_stats(
     current_user: dict = Depends(get_current_user),
@@ -15,6 +15,9 @@ from models.activity_models import (
     ActivityCreate, ActivityResponse, ActivityFilter, 
     ActivityStats, GPSTrackingLog, LocationData, DeviceInfo, ActivityType
 )
+from services.geo_utils import haversine_km
+from services.gps_track_service import ingest_points, get_recent_points
+from services.gps_analytics_service import get_rep_day_analytics, point_annotations
 
 router = APIRouter()
 security = HTTPBearer()
@@ -72,7 +75,26 @@ def admin_required(current_user: dict = Depends(get_current_user)):
 
 # Mock Database - في التطبيق الحقيقي يجب استخدام قاعدة بيانات حقيقية
 ACTIVITIES_DB = []
-GPS_LOGS_DB = []
+
+def gps_log_from_point(point: dict, **annotations) -> GPSTrackingLog:
+    """تحويل نقطة من مخزن المسارات إلى سجل GPS (مع تحليلات الحركة إن وُجدت)"""
+    longitude, latitude = point["location"]["coordinates"]
+    return GPSTrackingLog(
+        id=str(point.get("_id")),
+        user_id=point["user_id"],
+        activity_id=point.get("activity_id"),
+        location=LocationData(
+            latitude=latitude,
+            longitude=longitude,
+            accuracy=point.get("accuracy"),
+            altitude=point.get("altitude"),
+            speed=point.get("speed"),
+            heading=point.get("heading"),
+            timestamp=point["recorded_at"]
+        ),
+        created_at=point.get("received_at") or point["recorded_at"],
+        **annotations
+    )
 
 def generate_mock_activities():
     """توليد بيانات تجريبية شاملة للأنشطة"""
@@ -220,14 +242,10 @@ async def log_activity(
         # Store in mock database
         ACTIVITIES_DB.append(activity_response)
         
-        # If location provided, also store in GPS logs
+        # If location provided, also store in the GPS track store
         if activity.location:
-            gps_log = GPSTrackingLog(
-                user_id=current_user["id"],
-                activity_id=activity_response.id,
-                location=activity.location
-            )
-            GPS_LOGS_DB.append(gps_log)
+            from server import db
+            await ingest_points(db, current_user["id"], [activity.location.dict()], activity_id=activity_response.id)
         
         return activity_response
         
@@ -366,39 +384,34 @@ async def get_gps_tracking_logs(
     offset: int = 0,
     current_user: dict = Depends(admin_required)
 ):
-    """الحصول على سجلات تتبع GPS - للأدمن فقط"""
+    """الحصول على سجلات تتبع GPS - للأدمن فقط (للمسارات المبسطة: /api/gps/tracks)"""
     try:
-        # Generate mock GPS data if empty
-        if not GPS_LOGS_DB:
-            for activity in ACTIVITIES_DB[:20]:  # Generate GPS logs for first 20 activities
-                if activity.location:
-                    gps_log = GPSTrackingLog(
-                        user_id=activity.user_id,
-                        activity_id=activity.id,
-                        location=activity.location,
-                        movement_type=random.choice(["walking", "driving", "stationary"]),
-                        distance_from_last=random.uniform(0, 1000),
-                        duration_at_location=random.randint(5, 180)
-                    )
-                    GPS_LOGS_DB.append(gps_log)
-        
-        # Apply filters
-        filtered_logs = GPS_LOGS_DB.copy()
-        
-        if user_id:
-            filtered_logs = [log for log in filtered_logs if log.user_id == user_id]
-        
-        if from_date:
-            filtered_logs = [log for log in filtered_logs if log.created_at >= from_date]
-        
-        if to_date:
-            filtered_logs = [log for log in filtered_logs if log.created_at <= to_date]
-        
-        # Sort by timestamp (newest first)
-        filtered_logs.sort(key=lambda x: x.created_at, reverse=True)
-        
-        # Apply pagination
-        return filtered_logs[offset:offset + limit]
+        from server import db
+
+        # Filtered, sorted (newest first) and paginated by the user/time index
+        points = await get_recent_points(db, user_id, from_date, to_date, limit=limit, offset=offset)
+
+        # نوع الحركة ومدة البقاء والعيادات القريبة من تحليلات يوم كل نقطة (مخزنة لكل مندوب/يوم)
+        analytics = {}
+        for key in dict.fromkeys((point["user_id"], point["recorded_at"].date()) for point in points):
+            analytics[key] = await get_rep_day_analytics(db, *key)
+
+        logs = []
+        for index, point in enumerate(points):
+            # المسافة من النقطة السابقة زمنياً لنفس المستخدم (التالية في الترتيب الأحدث أولاً)
+            previous = next((other for other in points[index + 1:] if other["user_id"] == point["user_id"]), None)
+            distance_from_last = None
+            if previous is not None:
+                (longitude, latitude), (previous_longitude, previous_latitude) = (
+                    point["location"]["coordinates"], previous["location"]["coordinates"]
+                )
+                distance_from_last = round(float(haversine_km(previous_latitude, previous_longitude, latitude, longitude)) * 1000, 1)
+            logs.append(gps_log_from_point(
+                point,
+                distance_from_last=distance_from_last,
+                **point_annotations(analytics[(point["user_id"], point["recorded_at"].date())], point["recorded_at"])
+            ))
+        return logs
         
     except Exception as e:
         raise HTTPException(
@@ -449,16 +462,18 @@ async def log_gps_location(
     location_data: LocationData,
     current_user: dict = Depends(get_current_user)
 ):
-    """تسجيل موقع GPS للمستخدم الحالي"""
+    """تسجيل موقع GPS للمستخدم الحالي (للدفعات من التطبيق: /api/gps/points)"""
     try:
-        gps_log = GPSTrackingLog(
-            user_id=current_user["id"],
-            location=location_data
-        )
+        from server import db
+
+        result = await ingest_points(db, current_user["id"], [location_data.dict()])
+        if not result["accepted"]:
+            raise HTTPException(status_code=400, detail="موقع GPS غير صالح")
         
-        GPS_LOGS_DB.append(gps_log)
+        return {"message": "تم تسجيل الموقع بنجاح", **result}
         
-        return {"message": "تم تسجيل الموقع بنجاح", "log_id": gps_log.id}
+    except HTTPException:
+        raise
         
     except Exception as e:
         raise HTTPException(
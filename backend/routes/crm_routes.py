@@ -1,5 +1,5 @@
 # CRM API Routes - مسارات API لنظام إدارة العلاقات
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Optional
 from datetime import datetime
@@ -9,6 +9,7 @@ import jwt
 
 from models.crm_models import *
 from services.crm_service import CRMService
+from services.client_health_service import run_client_health_scoring, get_health_run_status
 
 router = APIRouter()
 security = HTTPBearer()
@@ -248,6 +249,10 @@ async def search_clients(
     category: Optional[str] = None,
     last_interaction_days: Optional[int] = None,
     search_text: Optional[str] = None,
+    health_score_max: Optional[float] = Query(None, ge=0, le=100),
+    risk_flag: Optional[str] = None,
+    sort_by: str = Query("updated_at", pattern="^(updated_at|health_score|total_order_value|last_interaction_date)$"),
+    sort_order: str = Query("desc", pattern="^(asc|desc)$"),
     limit: int = Query(50, le=200),
     offset: int = Query(0, ge=0),
     current_user: dict = Depends(get_current_user)
@@ -260,6 +265,10 @@ async def search_clients(
             category=category,
             last_interaction_days=last_interaction_days,
             search_text=search_text,
+            health_score_max=health_score_max,
+            risk_flag=risk_flag,
+            sort_by=sort_by,
+            sort_order=sort_order,
             limit=limit,
             offset=offset
         )
@@ -310,6 +319,36 @@ async def get_crm_dashboard(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في جلب لوحة المعلومات: {str(e)}")
 
+# Batch Health Scoring - التقييم الليلي لصحة العملاء
+@router.post("/crm/health-scoring/run")
+async def start_health_scoring(
+    background_tasks: BackgroundTasks,
+    restart: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """تشغيل (أو استئناف) إعادة حساب صحة كل العملاء في الخلفية"""
+    if current_user["role"] not in ["admin", "gm"]:
+        raise HTTPException(status_code=403, detail="غير مصرح لك بتشغيل التقييم")
+    
+    latest = await get_health_run_status(db)
+    if latest and latest["status"] == "running" and not restart:
+        return {"success": True, "message": "التقييم قيد التشغيل بالفعل", "run": latest}
+    
+    background_tasks.add_task(run_client_health_scoring, db, restart)
+    resumes = latest["run_id"] if latest and latest["status"] != "completed" and not restart else None
+    return {"success": True, "message": "تم بدء التقييم", "resumes_run": resumes}
+
+@router.get("/crm/health-scoring/status")
+async def health_scoring_status(
+    run_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """تقدم التقييم (آخر تشغيل افتراضياً)"""
+    run = await get_health_run_status(db, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="لا يوجد تشغيل")
+    return {"success": True, "run": run}
+
 # Quick Actions for Testing
 @router.post("/crm/test/create-sample-data")
 async def create_sample_crm_data(
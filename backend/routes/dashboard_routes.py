@@ -3,6 +3,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models.all_models import User, UserRole
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from services.money_codec import MONEY_TYPE_REGISTRY
 from datetime import datetime, timedelta
 import jwt
 from typing import Optional
@@ -36,7 +37,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     # Get user from database
     mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
+    client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
     db = client[os.environ.get('DB_NAME', 'test_database')]
     
     try:
@@ -53,7 +54,7 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     user = current_user
     
     mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-    client = AsyncIOMotorClient(mongo_url)
+    client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
     db = client[os.environ.get('DB_NAME', 'test_database')]
     
     try:
@@ -17,6 +17,13 @@ from models.enhanced_clinic_models import (
     LocationData, RegistrationLocationData
 )
 from routes.auth_routes import get_current_user
+from services.geo_service import (
+    build_location_field, find_clinics_near, clinics_within_query, to_geojson_point, user_clinic_scope,
+    MAX_NEAR_RADIUS_KM
+)
+from services.geo_utils import haversine_km, classify_registration_accuracy
+from services.geofence_service import clinic_geo_index
+from services.crm_service import sync_client_profile_clinic
 
 # إنشاء الموجه
 router = APIRouter(prefix="/enhanced-clinics", tags=["Enhanced Clinic Management"])
@@ -224,6 +231,7 @@ async def register_clinic(
             # بيانات الموقع
             "location_data": location_data.dict(),
             "admin_approved_location": None,
+            "location": build_location_field({"location_data": location_data.dict()}, "enhanced_clinics"),
             
             # الربط الجغرافي
             "line_id": request.line_id,
@@ -281,6 +289,16 @@ async def register_clinic(
         
         # حفظ العيادة
         await db.enhanced_clinics.insert_one(enhanced_clinic)
+        clinic_geo_index.update(enhanced_clinic, "enhanced_clinics")
+        
+        # حساب المسافة بين موقع العيادة وموقع المسجل مرة واحدة عند التسجيل
+        distance_km = None
+        if registration_location:
+            distance = float(haversine_km(
+                request.clinic_latitude, request.clinic_longitude,
+                registration_location.rep_latitude, registration_location.rep_longitude
+            ))
+            distance_km = None if distance != distance else round(distance, 3)  # NaN → None
         
         # إنشاء سجل للأدمن
         admin_log = {
@@ -295,9 +313,13 @@ async def register_clinic(
             "registrar_role": current_user.get("role", ""),
             "clinic_location": location_data.dict(),
             "registrar_location": registration_location.dict() if registration_location else None,
+            "line_id": request.line_id,
             "line_name": line.get("name", ""),
+            "area_id": request.area_id,
             "area_name": area.get("name", ""),
             "district_name": None,
+            "distance_between_locations_km": distance_km,
+            "registration_accuracy": str(classify_registration_accuracy(distance_km)),
             "registration_status": ClinicStatus.PENDING,
             "registration_type": "field_registration",
             "registration_photos": request.registration_photos,
@@ -328,34 +350,70 @@ async def register_clinic(
         print(f"Error registering clinic: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في تسجيل العيادة")
 
+def _format_available_clinic(clinic: Dict[str, Any], last_visit_date: Any) -> Dict[str, Any]:
+    """تنسيق بيانات العيادة لقوائم العيادات المتاحة"""
+    return {
+        "id": clinic.get("id", ""),
+        "name": clinic.get("name", ""),
+        "registration_number": clinic.get("registration_number", ""),
+        "primary_doctor_name": clinic.get("primary_doctor_name", ""),
+        "primary_doctor_specialty": clinic.get("primary_doctor_specialty", ""),
+        "phone": clinic.get("phone", ""),
+        "address": clinic.get("location_data", {}).get("address", ""),
+        "classification": clinic.get("classification", "average"),
+        "credit_classification": clinic.get("credit_classification", "b"),
+        "status": clinic.get("status", "pending"),
+        "line_name": clinic.get("line_name", ""),
+        "area_name": clinic.get("area_name", ""),
+        "assigned_rep_name": clinic.get("assigned_rep_name", ""),
+        "total_visits": clinic.get("total_visits", 0),
+        "total_revenue": clinic.get("total_revenue", 0.0),
+        "outstanding_debt": clinic.get("outstanding_debt", 0.0),
+        "last_visit_date": last_visit_date,
+        "location": {
+            "latitude": clinic.get("location_data", {}).get("latitude"),
+            "longitude": clinic.get("location_data", {}).get("longitude")
+        },
+        "is_available_for_visit": True,  # يمكن تطوير هذا بناء على قواعد العمل
+        "distance_from_user": clinic.get("distance_km")
+    }
+
+async def _last_completed_visit_dates(db, clinic_ids: List[str]) -> Dict[str, Any]:
+    """آخر زيارة مكتملة لكل عيادة في استعلام تجميعي واحد"""
+    if not clinic_ids:
+        return {}
+    pipeline = [
+        {"$match": {"clinic_id": {"$in": clinic_ids}, "status": "completed"}},
+        {"$group": {"_id": "$clinic_id", "last_visit": {"$max": "$actual_end_time"}}}
+    ]
+    rows = await db.rep_visits.aggregate(pipeline).to_list(length=len(clinic_ids))
+    return {row["_id"]: row["last_visit"] for row in rows}
+
 @router.get("/available-for-user")
 async def get_available_clinics_for_user(
     line_id: Optional[str] = Query(None, description="تصفية حسب الخط"),
     area_id: Optional[str] = Query(None, description="تصفية حسب المنطقة"),
     status_filter: Optional[str] = Query("approved", description="تصفية حسب الحالة"),
+    user_latitude: Optional[float] = Query(None, ge=-90, le=90, description="خط عرض المستخدم لحساب المسافة"),
+    user_longitude: Optional[float] = Query(None, ge=-180, le=180, description="خط طول المستخدم لحساب المسافة"),
     limit: int = Query(50, le=100),
     current_user: User = Depends(get_current_user)
 ):
-    """الحصول على العيادات المتاحة للمستخدم حسب الخط والمنطقة"""
+    """الحصول على العيادات المتاحة للمستخدم حسب الخط والمنطقة
+
+    عند إرسال موقع المستخدم تُرتب العيادات حسب المسافة وتُملأ distance_from_user،
+    ويقتصر البحث (والعدد الإجمالي) على العيادات ضمن MAX_NEAR_RADIUS_KM.
+    """
+    sort_by_distance = user_latitude is not None or user_longitude is not None
+    if sort_by_distance and to_geojson_point(user_latitude, user_longitude) is None:
+        raise HTTPException(status_code=400, detail="موقع المستخدم غير صالح: يلزم خط العرض وخط الطول معاً وبقيم غير (0, 0)")
+    
     try:
         from server import db
         
         # بناء فلتر البحث حسب دور المستخدم
         query_filter = {"status": status_filter or "approved", "is_active": True}
-        
-        if current_user.get("role") == "medical_rep":
-            # المندوب يرى العيادات المخصصة له أو المتاحة له
-            user_id = current_user.get("id")
-            query_filter["$or"] = [
-                {"assigned_rep_id": user_id},
-                {"available_reps": {"$in": [user_id]}},
-                {"backup_rep_ids": {"$in": [user_id]}}
-            ]
-            
-        elif current_user.get("role") in ["line_manager", "area_manager"]:
-            # مدير الخط/المنطقة يرى العيادات في نطاق مسؤوليته
-            # يمكن تطوير هذا لاحقاً بناء على بيانات المستخدم
-            pass
+        query_filter.update(user_clinic_scope(current_user))
         
         # تطبيق فلاتر إضافية
         if line_id:
@@ -365,54 +423,23 @@ async def get_available_clinics_for_user(
             query_filter["area_id"] = area_id
         
         # جلب العيادات
-        clinics = []
-        clinics_cursor = db.enhanced_clinics.find(query_filter).limit(limit).sort("created_at", -1)
-        
-        async for clinic in clinics_cursor:
-            # حساب آخر زيارة للعيادة
-            last_visit = await db.rep_visits.find_one(
-                {"clinic_id": clinic.get("id", ""), "status": "completed"},
-                sort=[("actual_end_time", -1)]
+        if sort_by_distance:
+            clinic_docs = await find_clinics_near(
+                db, user_latitude, user_longitude, MAX_NEAR_RADIUS_KM,
+                query=query_filter, limit=limit
             )
-            
-            last_visit_date = None
-            if last_visit and last_visit.get("actual_end_time"):
-                try:
-                    last_visit_date = last_visit["actual_end_time"]
-                except:
-                    pass
-            
-            # تنسيق بيانات العيادة
-            clinic_summary = {
-                "id": clinic.get("id", ""),
-                "name": clinic.get("name", ""),
-                "registration_number": clinic.get("registration_number", ""),
-                "primary_doctor_name": clinic.get("primary_doctor_name", ""),
-                "primary_doctor_specialty": clinic.get("primary_doctor_specialty", ""),
-                "phone": clinic.get("phone", ""),
-                "address": clinic.get("location_data", {}).get("address", ""),
-                "classification": clinic.get("classification", "average"),
-                "credit_classification": clinic.get("credit_classification", "b"),
-                "status": clinic.get("status", "pending"),
-                "line_name": clinic.get("line_name", ""),
-                "area_name": clinic.get("area_name", ""),
-                "assigned_rep_name": clinic.get("assigned_rep_name", ""),
-                "total_visits": clinic.get("total_visits", 0),
-                "total_revenue": clinic.get("total_revenue", 0.0),
-                "outstanding_debt": clinic.get("outstanding_debt", 0.0),
-                "last_visit_date": last_visit_date,
-                "location": {
-                    "latitude": clinic.get("location_data", {}).get("latitude"),
-                    "longitude": clinic.get("location_data", {}).get("longitude")
-                },
-                "is_available_for_visit": True,  # يمكن تطوير هذا بناء على قواعد العمل
-                "distance_from_user": None  # يمكن حسابها إذا توفر موقع المستخدم
-            }
-            
-            clinics.append(clinic_summary)
+            # العدد الإجمالي بنفس نطاق البحث (العيادات الأبعد أو بدون موقع غير مشمولة)
+            count_filter = clinics_within_query(user_latitude, user_longitude, MAX_NEAR_RADIUS_KM, query_filter)
+        else:
+            count_filter = query_filter
+            clinic_docs = await db.enhanced_clinics.find(query_filter, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(length=limit)
+        
+        # حساب آخر زيارة للعيادات
+        last_visits = await _last_completed_visit_dates(db, [clinic.get("id", "") for clinic in clinic_docs])
+        clinics = [_format_available_clinic(clinic, last_visits.get(clinic.get("id", ""))) for clinic in clinic_docs]
         
         # إحصائيات سريعة
-        total_count = await db.enhanced_clinics.count_documents(query_filter)
+        total_count = await db.enhanced_clinics.count_documents(count_filter)
         
         return {
             "success": True,
@@ -422,14 +449,73 @@ async def get_available_clinics_for_user(
                 "returned_count": len(clinics),
                 "user_role": current_user.get("role", ""),
                 "filtered_by_line": line_id is not None,
-                "filtered_by_area": area_id is not None
+                "filtered_by_area": area_id is not None,
+                "sorted_by_distance": sort_by_distance,
+                "max_distance_km": MAX_NEAR_RADIUS_KM if sort_by_distance else None
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error getting available clinics: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في جلب العيادات المتاحة")
 
+@router.get("/near")
+async def get_clinics_near_me(
+    latitude: float = Query(..., ge=-90, le=90, description="خط العرض الحالي"),
+    longitude: float = Query(..., ge=-180, le=180, description="خط الطول الحالي"),
+    radius_km: float = Query(5.0, gt=0, le=MAX_NEAR_RADIUS_KM, description="نصف قطر البحث بالكيلومتر"),
+    line_id: Optional[str] = Query(None, description="تصفية حسب الخط"),
+    area_id: Optional[str] = Query(None, description="تصفية حسب المنطقة"),
+    status_filter: Optional[str] = Query("approved", description="تصفية حسب الحالة"),
+    sort_by: str = Query("distance", regex="^(distance|name|last_visit)$", description="ترتيب النتائج"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """العيادات القريبة مني - أقرب العيادات ضمن نصف قطر محدد باستخدام فهرس 2dsphere"""
+    try:
+        from server import db
+        
+        query_filter = {"is_active": True}
+        if status_filter:
+            query_filter["status"] = status_filter
+        query_filter.update(user_clinic_scope(current_user))
+        if line_id:
+            query_filter["line_id"] = line_id
+        if area_id:
+            query_filter["area_id"] = area_id
+        
+        clinic_docs = await find_clinics_near(
+            db, latitude, longitude, radius_km, query=query_filter, limit=limit
+        )
+        last_visits = await _last_completed_visit_dates(db, [clinic.get("id", "") for clinic in clinic_docs])
+        clinics = [_format_available_clinic(clinic, last_visits.get(clinic.get("id", ""))) for clinic in clinic_docs]
+        
+        if sort_by == "name":
+            clinics.sort(key=lambda clinic: clinic["name"])
+        elif sort_by == "last_visit":
+            # العيادات التي لم تُزر أولاً ثم الأقدم زيارة
+            clinics.sort(key=lambda clinic: (clinic["last_visit_date"] is not None, str(clinic["last_visit_date"] or "")))
+        
+        return {
+            "success": True,
+            "clinics": clinics,
+            "search": {
+                "latitude": latitude,
+                "longitude": longitude,
+                "radius_km": radius_km,
+                "sort_by": sort_by,
+                "returned_count": len(clinics)
+            }
+        }
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error getting nearby clinics: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="خطأ في البحث عن العيادات القريبة")
+
 # ============================================================================
 # ADMIN REGISTRATION LOGS - سجلات التسجيل للأدمن
 # ============================================================================
@@ -439,13 +525,20 @@ async def get_admin_registration_logs(
     status: Optional[str] = Query(None, description="تصفية حسب حالة المراجعة"),
     line_id: Optional[str] = Query(None, description="تصفية حسب الخط"),
     registrar_id: Optional[str] = Query(None, description="تصفية حسب المسجل"),
+    accuracy: Optional[str] = Query(None, regex="^(high|medium|low)$", description="تصفية حسب دقة التسجيل"),
     from_date: Optional[date] = Query(None, description="من تاريخ"),
     to_date: Optional[date] = Query(None, description="إلى تاريخ"),
+    sort_by: str = Query("created_at", regex="^(created_at|distance)$", description="الترتيب حسب التاريخ أو المسافة"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     current_user: User = Depends(get_current_user)
 ):
-    """الحصول على سجلات تسجيل العيادات للأدمن"""
+    """الحصول على سجلات تسجيل العيادات للأدمن
+
+    المسافة ودقة التسجيل محسوبتان ومخزنتان عند التسجيل
+    (scripts/backfill_registration_accuracy.py للسجلات القديمة)، لذلك تتم
+    التصفية والترتيب عليهما في قاعدة البيانات مع فهرس.
+    """
     try:
         from server import db
         
@@ -460,16 +553,14 @@ async def get_admin_registration_logs(
             query_filter["review_decision"] = status
         
         if line_id:
-            # البحث في العيادات حسب الخط
-            clinics_in_line = await db.enhanced_clinics.find(
-                {"line_id": line_id}, {"id": 1}
-            ).to_list(1000)
-            clinic_ids = [clinic["id"] for clinic in clinics_in_line]
-            query_filter["clinic_id"] = {"$in": clinic_ids}
+            query_filter["line_id"] = line_id
         
         if registrar_id:
             query_filter["registered_by"] = registrar_id
         
+        if accuracy:
+            query_filter["registration_accuracy"] = accuracy
+        
         if from_date:
             query_filter["created_at"] = {"$gte": datetime.combine(from_date, datetime.min.time()).isoformat()}
         
@@ -483,52 +574,23 @@ async def get_admin_registration_logs(
         skip = (page - 1) * page_size
         
         # جلب السجلات
+        if sort_by == "distance":
+            sort_spec = [("distance_between_locations_km", -1), ("created_at", -1)]
+        else:
+            sort_spec = [("created_at", -1)]
+        
         logs = []
-        logs_cursor = db.admin_registration_logs.find(query_filter).skip(skip).limit(page_size).sort("created_at", -1)
+        logs_cursor = db.admin_registration_logs.find(query_filter, {"_id": 0}).sort(sort_spec).skip(skip).limit(page_size)
         
         async for log in logs_cursor:
-            # إضافة معلومات إضافية للسجل
-            log_enhanced = dict(log)
-            
-            # حساب المسافة بين موقع العيادة وموقع المسجل
-            clinic_loc = log.get("clinic_location", {})
-            registrar_loc = log.get("registrar_location", {})
-            
-            distance_km = None
-            if (clinic_loc.get("latitude") and clinic_loc.get("longitude") and 
-                registrar_loc and registrar_loc.get("rep_latitude") and registrar_loc.get("rep_longitude")):
-                # يمكن حساب المسافة باستخدام formula Haversine
-                import math
-                
-                def calculate_distance(lat1, lon1, lat2, lon2):
-                    R = 6371  # نصف قطر الأرض بالكيلومتر
-                    dLat = math.radians(lat2 - lat1)
-                    dLon = math.radians(lon2 - lon1)
-                    a = (math.sin(dLat / 2) * math.sin(dLat / 2) +
-                         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-                         math.sin(dLon / 2) * math.sin(dLon / 2))
-                    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-                    return R * c
-                
-                try:
-                    distance_km = round(calculate_distance(
-                        clinic_loc["latitude"], clinic_loc["longitude"],
-                        registrar_loc["rep_latitude"], registrar_loc["rep_longitude"]
-                    ), 2)
-                except:
-                    pass
-            
-            log_enhanced["distance_between_locations_km"] = distance_km
-            log_enhanced["registration_accuracy"] = "high" if distance_km and distance_km < 0.1 else "medium" if distance_km and distance_km < 1 else "low"
-            
             # تنسيق التواريخ
-            if "created_at" in log_enhanced and isinstance(log_enhanced["created_at"], str):
+            if "created_at" in log and isinstance(log["created_at"], str):
                 try:
-                    log_enhanced["created_at_formatted"] = datetime.fromisoformat(log_enhanced["created_at"].replace('Z', '+00:00')).strftime("%Y-%m-%d %H:%M")
-                except:
+                    log["created_at_formatted"] = datetime.fromisoformat(log["created_at"].replace('Z', '+00:00')).strftime("%Y-%m-%d %H:%M")
+                except ValueError:
                     pass
             
-            logs.append(log_enhanced)
+            logs.append(log)
         
         # إحصائيات
         total_count = await db.admin_registration_logs.count_documents(query_filter)
@@ -560,6 +622,7 @@ async def get_admin_registration_logs(
             },
             "statistics": {
                 "total_registrations": total_count,
+                "accuracy_filter": accuracy,
                 "pending": status_stats.get("pending", 0),
                 "approved": status_stats.get("approved", 0),
                 "rejected": status_stats.get("rejected", 0)
@@ -620,6 +683,9 @@ async def approve_clinic_registration(
         # إضافة الموقع المعتمد إذا تم تحديده
         if approved_location:
             update_data["admin_approved_location"] = approved_location
+            approved_point = build_location_field({"admin_approved_location": approved_location}, "enhanced_clinics")
+            if approved_point:
+                update_data["location"] = approved_point
         
         # إضافة سجل تدقيق
         audit_entry = {
@@ -648,6 +714,8 @@ async def approve_clinic_registration(
         
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="فشل في تحديث العيادة")
+        clinic_geo_index.update({**clinic, **update_data}, "enhanced_clinics")
+        await sync_client_profile_clinic(db, {**clinic, **update_data})
         
         # تحديث سجل الأدمن
         await db.admin_registration_logs.update_one(
@@ -753,6 +821,15 @@ async def modify_clinic(
         new_data["updated_at"] = datetime.utcnow().isoformat()
         new_data["updated_by"] = user_id
         
+        # إعادة حساب الموقع الجغرافي عند تعديل بيانات الموقع
+        if {"location_data", "admin_approved_location"} & set(modification_data.keys()):
+            new_data.pop("location", None)
+            merged_clinic = {key: value for key, value in clinic.items() if key != "location"}
+            merged_clinic.update(modification_data)
+            new_location = build_location_field(merged_clinic, "enhanced_clinics")
+            if new_location:
+                new_data["location"] = new_location
+        
         # إضافة سجل تدقيق
         audit_entry = {
             "action": "clinic_modified",
@@ -779,6 +856,8 @@ async def modify_clinic(
         
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="فشل في تحديث العيادة")
+        clinic_geo_index.update({**clinic, **new_data}, "enhanced_clinics")
+        await sync_client_profile_clinic(db, {**clinic, **new_data})
         
         # إنشاء سجل التعديل
         modification_log = {
@@ -8,6 +8,7 @@ from decimal import Decimal
 import traceback
 from models.all_models import User
 from routes.auth_routes import get_current_user
+from services.aging_service import get_aging_report, AMOUNT_FIELDS
 
 # إنشاء الموجه المالي
 router = APIRouter(prefix="/financial", tags=["Financial Management"])
@@ -301,6 +302,8 @@ async def get_debts(
 @router.get("/reports/aging-analysis")
 async def get_aging_analysis(
     clinic_ids: Optional[str] = Query(None),
+    as_of_date: Optional[date] = Query(None, description="تاريخ اللقطة (يُحسب مرة ويُعاد استخدامه)"),
+    refresh_snapshot: bool = Query(False, description="إعادة حساب لقطة as_of_date"),
     current_user: User = Depends(get_current_user)
 ):
     """تحليل تقادم الديون - Aging analysis"""
@@ -308,82 +311,31 @@ async def get_aging_analysis(
         from server import db
         
         # تحديد العيادات المطلوبة
-        clinic_filter = {}
+        clinic_ids_list = None
         if clinic_ids:
             clinic_ids_list = [cid.strip() for cid in clinic_ids.split(",") if cid.strip()]
-            clinic_filter = {"clinic_id": {"$in": clinic_ids_list}}
-        
-        # جلب الديون النشطة
-        debts_cursor = db.debts.find({
-            **clinic_filter,
-            "remaining_amount": {"$gt": 0}
-        })
         
-        # تجميع البيانات حسب العيادة
-        clinic_aging = {}
+        # التجميع يتم على الخادم - صف واحد لكل عيادة
+        rows = await get_aging_report(
+            db, "simple",
+            as_of_date=as_of_date,
+            clinic_ids=clinic_ids_list,
+            refresh=refresh_snapshot
+        )
         
-        async for debt in debts_cursor:
-            clinic_id = debt.get("clinic_id", "")
-            if not clinic_id:
-                continue
-            
-            if clinic_id not in clinic_aging:
-                # جلب معلومات العيادة
-                clinic = await db.clinics.find_one({"id": clinic_id})
-                clinic_name = clinic.get("name", "غير محدد") if clinic else "غير محدد"
-                
-                clinic_aging[clinic_id] = {
-                    "clinic_id": clinic_id,
-                    "clinic_name": clinic_name,
-                    "total_outstanding": {"amount": 0, "currency": "EGP"},
-                    "current": {"amount": 0, "currency": "EGP"},
-                    "days_30": {"amount": 0, "currency": "EGP"},
-                    "days_60": {"amount": 0, "currency": "EGP"},
-                    "days_90": {"amount": 0, "currency": "EGP"},
-                    "over_90": {"amount": 0, "currency": "EGP"},
-                    "risk_level": "low",
-                    "recommended_action": "مراقبة عادية"
-                }
-            
-            # حساب تقادم الدين
-            due_date = debt.get("due_date", datetime.utcnow())
-            if isinstance(due_date, str):
-                due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-            
-            days_overdue = max(0, (datetime.utcnow() - due_date).days)
-            outstanding = float(debt.get("remaining_amount", 0))
-            
-            clinic_aging[clinic_id]["total_outstanding"]["amount"] += outstanding
-            
-            # تصنيف حسب العمر
-            if days_overdue <= 0:
-                clinic_aging[clinic_id]["current"]["amount"] += outstanding
-            elif days_overdue <= 30:
-                clinic_aging[clinic_id]["days_30"]["amount"] += outstanding
-            elif days_overdue <= 60:
-                clinic_aging[clinic_id]["days_60"]["amount"] += outstanding
-            elif days_overdue <= 90:
-                clinic_aging[clinic_id]["days_90"]["amount"] += outstanding
-            else:
-                clinic_aging[clinic_id]["over_90"]["amount"] += outstanding
-        
-        # تحديد مستوى المخاطرة
-        for clinic_data in clinic_aging.values():
-            total = clinic_data["total_outstanding"]["amount"]
-            over_90 = clinic_data["over_90"]["amount"]
-            days_90 = clinic_data["days_90"]["amount"]
-            
-            if over_90 > total * 0.5:
-                clinic_data["risk_level"] = "critical"
-                clinic_data["recommended_action"] = "إجراءات تحصيل عاجلة"
-            elif days_90 > total * 0.3:
-                clinic_data["risk_level"] = "high"
-                clinic_data["recommended_action"] = "متابعة حثيثة للتحصيل"
-            elif (clinic_data["days_60"]["amount"]) > total * 0.4:
-                clinic_data["risk_level"] = "medium"
-                clinic_data["recommended_action"] = "متابعة منتظمة"
-        
-        return list(clinic_aging.values())
+        return [
+            {
+                "clinic_id": row["clinic_id"],
+                "clinic_name": row["clinic_name"],
+                **{
+                    field: {"amount": float(row[field]), "currency": "EGP"}
+                    for field in AMOUNT_FIELDS
+                },
+                "risk_level": row["risk_level"],
+                "recommended_action": row["recommended_action"]
+            }
+            for row in rows
+        ]
         
     except Exception as e:
         print(f"Error generating aging analysis: {traceback.format_exc()}")
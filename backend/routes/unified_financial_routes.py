@@ -15,6 +15,7 @@ from models.unified_financial_models import (
     UnifiedFinancialSummary
 )
 from routes.auth_routes import get_current_user
+from services.kpi_engine import get_period_kpis
 
 # إنشاء الموجه المالي الموحد
 router = APIRouter(prefix="/unified-financial", tags=["Unified Financial Management"])
@@ -481,117 +482,53 @@ async def get_comprehensive_financial_report(
     end_date: date = Query(..., description="تاريخ النهاية (مطلوب)"),
     clinic_ids: Optional[str] = Query(None, description="معرفات العيادات مفصولة بفواصل"),
     sales_rep_ids: Optional[str] = Query(None, description="معرفات المناديب مفصولة بفواصل"),
+    breakdown_limit: int = Query(20, ge=0, le=500, description="عدد المناديب/العيادات في التفصيل"),
     current_user: User = Depends(get_current_user)
 ):
     """تقرير مالي شامل موحد"""
     try:
         from server import db
         
-        # بناء فلاتر البحث
-        base_filter = {
-            "issue_date": {
-                "$gte": start_date.isoformat(),
-                "$lte": end_date.isoformat()
-            }
-        }
-        
-        if clinic_ids:
-            clinic_ids_list = [cid.strip() for cid in clinic_ids.split(",") if cid.strip()]
-            base_filter["clinic_id"] = {"$in": clinic_ids_list}
-        
-        if sales_rep_ids:
-            rep_ids_list = [rid.strip() for rid in sales_rep_ids.split(",") if rid.strip()]
-            base_filter["sales_rep_id"] = {"$in": rep_ids_list}
+        clinic_ids_list = [cid.strip() for cid in clinic_ids.split(",") if cid.strip()] if clinic_ids else None
+        rep_ids_list = [rid.strip() for rid in sales_rep_ids.split(",") if rid.strip()] if sales_rep_ids else None
         
         # فلترة حسب دور المستخدم
         if current_user.get("role") == "medical_rep":
-            base_filter["sales_rep_id"] = current_user.get("id")
+            rep_ids_list = [current_user.get("id")]
         
-        # إحصائيات شاملة
-        summary_pipeline = [
-            {"$match": base_filter},
-            {
-                "$group": {
-                    "_id": "$record_type",
-                    "count": {"$sum": 1},
-                    "total_amount": {"$sum": {"$toDouble": "$net_amount"}},
-                    "total_outstanding": {"$sum": {"$toDouble": "$outstanding_amount"}}
-                }
-            }
-        ]
-        
-        summary_results = await db.unified_financial_records.aggregate(summary_pipeline).to_list(100)
+        # كل المؤشرات والتفصيلات من إسقاط عمودي واحد (pandas/NumPy)
+        kpis = await get_period_kpis(
+            db, "unified", start_date, end_date,
+            clinic_ids=clinic_ids_list, rep_ids=rep_ids_list, breakdown_limit=breakdown_limit
+        )
+        totals = kpis["totals"]
         
-        # تنظيم النتائج
         report = {
             "period": {
                 "start_date": start_date.isoformat(),
                 "end_date": end_date.isoformat()
             },
             "generated_at": datetime.utcnow().isoformat(),
-            "summary_by_type": {},
+            "summary_by_type": kpis["by_type"],
             "totals": {
-                "total_records": 0,
-                "total_invoiced": 0.0,
-                "total_collected": 0.0,
-                "total_outstanding": 0.0
+                "total_records": kpis["records"],
+                "total_invoiced": totals["invoiced"],
+                "total_collected": totals["collected"],
+                "total_outstanding": totals["outstanding"],
+                "total_overdue": totals["overdue_amount"],
+                "open_count": totals["open_count"],
+                "overdue_count": totals["overdue_count"]
             },
-            "performance_metrics": {}
-        }
-        
-        total_invoiced = 0.0
-        total_collected = 0.0
-        total_outstanding = 0.0
-        total_records = 0
-        
-        for result in summary_results:
-            record_type = result["_id"]
-            count = result["count"]
-            amount = result["total_amount"]
-            outstanding = result["total_outstanding"]
-            
-            report["summary_by_type"][record_type] = {
-                "count": count,
-                "total_amount": amount,
-                "outstanding_amount": outstanding
-            }
-            
-            if record_type in ["invoice", "debt"]:
-                total_invoiced += amount
-                total_outstanding += outstanding
-            elif record_type in ["payment", "collection"]:
-                total_collected += amount
-            
-            total_records += count
-        
-        # حساب المؤشرات
-        collection_rate = 0.0
-        if total_invoiced > 0:
-            collection_rate = (total_collected / total_invoiced) * 100
-        
-        overdue_percentage = 0.0
-        if total_invoiced > 0:
-            # حساب المتأخرات
-            overdue_filter = {**base_filter, "status": "overdue"}
-            overdue_amount = 0.0
-            
-            overdue_cursor = db.unified_financial_records.find(overdue_filter)
-            async for record in overdue_cursor:
-                overdue_amount += float(record.get("outstanding_amount", 0))
-            
-            overdue_percentage = (overdue_amount / total_invoiced) * 100
-        
-        report["totals"] = {
-            "total_records": total_records,
-            "total_invoiced": total_invoiced,
-            "total_collected": total_collected,
-            "total_outstanding": total_outstanding
-        }
-        
-        report["performance_metrics"] = {
-            "collection_rate": round(collection_rate, 2),
-            "overdue_percentage": round(overdue_percentage, 2),
-            "outstanding_ratio": round((total_outstanding / total_invoiced * 100) if total_invoiced > 0 else 0, 2)
+            "performance_metrics": {
+                "collection_rate": kpis["kpis"]["collection_rate"],
+                "overdue_percentage": kpis["kpis"]["overdue_percentage"],
+                "outstanding_ratio": kpis["kpis"]["outstanding_ratio"],
+                "overdue_rate": kpis["kpis"]["overdue_rate"],
+                "average_collection_days": kpis["kpis"]["average_collection_days"]
+            },
+            "percentiles": kpis["percentiles"],
+            "by_sales_rep": kpis["by_rep"],
+            "by_clinic": kpis["by_clinic"]
         }
         
         return {
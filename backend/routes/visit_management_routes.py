@@ -10,13 +10,26 @@ import uuid
 from models.all_models import User
 from models.unified_financial_models import (
     RepVisit, VisitStatus, VisitType, VisitPlan,
-    CreateVisitRequest, VisitCheckInRequest, VisitCompletionRequest, VisitSummary
+    CreateVisitRequest, VisitCheckInRequest, VisitCompletionRequest, VisitSummary,
+    RoutePlanRequest
 )
 from routes.auth_routes import get_current_user
+from services.geo_service import extract_coordinates
+from services.geofence_service import (
+    check_geofence, visit_geofence_fields, find_suspicious_visits,
+    GEOFENCE_VERDICTS, SUSPICIOUS_VERDICTS
+)
+from services.route_planner import RoutePlanner
 
 # إنشاء الموجه لإدارة الزيارات
 router = APIRouter(prefix="/visits", tags=["Visit Management"])
 
+# الحقول المطلوبة من العيادة لتخطيط المسار
+ROUTE_PLAN_CLINIC_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "address": 1, "location": 1,
+    "clinic_latitude": 1, "clinic_longitude": 1, "latitude": 1, "longitude": 1
+}
+
 # ============================================================================
 # VISIT MANAGEMENT ENDPOINTS - واجهات إدارة الزيارات
 # ============================================================================
@@ -416,6 +429,9 @@ async def check_in_visit(
                 detail=f"لا يمكن تسجيل الدخول للزيارة في الحالة الحالية: {visit.get('status')}"
             )
         
+        # مقارنة موقع المندوب بموقع العيادة (فهرس الإحداثيات في الذاكرة)
+        geofence = await check_geofence(db, visit.get("clinic_id"), request.gps_latitude, request.gps_longitude)
+        
         # تحديث الزيارة
         check_in_data = {
             "status": VisitStatus.IN_PROGRESS,
@@ -426,6 +442,8 @@ async def check_in_visit(
                 "timestamp": datetime.utcnow().isoformat(),
                 "notes": request.notes
             },
+            "geofence": {"check_in": geofence},
+            **visit_geofence_fields(geofence, None),
             "updated_at": datetime.utcnow().isoformat()
         }
         
@@ -438,7 +456,9 @@ async def check_in_visit(
             return {
                 "success": True,
                 "message": "تم تسجيل الدخول للزيارة بنجاح",
-                "check_in_time": check_in_data["actual_start_time"]
+                "check_in_time": check_in_data["actual_start_time"],
+                "geofence_verdict": geofence["verdict"],
+                "distance_m": geofence["distance_m"]
             }
         else:
             raise HTTPException(status_code=500, detail="خطأ في تسجيل الدخول للزيارة")
@@ -504,6 +524,20 @@ async def complete_visit(
             "updated_at": datetime.utcnow().isoformat()
         }
         
+        # التحقق من موقع الخروج إن أُرسل، مع الإبقاء على نتيجة الدخول
+        check_in_geofence = (visit.get("geofence") or {}).get("check_in")
+        if request.gps_latitude is not None and request.gps_longitude is not None:
+            check_out_geofence = await check_geofence(
+                db, visit.get("clinic_id"), request.gps_latitude, request.gps_longitude
+            )
+            completion_data["check_out_location"] = {
+                "latitude": request.gps_latitude,
+                "longitude": request.gps_longitude,
+                "timestamp": end_time.isoformat()
+            }
+            completion_data["geofence.check_out"] = check_out_geofence
+            completion_data.update(visit_geofence_fields(check_in_geofence, check_out_geofence))
+        
         # إضافة تاريخ الزيارة التالية إذا كانت مطلوبة
         if request.follow_up_required and request.next_visit_suggestions:
             # اقتراح تاريخ بعد أسبوع
@@ -545,6 +579,172 @@ async def complete_visit(
         print(f"Error completing visit: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="خطأ في إنهاء الزيارة")
 
+@router.post("/route-plan")
+async def plan_visit_route(
+    request: RoutePlanRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """تخطيط ترتيب زيارات اليوم للمندوب (أقرب جار + 2-opt)"""
+    try:
+        from server import db
+
+        allowed_roles = ["medical_rep", "admin", "manager"]
+        if current_user.get("role") not in allowed_roles:
+            raise HTTPException(status_code=403, detail="تخطيط المسار متاح للمناديب والمديرين فقط")
+
+        rep_id = current_user.get("id")
+        day_start = _parse_clock_minutes(request.day_start)
+        day_end = _parse_clock_minutes(request.day_end)
+        if day_end <= day_start:
+            raise HTTPException(status_code=400, detail="نهاية يوم العمل يجب أن تكون بعد بدايته")
+
+        # المرشحون: العيادات المرسلة أو الزيارات المخططة لهذا اليوم
+        candidates: Dict[str, Dict[str, Any]] = {}
+        if request.stops:
+            for stop in request.stops:
+                candidates[stop.clinic_id] = {
+                    "clinic_id": stop.clinic_id,
+                    "priority": stop.priority,
+                    "service_minutes": stop.service_minutes,
+                    "window_start": _parse_clock_minutes(stop.window_start) if stop.window_start else None,
+                    "window_end": _parse_clock_minutes(stop.window_end) if stop.window_end else None,
+                }
+        else:
+            visits_cursor = db.rep_visits.find(
+                {
+                    "medical_rep_id": rep_id,
+                    "status": VisitStatus.PLANNED,
+                    "scheduled_date": {
+                        "$gte": datetime.combine(request.date, datetime.min.time()).isoformat(),
+                        "$lte": datetime.combine(request.date, datetime.max.time()).isoformat()
+                    }
+                },
+                {"_id": 0, "id": 1, "clinic_id": 1, "visit_type": 1, "scheduled_date": 1}
+            )
+            async for visit in visits_cursor:
+                scheduled = datetime.fromisoformat(visit["scheduled_date"].replace('Z', '+00:00'))
+                scheduled_minute = scheduled.hour * 60 + scheduled.minute
+                candidates[visit["clinic_id"]] = {
+                    "clinic_id": visit["clinic_id"],
+                    "visit_id": visit.get("id"),
+                    "priority": "high" if visit.get("visit_type") in (VisitType.EMERGENCY, VisitType.FOLLOW_UP) else "normal",
+                    "service_minutes": 30,
+                    # الزيارات ذات الموعد المحدد تُحترم كنافذة (-30/+60 دقيقة)
+                    "window_start": scheduled_minute - 30 if scheduled_minute else None,
+                    "window_end": scheduled_minute + 60 if scheduled_minute else None,
+                }
+
+        if not candidates:
+            return {"success": True, "data": {"route": [], "unscheduled": [], "missing_location": []}}
+
+        # جلب كل العيادات في استعلام واحد مع التحقق من صلاحية المندوب
+        clinics_filter: Dict[str, Any] = {"id": {"$in": list(candidates)}}
+        if current_user.get("role") == "medical_rep":
+            clinics_filter["$or"] = [
+                {"assigned_rep_id": rep_id},
+                {"available_reps": {"$in": [rep_id]}},
+                {"area_reps": {"$in": [rep_id]}}
+            ]
+
+        stops = []
+        clinics_cursor = db.clinics.find(clinics_filter, ROUTE_PLAN_CLINIC_PROJECTION)
+        async for clinic in clinics_cursor:
+            coordinates = extract_coordinates(clinic, "clinics")
+            candidate = candidates.pop(clinic["id"])
+            if not coordinates:
+                candidates[clinic["id"]] = {**candidate, "reason": "missing_location"}
+                continue
+            stops.append({
+                **candidate,
+                "id": clinic["id"],
+                "clinic_name": clinic.get("name", ""),
+                "clinic_address": clinic.get("address", ""),
+                "latitude": coordinates[0],
+                "longitude": coordinates[1],
+            })
+
+        start = None
+        if request.start_latitude is not None and request.start_longitude is not None:
+            start = (request.start_latitude, request.start_longitude)
+
+        planner = RoutePlanner(speed_kmh=request.average_speed_kmh)
+        plan = planner.plan(
+            stops,
+            start=start,
+            day_start_minutes=day_start,
+            day_end_minutes=day_end,
+            return_to_start=request.return_to_start
+        )
+
+        for stop in plan["route"]:
+            stop["arrival_time"] = _format_clock_minutes(stop["arrival_minute"])
+            stop["departure_time"] = _format_clock_minutes(stop["departure_minute"])
+
+        # العيادات غير الموجودة أو خارج صلاحية المندوب أو بدون موقع
+        plan["missing_location"] = [
+            {"clinic_id": clinic_id, "reason": candidate.get("reason", "not_found")}
+            for clinic_id, candidate in candidates.items()
+        ]
+        plan["date"] = request.date.isoformat()
+
+        return {"success": True, "data": plan}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error planning visit route: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="خطأ في تخطيط مسار الزيارات")
+
+@router.get("/reports/suspicious")
+async def get_suspicious_visits(
+    start_date: date,
+    end_date: date,
+    rep_id: Optional[str] = None,
+    verdicts: Optional[str] = Query(None, description="Comma-separated verdicts (default: outside)"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    """تقرير الزيارات المشبوهة: تسجيل دخول/خروج بعيد عن موقع العيادة"""
+    try:
+        from server import db
+        
+        allowed_roles = ["admin", "gm", "manager", "line_manager", "area_manager"]
+        if current_user.get("role") not in allowed_roles:
+            raise HTTPException(status_code=403, detail="تقرير الزيارات المشبوهة متاح للإدارة فقط")
+        
+        if end_date < start_date:
+            raise HTTPException(status_code=400, detail="تاريخ النهاية قبل تاريخ البداية")
+        
+        selected = tuple(verdict for verdict in (verdicts or "").split(",") if verdict) or SUSPICIOUS_VERDICTS
+        unknown = [verdict for verdict in selected if verdict not in GEOFENCE_VERDICTS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"حكم غير معروف: {', '.join(unknown)}")
+        
+        report = await find_suspicious_visits(
+            db,
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+            verdicts=selected,
+            rep_id=rep_id,
+            limit=limit,
+            skip=skip
+        )
+        
+        return {
+            "success": True,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "verdicts": list(selected),
+            **report
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error building suspicious visits report: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="خطأ في تقرير الزيارات المشبوهة")
+
 @router.get("/")
 async def get_visits(
     status: Optional[VisitStatus] = None,
@@ -754,4 +954,20 @@ def get_visit_status_display(visit: Dict[str, Any]) -> str:
         else:
             return status
     except:
-        return status
\ No newline at end of file
+        return status
+
+def _parse_clock_minutes(value: str) -> int:
+    """تحويل وقت HH:MM إلى دقائق من منتصف الليل"""
+    try:
+        hours, minutes = value.split(":")
+        total = int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"صيغة وقت غير صالحة: {value} (المطلوب HH:MM)")
+    if not 0 <= total <= 24 * 60:
+        raise HTTPException(status_code=400, detail=f"صيغة وقت غير صالحة: {value} (المطلوب HH:MM)")
+    return total
+
+def _format_clock_minutes(minutes: float) -> str:
+    """تحويل الدقائق من منتصف الليل إلى HH:MM"""
+    total = int(round(minutes))
+    return f"{total // 60:02d}:{total % 60:02d}"
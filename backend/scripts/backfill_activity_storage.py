@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+🗂️ تهيئة تخزين الأنشطة للسجلات القديمة - Activity storage backfill
+Activities written before the activity store have no ``recorded_at``, so the
+TTL index never expires them, they have no compact archive copy and they are
+missing from the hourly counters behind /api/activities/stats. This:
+  1. sets ``recorded_at`` (from timestamp/created_at) and ``action`` on them
+     and upserts their archive records, in chunks,
+  2. rebuilds the hourly counters from the archive for every hour before the
+     current one (the current hour is left to live writes).
+Creates the indexes first. Activities older than ACTIVITY_HOT_DAYS are then
+removed by the TTL monitor, leaving their archive record. Safe to re-run.
+
+Usage: python scripts/backfill_activity_storage.py
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReplaceOne
+from dotenv import load_dotenv
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.activity_store import (
+    ACTIVITY_HOT_COLLECTION, ACTIVITY_ARCHIVE_COLLECTION, ACTIVITY_STATS_COLLECTION, HOUR_KEY_FORMAT,
+    activity_action, archive_record, ensure_activity_storage_indexes, hour_bucket, stat_key
+)
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+CHUNK_SIZE = 5000
+
+# الأبعاد المحفوظة في الأرشيف: حقل الأرشيف ← اسم البعد في مستند الساعة
+ARCHIVE_DIMENSIONS = {"a": "actions", "n": "users", "d": "devices"}
+
+
+def recorded_time(activity):
+    """وقت النشاط من timestamp أو created_at (نص ISO أو datetime)، وإلا وقت إنشاء ObjectId"""
+    for field in ("timestamp", "created_at"):
+        value = activity.get(field)
+        if isinstance(value, datetime):
+            return value.replace(tzinfo=None)
+        if isinstance(value, str):
+            try:
+                parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            if parsed.tzinfo is not None:
+                parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+            return parsed
+    if hasattr(activity.get("_id"), "generation_time"):
+        return activity["_id"].generation_time.replace(tzinfo=None)
+    return datetime.utcnow()
+
+
+async def _flush(db, chunk):
+    hot_operations, archive_operations = [], []
+    for activity in chunk:
+        recorded_at = recorded_time(activity)
+        hot_operations.append(UpdateOne(
+            {"_id": activity["_id"]},
+            {"$set": {"recorded_at": recorded_at, "action": activity_action(activity)}}
+        ))
+        archived = archive_record(activity, recorded_at)
+        archive_operations.append(ReplaceOne({"_id": archived["_id"]}, archived, upsert=True))
+
+    if chunk:
+        await db[ACTIVITY_ARCHIVE_COLLECTION].bulk_write(archive_operations, ordered=False)
+        await db[ACTIVITY_HOT_COLLECTION].bulk_write(hot_operations, ordered=False)
+    return len(chunk)
+
+
+async def rebuild_hourly_counters(db, before: datetime) -> int:
+    """إعادة بناء مستندات الساعات من الأرشيف (الساعات قبل ``before`` فقط)"""
+    buckets = {}
+    for field, dimension in ARCHIVE_DIMENSIONS.items():
+        pipeline = [
+            {"$match": {"t": {"$lt": before}}},
+            {"$group": {
+                "_id": {"hour": {"$dateToString": {"format": "%Y-%m-%dT%H", "date": "$t"}}, "key": f"${field}"},
+                "count": {"$sum": 1},
+            }},
+        ]
+        async for row in db[ACTIVITY_ARCHIVE_COLLECTION].aggregate(pipeline, allowDiskUse=True):
+            hour = datetime.strptime(row["_id"]["hour"], HOUR_KEY_FORMAT)
+            bucket = buckets.setdefault(hour, {"hour": hour, "total": 0, "actions": {}, "users": {}, "devices": {}})
+            key = stat_key(row["_id"]["key"])
+            bucket[dimension][key] = bucket[dimension].get(key, 0) + row["count"]
+            if dimension == "actions":
+                bucket["total"] += row["count"]
+
+    operations = [
+        ReplaceOne({"_id": hour.strftime(HOUR_KEY_FORMAT)}, bucket, upsert=True)
+        for hour, bucket in buckets.items()
+    ]
+    for start in range(0, len(operations), 1000):
+        await db[ACTIVITY_STATS_COLLECTION].bulk_write(operations[start:start + 1000], ordered=False)
+    return len(operations)
+
+
+async def backfill_activity_storage():
+    """تهيئة recorded_at والأرشيف والعدادات للأنشطة القديمة"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        await ensure_activity_storage_indexes(db)
+        started_hour = hour_bucket(datetime.utcnow())
+
+        processed = 0
+        chunk = []
+        async for activity in db[ACTIVITY_HOT_COLLECTION].find({"recorded_at": {"$exists": False}}).batch_size(CHUNK_SIZE):
+            chunk.append(activity)
+            if len(chunk) >= CHUNK_SIZE:
+                processed += await _flush(db, chunk)
+                chunk = []
+                print(f"   ... {processed} activities")
+        processed += await _flush(db, chunk)
+        print(f"✅ recorded_at and archive records set for {processed} activities")
+
+        hours = await rebuild_hourly_counters(db, started_hour)
+        print(f"✅ Rebuilt {hours} hourly counter documents (before {started_hour.isoformat()})")
+
+    except Exception as e:
+        print(f"❌ Error backfilling activity storage: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_activity_storage())
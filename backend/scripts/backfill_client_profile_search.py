@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+🔎 تعبئة بيانات البحث في ملفات العملاء - Client profile search backfill
+Copies the clinic name/address/phone onto every ``client_profiles`` document
+with the normalized ``search_terms`` used by CRM search, reading clinics in
+batches (``clinics`` first, then ``enhanced_clinics``), and creates the
+search indexes. Safe to re-run.
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateMany
+from dotenv import load_dotenv
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.crm_service import clinic_search_fields, ensure_crm_search_indexes
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+CHUNK_SIZE = 1000
+
+CLINIC_PROJECTION = {"_id": 0, "id": 1, "name": 1, "clinic_name": 1, "address": 1, "location_data.address": 1,
+                     "phone": 1, "clinic_phone": 1}
+
+
+async def _flush(db, clinic_ids):
+    clinics = {}
+    for collection in ("clinics", "enhanced_clinics"):
+        missing = [clinic_id for clinic_id in clinic_ids if clinic_id not in clinics]
+        if not missing:
+            break
+        async for clinic in db[collection].find({"id": {"$in": missing}}, CLINIC_PROJECTION):
+            clinics[clinic["id"]] = clinic
+
+    operations = [
+        UpdateMany({"clinic_id": clinic_id}, {"$set": clinic_search_fields(clinic)})
+        for clinic_id, clinic in clinics.items()
+    ]
+    if operations:
+        await db.client_profiles.bulk_write(operations, ordered=False)
+    return len(operations), len(clinic_ids) - len(operations)
+
+
+async def backfill_client_profile_search():
+    """نسخ بيانات العيادة ومصطلحات البحث إلى ملفات العملاء"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        clinic_ids = await db.client_profiles.distinct("clinic_id")
+        updated = orphaned = 0
+        for start in range(0, len(clinic_ids), CHUNK_SIZE):
+            chunk_updated, chunk_orphaned = await _flush(db, clinic_ids[start:start + CHUNK_SIZE])
+            updated += chunk_updated
+            orphaned += chunk_orphaned
+            print(f"   ... {min(start + CHUNK_SIZE, len(clinic_ids))} clinics")
+
+        await ensure_crm_search_indexes(db)
+        print(f"✅ Search fields stored for {updated} clinics ({orphaned} profiles point to missing clinics)")
+
+    except Exception as e:
+        print(f"❌ Error backfilling client profile search: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_client_profile_search())
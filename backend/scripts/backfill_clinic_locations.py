@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+📍 تعبئة حقل الموقع الجغرافي للعيادات - Clinic GeoJSON location backfill
+Builds the GeoJSON ``location`` point from the loose latitude/longitude fields
+of ``clinics`` and ``enhanced_clinics`` and creates the 2dsphere indexes used
+by the "clinics near me" API. Safe to re-run.
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from datetime import datetime
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.geo_service import CLINIC_GEO_COLLECTIONS, location_backfill_pipeline, ensure_geo_indexes
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+MIGRATION_ID = "clinic_location_backfill_v1"
+
+
+async def backfill_clinic_locations():
+    """تعبئة location وإنشاء فهارس 2dsphere"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        results = {}
+        for collection in CLINIC_GEO_COLLECTIONS:
+            result = await db[collection].update_many({}, location_backfill_pipeline(collection))
+            with_location = await db[collection].count_documents({"location.type": "Point"})
+            total = await db[collection].count_documents({})
+            results[collection] = {"modified": result.modified_count, "with_location": with_location}
+            print(f"✅ {collection}: {with_location}/{total} clinics have a GeoJSON location")
+
+        await ensure_geo_indexes(db)
+        print("✅ 2dsphere indexes ready")
+
+        await db.schema_migrations.update_one(
+            {"id": MIGRATION_ID},
+            {"$set": {"applied_at": datetime.utcnow(), "results": results}},
+            upsert=True
+        )
+
+    except Exception as e:
+        print(f"❌ Error backfilling clinic locations: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_clinic_locations())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+⏰ إضافة مهام المتابعة القديمة إلى طابور التذكيرات - Follow-up reminder backfill
+Open follow-up tasks created before the reminder scheduler have no queue
+fields. This sets ``remind_at`` (reminder date, else due date) and
+``reminder_status`` on them and creates the queue index. Tasks whose reminder
+is more than ``--grace-days`` (default 1) in the past are marked cancelled
+instead, so the first scheduler run does not flood reps with stale reminders.
+Tasks that already have a reminder status are not touched. Safe to re-run.
+
+Usage: python scripts/backfill_follow_up_reminders.py [--grace-days N]
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.follow_up_scheduler import OPEN_TASK_STATUSES, ensure_follow_up_queue_indexes
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+
+async def backfill_follow_up_reminders(grace_days: int = 1):
+    """جدولة تذكير لكل مهمة مفتوحة بدون حالة تذكير"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        remind_at = {"$ifNull": ["$reminder_date", "$due_date"]}
+        cutoff = datetime.utcnow() - timedelta(days=grace_days)
+        base_query = {"reminder_status": {"$exists": False}, "status": {"$in": list(OPEN_TASK_STATUSES)}}
+
+        scheduled = await db.follow_up_tasks.update_many(
+            {**base_query, "$expr": {"$gte": [remind_at, cutoff]}},
+            [{"$set": {"remind_at": remind_at, "reminder_status": "scheduled", "reminder_attempts": 0}}]
+        )
+        cancelled = await db.follow_up_tasks.update_many(
+            base_query,
+            [{"$set": {"remind_at": remind_at, "reminder_status": "cancelled", "reminder_attempts": 0}}]
+        )
+
+        await ensure_follow_up_queue_indexes(db)
+        print(f"✅ Scheduled {scheduled.modified_count} reminders, "
+              f"cancelled {cancelled.modified_count} older than {grace_days} day(s)")
+
+    except Exception as e:
+        print(f"❌ Error backfilling follow-up reminders: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    grace_days = int(args[args.index("--grace-days") + 1]) if "--grace-days" in args else 1
+    asyncio.run(backfill_follow_up_reminders(grace_days=grace_days))
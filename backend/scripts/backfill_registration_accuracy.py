@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+📏 تعبئة دقة التسجيل للسجلات القديمة - Registration accuracy backfill
+Computes ``distance_between_locations_km`` and ``registration_accuracy`` for
+every admin registration log (in vectorized chunks, no row cap), copies the
+clinic's ``line_id``/``area_id`` onto the log, and creates the report indexes.
+Safe to re-run.
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+import numpy as np
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.geo_utils import haversine_km, classify_registration_accuracy
+from services.geo_service import ensure_registration_log_indexes
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+CHUNK_SIZE = 5000
+
+LOG_PROJECTION = {
+    "_id": 1,
+    "clinic_id": 1,
+    "line_id": 1,
+    "clinic_location.latitude": 1,
+    "clinic_location.longitude": 1,
+    "registrar_location.rep_latitude": 1,
+    "registrar_location.rep_longitude": 1,
+}
+
+
+async def _flush(db, chunk, clinic_lines):
+    clinic_loc = [log.get("clinic_location") or {} for log in chunk]
+    registrar_loc = [log.get("registrar_location") or {} for log in chunk]
+
+    distances = haversine_km(
+        [loc.get("latitude") for loc in clinic_loc],
+        [loc.get("longitude") for loc in clinic_loc],
+        [loc.get("rep_latitude") for loc in registrar_loc],
+        [loc.get("rep_longitude") for loc in registrar_loc],
+    )
+    accuracy = classify_registration_accuracy(distances)
+    rounded = np.round(distances, 3)
+
+    operations = []
+    for log, distance, accuracy_class in zip(chunk, rounded, accuracy):
+        update = {
+            "distance_between_locations_km": None if np.isnan(distance) else float(distance),
+            "registration_accuracy": str(accuracy_class),
+        }
+        if not log.get("line_id") and log.get("clinic_id") in clinic_lines:
+            update.update(clinic_lines[log["clinic_id"]])
+        operations.append(UpdateOne({"_id": log["_id"]}, {"$set": update}))
+
+    if operations:
+        await db.admin_registration_logs.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+async def backfill_registration_accuracy():
+    """حساب المسافة والدقة لكل سجلات التسجيل"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        # خريطة العيادة ← الخط/المنطقة لنسخها إلى السجلات القديمة
+        clinic_lines = {}
+        async for clinic in db.enhanced_clinics.find({}, {"_id": 0, "id": 1, "line_id": 1, "area_id": 1}):
+            clinic_lines[clinic.get("id")] = {"line_id": clinic.get("line_id"), "area_id": clinic.get("area_id")}
+
+        processed = 0
+        chunk = []
+        async for log in db.admin_registration_logs.find({}, LOG_PROJECTION).batch_size(CHUNK_SIZE):
+            chunk.append(log)
+            if len(chunk) >= CHUNK_SIZE:
+                processed += await _flush(db, chunk, clinic_lines)
+                chunk = []
+                print(f"   ... {processed} logs")
+        processed += await _flush(db, chunk, clinic_lines)
+
+        await ensure_registration_log_indexes(db)
+        print(f"✅ Registration accuracy stored for {processed} logs")
+
+    except Exception as e:
+        print(f"❌ Error backfilling registration accuracy: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_registration_accuracy())
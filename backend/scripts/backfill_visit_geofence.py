@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+📍 تعبئة حكم السياج الجغرافي للزيارات القديمة - Visit geofence backfill
+Computes the check-in (and check-out, when recorded) distance to the clinic
+for visits checked in before geofencing existed, stores the same fields as
+POST /visits/check-in and /visits/complete, and creates the report index.
+Distances are computed per chunk with the vectorized haversine. Visits that
+already have a verdict are skipped unless ``--force`` is given. Safe to re-run.
+
+Usage: python scripts/backfill_visit_geofence.py [--force]
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+import numpy as np
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.geo_utils import haversine_km
+from services.geofence_service import (
+    clinic_geo_index, geofence_verdict, visit_geofence_fields, ensure_geofence_indexes, GEOFENCE_RADIUS_M
+)
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+CHUNK_SIZE = 5000
+
+VISIT_PROJECTION = {"_id": 1, "clinic_id": 1, "check_in_location": 1, "check_out_location": 1}
+
+
+def _checks(chunk, field, checked_at):
+    """حكم كل زيارة في الدفعة لموقع واحد (الدخول أو الخروج)"""
+    clinic_points = [clinic_geo_index.get(visit.get("clinic_id")) or (None, None) for visit in chunk]
+    locations = [visit.get(field) or {} for visit in chunk]
+    distances = haversine_km(
+        [point[0] for point in clinic_points],
+        [point[1] for point in clinic_points],
+        [location.get("latitude") for location in locations],
+        [location.get("longitude") for location in locations],
+    ) * 1000
+
+    checks = []
+    for location, distance in zip(locations, distances):
+        if not location:
+            checks.append(None)
+            continue
+        distance = None if np.isnan(distance) else round(float(distance), 1)
+        checks.append({
+            "verdict": geofence_verdict(distance),
+            "distance_m": distance,
+            "radius_m": GEOFENCE_RADIUS_M,
+            "checked_at": checked_at,
+        })
+    return checks
+
+
+async def _flush(db, chunk):
+    checked_at = datetime.utcnow().isoformat()
+    operations = []
+    for visit, check_in, check_out in zip(
+        chunk, _checks(chunk, "check_in_location", checked_at), _checks(chunk, "check_out_location", checked_at)
+    ):
+        geofence = {key: check for key, check in (("check_in", check_in), ("check_out", check_out)) if check}
+        operations.append(UpdateOne(
+            {"_id": visit["_id"]},
+            {"$set": {"geofence": geofence, **visit_geofence_fields(check_in, check_out)}}
+        ))
+
+    if operations:
+        await db.rep_visits.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+async def backfill_visit_geofence(force: bool = False):
+    """حساب حكم السياج لكل زيارة سُجل دخولها"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        loaded = await clinic_geo_index.load(db)
+        print(f"📍 {loaded} clinics loaded")
+
+        query = {"check_in_location.latitude": {"$ne": None}}
+        if not force:
+            query["geofence_verdict"] = {"$exists": False}
+
+        processed = 0
+        chunk = []
+        async for visit in db.rep_visits.find(query, VISIT_PROJECTION).batch_size(CHUNK_SIZE):
+            chunk.append(visit)
+            if len(chunk) >= CHUNK_SIZE:
+                processed += await _flush(db, chunk)
+                chunk = []
+                print(f"   ... {processed} visits")
+        processed += await _flush(db, chunk)
+
+        await ensure_geofence_indexes(db)
+        print(f"✅ Geofence verdict stored for {processed} visits")
+
+    except Exception as e:
+        print(f"❌ Error backfilling visit geofence: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_visit_geofence(force="--force" in sys.argv[1:]))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس زمن إحصائيات الأنشطة من العدادات - Activity stats benchmark
+Builds a year of synthetic hourly counter documents (the shape
+``record_activity`` maintains in ``activity_stats_hourly``) and times
+``get_activity_stats`` over them with an in-memory stand-in for the
+collection, i.e. the work /api/activities/stats does after the read. The cost
+depends on the number of hours, not on the number of activities logged.
+
+Usage: python scripts/benchmark_activity_stats.py [hours] [users] [activities_per_hour]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.activity_store import ACTIVITY_STATS_COLLECTION, HOUR_KEY_FORMAT, hour_bucket, get_activity_stats
+
+random.seed(48)
+ACTIONS = ["login", "logout", "visit_created", "clinic_registration", "payment_processed", "debt_created",
+           "invoice_created", "order_created", "user_created", "product_updated"]
+DEVICES = ["Desktop", "Mobile", "Tablet", "Unknown"]
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length=None):
+        return self.rows
+
+
+class _Collection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def find(self, query, projection=None):
+        return _Cursor(self.rows)
+
+
+def synthetic_buckets(hours: int, users: int, per_hour: int):
+    now = hour_bucket(datetime.utcnow())
+    buckets = []
+    for offset in range(hours):
+        hour = now - timedelta(hours=offset)
+        bucket = {"_id": hour.strftime(HOUR_KEY_FORMAT), "hour": hour, "total": per_hour,
+                  "actions": {}, "users": {}, "devices": {}}
+        for _ in range(per_hour):
+            for dimension, key in (("actions", random.choice(ACTIONS)),
+                                   ("users", f"user {random.randrange(users)}"),
+                                   ("devices", random.choice(DEVICES))):
+                bucket[dimension][key] = bucket[dimension].get(key, 0) + 1
+        buckets.append(bucket)
+    return buckets
+
+
+async def run(hours: int, users: int, per_hour: int):
+    buckets = synthetic_buckets(hours, users, per_hour)
+    db = {ACTIVITY_STATS_COLLECTION: _Collection(buckets)}
+    print(f"{hours} hourly buckets = {hours * per_hour:,} activities, {users} users")
+
+    timings = []
+    for _ in range(5):
+        started = time.perf_counter()
+        stats = await get_activity_stats(db)
+        timings.append(time.perf_counter() - started)
+    print(f"stats: best {min(timings) * 1000:.1f} ms, total {stats['total_activities']:,}, "
+          f"24h {stats['recent_activities_24h']:,}, top user {stats['users'][0]}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(run(
+        int(args[0]) if args else 24 * 365,
+        int(args[1]) if len(args) > 1 else 300,
+        int(args[2]) if len(args) > 2 else 200,
+    ))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس زمن تقييم صحة العملاء - Client health scoring benchmark
+Builds N synthetic client analytics and compares scoring them one at a time
+(``CRMService._calculate_health_score`` + ``_generate_recommendations``, the
+per-client path) with scoring all of them as NumPy columns, the way the
+nightly batch does per chunk. Database reads are not included.
+
+Usage: python scripts/benchmark_client_health.py [clients]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from models.crm_models import ClientAnalytics
+from services.crm_service import (
+    CRMService, attention_priorities, client_health_fields, health_columns, health_risk_flags, health_scores
+)
+
+random.seed(46)
+
+
+def synthetic_analytics(count: int):
+    rows = []
+    for index in range(count):
+        orders = random.choice([0, 0, 1, 3, 7, 12, 30])
+        value = orders * random.uniform(100, 1500)
+        rows.append(ClientAnalytics(
+            client_id=f"clinic-{index}",
+            client_name=f"Clinic {index}",
+            days_since_last_visit=random.choice([None, random.randint(0, 120)]),
+            visit_success_rate=random.uniform(0, 100),
+            total_orders=orders,
+            total_order_value=value,
+            average_order_value=value / orders if orders else 0.0,
+            interactions_this_month=random.choice([0, 1, 4]),
+            orders_this_month=random.choice([0, 1]),
+        ))
+    return rows
+
+
+def run(count: int):
+    rows = synthetic_analytics(count)
+    service = CRMService(None)
+
+    started = time.perf_counter()
+    per_client = [(service._calculate_health_score(row), service._generate_recommendations(row)) for row in rows]
+    per_client_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    columns = health_columns(rows)
+    columns_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scores = health_scores(columns)
+    flags = health_risk_flags(columns)
+    priorities = attention_priorities(scores)
+    now = datetime.utcnow()
+    fields = [client_health_fields(scores, flags, priorities, index, now) for index in range(count)]
+    batch_seconds = time.perf_counter() - started
+
+    mismatches = sum(
+        1 for (score, recommendations), field in zip(per_client, fields)
+        if round(score, 1) != field["health_score"] or recommendations != field["recommendations"]
+    )
+    print(f"{count} clients")
+    print(f"per client: {per_client_seconds * 1000:.1f} ms ({per_client_seconds / count * 1e6:.1f} µs/client)")
+    print(f"batch:      {batch_seconds * 1000:.1f} ms scoring + update documents "
+          f"({batch_seconds / count * 1e6:.1f} µs/client); "
+          f"columns from models {columns_seconds * 1000:.1f} ms (the batch job builds them from aggregations)")
+    print(f"mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(int(args[0]) if args else 100000)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس أداء تصيير كشوف الحساب - Document rendering benchmark
+Builds N synthetic clinic statements (the payload shape ``load_clinic_statements``
+returns; 8 open debts and 5 recent payments each) and times, per batch:
+
+  * per call     - one document per request: templates read and compiled again
+                   for every statement, as the per-debt print endpoints did
+  * cached       - compiled templates, whole batch rendered inline
+  * streamed     - ``stream_documents`` with the default policy: inline chunks
+                   yielding to the event loop (one worker or a small batch)
+  * pool         - the same with every chunk sent to the process pool and
+                   streamed in order (pool already warm, as in a running server)
+  * pdf          - the merged PDF, only when WeasyPrint is installed
+
+Usage: python scripts/benchmark_document_render.py [count] [--workers N]
+       python scripts/benchmark_document_render.py 500 --workers 4
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.document_render_service as render_service
+from services.document_render_service import (
+    PDF_RENDERING_AVAILABLE, compiled_template, document_head, document_tail,
+    render_html_sections, render_pdf, stream_documents, shutdown_render_executor
+)
+
+RUNS = 3
+AS_OF = datetime(2025, 1, 1)
+
+
+def synthetic_statements(count: int):
+    """كشوف عشوائية ثابتة: 8 ديون مفتوحة و5 مدفوعات لكل عيادة"""
+    statements = []
+    for index in range(count):
+        debts = [
+            {
+                "debt_number": f"DEBT-2024-{index:04d}{line}",
+                "created_at": AS_OF - timedelta(days=30 + 11 * line),
+                "due_date": AS_OF - timedelta(days=11 * line - 20),
+                "days_overdue": max(0, 11 * line - 20),
+                "original": 1500.0 + 250 * line,
+                "paid": 300.0 * (line % 3),
+                "outstanding": 1500.0 + 250 * line - 300.0 * (line % 3),
+            }
+            for line in range(8)
+        ]
+        payments = [
+            {
+                "payment_date": AS_OF - timedelta(days=7 * line),
+                "payment_method": "cash",
+                "reference": f"RC-{index}-{line}",
+                "amount": 300.0,
+            }
+            for line in range(5)
+        ]
+        statements.append({
+            "statement_number": f"ST-20250101-{index:08d}",
+            "as_of": AS_OF,
+            "clinic": {
+                "name": f"عيادة الشفاء {index}",
+                "doctor_name": f"د. أحمد {index}",
+                "address": "شارع التحرير، الدقي، الجيزة",
+                "phone": "+20 100 000 0000",
+            },
+            "rep_name": "مندوب المنطقة",
+            "debts": debts,
+            "payments": payments,
+            "generated_by": "benchmark",
+            "generated_at": "2025-01-01 08:00",
+        })
+    return statements
+
+
+def per_call(statements):
+    """مستند واحد لكل طلب مع ترجمة القوالب في كل مرة"""
+    total = 0
+    for statement in statements:
+        compiled_template.cache_clear()
+        total += len(document_head("statement") + render_html_sections("statement", [statement]) + document_tail())
+    return total
+
+
+def cached(statements):
+    return len(document_head("statements") + render_html_sections("statement", statements) + document_tail())
+
+
+async def streamed(statements):
+    total = 0
+    async for part in stream_documents("statement", statements, "html", title="statements"):
+        total += len(part)
+    return total
+
+
+def _time(function, runs: int = RUNS):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def run(count: int):
+    statements = synthetic_statements(count)
+    print(f"{count} statements, {render_service.RENDER_WORKERS} render workers, chunk {render_service.RENDER_CHUNK_SIZE}")
+    print(f"{'mode':>10} {'seconds':>9} {'docs/s':>9} {'size MB':>8}")
+
+    def report(mode, seconds, size):
+        print(f"{mode:>10} {seconds:9.3f} {count / seconds:9.0f} {size / 1e6:8.2f}")
+
+    report("per call", *_time(lambda: per_call(statements)))
+    report("cached", *_time(lambda: cached(statements)))
+
+    report("streamed", *_time(lambda: asyncio.run(streamed(statements))))
+
+    # كل الدفعات إلى مجمع بعدد العمليات المطلوب؛ تسخينه أولاً (بدء العمليات وترجمة القوالب فيها)
+    workers, inline_limit = render_service.RENDER_WORKERS, render_service.INLINE_RENDER_LIMIT
+    render_service.RENDER_WORKERS, render_service.INLINE_RENDER_LIMIT = max(workers, 2), 0
+    render_service._executor = ProcessPoolExecutor(max_workers=workers)
+    asyncio.run(streamed(statements[:render_service.RENDER_CHUNK_SIZE * workers]))
+    report("pool", *_time(lambda: asyncio.run(streamed(statements))))
+    render_service.RENDER_WORKERS, render_service.INLINE_RENDER_LIMIT = workers, inline_limit
+
+    if PDF_RENDERING_AVAILABLE:
+        report("pdf", *_time(lambda: len(render_pdf("statement", statements, "statements")), runs=1))
+    else:
+        print(f"{'pdf':>10}   skipped (WeasyPrint not installed)")
+
+    shutdown_render_executor()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if "--workers" in args:
+        position = args.index("--workers")
+        render_service.RENDER_WORKERS = int(args[position + 1])
+        del args[position:position + 2]
+    run(int(args[0]) if args else 500)
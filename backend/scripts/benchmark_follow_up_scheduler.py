@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس أداء طابور تذكيرات المتابعة - Follow-up reminder queue benchmark
+Seeds N follow-up tasks (default 50,000; 1% due, the rest in the future or
+already sent) into a scratch database on a LOCAL MongoDB, then:
+  1. prints the plan of the claim query (index used, keys/documents examined),
+  2. times claiming every due reminder with W concurrent workers,
+  3. checks no reminder was claimed twice.
+Notifications are not created - this measures the queue only. The scratch
+database is dropped at the end.
+
+Usage: python scripts/benchmark_follow_up_scheduler.py [tasks] [workers]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.follow_up_scheduler import claim_due_reminder, ensure_follow_up_queue_indexes
+
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+SCRATCH_DB = "benchmark_follow_up_scheduler"
+
+random.seed(47)
+
+
+def synthetic_tasks(count: int, now: datetime):
+    tasks = []
+    for index in range(count):
+        roll = random.random()
+        if roll < 0.01:
+            remind_at, status = now - timedelta(minutes=random.randint(1, 600)), "scheduled"
+        elif roll < 0.6:
+            remind_at, status = now + timedelta(minutes=random.randint(1, 60 * 24 * 30)), "scheduled"
+        else:
+            remind_at, status = now - timedelta(days=random.randint(1, 365)), "sent"
+        tasks.append({
+            "id": f"task-{index}", "client_id": f"clinic-{index % 5000}", "assigned_to": f"rep-{index % 300}",
+            "title": "متابعة", "priority": "medium", "status": "pending",
+            "due_date": remind_at, "remind_at": remind_at, "reminder_status": status, "reminder_attempts": 0,
+        })
+    return tasks
+
+
+async def drain(db, worker_id: str, now: datetime, claimed: list, timings: list):
+    while True:
+        started = time.perf_counter()
+        task = await claim_due_reminder(db, worker_id, now)
+        timings.append(time.perf_counter() - started)
+        if task is None:
+            return
+        claimed.append(task["id"])
+
+
+async def run(count: int, workers: int):
+    if urlparse(mongo_url).hostname not in ("localhost", "127.0.0.1", "::1"):
+        sys.exit(f"refusing to run against non-local MongoDB: {mongo_url}")
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[SCRATCH_DB]
+    try:
+        await db.follow_up_tasks.drop()
+        now = datetime.utcnow()
+        tasks = synthetic_tasks(count, now)
+        await db.follow_up_tasks.insert_many(tasks)
+        await ensure_follow_up_queue_indexes(db)
+        due = sum(1 for task in tasks if task["reminder_status"] == "scheduled" and task["remind_at"] <= now)
+        print(f"{count} tasks, {due} due")
+
+        plan = await db.command({
+            "explain": {
+                "findAndModify": "follow_up_tasks",
+                "query": {"reminder_status": "scheduled", "remind_at": {"$lte": now}},
+                "sort": {"remind_at": 1},
+                "update": {"$set": {"lease_owner": "explain"}},
+            },
+            "verbosity": "executionStats",
+        })
+        stats = plan["executionStats"]
+        stage = plan["queryPlanner"]["winningPlan"]
+        while "inputStage" in stage and stage.get("stage") != "IXSCAN":
+            stage = stage["inputStage"]
+        print(f"claim plan: {stage.get('stage')} {stage.get('indexName', '')}, "
+              f"keys examined {stats['totalKeysExamined']}, docs examined {stats['totalDocsExamined']}")
+
+        claimed, timings = [], []
+        started = time.perf_counter()
+        await asyncio.gather(*(drain(db, f"worker-{index}", now, claimed, timings) for index in range(workers)))
+        elapsed = time.perf_counter() - started
+        timings.sort()
+        print(f"{workers} workers claimed {len(claimed)} reminders in {elapsed * 1000:.0f} ms "
+              f"(median claim {statistics.median(timings) * 1000:.2f} ms, p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms)")
+        print(f"duplicates: {len(claimed) - len(set(claimed))}, missed: {due - len(set(claimed))}")
+    finally:
+        await client.drop_database(SCRATCH_DB)
+        client.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(run(int(args[0]) if args else 50000, int(args[1]) if len(args) > 1 else 4))
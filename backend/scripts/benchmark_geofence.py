@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس زمن التحقق من موقع تسجيل الدخول - Check-in geofence benchmark
+Fills the in-memory clinic index with N synthetic clinics around Cairo (both
+GeoJSON and legacy coordinate fields) and times ``check_geofence`` for random
+check-ins, i.e. the work added to POST /visits/check-in when the clinic is
+in the index (the normal case after the startup load).
+
+Usage: python scripts/benchmark_geofence.py [clinics] [checks]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.geofence_service import clinic_geo_index, check_geofence
+
+random.seed(43)
+CAIRO = (30.0444, 31.2357)
+
+
+def synthetic_clinics(count: int):
+    clinics = []
+    for index in range(count):
+        latitude = CAIRO[0] + random.uniform(-0.3, 0.3)
+        longitude = CAIRO[1] + random.uniform(-0.3, 0.3)
+        if index % 2:
+            clinics.append(({"id": f"clinic-{index}", "clinic_latitude": latitude, "clinic_longitude": longitude}, "clinics"))
+        else:
+            clinics.append((
+                {"id": f"clinic-{index}", "location": {"type": "Point", "coordinates": [longitude, latitude]}},
+                "enhanced_clinics"
+            ))
+    return clinics
+
+
+async def run(clinic_count: int, checks: int):
+    start = time.perf_counter()
+    loaded = clinic_geo_index.replace_all(synthetic_clinics(clinic_count))
+    print(f"index: {loaded} clinics built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    timings = []
+    verdicts = {}
+    for _ in range(checks):
+        clinic_id = f"clinic-{random.randrange(clinic_count)}"
+        latitude = CAIRO[0] + random.uniform(-0.3, 0.3)
+        longitude = CAIRO[1] + random.uniform(-0.3, 0.3)
+        started = time.perf_counter()
+        # قاعدة البيانات لا تُستخدم: كل العيادات موجودة في الفهرس
+        result = await check_geofence(None, clinic_id, latitude, longitude)
+        timings.append(time.perf_counter() - started)
+        verdicts[result["verdict"]] = verdicts.get(result["verdict"], 0) + 1
+
+    timings.sort()
+    print(f"{checks} check-ins: median {statistics.median(timings) * 1e6:.1f} µs, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f} µs, max {timings[-1] * 1e6:.1f} µs")
+    print(f"verdicts: {verdicts}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(run(int(args[0]) if args else 20000, int(args[1]) if len(args) > 1 else 100000))
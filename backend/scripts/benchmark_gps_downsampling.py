@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس أداء تبسيط مسارات GPS - GPS track downsampling benchmark
+Builds one working day of synthetic rep tracks (a fix every 10 seconds for
+10 hours: drives between clinics with GPS jitter and stops at each visit)
+and times, for the whole team:
+
+  * bucket       - one point per time bucket, as the ``$group`` stage of
+                   ``get_tracks(bucket_seconds=...)`` keeps inside MongoDB
+  * simplify     - ``simplify_track`` (Douglas-Peucker) at several tolerances
+  * distance     - ``track_distance_km`` on raw and simplified tracks
+  * analytics    - ``analyze_track`` (movement classes, stops, dwell) per rep-day
+
+Usage: python scripts/benchmark_gps_downsampling.py [reps]
+       python scripts/benchmark_gps_downsampling.py 400
+"""
+
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.gps_track_service import simplify_track, track_distance_km
+from services.gps_analytics_service import analyze_track
+
+RUNS = 3
+FIX_INTERVAL_S = 10
+DAY_HOURS = 10
+TOLERANCES_M = (5.0, 15.0, 50.0)
+BUCKETS_S = (30, 60)
+
+
+def synthetic_track(rng: np.random.Generator) -> np.ndarray:
+    """مسار يوم عمل: تنقل بين 12 عيادة مع توقف عند كل زيارة وتشويش GPS"""
+    count = DAY_HOURS * 3600 // FIX_INTERVAL_S
+    stops = np.cumsum(rng.uniform(-0.02, 0.02, size=(13, 2)), axis=0) + (30.05, 31.23)
+    segment = count // 12
+    points = []
+    for leg in range(12):
+        moving = segment // 2
+        fraction = np.linspace(0.0, 1.0, moving)[:, None]
+        points.append(stops[leg] + fraction * (stops[leg + 1] - stops[leg]))
+        points.append(np.repeat(stops[leg + 1][None, :], segment - moving, axis=0))
+    coordinates = np.concatenate(points)
+    coordinates += rng.normal(0.0, 0.00004, size=coordinates.shape)  # ~4 m
+    timestamps = 1_735_718_400_000 + np.arange(len(coordinates)) * FIX_INTERVAL_S * 1000
+    return np.column_stack((timestamps, coordinates))
+
+
+def bucket_track(track: np.ndarray, bucket_seconds: int) -> np.ndarray:
+    """أول نقطة في كل فترة - the same reduction as the Mongo-side $group/$first"""
+    buckets = np.floor_divide(track[:, 0], bucket_seconds * 1000)
+    first = np.concatenate(([True], np.diff(buckets) > 0))
+    return track[first]
+
+
+def _time(function, runs: int = RUNS):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def run(reps: int):
+    rng = np.random.default_rng(41)
+    tracks = [synthetic_track(rng) for _ in range(reps)]
+    raw_points = sum(len(track) for track in tracks)
+    raw_km = sum(track_distance_km(track) for track in tracks)
+    print(f"{reps} reps, {raw_points} points ({raw_points // reps} per rep), raw distance {raw_km:,.0f} km")
+    print(f"{'mode':>16} {'ms':>9} {'points':>9} {'kept %':>7} {'km':>9}")
+
+    def report(mode, seconds, kept):
+        points = sum(len(track) for track in kept)
+        km = sum(track_distance_km(track) for track in kept)
+        print(f"{mode:>16} {seconds * 1000:9.1f} {points:9d} {100 * points / raw_points:7.2f} {km:9,.0f}")
+
+    for bucket_seconds in BUCKETS_S:
+        report(f"bucket {bucket_seconds}s", *_time(lambda: [bucket_track(t, bucket_seconds) for t in tracks]))
+    for tolerance in TOLERANCES_M:
+        report(f"simplify {tolerance:g}m", *_time(lambda: [simplify_track(t, tolerance) for t in tracks]))
+
+    bucketed = [bucket_track(track, BUCKETS_S[0]) for track in tracks]
+    report("bucket+simplify", *_time(lambda: [simplify_track(t, TOLERANCES_M[1]) for t in bucketed]))
+
+    seconds, _ = _time(lambda: [track_distance_km(track) for track in tracks])
+    print(f"{'distance (raw)':>16} {seconds * 1000:9.1f}")
+
+    seconds, analytics = _time(lambda: [analyze_track(track) for track in tracks])
+    stops = sum(len(result["stops"]) for result in analytics)
+    print(f"{'analytics':>16} {seconds * 1000:9.1f} {stops:9d} stops, {seconds * 1000 / reps:.2f} ms per rep-day")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس زمن تسجيل الدخول مع طابور التدقيق - Login audit benchmark
+Simulates a morning login spike against an in-memory stand-in for the
+collections that adds a fixed round-trip latency to every call, and compares
+the audit work the login handler used to await (insert, find_one verify,
+activity writes, two count_documents) with ``LoginAuditPipeline.submit``
+plus the background writer's bulk writes.
+
+Usage: python scripts/benchmark_login_audit.py [logins] [round_trip_ms]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.activity_store import record_activity
+from services.login_audit_service import LoginAuditPipeline, build_login_event
+
+
+class _Collection:
+    def __init__(self, db):
+        self.db = db
+
+    async def _round_trip(self, *args, **kwargs):
+        self.db.round_trips += 1
+        await asyncio.sleep(self.db.latency)
+
+    insert_one = insert_many = bulk_write = update_one = find_one = count_documents = _round_trip
+
+
+class _Database(dict):
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+        self.round_trips = 0
+
+    def __missing__(self, name):
+        return self.setdefault(name, _Collection(self))
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+def user(i):
+    return {"id": f"user-{i}", "username": f"rep{i}", "full_name": f"مندوب {i}", "role": "medical_rep"}
+
+
+async def previous_login_audit(db, user_info):
+    """ما كان مسار الدخول ينتظره قبل إرجاع الرمز"""
+    event = build_login_event(user_info, {"city": "Cairo", "country": "Egypt"}, "Mobile", "10.0.0.1")
+    await db.login_logs.insert_one(event["login_log"])
+    await db.login_logs.find_one({"id": event["login_log"]["id"]})
+    await record_activity(db, event["activity"])
+    await db.login_logs.count_documents({})
+    await db.login_logs.count_documents({"username": user_info["username"]})
+
+
+async def run(logins: int, round_trip_ms: float):
+    latency = round_trip_ms / 1000
+    print(f"{logins} concurrent logins, {round_trip_ms} ms per round trip")
+
+    db = _Database(latency)
+    started = time.perf_counter()
+    await asyncio.gather(*(previous_login_audit(db, user(i)) for i in range(logins)))
+    elapsed = time.perf_counter() - started
+    print(f"awaited audit:  {elapsed * 1000:8.1f} ms for the spike, {db.round_trips:6,} round trips")
+
+    db = _Database(latency)
+    pipeline = LoginAuditPipeline(db)
+    pipeline.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(pipeline.submit(user(i), {"city": "Cairo", "country": "Egypt"}, "Mobile", "10.0.0.1")
+                           for i in range(logins)))
+    elapsed = time.perf_counter() - started
+    await pipeline.stop()
+    print(f"queued audit:   {elapsed * 1000:8.1f} ms in the login path, {db.round_trips:6,} round trips (background)")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(run(
+        int(args[0]) if args else 2000,
+        float(args[1]) if len(args) > 1 else 2.0,
+    ))
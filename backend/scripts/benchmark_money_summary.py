@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس أداء ملخص المدفوعات قبل/بعد Decimal128 - Money summary benchmark
+Seeds a scratch database with N payment rows twice — once with amounts stored
+the legacy way (numeric strings, summed via $toDouble and rebuilt with
+Decimal(str(...))) and once as Decimal128 (native $sum) — and times the
+payments part of ``generate_financial_summary`` for a date range, reporting
+latency and whether the total is exact.
+
+Needs a reachable MongoDB (MONGO_URL). The scratch database is dropped at the end.
+
+Usage: python scripts/benchmark_money_summary.py [rows] [runs]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from services.money_codec import MONEY_TYPE_REGISTRY, to_decimal
+
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+BENCH_DB = "benchmark_money_summary"
+BATCH = 20000
+
+random.seed(42)
+NOW = datetime.utcnow()
+
+
+def _payment(amount: Decimal, legacy: bool):
+    return {
+        "amount": {"amount": str(amount) if legacy else amount, "currency": "EGP"},
+        "clinic_id": f"clinic-{random.randint(1, 2000)}",
+        "created_at": NOW - timedelta(minutes=random.randint(0, 365 * 24 * 60)),
+    }
+
+
+async def _seed(collection, amounts, legacy: bool):
+    await collection.drop()
+    for start in range(0, len(amounts), BATCH):
+        await collection.insert_many(
+            [_payment(amount, legacy) for amount in amounts[start:start + BATCH]], ordered=False
+        )
+    await collection.create_index([("created_at", 1)])
+
+
+async def _time(coro_factory, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await coro_factory()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[-1], result
+
+
+async def run(rows: int = 1_000_000, runs: int = 5):
+    client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
+    db = client[BENCH_DB]
+    try:
+        amounts = [Decimal(random.randint(100, 5_000_000)) / 100 for _ in range(rows)]
+        exact_total = sum(amounts, Decimal("0.00"))
+        date_match = {"$match": {"created_at": {"$gte": NOW - timedelta(days=365), "$lte": NOW}}}
+
+        print(f"📊 Seeding {rows:,} payments per layout ...")
+        await _seed(db.payments_legacy, amounts, legacy=True)
+        await _seed(db.payments_decimal, amounts, legacy=False)
+
+        async def legacy_summary():
+            rows_ = await db.payments_legacy.aggregate([
+                date_match,
+                {"$group": {"_id": None, "total_count": {"$sum": 1},
+                            "total_amount": {"$sum": {"$toDouble": "$amount.amount"}}}}
+            ]).to_list(1)
+            return Decimal(str(rows_[0]["total_amount"]))
+
+        async def decimal_summary():
+            rows_ = await db.payments_decimal.aggregate([
+                date_match,
+                {"$group": {"_id": None, "total_count": {"$sum": 1},
+                            "total_amount": {"$sum": "$amount.amount"}}}
+            ]).to_list(1)
+            return to_decimal(rows_[0]["total_amount"])
+
+        print(f"{'layout':28} {'median ms':>10} {'max ms':>10}  total (exact = {exact_total})")
+        for name, factory in (("string + $toDouble", legacy_summary), ("Decimal128 native $sum", decimal_summary)):
+            median, worst, total = await _time(factory, runs)
+            exact = "exact" if total == exact_total else f"off by {total - exact_total}"
+            print(f"{name:28} {median:10.1f} {worst:10.1f}  {total} ({exact})")
+
+    finally:
+        await client.drop_database(BENCH_DB)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    ))
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس أداء خط الاستجابات - Response pipeline benchmark
+Compares the default FastAPI path (jsonable_encoder + json.dumps) with the
+orjson FastJSONResponse path, and reports bytes on the wire raw / gzip / brotli
+for synthetic payloads shaped like the 10 heaviest list endpoints.
+
+Usage: python scripts/benchmark_response_pipeline.py [scale]
+"""
+
+import gzip
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from services.response_service import render_json, BROTLI_AVAILABLE
+
+if BROTLI_AVAILABLE:
+    import brotli
+
+random.seed(42)
+NOW = datetime.utcnow()
+
+
+def _ts(days: int = 365) -> datetime:
+    return NOW - timedelta(days=random.randint(0, days), seconds=random.randint(0, 86400))
+
+
+def clinic_row(_):
+    return {
+        "id": str(uuid.uuid4()), "name": f"عيادة {random.randint(1, 9999)}",
+        "clinic_name": "عيادة", "doctor_name": "د. أحمد المصري", "phone": "01000000000",
+        "email": "clinic@example.com", "address": "شارع التحرير، القاهرة",
+        "classification": "class_a", "credit_classification": "green", "is_active": True,
+        "status": "active", "line_id": str(uuid.uuid4()), "area_id": str(uuid.uuid4()),
+        "clinic_latitude": 30.0 + random.random(), "clinic_longitude": 31.0 + random.random(),
+        "created_at": _ts().isoformat(), "updated_at": _ts().isoformat(),
+        "registered_by": "rep", "registration_number": "CL-20240101-ABCDEF12",
+    }
+
+
+def debt_row(_):
+    original = Decimal(random.randint(100, 50000)) / 100
+    return {
+        "id": str(uuid.uuid4()), "debt_number": f"DBT-{random.randint(1, 999999):06d}",
+        "clinic_id": str(uuid.uuid4()), "clinic_name": "عيادة النور",
+        "original_amount": original, "paid_amount": Decimal("0.00"), "remaining_amount": original,
+        "status": random.choice(["outstanding", "partially_paid", "overdue"]),
+        "due_date": _ts(90), "created_at": _ts(), "assigned_to": str(uuid.uuid4()),
+        "payment_history": [
+            {"amount": Decimal("10.00"), "payment_date": _ts(), "payment_method": "cash"}
+            for _ in range(random.randint(0, 4))
+        ],
+    }
+
+
+def payment_row(_):
+    return {
+        "id": str(uuid.uuid4()), "debt_id": str(uuid.uuid4()), "clinic_id": str(uuid.uuid4()),
+        "clinic_name": "عيادة الشفاء", "payment_amount": round(random.uniform(10, 5000), 2),
+        "payment_method": "cash", "payment_date": _ts().isoformat(), "payment_notes": "",
+        "processed_by": str(uuid.uuid4()), "processor_name": "محاسب", "created_at": _ts().isoformat(),
+    }
+
+
+def activity_row(_):
+    return {
+        "id": str(uuid.uuid4()), "activity_type": "visit_created", "description": "إنشاء زيارة جديدة",
+        "user_id": str(uuid.uuid4()), "user_name": "مندوب", "user_role": "medical_rep",
+        "ip_address": "10.0.0.1", "location": "Cairo, Egypt", "device_info": "Chrome on Android",
+        "geolocation": {"latitude": 30.04, "longitude": 31.23, "accuracy": 12.5},
+        "timestamp": _ts(30), "created_at": _ts(30),
+    }
+
+
+def visit_row(_):
+    return {
+        "id": str(uuid.uuid4()), "visit_number": "V-20240101-ABCDEF12", "clinic_id": str(uuid.uuid4()),
+        "clinic_name": "عيادة", "doctor_name": "د. سارة", "visit_type": "routine",
+        "scheduled_date": _ts(60).isoformat(), "visit_purpose": "متابعة", "visit_notes": "ملاحظات" * 5,
+        "assigned_to": str(uuid.uuid4()), "status": "completed", "created_at": _ts().isoformat(),
+        "representative_location": {"latitude": 30.1, "longitude": 31.2},
+    }
+
+
+def product_row(_):
+    return {
+        "id": str(uuid.uuid4()), "name": "بانادول 500 مجم", "code": "PAN500", "brand": "GSK",
+        "description": "مسكن للآلام وخافض للحرارة", "price": 15.5, "cost": 12.0, "unit": "علبة",
+        "stock_quantity": random.randint(0, 500), "minimum_stock": 20, "maximum_stock": 500,
+        "is_active": True, "created_at": _ts().isoformat(), "medical_category": "مسكنات الألم",
+        "requires_prescription": False, "stock_status": "good",
+    }
+
+
+def user_stats_row(_):
+    return {
+        "id": str(uuid.uuid4()), "username": "rep", "full_name": "مندوب مبيعات", "role": "medical_rep",
+        "email": "rep@example.com", "phone": "01000000000", "is_active": True,
+        "visits_count": 120, "visits_this_month": 14, "clinics_count": 30, "clinics_this_month": 2,
+        "sales_count": 40, "total_sales": 125000.5, "collections_count": 35, "total_collections": 99000.0,
+        "debts_count": 5, "total_debts": 26000.5, "activities_count": 900, "activities_today": 4,
+        "last_activity": _ts(2).isoformat(), "line_name": "الخط الأول", "area_name": "القاهرة",
+        "manager_name": "مدير", "status": "active",
+    }
+
+
+def invoice_row(_):
+    return {
+        "id": str(uuid.uuid4()), "invoice_number": f"INV-{random.randint(1, 999999):06d}",
+        "clinic_id": str(uuid.uuid4()), "clinic_name": "عيادة", "sales_rep_id": str(uuid.uuid4()),
+        "items": [
+            {"product_id": str(uuid.uuid4()), "product_name": "أوجمنتين", "quantity": 3,
+             "unit_price": Decimal("45.00"), "total_price": Decimal("135.00")}
+            for _ in range(random.randint(1, 6))
+        ],
+        "total_amount": Decimal("540.00"), "status": "confirmed", "issue_date": _ts(), "due_date": _ts(30),
+    }
+
+
+def login_log_row(_):
+    return {
+        "id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "username": "rep",
+        "full_name": "مندوب", "role": "medical_rep", "login_time": _ts(30).isoformat(),
+        "device_info": "Mozilla/5.0 (Linux; Android 13)", "ip_address": "10.0.0.1",
+        "geolocation": {"latitude": 30.0, "longitude": 31.0, "city": "Cairo", "country": "Egypt"},
+        "session_id": str(uuid.uuid4()), "login_method": "web_portal", "is_active_session": True,
+    }
+
+
+def analytics_payload(scale):
+    return {
+        "daily": [
+            {"date": (NOW - timedelta(days=i)).date(), "visits": random.randint(0, 500),
+             "orders": random.randint(0, 200), "revenue": Decimal(random.randint(0, 10**7)) / 100}
+            for i in range(365)
+        ],
+        "by_rep": [user_stats_row(i) for i in range(scale // 10)],
+        "by_area": {f"area-{i}": {"revenue": random.random() * 1e6, "visits": i} for i in range(50)},
+    }
+
+
+ENDPOINTS = [
+    ("GET /api/clinics", lambda n: [clinic_row(i) for i in range(n)]),
+    ("GET /api/debts", lambda n: {"debts": [debt_row(i) for i in range(n)]}),
+    ("GET /api/payments", lambda n: [payment_row(i) for i in range(n)]),
+    ("GET /api/activities", lambda n: {"activities": [activity_row(i) for i in range(n)]}),
+    ("GET /api/visits/", lambda n: {"success": True, "visits": [visit_row(i) for i in range(n)]}),
+    ("GET /api/products", lambda n: [product_row(i) for i in range(n // 4)]),
+    ("GET /api/enhanced-users/with-statistics", lambda n: {"users": [user_stats_row(i) for i in range(n // 5)]}),
+    ("GET /api/invoices", lambda n: {"invoices": [invoice_row(i) for i in range(n)]}),
+    ("GET /api/visits/login-logs", lambda n: {"login_logs": [login_log_row(i) for i in range(n)]}),
+    ("GET /api/analytics/dashboard", analytics_payload),
+]
+
+
+def _time(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def run(scale: int = 2000):
+    print(f"📊 Response pipeline benchmark (rows per list ≈ {scale}, best of 5)")
+    header = f"{'endpoint':42} {'default ms':>10} {'orjson ms':>10} {'speedup':>8} {'raw KB':>9} {'gzip KB':>9} {'br KB':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, factory in ENDPOINTS:
+        payload = factory(scale)
+        default_ms, body = _time(lambda: json.dumps(
+            jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8"))
+        orjson_ms, fast_body = _time(lambda: render_json(payload))
+        gzip_kb = len(gzip.compress(fast_body, compresslevel=6)) / 1024
+        br_kb = len(brotli.compress(fast_body, quality=4)) / 1024 if BROTLI_AVAILABLE else float("nan")
+        print(
+            f"{name:42} {default_ms:10.1f} {orjson_ms:10.1f} {default_ms / orjson_ms:7.1f}x "
+            f"{len(body) / 1024:9.0f} {gzip_kb:9.0f} {br_kb:9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
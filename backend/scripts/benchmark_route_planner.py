@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+⏱️ قياس أداء مخطط مسار الزيارات - Route planner benchmark
+Plans random rep days around Cairo (a share of stops with time windows and
+mixed priorities) and reports solve time, the distance saved against visiting
+the same scheduled clinics in input order, and how many stops did not fit the
+day (reported separately, they are not part of the distance comparison).
+
+Usage: python scripts/benchmark_route_planner.py [stops] [runs]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from services.route_planner import RoutePlanner
+
+random.seed(42)
+CAIRO = (30.0444, 31.2357)
+
+
+def random_day(stops: int):
+    day = []
+    for index in range(stops):
+        stop = {
+            "id": f"clinic-{index}",
+            "latitude": CAIRO[0] + random.uniform(-0.12, 0.12),
+            "longitude": CAIRO[1] + random.uniform(-0.12, 0.12),
+            "service_minutes": random.choice([5, 10, 15]),
+            "priority": random.choices(["high", "normal", "low"], weights=[2, 6, 2])[0],
+        }
+        if random.random() < 0.2:
+            opens = random.choice([9, 11, 13, 15]) * 60
+            stop["window_start"] = opens
+            stop["window_end"] = opens + 180
+        day.append(stop)
+    return day
+
+
+def run(stops: int = 50, runs: int = 200):
+    planner = RoutePlanner()
+    timings, savings, scheduled, dropped = [], [], [], []
+    for _ in range(runs):
+        day = random_day(stops)
+        start = time.perf_counter()
+        plan = planner.plan(day, start=CAIRO, day_start_minutes=8 * 60, day_end_minutes=20 * 60)
+        timings.append((time.perf_counter() - start) * 1000)
+        if plan["input_order_distance_km"] > 0:
+            savings.append(1 - plan["total_distance_km"] / plan["input_order_distance_km"])
+        scheduled.append(len(plan["route"]))
+        dropped.append(len(plan["unscheduled"]))
+
+    timings = np.array(timings)
+    print(f"📊 Route planner benchmark ({stops} stops, {runs} random days)")
+    print(f"   solve time  mean {timings.mean():.1f} ms | p95 {np.percentile(timings, 95):.1f} ms | max {timings.max():.1f} ms")
+    print(f"   distance saved vs same stops in input order  mean {np.mean(savings) * 100:.1f}%")
+    print(f"   stops scheduled  mean {np.mean(scheduled):.1f}/{stops} | dropped mean {np.mean(dropped):.1f}")
+
+
+if __name__ == "__main__":
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    )
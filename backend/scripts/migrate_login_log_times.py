@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+🕒 تحويل أوقات سجلات الدخول إلى تواريخ - Login log datetime migration
+Login logs written before the login analytics change store ``login_time`` as
+an ISO string, which range queries compare as text and the hourly analytics
+cannot bucket. This:
+  1. converts string ``login_time`` values to BSON dates (UTC), in chunks,
+  2. rebuilds the per-user hourly buckets behind /api/visits/login-analytics
+     from login_logs for every hour before the current one (the current hour
+     is left to live writes),
+  3. rebuilds the login_stats counters (total and per-user count/last login)
+     that the login audit writer only increments. Logins that arrive while
+     this step runs can be missed or counted twice; run it in a quiet period.
+Creates the indexes first. Safe to re-run.
+
+Usage: python scripts/migrate_login_log_times.py
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReplaceOne
+from dotenv import load_dotenv
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.activity_store import HOUR_KEY_FORMAT, hour_bucket, stat_key
+from services.login_audit_service import LOGIN_STATS_COLLECTION, LOGIN_TOTAL_KEY, login_user_key
+from services.login_analytics_service import (
+    LOGIN_HOURLY_COLLECTION, ensure_login_analytics_indexes, login_bucket_id, parse_login_time
+)
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+CHUNK_SIZE = 5000
+
+# حقول الموقع في سجل الدخول ← اسم التوزيع في مستند الساعة
+LOCATION_DIMENSIONS = {"city": "cities", "country": "countries"}
+
+
+async def _flush(db, chunk):
+    operations = []
+    for log in chunk:
+        login_time = parse_login_time(log["login_time"])
+        if login_time is not None:
+            operations.append(UpdateOne({"_id": log["_id"]}, {"$set": {"login_time": login_time}}))
+    if operations:
+        await db.login_logs.bulk_write(operations, ordered=False)
+    return len(operations), len(chunk) - len(operations)
+
+
+async def rebuild_login_buckets(db, before: datetime) -> int:
+    """إعادة بناء مستندات (مستخدم، ساعة) من login_logs (الساعات قبل ``before`` فقط)"""
+    match = {"$match": {"user_id": {"$ne": None}, "login_time": {"$type": "date", "$lt": before}}}
+    hour = {"$dateToString": {"format": "%Y-%m-%dT%H", "date": "$login_time"}}
+
+    buckets = {}
+    pipeline = [match, {"$group": {
+        "_id": {"user_id": "$user_id", "hour": hour},
+        "username": {"$first": "$username"},
+        "full_name": {"$first": "$full_name"},
+        "role": {"$first": "$role"},
+        "count": {"$sum": 1},
+        "first_login": {"$min": "$login_time"},
+        "last_login": {"$max": "$login_time"},
+    }}]
+    async for row in db.login_logs.aggregate(pipeline, allowDiskUse=True):
+        bucket_hour = datetime.strptime(row["_id"]["hour"], HOUR_KEY_FORMAT)
+        bucket_id = login_bucket_id(row["_id"]["user_id"], bucket_hour)
+        buckets[bucket_id] = {
+            "user_id": row["_id"]["user_id"], "username": row.get("username"), "full_name": row.get("full_name"),
+            "role": row.get("role"), "hour": bucket_hour, "count": row["count"],
+            "first_login": row["first_login"], "last_login": row["last_login"], "cities": {}, "countries": {},
+        }
+
+    for field, dimension in LOCATION_DIMENSIONS.items():
+        pipeline = [match, {"$group": {
+            "_id": {"user_id": "$user_id", "hour": hour, "key": {"$ifNull": [f"${field}", "Unknown"]}},
+            "count": {"$sum": 1},
+        }}]
+        async for row in db.login_logs.aggregate(pipeline, allowDiskUse=True):
+            bucket_id = login_bucket_id(row["_id"]["user_id"], datetime.strptime(row["_id"]["hour"], HOUR_KEY_FORMAT))
+            counts = buckets[bucket_id][dimension]
+            key = stat_key(row["_id"]["key"] or "Unknown")
+            counts[key] = counts.get(key, 0) + row["count"]
+
+    operations = [ReplaceOne({"_id": bucket_id}, bucket, upsert=True) for bucket_id, bucket in buckets.items()]
+    for start in range(0, len(operations), 1000):
+        await db[LOGIN_HOURLY_COLLECTION].bulk_write(operations[start:start + 1000], ordered=False)
+    return len(operations)
+
+
+async def rebuild_login_counters(db) -> int:
+    """إعادة بناء عدادات الدخول (الإجمالي ولكل مستخدم) من login_logs"""
+    pipeline = [
+        {"$match": {"username": {"$ne": None}}},
+        {"$group": {
+            "_id": "$username",
+            "count": {"$sum": 1},
+            "last_login": {"$max": {"$cond": [{"$eq": [{"$type": "$login_time"}, "date"]}, "$login_time", None]}},
+        }},
+    ]
+    total = 0
+    operations = []
+    async for row in db.login_logs.aggregate(pipeline, allowDiskUse=True):
+        total += row["count"]
+        operations.append(ReplaceOne(
+            {"_id": login_user_key(row["_id"])},
+            {"username": row["_id"], "count": row["count"], "last_login": row["last_login"]},
+            upsert=True
+        ))
+    # سجلات بلا اسم مستخدم تُحسب في الإجمالي فقط
+    total += await db.login_logs.count_documents({"username": None})
+    operations.append(ReplaceOne({"_id": LOGIN_TOTAL_KEY}, {"count": total}, upsert=True))
+    for start in range(0, len(operations), 1000):
+        await db[LOGIN_STATS_COLLECTION].bulk_write(operations[start:start + 1000], ordered=False)
+    return total
+
+
+async def migrate_login_log_times():
+    """تحويل login_time إلى تاريخ وإعادة بناء عدادات الدخول (بالساعة والإجمالية)"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        await ensure_login_analytics_indexes(db)
+        started_hour = hour_bucket(datetime.utcnow())
+
+        converted = skipped = 0
+        chunk = []
+        async for log in db.login_logs.find({"login_time": {"$type": "string"}}, {"login_time": 1}).batch_size(CHUNK_SIZE):
+            chunk.append(log)
+            if len(chunk) >= CHUNK_SIZE:
+                done, bad = await _flush(db, chunk)
+                converted, skipped = converted + done, skipped + bad
+                chunk = []
+                print(f"   ... {converted} login logs")
+        done, bad = await _flush(db, chunk)
+        converted, skipped = converted + done, skipped + bad
+        print(f"✅ Converted login_time to a date for {converted} login logs")
+        if skipped:
+            print(f"⚠️ {skipped} login logs have an unreadable login_time and were left as is")
+
+        buckets = await rebuild_login_buckets(db, started_hour)
+        print(f"✅ Rebuilt {buckets} hourly login buckets (before {started_hour.isoformat()})")
+
+        total = await rebuild_login_counters(db)
+        print(f"✅ Rebuilt login counters ({total} logins in total)")
+
+    except Exception as e:
+        print(f"❌ Error migrating login logs: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_login_log_times())
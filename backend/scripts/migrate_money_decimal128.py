@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+💰 تحويل المبالغ المالية إلى Decimal128 - Money storage migration
+Converts every ``MoneyAmount`` value ({amount, currency}) in invoices (including
+line items), debts, payments and financial_transactions to Decimal128, so
+reports can ``$sum`` natively and exactly instead of going through $toDouble.
+
+Runs server-side with pipeline updates, only touches documents that still hold
+non-Decimal128 amounts, and is recorded in ``schema_migrations``. Values that
+cannot be converted are left unchanged and counted in the report.
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from datetime import datetime
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.money_codec import (
+    MONEY_FIELDS, MONEY_TYPE_REGISTRY, money_migration_filter, money_migration_pipeline
+)
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+MIGRATION_ID = "money_decimal128_v1"
+
+
+async def migrate_money_decimal128(force: bool = False):
+    """تحويل حقول MoneyAmount إلى Decimal128"""
+    client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
+    db = client[db_name]
+
+    try:
+        applied = await db.schema_migrations.find_one({"id": MIGRATION_ID})
+        if applied and not force:
+            print(f"ℹ️ Migration {MIGRATION_ID} already applied at {applied.get('applied_at')}")
+            return
+
+        results = {}
+        for collection_name in MONEY_FIELDS:
+            collection = db[collection_name]
+            result = await collection.update_many(
+                money_migration_filter(collection_name),
+                money_migration_pipeline(collection_name)
+            )
+            # ما تبقى بغير Decimal128 = قيم غير قابلة للتحويل (نصوص تالفة مثلاً)
+            remaining = await collection.count_documents(money_migration_filter(collection_name))
+            results[collection_name] = {"converted": result.modified_count, "unconvertible": remaining}
+            print(f"✅ {collection_name}: converted {result.modified_count} documents, {remaining} left unconvertible")
+
+        await db.schema_migrations.update_one(
+            {"id": MIGRATION_ID},
+            {"$set": {"applied_at": datetime.utcnow(), "results": results}},
+            upsert=True
+        )
+        print(f"\n✅ Money migration completed: {MIGRATION_ID}")
+
+    except Exception as e:
+        print(f"❌ Error migrating money fields: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_money_decimal128(force="--force" in sys.argv))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+🧹 توحيد أسماء الحقول - One-time schema normalization migration
+Copies legacy field names (clinic_name, current_stock, category, ...) into the
+canonical fields read by the list endpoints and fills their defaults, so the
+handlers can return Mongo projections directly instead of per-row fallbacks.
+
+The migration is idempotent and runs entirely server-side with pipeline
+updates; it is recorded in ``schema_migrations`` once applied. Legacy fields
+are left in place for the older screens that still read them.
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from datetime import datetime
+
+# Load environment
+sys.path.append('/app/backend')
+load_dotenv('/app/backend/.env')
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+MIGRATION_ID = "normalize_schema_v1"
+
+
+def _coalesce(*fields, default=None):
+    """أول قيمة غير فارغة من الحقول - first non-empty value among fields"""
+    expression = default
+    for field in reversed(fields):
+        expression = {
+            "$cond": [
+                {"$in": [{"$ifNull": [f"${field}", None]}, [None, ""]]},
+                expression,
+                f"${field}"
+            ]
+        }
+    return expression
+
+
+def _string_or_none(field):
+    """القيمة فقط إذا كانت نصاً (الحقل location القديم قد يكون كائناً)"""
+    return {"$cond": [{"$eq": [{"$type": f"${field}"}, "string"]}, f"${field}", None]}
+
+
+CLINIC_NORMALIZATION = [
+    {"$set": {
+        "name": _coalesce("name", "clinic_name"),
+        "doctor_name": _coalesce("doctor_name", "owner_name", default="غير محدد"),
+        "phone": _coalesce("phone", "clinic_phone", default=""),
+        "email": _coalesce("email", "clinic_email", default=""),
+        "address": {"$ifNull": [
+            _coalesce("address"),
+            {"$ifNull": [_string_or_none("location"), "العنوان غير متوفر"]}
+        ]},
+        "classification": _coalesce("classification", default="class_b"),
+        "credit_classification": _coalesce("credit_classification", default="yellow"),
+        "is_active": {"$ifNull": ["$is_active", True]},
+        "status": _coalesce("status", default="active"),
+    }}
+]
+
+PRODUCT_NORMALIZATION = [
+    {"$set": {
+        "code": _coalesce("code", default={"$substrCP": [{"$ifNull": ["$id", ""]}, 0, 8]}),
+        "brand": _coalesce("brand", "category", default="Unknown"),
+        "description": {"$ifNull": ["$description", ""]},
+        "price": {"$ifNull": ["$price", 0]},
+        "cost": {"$ifNull": ["$cost", 0]},
+        "unit": _coalesce("unit", default="قطعة"),
+        "stock_quantity": {"$ifNull": ["$stock_quantity", {"$ifNull": ["$current_stock", 0]}]},
+        "minimum_stock": {"$ifNull": ["$minimum_stock", 10]},
+        "maximum_stock": {"$ifNull": ["$maximum_stock", 1000]},
+        "is_active": {"$ifNull": ["$is_active", True]},
+        "requires_prescription": {"$ifNull": ["$requires_prescription", False]},
+    }}
+]
+
+USER_NORMALIZATION = [
+    {"$set": {"is_active": {"$ifNull": ["$is_active", True]}}}
+]
+
+
+async def normalize_schema(force: bool = False):
+    """توحيد مخطط العيادات والمنتجات والمستخدمين"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        applied = await db.schema_migrations.find_one({"id": MIGRATION_ID})
+        if applied and not force:
+            print(f"ℹ️ Migration {MIGRATION_ID} already applied at {applied.get('applied_at')}")
+            return
+
+        results = {}
+        for collection_name, pipeline in (
+            ("clinics", CLINIC_NORMALIZATION),
+            ("products", PRODUCT_NORMALIZATION),
+            ("users", USER_NORMALIZATION),
+        ):
+            result = await db[collection_name].update_many({}, pipeline)
+            results[collection_name] = result.modified_count
+            print(f"✅ {collection_name}: normalized {result.modified_count} documents")
+
+        await db.schema_migrations.update_one(
+            {"id": MIGRATION_ID},
+            {"$set": {"applied_at": datetime.utcnow(), "modified": results}},
+            upsert=True
+        )
+        print(f"\n✅ Schema normalization completed: {MIGRATION_ID}")
+
+    except Exception as e:
+        print(f"❌ Error normalizing schema: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(normalize_schema(force="--force" in sys.argv))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+🏦 إعادة بناء الأرصدة الجارية للعيادات ولقطاتها - Clinic running balance tool
+Rebuilds ``clinic_balances`` from the source documents (invoices, debts with
+their ledger-posted payments, approved collections) and/or writes the daily
+``clinic_balance_snapshots``. Run a full rebuild once after deploying the
+running balance; schedule ``--snapshot`` daily (e.g. from cron).
+
+Usage:
+    python scripts/rebuild_clinic_balances.py                 # rebuild all + snapshot
+    python scripts/rebuild_clinic_balances.py --clinic ID ... # rebuild given clinics
+    python scripts/rebuild_clinic_balances.py --snapshot      # snapshot only
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from datetime import datetime
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.clinic_balance_service import (
+    ensure_clinic_balance_indexes, rebuild_clinic_balances, snapshot_clinic_balances
+)
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+MIGRATION_ID = "clinic_running_balance_v1"
+
+
+async def run(clinic_ids=None, snapshot_only: bool = False):
+    """إعادة البناء ثم أخذ لقطة اليوم"""
+    client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
+    db = client[db_name]
+
+    try:
+        await ensure_clinic_balance_indexes(db)
+
+        if not snapshot_only:
+            started = datetime.utcnow()
+            rebuilt = await rebuild_clinic_balances(db, clinic_ids)
+            print(f"✅ Rebuilt {rebuilt} clinic balances in {(datetime.utcnow() - started).total_seconds():.1f}s")
+            if not clinic_ids:
+                await db.schema_migrations.update_one(
+                    {"id": MIGRATION_ID},
+                    {"$set": {"applied_at": datetime.utcnow(), "clinics": rebuilt}},
+                    upsert=True
+                )
+
+        snapshots = await snapshot_clinic_balances(db)
+        print(f"✅ Snapshot written for {snapshots} clinics")
+
+    except Exception as e:
+        print(f"❌ Error rebuilding clinic balances: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    clinic_ids = args[args.index("--clinic") + 1:] if "--clinic" in args else None
+    asyncio.run(run(clinic_ids=clinic_ids, snapshot_only="--snapshot" in args))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+🧮 مطابقة عدادات إحصائيات الديون - Nightly debt statistics reconciliation
+Refreshes debt aging (days overdue / aging category, with their counter
+transitions), then recounts every debt and compares the result with the
+incremental ``debt_statistics`` counters. Mismatching counters are reported and
+replaced; every run is recorded in ``debt_statistics_reconciliations``. Run it
+once after deploying to seed the counters, then nightly (e.g. from cron).
+
+Usage:
+    python scripts/reconcile_debt_statistics.py               # aging + reconcile + repair
+    python scripts/reconcile_debt_statistics.py --check-only  # report mismatches only
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from datetime import datetime
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.debt_statistics_service import (
+    ensure_debt_statistics_indexes, refresh_debt_aging, reconcile_debt_statistics
+)
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+
+async def run(check_only: bool = False):
+    """تحديث التقادم ثم المطابقة"""
+    client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
+    db = client[db_name]
+
+    try:
+        await ensure_debt_statistics_indexes(db)
+        started = datetime.utcnow()
+
+        if not check_only:
+            aged = await refresh_debt_aging(db)
+            print(f"✅ Aging updated for {aged} debts")
+
+        report = await reconcile_debt_statistics(db, repair=not check_only)
+        print(f"✅ Checked {report['counters']} counters in {(datetime.utcnow() - started).total_seconds():.1f}s: "
+              f"{report['mismatches']} mismatched{' (repaired)' if report['repaired'] else ''}")
+        for mismatch in report["details"]:
+            print(f"   ⚠️ {mismatch['id']}: {', '.join(sorted(mismatch['fields']))}")
+
+    except Exception as e:
+        print(f"❌ Error reconciling debt statistics: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(run(check_only="--check-only" in sys.argv[1:]))
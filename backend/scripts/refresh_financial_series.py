@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+📈 تحديث السلاسل الزمنية المالية اليومية - Daily financial series refresh
+Recomputes the trailing days of ``financial_daily_series`` (new debt, collected
+and end-of-day outstanding per clinic, rep, area and company-wide) that
+``/api/financial/reports/collection-trends`` reads. Schedule it nightly (e.g.
+from cron) with the default short window; run it once with a long window after
+deploying to backfill history.
+
+Usage:
+    python scripts/refresh_financial_series.py              # last 3 days (nightly)
+    python scripts/refresh_financial_series.py --days 730   # backfill two years
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from datetime import datetime
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.financial_timeseries_service import ensure_financial_series_indexes, refresh_daily_series
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+
+async def run(days: int = 3):
+    """تحديث آخر ``days`` يوماً"""
+    client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
+    db = client[db_name]
+
+    try:
+        await ensure_financial_series_indexes(db)
+        started = datetime.utcnow()
+        written = await refresh_daily_series(db, days=days)
+        print(f"✅ Wrote {written} series points for the last {days} days "
+              f"in {(datetime.utcnow() - started).total_seconds():.1f}s")
+
+    except Exception as e:
+        print(f"❌ Error refreshing financial series: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    days = int(args[args.index("--days") + 1]) if "--days" in args else 3
+    asyncio.run(run(days=days))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+🩺 إعادة حساب صحة العملاء ليلياً - Nightly client health scoring
+Recomputes health_score, risk_flags, recommendations and attention_priority
+on every client profile in chunks of 1000 (three aggregations and one
+bulk_write per chunk), which ``/crm/dashboard`` and ``/crm/clients/search``
+sort and filter on. Schedule it nightly (e.g. from cron). Progress is saved
+after each chunk: an interrupted run resumes from the next clinic on the
+following invocation; ``--restart`` abandons it and starts over.
+
+Usage:
+    python scripts/score_client_health.py             # resume or start (nightly)
+    python scripts/score_client_health.py --restart   # start a fresh run
+"""
+
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from datetime import datetime
+
+# Load environment
+sys.path.append('/app/backend')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv('/app/backend/.env')
+
+from services.client_health_service import ensure_client_health_indexes, run_client_health_scoring
+
+# MongoDB connection
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+db_name = os.environ.get('DB_NAME', 'test_database')
+
+
+async def print_progress(run):
+    print(f"   ... {run['processed']}/{run['total']} clients ({run['progress_percent']}%)")
+
+
+async def run(restart: bool = False):
+    """تقييم كل ملفات العملاء"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    try:
+        await ensure_client_health_indexes(db)
+        started = datetime.utcnow()
+        result = await run_client_health_scoring(db, restart=restart, on_progress=print_progress)
+        if result is None:
+            print("⏳ Another health scoring run is in progress - nothing to do")
+            return
+        print(f"✅ Scored {result['processed']} clients (run {result['_id']}, attempt {result['attempts']}) "
+              f"in {(datetime.utcnow() - started).total_seconds():.1f}s")
+
+    except Exception as e:
+        print(f"❌ Error scoring client health: {e}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(run(restart="--restart" in sys.argv[1:]))
@@ -33,6 +33,7 @@ from routers.enhanced_activity_routes import router as enhanced_activity_router
 # from routers.professional_accounting_routes import router as professional_accounting_router
 from routers.invoice_management_routes import router as invoice_router
 from routers.debt_management_routes import router as debt_router
+from routers.gps_tracking_routes import router as gps_router
 
 # Import clinic routes from routes directory
 try:
@@ -44,11 +45,43 @@ except ImportError as e:
     print(f"⚠️ Enhanced routes not available: {e}")
     ENHANCED_ROUTES_AVAILABLE = False
 
+from services.projection_service import CLINIC_LIST_FIELDS, parse_fields_param, build_projection
+from services.response_service import FastJSONResponse, CompressionMiddleware
+from services.geo_service import to_geojson_point, ensure_geo_indexes, ensure_registration_log_indexes
+from services.payment_ledger_service import ensure_payment_ledger_indexes, DebtBalanceFields, post_debt_payment
+from services.aging_service import ensure_aging_snapshot_indexes
+from services.money_codec import MONEY_TYPE_REGISTRY
+from services.clinic_balance_service import ensure_clinic_balance_indexes, payment_balance_hook
+from services.unit_of_work import ensure_unit_of_work_indexes, replay_outbox
+from services.financial_timeseries_service import ensure_financial_series_indexes
+from services.document_render_service import shutdown_render_executor
+from services.idempotency_service import IdempotencyMiddleware, ensure_idempotency_indexes
+from services.gps_track_service import ensure_gps_track_collection
+from services.gps_analytics_service import ensure_gps_analytics_indexes
+from services.geofence_service import clinic_geo_index, ensure_geofence_indexes
+from services.crm_service import ensure_crm_search_indexes, ensure_client_analytics_indexes, invalidate_client_analytics
+from services.client_health_service import ensure_client_health_indexes
+from services.follow_up_scheduler import FollowUpScheduler, ensure_follow_up_queue_indexes
+from services.activity_store import record_activity, ensure_activity_storage_indexes
+from services.login_audit_service import LoginAuditPipeline, get_login_counts
+from services.login_analytics_service import ensure_login_analytics_indexes
+from services.debt_statistics_service import (
+    ensure_debt_statistics_indexes, payment_statistics_hook, get_debt_statistics
+)
+
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, type_registry=MONEY_TYPE_REGISTRY)
 db = client[os.environ.get('DB_NAME', 'test_database')]
 
+# حقول الرصيد في مستند الدين البسيط المستخدم في /api/payments/process
+PROCESS_PAYMENT_BALANCE_FIELDS = DebtBalanceFields(
+    paid_field="paid_amount",
+    remaining_field="remaining_amount",
+    settled_status="paid",
+    partial_status="partially_paid"
+)
+
 # JWT Configuration
 JWT_SECRET_KEY = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
@@ -58,7 +91,17 @@ JWT_EXPIRATION_HOURS = 24
 security = HTTPBearer()
 
 # Create FastAPI app
-app = FastAPI(title="Medical Management System API", version="2.0.0")
+app = FastAPI(
+    title="Medical Management System API",
+    version="2.0.0",
+    default_response_class=FastJSONResponse
+)
+
+# Idempotency-Key replay for payment, invoice and visit writes (inside compression: stores plain bodies)
+app.add_middleware(IdempotencyMiddleware, db=db, secret_key=JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+# Response compression - gzip/brotli for bodies above 1KB (clinic lists, analytics, debts)
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
 
 # CORS middleware
 app.add_middleware(
@@ -83,6 +126,7 @@ app.include_router(enhanced_activity_router)
 # app.include_router(professional_accounting_router)
 app.include_router(invoice_router)
 app.include_router(debt_router)
+app.include_router(gps_router)
 
 # Include enhanced routes if available
 if ENHANCED_ROUTES_AVAILABLE:
@@ -93,6 +137,85 @@ if ENHANCED_ROUTES_AVAILABLE:
 else:
     print("⚠️ Enhanced routes not included - using basic functionality")
 
+@app.on_event("startup")
+async def ensure_indexes():
+    """إنشاء الفهارس المطلوبة عند بدء التشغيل (العملية idempotent)"""
+    # كل مجموعة فهارس مستقلة: فشل إحداها (مثلاً بيانات قديمة) لا يمنع إنشاء البقية
+    for ensure in (
+        ensure_geo_indexes,
+        ensure_registration_log_indexes,
+        ensure_payment_ledger_indexes,
+        ensure_aging_snapshot_indexes,
+        ensure_clinic_balance_indexes,
+        ensure_unit_of_work_indexes,
+        ensure_financial_series_indexes,
+        ensure_debt_statistics_indexes,
+        ensure_idempotency_indexes,
+        ensure_gps_track_collection,
+        ensure_gps_analytics_indexes,
+        ensure_geofence_indexes,
+        ensure_crm_search_indexes,
+        ensure_client_analytics_indexes,
+        ensure_client_health_indexes,
+        ensure_follow_up_queue_indexes,
+        ensure_activity_storage_indexes,
+        ensure_login_analytics_indexes,
+    ):
+        try:
+            await ensure(db)
+        except Exception as e:
+            print(f"⚠️ تعذر إنشاء الفهارس ({ensure.__name__}): {e}")
+
+@app.on_event("startup")
+async def replay_unit_of_work_outbox():
+    """إكمال وحدات العمل المنقطعة (خادم MongoDB مستقل فقط)"""
+    try:
+        replayed = await replay_outbox(db)
+        if replayed:
+            print(f"♻️ تم إكمال {replayed} وحدة عمل منقطعة")
+    except Exception as e:
+        print(f"⚠️ تعذر إكمال وحدات العمل المنقطعة: {e}")
+
+@app.on_event("startup")
+async def load_clinic_geo_index():
+    """تحميل إحداثيات العيادات في الذاكرة للتحقق من مواقع تسجيل الدخول"""
+    try:
+        loaded = await clinic_geo_index.load(db)
+        print(f"📍 تم تحميل إحداثيات {loaded} عيادة")
+    except Exception as e:
+        print(f"⚠️ تعذر تحميل إحداثيات العيادات: {e}")
+
+follow_up_scheduler = FollowUpScheduler(db)
+
+@app.on_event("startup")
+async def start_follow_up_scheduler():
+    """جدولة تذكيرات مهام المتابعة (آمنة مع عدة عمليات للخادم)"""
+    if os.environ.get("FOLLOW_UP_SCHEDULER_ENABLED", "1") == "1":
+        follow_up_scheduler.start()
+        print(f"⏰ تم تشغيل جدولة تذكيرات المتابعة ({follow_up_scheduler.worker_id})")
+
+@app.on_event("shutdown")
+async def stop_render_workers():
+    """إيقاف عمليات تصيير المستندات"""
+    shutdown_render_executor()
+
+@app.on_event("shutdown")
+async def stop_follow_up_scheduler():
+    """إيقاف جدولة تذكيرات المتابعة"""
+    await follow_up_scheduler.stop()
+
+login_audit = LoginAuditPipeline(db)
+
+@app.on_event("startup")
+async def start_login_audit():
+    """كاتب سجلات الدخول في الخلفية"""
+    login_audit.start()
+
+@app.on_event("shutdown")
+async def stop_login_audit():
+    """كتابة ما تبقى في طابور سجلات الدخول"""
+    await login_audit.stop()
+
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
@@ -189,8 +312,8 @@ async def login(credentials: dict):
                 "role": admin_user["role"]
             }
             
-            # تسجيل عملية الدخول
-            await log_user_login(user_info, geolocation, device_info, ip_address)
+            # تسجيل عملية الدخول (طابور التدقيق - الكتابة في الخلفية)
+            await login_audit.submit(user_info, geolocation, device_info, ip_address)
             
             return {
                 "access_token": token,
@@ -217,8 +340,8 @@ async def login(credentials: dict):
                 "role": user["role"]
             }
             
-            # تسجيل عملية الدخول
-            await log_user_login(user_info, geolocation, device_info, ip_address)
+            # تسجيل عملية الدخول (طابور التدقيق - الكتابة في الخلفية)
+            await login_audit.submit(user_info, geolocation, device_info, ip_address)
             
             return {
                 "access_token": token,
@@ -231,100 +354,12 @@ async def login(credentials: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Login error: {str(e)}")
 
-async def log_user_login(user_info: dict, geolocation: dict = None, device_info: str = None, ip_address: str = None):
-    """تسجيل عملية دخول المستخدم مع الموقع الجغرافي"""
-    try:
-        login_log = {
-            "id": str(uuid.uuid4()),
-            "user_id": user_info["id"],
-            "username": user_info["username"],
-            "full_name": user_info["full_name"],
-            "role": user_info["role"],
-            "login_time": datetime.utcnow().isoformat(),
-            "device_info": device_info or "Unknown Device",
-            "ip_address": ip_address or "Unknown IP",
-            "geolocation": geolocation or {},
-            "session_id": str(uuid.uuid4()),
-            "login_method": "web_portal",
-            "is_active_session": True
-        }
-        
-        # إضافة معلومات الموقع إذا كانت متوفرة
-        if geolocation:
-            login_log.update({
-                "latitude": geolocation.get("latitude"),
-                "longitude": geolocation.get("longitude"),
-                "location_accuracy": geolocation.get("accuracy"),
-                "location_timestamp": geolocation.get("timestamp"),
-                "city": geolocation.get("city", "Unknown"),
-                "country": geolocation.get("country", "Unknown"),
-                "address": geolocation.get("address", "")
-            })
-        
-        print(f"🔍 محاولة حفظ سجل دخول: {user_info['username']}")
-        print(f"📍 الموقع: {geolocation.get('city', 'Unknown') if geolocation else 'No location'}")
-        
-        # حفظ سجل الدخول في قاعدة البيانات مع معالجة أفضل للأخطاء
-        result = await db.login_logs.insert_one(login_log)
-        
-        if result.inserted_id:
-            print(f"✅ تم حفظ سجل الدخول بنجاح: {user_info['username']} - ID: {result.inserted_id}")
-            
-            # التحقق من الحفظ
-            saved_log = await db.login_logs.find_one({"id": login_log["id"]})
-            if saved_log:
-                print(f"🎯 تم التحقق من حفظ البيانات: session_id = {saved_log['session_id']}")
-            else:
-                print(f"⚠️ لم يتم العثور على السجل المحفوظ")
-        else:
-            print(f"❌ فشل في الحصول على inserted_id")
-        
-        # تسجيل النشاط في مجموعة الأنشطة
-        activity_record = {
-            "_id": str(uuid.uuid4()),
-            "activity_type": "login",
-            "description": f"تسجيل دخول للنظام - {user_info['role']}",
-            "user_id": user_info["id"],
-            "user_name": user_info["full_name"] or user_info["username"],
-            "user_role": user_info["role"],
-            "ip_address": ip_address or "Unknown IP",
-            "location": f"{geolocation.get('city', 'Unknown')}, {geolocation.get('country', 'Unknown')}" if geolocation else "Unknown Location",
-            "device_info": device_info or "Unknown Device",
-            "details": f"جلسة جديدة: {login_log['session_id'][:8]}...",
-            "geolocation": geolocation,
-            "timestamp": datetime.utcnow().isoformat(),
-            "created_at": datetime.utcnow().isoformat()
-        }
-        
-        try:
-            await db.activities.insert_one(activity_record)
-            print(f"✅ تم تسجيل نشاط تسجيل الدخول للمستخدم: {user_info['username']}")
-        except Exception as activity_error:
-            print(f"⚠️ خطأ في تسجيل النشاط: {activity_error}")
-        
-        # عرض إحصائيات سريعة
-        total_logs = await db.login_logs.count_documents({})
-        user_logs = await db.login_logs.count_documents({"username": user_info["username"]})
-        print(f"📊 إجمالي السجلات: {total_logs} | سجلات {user_info['username']}: {user_logs}")
-        
-    except Exception as e:
-        print(f"❌ خطأ في تسجيل عملية الدخول لـ {user_info.get('username', 'Unknown')}: {str(e)}")
-        print(f"🔍 تفاصيل الخطأ: {type(e).__name__}: {e}")
-        
-        # محاولة بديلة للحفظ
-        try:
-            basic_log = {
-                "_id": str(uuid.uuid4()),
-                "username": user_info["username"],
-                "login_time": datetime.utcnow().isoformat(),
-                "role": user_info.get("role", "unknown")
-            }
-            await db.login_logs.insert_one(basic_log)
-            print(f"✅ تم حفظ سجل مبسط كحل بديل لـ {user_info['username']}")
-        except Exception as fallback_error:
-            print(f"❌ فشل حتى الحل البديل: {fallback_error}")
-            # لا نقف التطبيق إذا فشل التسجيل
-            pass
+@app.get("/api/auth/login-stats")
+async def get_login_stats(username: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """إحصائيات تسجيل الدخول من العدادات - المدير لأي مستخدم، والباقي لأنفسهم"""
+    if current_user.get("role") not in ["admin", "gm"] or not username:
+        username = current_user.get("username")
+    return await get_login_counts(db, username)
 
 @app.get("/api/dashboard/stats/{role_type}")
 async def get_dashboard_stats(role_type: str, time_filter: str = "today", current_user: dict = Depends(get_current_user)):
@@ -357,17 +392,12 @@ async def get_dashboard_stats(role_type: str, time_filter: str = "today", curren
                 {"$sort": {"count": -1}}
             ]).to_list(10)
             
-            financial_stats = await db.debts.aggregate([
-                {"$group": {
-                    "_id": None,
-                    "total_debts": {"$sum": 1},
-                    "total_outstanding": {"$sum": "$remaining_amount"},
-                    "total_settled": {"$sum": {"$subtract": ["$original_amount", "$remaining_amount"]}}
-                }}
-            ]).to_list(1)
-            
-            financial_data = financial_stats[0] if financial_stats else {
-                "total_debts": 0, "total_outstanding": 0, "total_settled": 0
+            # من عدادات الديون التزايدية بدل تجميع كل الديون
+            debt_stats = await get_debt_statistics(db)
+            financial_data = {
+                "total_debts": debt_stats["total_debts"],
+                "total_outstanding": debt_stats["total_outstanding"],
+                "total_settled": round(debt_stats["total_original"] - debt_stats["total_outstanding"], 2)
             }
             
             base_stats.update({
@@ -405,15 +435,7 @@ async def get_dashboard_stats(role_type: str, time_filter: str = "today", curren
             
         elif role_type == "accounting":
             # Accounting gets financial overview
-            financial_summary = await db.debts.aggregate([
-                {"$group": {
-                    "_id": None,
-                    "total_invoices": {"$sum": 1},
-                    "total_amount": {"$sum": "$original_amount"},
-                    "outstanding_amount": {"$sum": "$remaining_amount"},
-                    "settled_amount": {"$sum": {"$subtract": ["$original_amount", "$remaining_amount"]}}
-                }}
-            ]).to_list(1)
+            debt_stats = await get_debt_statistics(db)
             
             payments_count = await db.payments.count_documents({})
             overdue_debts = await db.debts.count_documents({
@@ -421,8 +443,11 @@ async def get_dashboard_stats(role_type: str, time_filter: str = "today", curren
                 "due_date": {"$lt": datetime.utcnow()}
             })
             
-            financial_data = financial_summary[0] if financial_summary else {
-                "total_invoices": 0, "total_amount": 0, "outstanding_amount": 0, "settled_amount": 0
+            financial_data = {
+                "total_invoices": debt_stats["total_debts"],
+                "total_amount": debt_stats["total_original"],
+                "outstanding_amount": debt_stats["total_outstanding"],
+                "settled_amount": round(debt_stats["total_original"] - debt_stats["total_outstanding"], 2)
             }
             
             base_stats.update({
@@ -497,48 +522,33 @@ async def get_dashboard_widgets(role_type: str, current_user: dict = Depends(get
     return widgets_config.get(role_type, [])
 
 @app.get("/api/clinics")
-async def get_clinics(current_user: dict = Depends(get_current_user)):
-    """Get all clinics - Fixed endpoint with standardized field names"""
+async def get_clinics(fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Get all clinics - Fixed endpoint with standardized field names
+
+    يدعم ``fields=id,name,clinic_latitude,clinic_longitude`` لإرجاع الحقول المطلوبة فقط.
+    Field names are standardized once by scripts/normalize_schema.py, so rows
+    are returned as projected by Mongo without per-row fallbacks.
+    """
     try:
-        # Get clinics from database
-        clinics = []
-        cursor = db.clinics.find({"is_active": {"$ne": False}}, {"_id": 0})
-        async for clinic in cursor:
-            # Standardize field names for frontend consistency
-            standardized_clinic = {
-                "id": clinic.get("id"),
-                "name": clinic.get("name") or clinic.get("clinic_name") or "عيادة غير محددة",
-                "clinic_name": clinic.get("name") or clinic.get("clinic_name") or "عيادة غير محددة",
-                "doctor_name": clinic.get("doctor_name") or clinic.get("owner_name") or "غير محدد",
-                "phone": clinic.get("phone") or clinic.get("clinic_phone") or "",
-                "email": clinic.get("email") or clinic.get("clinic_email") or "",
-                "address": clinic.get("address") or clinic.get("location") or "العنوان غير متوفر",
-                "classification": clinic.get("classification") or "class_b",
-                "credit_classification": clinic.get("credit_classification") or "yellow",
-                "is_active": clinic.get("is_active", True),
-                "status": clinic.get("status") or "active",
-                "line_id": clinic.get("line_id"),
-                "area_id": clinic.get("area_id"),
-                # GPS coordinates if available
-                "clinic_latitude": clinic.get("clinic_latitude"),
-                "clinic_longitude": clinic.get("clinic_longitude"),
-                # Registration info
-                "created_at": clinic.get("created_at"),
-                "updated_at": clinic.get("updated_at"),
-                "registered_by": clinic.get("registered_by"),
-                "registration_number": clinic.get("registration_number")
-            }
-            
-            # Only include clinics with valid ID and name
-            if standardized_clinic["id"] and standardized_clinic["name"] != "عيادة غير محددة":
-                clinics.append(standardized_clinic)
+        try:
+            requested = parse_fields_param(fields, CLINIC_LIST_FIELDS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        print(f"✅ تم جلب {len(clinics)} عيادة مع توحيد الحقول")
-        for i, clinic in enumerate(clinics[:3], 1):  # Log first 3 clinics
-            print(f"   {i}. {clinic['name']} - د. {clinic['doctor_name']} (ID: {clinic['id']})")
+        # Only include clinics with valid ID and name
+        query = {
+            "is_active": {"$ne": False},
+            "id": {"$nin": [None, ""]},
+            "name": {"$nin": [None, ""]}
+        }
+        projection = build_projection(CLINIC_LIST_FIELDS, requested)
+        clinics = await db.clinics.find(query, projection).to_list(length=None)
         
-        return clinics
+        print(f"✅ تم جلب {len(clinics)} عيادة")
+        return FastJSONResponse(clinics)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ خطأ في جلب العيادات: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching clinics: {str(e)}")
@@ -579,6 +589,7 @@ async def create_clinic(clinic_data: dict, current_user: dict = Depends(get_curr
             "location_accuracy": clinic_data.get("location_accuracy"),
             "formatted_address": clinic_data.get("formatted_address", ""),
             "place_id": clinic_data.get("place_id"),
+            "location": to_geojson_point(clinic_data.get("clinic_latitude"), clinic_data.get("clinic_longitude")),
             
             # System fields
             "registered_by": current_user.get("username", ""),
@@ -597,6 +608,7 @@ async def create_clinic(clinic_data: dict, current_user: dict = Depends(get_curr
         
         # Insert into database
         result = await db.clinics.insert_one(clinic_document)
+        clinic_geo_index.update(clinic_document, "clinics")
         
         if result.inserted_id:
             print(f"✅ تم تسجيل العيادة بنجاح: {clinic_data.get('clinic_name', 'Unknown')} - ID: {clinic_id}")
@@ -618,7 +630,7 @@ async def create_clinic(clinic_data: dict, current_user: dict = Depends(get_curr
             }
             
             try:
-                await db.activities.insert_one(activity_record)
+                await record_activity(db, activity_record)
                 print(f"✅ تم تسجيل نشاط تسجيل العيادة")
             except Exception as activity_error:
                 print(f"⚠️ خطأ في تسجيل النشاط: {activity_error}")
@@ -653,7 +665,7 @@ async def get_payments(current_user: dict = Depends(get_current_user)):
         async for payment in cursor:
             payments.append(payment)
         
-        return payments
+        return FastJSONResponse(payments)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching payments: {str(e)}")
@@ -670,49 +682,56 @@ async def process_payment(payment_data: dict, current_user: dict = Depends(get_c
         if not debt_id or payment_amount <= 0:
             raise HTTPException(status_code=400, detail="معرف الدين ومبلغ الدفع مطلوبان")
         
-        # Find the debt
-        debt = await db.debts.find_one({"id": debt_id})
-        if not debt:
-            raise HTTPException(status_code=404, detail="الدين غير موجود")
-        
-        current_remaining = float(debt.get("remaining_amount", 0))
-        if payment_amount > current_remaining:
-            raise HTTPException(status_code=400, detail="مبلغ الدفع أكبر من المبلغ المتبقي")
-        
         # Create payment record
         payment_id = str(uuid.uuid4())
+        posted_at = datetime.utcnow()
+        now = posted_at.isoformat()
         payment_record = {
             "id": payment_id,
             "debt_id": debt_id,
-            "clinic_id": debt.get("clinic_id", ""),
-            "clinic_name": debt.get("clinic_name", ""),
             "payment_amount": payment_amount,
             "payment_method": payment_method,
-            "payment_date": datetime.utcnow().isoformat(),
+            "payment_date": now,
             "payment_notes": payment_notes,
             "processed_by": current_user.get("user_id", ""),
             "processor_name": current_user.get("full_name", current_user.get("username", "")),
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": now
         }
         
-        # Insert payment record
-        await db.payments.insert_one(payment_record)
-        
-        # Update debt
-        new_remaining = current_remaining - payment_amount
-        debt_status = "paid" if new_remaining == 0 else "partially_paid"
-        
-        await db.debts.update_one(
+        # Atomic conditional posting: remaining_amount >= amount is checked by the same
+        # write that moves the balances; the ledger entry and the payment row are
+        # written in the same transaction
+        debt = await post_debt_payment(
+            db,
             {"id": debt_id},
-            {
-                "$set": {
-                    "remaining_amount": new_remaining,
-                    "status": debt_status,
-                    "last_payment_date": datetime.utcnow().isoformat(),
-                    "updated_at": datetime.utcnow().isoformat()
-                }
-            }
+            payment_amount,
+            PROCESS_PAYMENT_BALANCE_FIELDS,
+            ledger_entry={
+                "payment_id": payment_id,
+                "payment_method": payment_method,
+                "notes": payment_notes,
+                "collected_by": current_user.get("user_id", ""),
+                "source": "payments_process"
+            },
+            set_fields={"last_payment_date": now, "updated_at": now},
+            related_inserts=(
+                ("payments", lambda debt: {
+                    **payment_record,
+                    "clinic_id": debt.get("clinic_id", ""),
+                    "clinic_name": debt.get("clinic_name", "")
+                }),
+            ),
+            on_posted=payment_balance_hook(
+                db, payment_amount, PROCESS_PAYMENT_BALANCE_FIELDS.settled_status, posted_at
+            ),
+            after_commit=payment_statistics_hook(db, payment_amount, PROCESS_PAYMENT_BALANCE_FIELDS)
         )
+        if not debt:
+            if not await db.debts.count_documents({"id": debt_id}, limit=1):
+                raise HTTPException(status_code=404, detail="الدين غير موجود")
+            raise HTTPException(status_code=400, detail="مبلغ الدفع أكبر من المبلغ المتبقي")
+        
+        new_remaining = float(debt.get("remaining_amount", 0))
         
         # Create activity log
         activity_record = {
@@ -731,7 +750,7 @@ async def process_payment(payment_data: dict, current_user: dict = Depends(get_c
         }
         
         try:
-            await db.activities.insert_one(activity_record)
+            await record_activity(db, activity_record)
         except Exception as activity_error:
             print(f"⚠️ خطأ في تسجيل نشاط المدفوعات: {activity_error}")
         
@@ -741,7 +760,7 @@ async def process_payment(payment_data: dict, current_user: dict = Depends(get_c
             "payment_id": payment_id,
             "debt_id": debt_id,
             "new_remaining_amount": new_remaining,
-            "debt_status": debt_status
+            "debt_status": debt.get("status")
         }
         
     except HTTPException:
@@ -892,6 +911,7 @@ async def create_visit(visit_data: dict, current_user: dict = Depends(get_curren
         result = await db.visits.insert_one(visit_document)
         
         if result.inserted_id:
+            await invalidate_client_analytics(db, visit_document.get("clinic_id"))
             print(f"✅ تم إنشاء الزيارة بنجاح: {visit_data.get('clinic_name', 'Unknown')} - ID: {visit_id}")
             
             # Create activity log
@@ -910,7 +930,7 @@ async def create_visit(visit_data: dict, current_user: dict = Depends(get_curren
             }
             
             try:
-                await db.activities.insert_one(activity_record)
+                await record_activity(db, activity_record)
                 print(f"✅ تم تسجيل نشاط إنشاء الزيارة")
             except Exception as activity_error:
                 print(f"⚠️ خطأ في تسجيل النشاط: {activity_error}")
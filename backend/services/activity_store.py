@@ -0,0 +1,287 @@
+# نظام الإدارة الطبية المتكامل - تخزين سجل الأنشطة: مجموعة حديثة + أرشيف مضغوط + عدادات بالساعة
+# Medical Management System - Activity storage: hot collection (TTL), compact archive (TTL), hourly counters
+
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+import asyncio
+import os
+import uuid
+
+import pymongo
+from pymongo.errors import OperationFailure, BulkWriteError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# المجموعة الحديثة هي activities نفسها (كل القراءات الحالية تقرأ منها)
+ACTIVITY_HOT_COLLECTION = "activities"
+ACTIVITY_ARCHIVE_COLLECTION = "activity_archive"
+ACTIVITY_STATS_COLLECTION = "activity_stats_hourly"
+
+# مدة بقاء السجل الكامل، ثم السجل المضغوط في الأرشيف (0 = بلا حذف)
+ACTIVITY_HOT_DAYS = int(os.environ.get("ACTIVITY_HOT_DAYS", 90))
+ACTIVITY_ARCHIVE_DAYS = int(os.environ.get("ACTIVITY_ARCHIVE_DAYS", 730))
+
+HOUR_KEY_FORMAT = "%Y-%m-%dT%H"
+
+MOBILE_MARKERS = ("mobile", "android", "iphone")
+TABLET_MARKERS = ("tablet", "ipad")
+DESKTOP_MARKERS = ("windows", "mac", "linux", "chrome", "firefox", "safari", "edge", "desktop", "browser")
+
+INDEX_OPTIONS_CONFLICT = 85
+DUPLICATE_KEY = 11000
+
+
+def activity_action(activity: Dict[str, Any]) -> str:
+    # المسارات القديمة تكتب activity_type، ومسار /activities/record يكتب action
+    return activity.get("action") or activity.get("activity_type") or "unknown"
+
+
+def activity_device_type(device_info: Any) -> str:
+    """نوع الجهاز من device_info (قاموس من parse_user_agent أو نص حر)"""
+    if isinstance(device_info, dict):
+        return device_info.get("device_type") or "Unknown"
+    text = str(device_info or "").lower()
+    if any(marker in text for marker in TABLET_MARKERS):
+        return "Tablet"
+    if any(marker in text for marker in MOBILE_MARKERS):
+        return "Mobile"
+    if any(marker in text for marker in DESKTOP_MARKERS):
+        return "Desktop"
+    return "Unknown"
+
+
+def stat_key(value: Any) -> str:
+    # المفاتيح تصبح أسماء حقول: بدون نقاط أو $ في البداية
+    key = str(value or "unknown").replace(".", "_")
+    return "_" + key[1:] if key.startswith("$") else key
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def archive_record(activity: Dict[str, Any], recorded_at: datetime) -> Dict[str, Any]:
+    """السجل المضغوط: مفاتيح قصيرة وبدون الوصف والموقع والتفاصيل"""
+    device_info = activity.get("device_info")
+    return {
+        "_id": str(activity.get("id") or activity.get("_id") or uuid.uuid4()),
+        "t": recorded_at,
+        "a": activity_action(activity),
+        "u": activity.get("user_id"),
+        "n": activity.get("user_name"),
+        "r": activity.get("user_role"),
+        "e": activity.get("entity_type"),
+        "i": activity.get("entity_id") or activity.get("clinic_id") or activity.get("debt_id"),
+        "d": activity_device_type(device_info),
+        "ip": activity.get("ip_address") or (device_info.get("ip_address") if isinstance(device_info, dict) else None),
+    }
+
+
+def stats_increment(activity: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        "total": 1,
+        f"actions.{stat_key(activity_action(activity))}": 1,
+        f"users.{stat_key(activity.get('user_name'))}": 1,
+        f"devices.{stat_key(activity_device_type(activity.get('device_info')))}": 1,
+    }
+
+
+async def record_activity(db: AsyncIOMotorDatabase, activity: Dict[str, Any]) -> Dict[str, Any]:
+    """تسجيل نشاط: المجموعة الحديثة + الأرشيف المضغوط + عداد الساعة
+
+    ``timestamp`` is stored as each caller already writes it (ISO string or
+    datetime) so existing readers keep working; ``recorded_at`` is the BSON
+    date that drives TTL expiry, the recent feeds and the hour bucket.
+    """
+    recorded_at = datetime.utcnow()
+    activity["recorded_at"] = recorded_at
+    if not activity.get("action"):
+        activity["action"] = activity_action(activity)
+    archived = archive_record(activity, recorded_at)
+    hour = hour_bucket(recorded_at)
+
+    await asyncio.gather(
+        db[ACTIVITY_HOT_COLLECTION].insert_one(activity),
+        db[ACTIVITY_ARCHIVE_COLLECTION].insert_one(archived),
+        db[ACTIVITY_STATS_COLLECTION].update_one(
+            {"_id": hour.strftime(HOUR_KEY_FORMAT)},
+            {"$inc": stats_increment(activity), "$setOnInsert": {"hour": hour}},
+            upsert=True
+        ),
+    )
+    return activity
+
+
+async def record_activities(db: AsyncIOMotorDatabase, activities: List[Dict[str, Any]]) -> None:
+    """تسجيل دفعة أنشطة: insert_many للمجموعتين وتحديث واحد لكل ساعة
+
+    Batch form of ``record_activity`` for background writers. Inserts are
+    unordered, so one duplicate ``_id`` (a retried batch) does not stop the
+    rest; the hour counters are incremented after the inserts.
+    """
+    if not activities:
+        return
+    increments: Dict[datetime, Dict[str, int]] = {}
+    archived = []
+    for activity in activities:
+        recorded_at = activity.setdefault("recorded_at", datetime.utcnow())
+        if not activity.get("action"):
+            activity["action"] = activity_action(activity)
+        archived.append(archive_record(activity, recorded_at))
+        bucket = increments.setdefault(hour_bucket(recorded_at), {})
+        for field, count in stats_increment(activity).items():
+            bucket[field] = bucket.get(field, 0) + count
+
+    await asyncio.gather(
+        _insert_ignoring_duplicates(db[ACTIVITY_HOT_COLLECTION], activities),
+        _insert_ignoring_duplicates(db[ACTIVITY_ARCHIVE_COLLECTION], archived),
+    )
+    await db[ACTIVITY_STATS_COLLECTION].bulk_write([
+        pymongo.UpdateOne(
+            {"_id": hour.strftime(HOUR_KEY_FORMAT)},
+            {"$inc": fields, "$setOnInsert": {"hour": hour}},
+            upsert=True
+        )
+        for hour, fields in increments.items()
+    ], ordered=False)
+
+
+async def _insert_ignoring_duplicates(collection, documents: List[Dict[str, Any]]) -> None:
+    try:
+        await collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+            raise
+
+
+# ============================================================================
+# INDEXES - فهارس القراءة وطبقات الصلاحية
+# ============================================================================
+
+async def _ensure_ttl_index(collection, field: str, days: int) -> None:
+    """فهرس TTL؛ تغيير المدة في البيئة يُطبق بـ collMod بدلاً من خطأ تعارض الخيارات"""
+    if days <= 0:
+        return
+    seconds = days * 86400
+    try:
+        await collection.create_index([(field, pymongo.ASCENDING)], expireAfterSeconds=seconds)
+    except OperationFailure as e:
+        if e.code != INDEX_OPTIONS_CONFLICT:
+            raise
+        await collection.database.command({
+            "collMod": collection.name,
+            "index": {"keyPattern": {field: 1}, "expireAfterSeconds": seconds},
+        })
+
+
+async def ensure_activity_storage_indexes(db: AsyncIOMotorDatabase) -> None:
+    hot = db[ACTIVITY_HOT_COLLECTION]
+    await _ensure_ttl_index(hot, "recorded_at", ACTIVITY_HOT_DAYS)
+    await hot.create_index([("user_id", pymongo.ASCENDING), ("recorded_at", pymongo.DESCENDING)])
+    await hot.create_index([("action", pymongo.ASCENDING), ("recorded_at", pymongo.DESCENDING)])
+
+    archive = db[ACTIVITY_ARCHIVE_COLLECTION]
+    await _ensure_ttl_index(archive, "t", ACTIVITY_ARCHIVE_DAYS)
+    await archive.create_index([("u", pymongo.ASCENDING), ("t", pymongo.DESCENDING)])
+
+    await db[ACTIVITY_STATS_COLLECTION].create_index([("hour", pymongo.DESCENDING)])
+
+
+# ============================================================================
+# READ - الإحصائيات والأنشطة الحديثة والأرشيف
+# ============================================================================
+
+def _merge_counts(buckets: List[Dict[str, Any]], dimension: str) -> Dict[str, int]:
+    merged: Dict[str, int] = {}
+    for bucket in buckets:
+        for key, count in (bucket.get(dimension) or {}).items():
+            merged[key] = merged.get(key, 0) + count
+    return merged
+
+
+def _ranked(counts: Dict[str, int], label: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    rows = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    return [{label: key, "count": count} for key, count in rows[:limit]]
+
+
+async def get_activity_stats(
+    db: AsyncIOMotorDatabase,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    top_users: int = 10
+) -> Dict[str, Any]:
+    """إحصائيات الأنشطة من عدادات الساعات (بدون قراءة سجل الأنشطة)
+
+    One bucket document per hour, so a year of history is ~8,760 small
+    documents regardless of how many activities were recorded. The 24h
+    figure covers the current hour and the 23 before it.
+    """
+    query: Dict[str, Any] = {}
+    if start or end:
+        query["hour"] = {}
+        if start:
+            query["hour"]["$gte"] = hour_bucket(start)
+        if end:
+            query["hour"]["$lt"] = end
+
+    buckets = await db[ACTIVITY_STATS_COLLECTION].find(query, {"_id": 0}).to_list(length=None)
+    day_start = hour_bucket(datetime.utcnow()) - timedelta(hours=23)
+
+    return {
+        "total_activities": sum(bucket.get("total", 0) for bucket in buckets),
+        "recent_activities_24h": sum(bucket.get("total", 0) for bucket in buckets if bucket["hour"] >= day_start),
+        "actions": _ranked(_merge_counts(buckets, "actions"), "action"),
+        "users": _ranked(_merge_counts(buckets, "users"), "user", top_users),
+        "devices": _ranked(_merge_counts(buckets, "devices"), "device"),
+    }
+
+
+async def get_hourly_activity(db: AsyncIOMotorDatabase, hours: int = 24) -> List[Dict[str, Any]]:
+    """عدد الأنشطة لكل ساعة (الساعات بدون أنشطة = 0)"""
+    first_hour = hour_bucket(datetime.utcnow()) - timedelta(hours=hours - 1)
+    buckets = {
+        bucket["hour"]: bucket.get("total", 0)
+        async for bucket in db[ACTIVITY_STATS_COLLECTION].find({"hour": {"$gte": first_hour}}, {"hour": 1, "total": 1})
+    }
+    return [
+        {"hour": (first_hour + timedelta(hours=offset)).isoformat(), "count": buckets.get(first_hour + timedelta(hours=offset), 0)}
+        for offset in range(hours)
+    ]
+
+
+async def get_recent_activities(
+    db: AsyncIOMotorDatabase,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    """آخر الأنشطة من المجموعة الحديثة (فهرس recorded_at لكل مستخدم/نوع)"""
+    query: Dict[str, Any] = {}
+    if user_id:
+        query["user_id"] = user_id
+    if action:
+        query["action"] = action
+    return await db[ACTIVITY_HOT_COLLECTION].find(query, {"_id": 0}).sort(
+        "recorded_at", pymongo.DESCENDING
+    ).skip(offset).limit(limit).to_list(length=limit)
+
+
+async def get_archived_activities(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    start: datetime,
+    end: datetime,
+    limit: int = 500
+) -> List[Dict[str, Any]]:
+    """سجل مستخدم من الأرشيف المضغوط (بعد انتهاء صلاحية السجل الكامل)"""
+    rows = await db[ACTIVITY_ARCHIVE_COLLECTION].find(
+        {"u": user_id, "t": {"$gte": start, "$lt": end}}
+    ).sort("t", pymongo.DESCENDING).limit(limit).to_list(length=limit)
+    return [
+        {
+            "id": row["_id"], "recorded_at": row["t"], "action": row["a"], "user_id": row["u"],
+            "user_name": row.get("n"), "user_role": row.get("r"), "entity_type": row.get("e"),
+            "entity_id": row.get("i"), "device_type": row.get("d"), "ip_address": row.get("ip"),
+        }
+        for row in rows
+    ]
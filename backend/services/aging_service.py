@@ -0,0 +1,228 @@
+# نظام الإدارة الطبية المتكامل - خدمة تقادم الديون على الخادم
+# Medical Management System - Server-side debt aging buckets with as_of_date snapshots
+
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import pymongo
+
+# فئات التقادم بالترتيب وحدودها العليا بالأيام (None = بلا حد)
+AGING_BUCKETS: Tuple[Tuple[str, Optional[int]], ...] = (
+    ("current", 0),
+    ("days_30", 30),
+    ("days_60", 60),
+    ("days_90", 90),
+    ("over_90", None),
+)
+
+AMOUNT_FIELDS = ("total_outstanding",) + tuple(name for name, _ in AGING_BUCKETS)
+
+# شكلا مستند الدين: السجل المتكامل (MoneyAmount) والسجل البسيط (remaining_amount)
+AGING_SOURCES: Dict[str, Dict[str, Any]] = {
+    "integrated": {
+        "match": {"status": {"$in": ["outstanding", "partially_collected"]}},
+        "amount_field": "outstanding_amount.amount",
+        "clinic_names_from_clinics": False,
+    },
+    "simple": {
+        "match": {"remaining_amount": {"$gt": 0}},
+        "amount_field": "remaining_amount",
+        "clinic_names_from_clinics": True,
+    },
+}
+
+AGING_SNAPSHOTS_COLLECTION = "aging_snapshots"
+AGING_SNAPSHOT_RUNS_COLLECTION = "aging_snapshot_runs"
+
+_ZERO = Decimal128("0")
+
+
+def _bucket_condition(lower: Optional[int], upper: Optional[int]) -> Dict[str, Any]:
+    conditions = []
+    if lower is not None:
+        conditions.append({"$gt": ["$_days_overdue", lower]})
+    if upper is not None:
+        conditions.append({"$lte": ["$_days_overdue", upper]})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def aging_pipeline(
+    source: str,
+    as_of: date,
+    clinic_ids: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """خط تجميع التقادم: صف واحد لكل عيادة بمجاميع Decimal128 لكل فئة"""
+    config = AGING_SOURCES[source]
+    match: Dict[str, Any] = {**config["match"], "clinic_id": {"$nin": [None, ""]}}
+    if clinic_ids:
+        match["clinic_id"] = {"$in": clinic_ids}
+
+    as_of_datetime = datetime.combine(as_of, datetime.min.time())
+    # الديون المنشأة حتى نهاية يوم as_of فقط
+    created_before = as_of_datetime + timedelta(days=1)
+
+    buckets: Dict[str, Any] = {}
+    lower: Optional[int] = None
+    for name, upper in AGING_BUCKETS:
+        buckets[name] = {"$sum": {"$cond": [_bucket_condition(lower, upper), "$_amount", _ZERO]}}
+        lower = upper
+
+    return [
+        {"$match": match},
+        {"$project": {
+            "clinic_id": 1,
+            "clinic_name": 1,
+            "_amount": {"$convert": {
+                "input": f"${config['amount_field']}", "to": "decimal", "onError": _ZERO, "onNull": _ZERO
+            }},
+            "_due": {"$convert": {"input": "$due_date", "to": "date", "onError": None, "onNull": None}},
+            "_created": {"$convert": {"input": "$created_at", "to": "date", "onError": None, "onNull": None}},
+        }},
+        {"$match": {"$or": [{"_created": None}, {"_created": {"$lt": created_before}}]}},
+        {"$set": {"_days_overdue": {"$cond": [
+            {"$eq": ["$_due", None]},
+            0,
+            {"$dateDiff": {"startDate": "$_due", "endDate": as_of_datetime, "unit": "day"}}
+        ]}}},
+        {"$group": {
+            "_id": "$clinic_id",
+            "clinic_name": {"$first": "$clinic_name"},
+            "total_outstanding": {"$sum": "$_amount"},
+            **buckets
+        }},
+        {"$sort": {"total_outstanding": -1}},
+    ]
+
+
+def classify_aging_risk(row: Dict[str, Any]) -> Tuple[str, str]:
+    """مستوى المخاطرة والإجراء المقترح حسب توزيع الفئات"""
+    total = row["total_outstanding"]
+    if row["over_90"] > total * Decimal("0.5"):  # أكثر من 50% فوق 90 يوم
+        return "critical", "إجراءات تحصيل عاجلة"
+    if row["days_90"] > total * Decimal("0.3"):  # أكثر من 30% فوق 60 يوم
+        return "high", "متابعة حثيثة للتحصيل"
+    if row["days_60"] > total * Decimal("0.4"):  # أكثر من 40% فوق 30 يوم
+        return "medium", "متابعة منتظمة"
+    return "low", "مراقبة عادية"
+
+
+def _to_decimal(value: Any) -> Decimal:
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return Decimal(str(value or 0))
+
+
+def _finalize_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    result = {
+        "clinic_id": row.get("clinic_id") or row.get("_id"),
+        "clinic_name": row.get("clinic_name") or "غير محدد",
+        **{field: _to_decimal(row.get(field)) for field in AMOUNT_FIELDS}
+    }
+    result["risk_level"], result["recommended_action"] = classify_aging_risk(result)
+    return result
+
+
+async def compute_aging_rows(
+    db: AsyncIOMotorDatabase,
+    source: str,
+    as_of: date,
+    clinic_ids: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """حساب التقادم مباشرة - only one row per clinic comes back to Python"""
+    rows = await db.debts.aggregate(aging_pipeline(source, as_of, clinic_ids)).to_list(length=None)
+
+    if AGING_SOURCES[source]["clinic_names_from_clinics"] and rows:
+        names = {
+            clinic["id"]: clinic.get("name")
+            async for clinic in db.clinics.find(
+                {"id": {"$in": [row["_id"] for row in rows]}}, {"_id": 0, "id": 1, "name": 1}
+            )
+        }
+        for row in rows:
+            row["clinic_name"] = names.get(row["_id"])
+
+    return [_finalize_row(row) for row in rows]
+
+
+async def ensure_aging_snapshot_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهارس لقطات التقادم"""
+    await db[AGING_SNAPSHOTS_COLLECTION].create_index(
+        [("source", pymongo.ASCENDING), ("as_of_date", pymongo.ASCENDING), ("clinic_id", pymongo.ASCENDING)],
+        unique=True
+    )
+    await db[AGING_SNAPSHOT_RUNS_COLLECTION].create_index(
+        [("source", pymongo.ASCENDING), ("as_of_date", pymongo.ASCENDING)], unique=True
+    )
+
+
+async def _store_snapshot(db: AsyncIOMotorDatabase, source: str, as_of: date, rows: List[Dict[str, Any]]) -> None:
+    as_of_key = as_of.isoformat()
+    generated_at = datetime.utcnow()
+    snapshots = db[AGING_SNAPSHOTS_COLLECTION]
+
+    # استبدال صف كل عيادة في مكانه (upsert على المفتاح الفريد) ثم حذف صفوف العيادات التي لم تعد
+    # في اللقطة - القراء لا يرون لقطة فارغة، وطلبان متزامنان لا يتعارضان على الفهرس الفريد
+    key = {"source": source, "as_of_date": as_of_key}
+    operations = [
+        pymongo.ReplaceOne(
+            {**key, "clinic_id": row["clinic_id"]},
+            {
+                **row,
+                **{field: Decimal128(str(row[field])) for field in AMOUNT_FIELDS},
+                **key,
+                "generated_at": generated_at
+            },
+            upsert=True
+        )
+        for row in rows
+    ]
+    for start in range(0, len(operations), 1000):
+        await snapshots.bulk_write(operations[start:start + 1000], ordered=False)
+    await snapshots.delete_many({**key, "generated_at": {"$lt": generated_at}})
+    await db[AGING_SNAPSHOT_RUNS_COLLECTION].update_one(
+        {"source": source, "as_of_date": as_of_key},
+        {"$set": {"generated_at": generated_at, "clinics": len(rows)}},
+        upsert=True
+    )
+
+
+async def get_aging_report(
+    db: AsyncIOMotorDatabase,
+    source: str,
+    as_of_date: Optional[date] = None,
+    clinic_ids: Optional[List[str]] = None,
+    refresh: bool = False
+) -> List[Dict[str, Any]]:
+    """تقرير التقادم لكل عيادة مرتباً حسب إجمالي المستحق
+
+    Without ``as_of_date`` the report is computed live for today. With an
+    explicit ``as_of_date`` (e.g. month-end close) the full report is computed
+    once, stored as a snapshot and reused by later requests for that date;
+    ``refresh=True`` recomputes and replaces the snapshot.
+
+    Only debts created on or before ``as_of_date`` are counted, but their
+    balances are the ones at computation time, so a snapshot is exact when it
+    is taken on its own date (the month-end job). Dates after today are
+    computed live and never stored.
+    """
+    if as_of_date is None or as_of_date > date.today():
+        return await compute_aging_rows(db, source, as_of_date or date.today(), clinic_ids)
+
+    as_of_key = as_of_date.isoformat()
+    run = None
+    if not refresh:
+        run = await db[AGING_SNAPSHOT_RUNS_COLLECTION].find_one({"source": source, "as_of_date": as_of_key})
+
+    if run is None:
+        # اللقطة تُحسب دائماً لكل العيادات ثم تُفلتر عند القراءة
+        await _store_snapshot(db, source, as_of_date, await compute_aging_rows(db, source, as_of_date))
+
+    query: Dict[str, Any] = {"source": source, "as_of_date": as_of_key}
+    if clinic_ids:
+        query["clinic_id"] = {"$in": clinic_ids}
+    rows = await db[AGING_SNAPSHOTS_COLLECTION].find(
+        query, {"_id": 0, "source": 0, "as_of_date": 0}
+    ).sort("total_outstanding", -1).to_list(length=None)
+    return [_finalize_row(row) for row in rows]
@@ -0,0 +1,278 @@
+# نظام الإدارة الطبية المتكامل - إعادة حساب صحة العملاء دفعة واحدة (ليلياً)
+# Medical Management System - Batch client health scoring: chunked aggregations, NumPy scoring, bulk_write
+
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from datetime import datetime, timedelta
+import asyncio
+import uuid
+
+import numpy as np
+import pymongo
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.crm_service import (
+    HEALTH_INPUT_FIELDS, date_expression, attention_priorities, client_health_fields, health_risk_flags, health_scores
+)
+
+CLIENT_HEALTH_RUNS_COLLECTION = "client_health_runs"
+
+# عدد ملفات العملاء في كل دفعة (ثلاثة خطوط تجميع + bulk_write واحد لكل دفعة)
+HEALTH_SCORING_CHUNK_SIZE = 1000
+
+# حجز التشغيل: يُجدد مع كل دفعة، وتشغيل انتهى حجزه يُستأنف من آخر عيادة (عامل توقف)
+HEALTH_RUN_LEASE = timedelta(minutes=10)
+
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+async def ensure_client_health_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فرز العملاء حسب الصحة (الكل أو عملاء مندوب) وسجل التشغيلات"""
+    profiles = db.client_profiles
+    await profiles.create_index([("health_score", pymongo.ASCENDING)])
+    await profiles.create_index([("assigned_rep_id", pymongo.ASCENDING), ("health_score", pymongo.ASCENDING)])
+    runs = db[CLIENT_HEALTH_RUNS_COLLECTION]
+    await runs.create_index([("started_at", pymongo.DESCENDING)])
+
+    # تشغيل واحد فقط بحالة running (البدء المتزامن يفشل بمفتاح مكرر)؛ التشغيلات القديمة
+    # العالقة بهذه الحالة من قبل الفهرس تُترك كمهجورة عدا الأحدث
+    latest = await runs.find_one({"status": "running"}, sort=[("started_at", pymongo.DESCENDING)])
+    if latest:
+        await runs.update_many(
+            {"status": "running", "_id": {"$ne": latest["_id"]}},
+            {"$set": {"status": "abandoned", "updated_at": datetime.utcnow()}}
+        )
+    await runs.create_index(
+        [("status", pymongo.ASCENDING)],
+        unique=True, partialFilterExpression={"status": "running"}, name="single_running_run"
+    )
+
+
+# ============================================================================
+# CHUNK - تحميل المدخلات وحساب النقاط لدفعة عملاء
+# ============================================================================
+
+async def load_health_columns(
+    db: AsyncIOMotorDatabase,
+    clinic_ids: List[str],
+    now: datetime
+) -> Dict[str, np.ndarray]:
+    """أعمدة التقييم لدفعة عملاء: خط تجميع واحد لكل مجموعة (بدلاً من ثلاثة لكل عميل)"""
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_flag = {"$cond": [{"$gte": ["$created", month_start]}, 1, 0]}
+
+    visits, orders, interactions = await asyncio.gather(
+        db.visits.aggregate([
+            {"$match": {"clinic_id": {"$in": clinic_ids}}},
+            {"$group": {
+                "_id": "$clinic_id",
+                "total": {"$sum": 1},
+                "successful": {"$sum": {"$cond": [{"$eq": ["$effective", True]}, 1, 0]}},
+                "last": {"$max": date_expression("$date")},
+            }},
+        ]).to_list(length=None),
+        db.orders.aggregate([
+            {"$match": {"clinic_id": {"$in": clinic_ids}}},
+            {"$project": {
+                "clinic_id": 1,
+                "created": date_expression("$created_at"),
+                "amount": {"$convert": {"input": "$total_amount", "to": "double", "onError": 0.0, "onNull": 0.0}},
+            }},
+            {"$group": {
+                "_id": "$clinic_id",
+                "count": {"$sum": 1},
+                "value": {"$sum": "$amount"},
+                "this_month": {"$sum": month_flag},
+            }},
+        ]).to_list(length=None),
+        db.client_interactions.aggregate([
+            {"$match": {"client_id": {"$in": clinic_ids}}},
+            {"$project": {"client_id": 1, "created": date_expression("$created_at")}},
+            {"$group": {"_id": "$client_id", "this_month": {"$sum": month_flag}}},
+        ]).to_list(length=None),
+    )
+
+    position = {clinic_id: index for index, clinic_id in enumerate(clinic_ids)}
+    columns = {field: np.zeros(len(clinic_ids)) for field in HEALTH_INPUT_FIELDS}
+    columns["days_since_last_visit"][:] = np.nan
+    visit_totals = np.zeros(len(clinic_ids))
+    visit_successes = np.zeros(len(clinic_ids))
+
+    for row in visits:
+        index = position[row["_id"]]
+        visit_totals[index] = row["total"]
+        visit_successes[index] = row["successful"]
+        if row["last"] is not None:
+            columns["days_since_last_visit"][index] = (now - row["last"]).days
+    for row in orders:
+        index = position[row["_id"]]
+        columns["total_orders"][index] = row["count"]
+        columns["total_order_value"][index] = row["value"]
+        columns["orders_this_month"][index] = row["this_month"]
+    for row in interactions:
+        columns["interactions_this_month"][position[row["_id"]]] = row["this_month"]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns["visit_success_rate"] = np.where(visit_totals > 0, visit_successes / visit_totals * 100, 0.0)
+        columns["average_order_value"] = np.where(
+            columns["total_orders"] > 0, columns["total_order_value"] / columns["total_orders"], 0.0
+        )
+    return columns
+
+
+async def score_client_chunk(db: AsyncIOMotorDatabase, clinic_ids: List[str], now: datetime) -> int:
+    """حساب وكتابة نقاط الصحة وعلامات المخاطر والتوصيات لدفعة عملاء"""
+    if not clinic_ids:
+        return 0
+    columns = await load_health_columns(db, clinic_ids, now)
+    scores = health_scores(columns)
+    flags = health_risk_flags(columns)
+    priorities = attention_priorities(scores)
+
+    operations = [
+        UpdateOne({"clinic_id": clinic_id}, {"$set": client_health_fields(scores, flags, priorities, index, now)})
+        for index, clinic_id in enumerate(clinic_ids)
+    ]
+    await db.client_profiles.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+# ============================================================================
+# RUN - تشغيل قابل للاستئناف مع تقدم محفوظ
+# ============================================================================
+
+def _with_progress(run: Dict[str, Any]) -> Dict[str, Any]:
+    total = run.get("total") or 0
+    run["progress_percent"] = round(min(run.get("processed", 0) / total * 100, 100.0), 1) if total else 100.0
+    return run
+
+
+def _lease(owner: str) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {"lease_owner": owner, "lease_until": now + HEALTH_RUN_LEASE, "updated_at": now}
+
+
+async def _claim_run(db: AsyncIOMotorDatabase, restart: bool, owner: str) -> Optional[Dict[str, Any]]:
+    """استئناف آخر تشغيل غير مكتمل أو بدء تشغيل جديد
+
+    Returns None when another worker holds the lease of the latest run. A
+    failed run, or a running one whose lease expired, is taken over with one
+    conditional ``find_one_and_update`` and keeps its ``last_clinic_id``;
+    ``restart=True`` abandons it instead. A new run is inserted as "running",
+    which the unique partial index allows only once, so two workers starting
+    at the same time cannot both win.
+    """
+    runs = db[CLIENT_HEALTH_RUNS_COLLECTION]
+    now = datetime.utcnow()
+    latest = await runs.find_one({}, sort=[("started_at", pymongo.DESCENDING)])
+    claimable = {"$or": [
+        {"status": "failed"},
+        {"status": "running", "lease_until": {"$not": {"$gte": now}}},
+    ]}
+
+    try:
+        if latest and latest["status"] in ("running", "failed"):
+            if not restart:
+                return await runs.find_one_and_update(
+                    {"_id": latest["_id"], **claimable},
+                    {"$set": {"status": "running", **_lease(owner), "error": None}, "$inc": {"attempts": 1}},
+                    return_document=ReturnDocument.AFTER
+                )
+            abandoned = await runs.update_one(
+                {"_id": latest["_id"], **claimable},
+                {"$set": {"status": "abandoned", "updated_at": now}, "$unset": {"lease_owner": "", "lease_until": ""}}
+            )
+            if not abandoned.modified_count:
+                return None
+
+        run = {
+            "_id": str(uuid.uuid4()),
+            "status": "running",
+            "started_at": now,
+            "finished_at": None,
+            "total": await db.client_profiles.count_documents({}),
+            "processed": 0,
+            "last_clinic_id": None,
+            "attempts": 1,
+            "error": None,
+            **_lease(owner),
+        }
+        await runs.insert_one(run)
+        return run
+    except DuplicateKeyError:
+        # تشغيل آخر بدأ أو استُؤنف في نفس اللحظة
+        return None
+
+
+async def run_client_health_scoring(
+    db: AsyncIOMotorDatabase,
+    restart: bool = False,
+    chunk_size: int = HEALTH_SCORING_CHUNK_SIZE,
+    on_progress: Optional[ProgressCallback] = None
+) -> Optional[Dict[str, Any]]:
+    """إعادة حساب صحة كل العملاء بالترتيب حسب clinic_id
+
+    Progress (``last_clinic_id``, ``processed``) is saved after every chunk
+    together with a renewed lease, so an interrupted run continues from the
+    next clinic once its lease expires. Returns the finished run, or None if
+    another run is in progress (or took this one over after its lease lapsed).
+    """
+    owner = str(uuid.uuid4())
+    run = await _claim_run(db, restart, owner)
+    if run is None:
+        return None
+
+    runs = db[CLIENT_HEALTH_RUNS_COLLECTION]
+    try:
+        while True:
+            query = {"clinic_id": {"$gt": run["last_clinic_id"]}} if run["last_clinic_id"] else {}
+            profiles = await db.client_profiles.find(query, {"_id": 0, "clinic_id": 1}).sort(
+                "clinic_id", pymongo.ASCENDING
+            ).limit(chunk_size).to_list(length=chunk_size)
+            if not profiles:
+                break
+
+            clinic_ids = [profile["clinic_id"] for profile in profiles]
+            scored = await score_client_chunk(db, clinic_ids, datetime.utcnow())
+            run = await runs.find_one_and_update(
+                {"_id": run["_id"], "lease_owner": owner},
+                {"$set": {"last_clinic_id": clinic_ids[-1], **_lease(owner)},
+                 "$inc": {"processed": scored}},
+                return_document=ReturnDocument.AFTER
+            )
+            if run is None:
+                # الحجز انتهى واستأنف عامل آخر التشغيل من آخر نقطة محفوظة
+                return None
+            if on_progress:
+                await on_progress(_with_progress(run))
+
+        now = datetime.utcnow()
+        run = await runs.find_one_and_update(
+            {"_id": run["_id"], "lease_owner": owner},
+            {"$set": {"status": "completed", "updated_at": now, "finished_at": now},
+             "$unset": {"lease_owner": "", "lease_until": ""}},
+            return_document=ReturnDocument.AFTER
+        )
+        return _with_progress(run) if run else None
+
+    except Exception as e:
+        await runs.update_one(
+            {"_id": run["_id"], "lease_owner": owner},
+            {"$set": {"status": "failed", "updated_at": datetime.utcnow(), "error": str(e)},
+             "$unset": {"lease_owner": "", "lease_until": ""}}
+        )
+        raise
+
+
+async def get_health_run_status(db: AsyncIOMotorDatabase, run_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """حالة تشغيل (أو آخر تشغيل) مع نسبة التقدم"""
+    runs = db[CLIENT_HEALTH_RUNS_COLLECTION]
+    if run_id:
+        run = await runs.find_one({"_id": run_id})
+    else:
+        run = await runs.find_one({}, sort=[("started_at", pymongo.DESCENDING)])
+    if not run:
+        return None
+    run["run_id"] = run.pop("_id")
+    return _with_progress(run)
@@ -0,0 +1,387 @@
+# نظام الإدارة الطبية المتكامل - الرصيد الجاري لكل عيادة
+# Medical Management System - Per-clinic running balance, snapshots and rebuild
+
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from datetime import datetime, date
+from decimal import Decimal
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+import pymongo
+
+from services.money_codec import to_decimal, money_expression
+from services.payment_ledger_service import supports_transactions, run_in_transaction, to_bson_value
+
+CLINIC_BALANCES_COLLECTION = "clinic_balances"
+CLINIC_BALANCE_SNAPSHOTS_COLLECTION = "clinic_balance_snapshots"
+
+BALANCE_AMOUNT_FIELDS = ("invoiced", "collected", "outstanding")
+
+# مفتاح الديون بلا تاريخ استحقاق (لا تصبح متأخرة أبداً)
+NO_DUE_DATE = "none"
+
+# حالات الفواتير التي لم تُعتمد بعد، وحالات الديون التي خرجت من الرصيد
+UNBILLED_INVOICE_STATUSES = ["draft", "pending", "cancelled"]
+CLOSED_DEBT_STATUSES = ["written_off", "cancelled"]
+
+_ZERO = Decimal("0.00")
+
+
+def due_key(value: Any) -> str:
+    """مفتاح تاريخ الاستحقاق YYYY-MM-DD (date/datetime/نص ISO)"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).date().isoformat()
+        except ValueError:
+            return NO_DUE_DATE
+    return NO_DUE_DATE
+
+
+def debt_due_key(debt: Dict[str, Any]) -> str:
+    """مفتاح استحقاق الدين - integrated/profile debts use due_date, flat debts original_due_date"""
+    return due_key(debt.get("due_date") or debt.get("original_due_date"))
+
+
+def clinic_balance_update(
+    invoiced: Any = 0,
+    collected: Any = 0,
+    outstanding: Any = 0,
+    due_date: Any = None,
+    open_debts: int = 0,
+    last_payment_date: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """تحديث $inc للرصيد الجاري - every field is a delta, applied in one write"""
+    increments: Dict[str, Any] = {}
+    for field, delta in (("invoiced", invoiced), ("collected", collected), ("outstanding", outstanding)):
+        if delta:
+            increments[field] = Decimal(str(delta))
+    if outstanding:
+        increments[f"outstanding_by_due.{due_key(due_date)}"] = Decimal(str(outstanding))
+    if open_debts:
+        increments["open_debts"] = open_debts
+
+    # مستند يُنشأ بفرق فقط (بدون التاريخ السابق للعيادة) يُعلَّم لإعادة بنائه عند أول قراءة
+    update: Dict[str, Any] = {
+        "$set": {"updated_at": datetime.utcnow()},
+        "$setOnInsert": {"created_at": datetime.utcnow(), "needs_rebuild": True},
+    }
+    if increments:
+        update["$inc"] = increments
+    if last_payment_date is not None:
+        update["$max"] = {"last_payment_date": last_payment_date}
+    return to_bson_value(update)
+
+
+async def apply_clinic_balance_delta(
+    db: AsyncIOMotorDatabase,
+    clinic_id: Optional[str],
+    session=None,
+    **delta: Any
+) -> None:
+    """تطبيق فرق على رصيد العيادة (upsert) - a single atomic document write"""
+    if not clinic_id:
+        return
+    await db[CLINIC_BALANCES_COLLECTION].update_one(
+        {"clinic_id": clinic_id}, clinic_balance_update(**delta), upsert=True, session=session
+    )
+
+
+async def write_with_clinic_balance(
+    db: AsyncIOMotorDatabase,
+    write: Callable[[Any], Awaitable[Any]],
+    clinic_id: Optional[str],
+    **delta: Any
+) -> Any:
+    """تنفيذ كتابة مالية مع تحديث رصيد العيادة معها
+
+    ``write(session)`` performs the invoice/debt/payment write and returns
+    ``None`` when nothing was written, in which case the balance is untouched.
+    Both writes share one transaction when the deployment supports it, retried
+    on write conflicts (the balance document is hot for busy clinics), so
+    ``write`` must only write through ``session``; on a standalone server the
+    balance follows the write and ``rebuild_clinic_balances`` repairs any drift.
+    """
+    async def _write(session) -> Any:
+        result = await write(session)
+        if result is not None:
+            await apply_clinic_balance_delta(db, clinic_id, session=session, **delta)
+        return result
+
+    if await supports_transactions(db):
+        return await run_in_transaction(db, _write)
+
+    result = await write(None)
+    if result is not None:
+        await apply_clinic_balance_delta(db, clinic_id, **delta)
+    return result
+
+
+def stage_clinic_balance_delta(uow, clinic_id: Optional[str], **delta: Any) -> None:
+    """تسجيل فرق الرصيد ضمن وحدة عمل (UnitOfWork) مع بقية كتاباتها"""
+    if clinic_id:
+        uow.update_one(
+            CLINIC_BALANCES_COLLECTION, {"clinic_id": clinic_id}, clinic_balance_update(**delta), upsert=True
+        )
+
+
+def payment_balance_hook(
+    db: AsyncIOMotorDatabase,
+    amount: Any,
+    settled_status: str,
+    payment_date: Optional[datetime] = None
+) -> Callable[[Dict[str, Any], Any], Awaitable[None]]:
+    """خطاف ترحيل الدفعة: تحصيل + إنقاص المستحق على تاريخ استحقاق الدين"""
+    async def _hook(debt: Dict[str, Any], session=None) -> None:
+        await apply_clinic_balance_delta(
+            db, debt.get("clinic_id"), session=session,
+            collected=amount,
+            outstanding=-Decimal(str(amount)),
+            due_date=debt.get("due_date") or debt.get("original_due_date"),
+            open_debts=-1 if debt.get("status") == settled_status else 0,
+            last_payment_date=payment_date or datetime.utcnow()
+        )
+    return _hook
+
+
+def _overdue(outstanding_by_due: Dict[str, Any], as_of: date) -> Decimal:
+    as_of_key = as_of.isoformat()
+    return sum(
+        (to_decimal(amount) for key, amount in (outstanding_by_due or {}).items()
+         if key != NO_DUE_DATE and key < as_of_key),
+        _ZERO
+    )
+
+
+def _format_balance(clinic_id: str, document: Optional[Dict[str, Any]], as_of: date) -> Dict[str, Any]:
+    document = document or {}
+    return {
+        "clinic_id": clinic_id,
+        **{field: to_decimal(document.get(field)) for field in BALANCE_AMOUNT_FIELDS},
+        "overdue": _overdue(document.get("outstanding_by_due"), as_of),
+        "open_debts": document.get("open_debts", 0),
+        "last_payment_date": document.get("last_payment_date"),
+        "updated_at": document.get("updated_at"),
+    }
+
+
+async def get_clinic_balance(
+    db: AsyncIOMotorDatabase,
+    clinic_id: str,
+    as_of: Optional[date] = None
+) -> Dict[str, Any]:
+    """رصيد العيادة - one indexed document read regardless of history length
+
+    A clinic without a balance document yet, or whose document was created by
+    a delta alone (``needs_rebuild``: its history predates the running
+    balance), is rebuilt from its source documents on first access.
+    """
+    document = await db[CLINIC_BALANCES_COLLECTION].find_one({"clinic_id": clinic_id}, {"_id": 0})
+    if document is None or document.get("needs_rebuild"):
+        await rebuild_clinic_balances(db, [clinic_id])
+        document = await db[CLINIC_BALANCES_COLLECTION].find_one({"clinic_id": clinic_id}, {"_id": 0})
+    return _format_balance(clinic_id, document, as_of or date.today())
+
+
+# ============================================================================
+# REBUILD - إعادة البناء من المستندات المصدر
+# ============================================================================
+
+def _decimal(expression: Any) -> Dict[str, Any]:
+    return {"$convert": {"input": expression, "to": "decimal", "onError": 0, "onNull": 0}}
+
+
+def _clinic_match(clinic_ids: Optional[List[str]]) -> Dict[str, Any]:
+    return {"$in": clinic_ids} if clinic_ids else {"$nin": [None, ""]}
+
+
+async def _invoiced_totals(db, clinic_ids) -> Dict[str, Decimal]:
+    rows = db.invoices.aggregate([
+        {"$match": {"clinic_id": _clinic_match(clinic_ids), "status": {"$nin": UNBILLED_INVOICE_STATUSES}}},
+        {"$group": {"_id": "$clinic_id", "invoiced": {"$sum": {"$ifNull": [
+            money_expression("total_amount"), _decimal("$amount")
+        ]}}}}
+    ])
+    return {row["_id"]: to_decimal(row["invoiced"]) async for row in rows}
+
+
+async def _debt_totals(db, clinic_ids) -> Dict[str, Dict[str, Any]]:
+    rows = db.debts.aggregate([
+        {"$match": {"clinic_id": _clinic_match(clinic_ids), "status": {"$nin": CLOSED_DEBT_STATUSES}}},
+        {"$project": {
+            "clinic_id": 1,
+            "last_payment_date": 1,
+            # المتبقي: MoneyAmount المتكامل، ثم remaining_amount المسطح، ثم amount لديون ملف العيادة
+            # ثم total_amount لديون المحاسبة الاحترافية
+            "_outstanding": {"$ifNull": [
+                money_expression("outstanding_amount"),
+                {"$ifNull": [
+                    money_expression("remaining_amount"),
+                    _decimal({"$ifNull": ["$amount", "$total_amount"]})
+                ]}
+            ]},
+            "_paid": {"$ifNull": [money_expression("paid_amount"), _decimal(0)]},
+            "_due": {"$dateToString": {
+                "format": "%Y-%m-%d",
+                "date": {"$convert": {
+                    "input": {"$ifNull": ["$due_date", "$original_due_date"]},
+                    "to": "date", "onError": None, "onNull": None
+                }},
+                "onNull": NO_DUE_DATE
+            }},
+        }},
+        {"$group": {
+            "_id": {"clinic_id": "$clinic_id", "due": "$_due"},
+            "outstanding": {"$sum": "$_outstanding"},
+            "collected": {"$sum": "$_paid"},
+            "open_debts": {"$sum": {"$cond": [{"$gt": ["$_outstanding", 0]}, 1, 0]}},
+            "last_payment_date": {"$max": "$last_payment_date"},
+        }},
+        {"$group": {
+            "_id": "$_id.clinic_id",
+            "outstanding": {"$sum": "$outstanding"},
+            "collected": {"$sum": "$collected"},
+            "open_debts": {"$sum": "$open_debts"},
+            "last_payment_date": {"$max": "$last_payment_date"},
+            "outstanding_by_due": {"$push": {"k": "$_id.due", "v": "$outstanding"}},
+        }},
+    ])
+    return {row["_id"]: row async for row in rows}
+
+
+async def _collection_totals(db, clinic_ids) -> Dict[str, Dict[str, Any]]:
+    rows = db.collections.aggregate([
+        {"$match": {"clinic_id": _clinic_match(clinic_ids), "status": "approved"}},
+        {"$group": {
+            "_id": "$clinic_id",
+            "collected": {"$sum": _decimal("$amount")},
+            "last_payment_date": {"$max": {"$convert": {
+                "input": "$approved_at", "to": "date", "onError": None, "onNull": None
+            }}},
+        }}
+    ])
+    return {row["_id"]: row async for row in rows}
+
+
+def _latest(*values: Optional[datetime]) -> Optional[datetime]:
+    present = [value for value in values if isinstance(value, datetime)]
+    return max(present) if present else None
+
+
+async def rebuild_clinic_balances(
+    db: AsyncIOMotorDatabase,
+    clinic_ids: Optional[List[str]] = None
+) -> int:
+    """إعادة بناء الأرصدة الجارية من المستندات المصدر
+
+    Folds invoices, debts (open balances by due date and amounts paid, which
+    includes every ledger-posted payment) and approved clinic collections into
+    fresh balance documents. Run it once after deploying, and whenever drift is
+    suspected; run it in a quiet window, since writes landing mid-rebuild for the
+    same clinic can be overwritten. Returns the number of balances written.
+    """
+    invoiced = await _invoiced_totals(db, clinic_ids)
+    debts = await _debt_totals(db, clinic_ids)
+    collections = await _collection_totals(db, clinic_ids)
+
+    all_clinic_ids = set(clinic_ids or []) | set(invoiced) | set(debts) | set(collections)
+    now = datetime.utcnow()
+    operations = []
+    for clinic_id in all_clinic_ids:
+        debt_row = debts.get(clinic_id, {})
+        collection_row = collections.get(clinic_id, {})
+        document = {
+            "clinic_id": clinic_id,
+            "invoiced": invoiced.get(clinic_id, _ZERO),
+            "collected": to_decimal(debt_row.get("collected")) + to_decimal(collection_row.get("collected")),
+            "outstanding": to_decimal(debt_row.get("outstanding")),
+            "outstanding_by_due": {
+                entry["k"]: entry["v"] for entry in debt_row.get("outstanding_by_due", [])
+                if to_decimal(entry["v"]) != 0
+            },
+            "open_debts": debt_row.get("open_debts", 0),
+            "last_payment_date": _latest(debt_row.get("last_payment_date"), collection_row.get("last_payment_date")),
+            "rebuilt_at": now,
+            "updated_at": now,
+            "created_at": now,
+        }
+        operations.append(ReplaceOne({"clinic_id": clinic_id}, to_bson_value(document), upsert=True))
+
+    for start in range(0, len(operations), 1000):
+        await db[CLINIC_BALANCES_COLLECTION].bulk_write(operations[start:start + 1000], ordered=False)
+    return len(operations)
+
+
+# ============================================================================
+# SNAPSHOTS - لقطات دورية
+# ============================================================================
+
+async def snapshot_clinic_balances(db: AsyncIOMotorDatabase, as_of: Optional[date] = None) -> int:
+    """لقطة يومية لكل الأرصدة (تُشغَّل دورياً) - computed and merged server-side
+
+    Also compacts due-date entries that have been fully collected, so the
+    running document stays small for clinics with years of history.
+    """
+    as_of = as_of or date.today()
+    as_of_key = as_of.isoformat()
+    balances = db[CLINIC_BALANCES_COLLECTION]
+
+    # أرصدة أُنشئت بفرق فقط تُعاد من المصادر قبل أخذ اللقطة
+    pending = await balances.distinct("clinic_id", {"needs_rebuild": True})
+    if pending:
+        await rebuild_clinic_balances(db, pending)
+
+    await balances.update_many({}, [{"$set": {"outstanding_by_due": {"$arrayToObject": {"$filter": {
+        "input": {"$objectToArray": {"$ifNull": ["$outstanding_by_due", {}]}},
+        "cond": {"$ne": ["$$this.v", 0]}
+    }}}}}])
+
+    await balances.aggregate([
+        {"$project": {
+            "_id": 0,
+            "clinic_id": 1,
+            "snapshot_date": as_of_key,
+            **{field: 1 for field in BALANCE_AMOUNT_FIELDS},
+            "open_debts": 1,
+            "last_payment_date": 1,
+            "overdue": {"$sum": {"$map": {
+                "input": {"$filter": {
+                    "input": {"$objectToArray": {"$ifNull": ["$outstanding_by_due", {}]}},
+                    "cond": {"$and": [
+                        {"$ne": ["$$this.k", NO_DUE_DATE]}, {"$lt": ["$$this.k", as_of_key]}
+                    ]}
+                }},
+                "in": "$$this.v"
+            }}},
+            "generated_at": {"$literal": datetime.utcnow()},
+        }},
+        {"$merge": {
+            "into": CLINIC_BALANCE_SNAPSHOTS_COLLECTION,
+            "on": ["clinic_id", "snapshot_date"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]).to_list(length=None)
+
+    return await db[CLINIC_BALANCE_SNAPSHOTS_COLLECTION].count_documents({"snapshot_date": as_of_key})
+
+
+async def get_clinic_balance_history(
+    db: AsyncIOMotorDatabase,
+    clinic_id: str,
+    limit: int = 90
+) -> List[Dict[str, Any]]:
+    """لقطات رصيد العيادة (الأحدث أولاً)"""
+    return await db[CLINIC_BALANCE_SNAPSHOTS_COLLECTION].find(
+        {"clinic_id": clinic_id}, {"_id": 0}
+    ).sort("snapshot_date", -1).limit(limit).to_list(length=limit)
+
+
+async def ensure_clinic_balance_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهارس الأرصدة الجارية واللقطات"""
+    await db[CLINIC_BALANCES_COLLECTION].create_index([("clinic_id", pymongo.ASCENDING)], unique=True)
+    await db[CLINIC_BALANCE_SNAPSHOTS_COLLECTION].create_index(
+        [("clinic_id", pymongo.ASCENDING), ("snapshot_date", pymongo.ASCENDING)], unique=True
+    )
@@ -1,11 +1,308 @@
 # CRM Service - خدمة إدارة العلاقات مع العملاء
 import asyncio
 import logging
+import re
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
+import numpy as np
+import pymongo
+from pymongo.errors import DuplicateKeyError
 import uuid
 from models.crm_models import *
+from services.follow_up_scheduler import OPEN_TASK_STATUSES, reminder_fields, cancel_reminder
+
+# ============================================================================
+# CLIENT SEARCH - بيانات العيادة المكررة في ملف العميل مع مصطلحات بحث مطبّعة
+# ============================================================================
+
+# التشكيل والتطويل، وتوحيد أشكال الحروف والأرقام العربية قبل البحث
+ARABIC_DIACRITICS = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ARABIC_LETTER_FORMS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    **{digit: str(index % 10) for index, digit in enumerate("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹")}
+})
+PHONE_QUERY = re.compile(r"^[\d\s+()\-]+$")
+MAX_SEARCH_TOKENS = 5
+
+# الحقول المكررة من العيادة (تُحدّث عند تعديل العيادة)
+CLINIC_SEARCH_FIELDS = ("clinic_name", "clinic_address", "clinic_phone", "search_terms")
+
+
+def normalize_search_text(text: Any) -> str:
+    """تطبيع النص للبحث: إزالة التشكيل وتوحيد الهمزات والتاء المربوطة والأرقام وحالة الأحرف"""
+    return ARABIC_DIACRITICS.sub("", str(text or "")).translate(ARABIC_LETTER_FORMS).casefold()
+
+
+def phone_terms(phone: Any) -> List[str]:
+    """أرقام الهاتف بصيغه الشائعة: كاملاً، محلياً (0...)، وبدون الصفر"""
+    digits = re.sub(r"\D", "", normalize_search_text(phone))
+    if digits.startswith("00"):
+        digits = digits[2:]
+    local = "0" + digits[2:] if digits.startswith("20") else digits
+    return [variant for variant in dict.fromkeys((digits, local, local.lstrip("0"))) if variant]
+
+
+def search_terms(*texts: Any) -> List[str]:
+    """كلمات البحث المطبّعة (مع نسخة بدون "ال" التعريف)"""
+    terms = []
+    for text in texts:
+        for word in re.findall(r"\w+", normalize_search_text(text)):
+            terms.append(word)
+            if word.startswith("ال") and len(word) > 4:
+                terms.append(word[2:])
+    return terms
+
+
+def clinic_search_fields(clinic: Dict[str, Any]) -> Dict[str, Any]:
+    """حقول العيادة المكررة في ملف العميل (clinics أو enhanced_clinics)"""
+    name = clinic.get("name") or clinic.get("clinic_name")
+    address = clinic.get("address") or (clinic.get("location_data") or {}).get("address")
+    phone = clinic.get("phone") or clinic.get("clinic_phone")
+    return {
+        "clinic_name": name,
+        "clinic_address": address,
+        "clinic_phone": phone,
+        "search_terms": list(dict.fromkeys(search_terms(name, address) + phone_terms(phone))),
+    }
+
+
+def search_text_query(text: str) -> Optional[Dict[str, Any]]:
+    """فلتر بادئات مرتكزة على مصطلحات البحث (يستخدم الفهرس) - every query word must match"""
+    if PHONE_QUERY.match(text.strip()):
+        tokens = phone_terms(text)[:1]
+    else:
+        tokens = list(dict.fromkeys(re.findall(r"\w+", normalize_search_text(text))))[:MAX_SEARCH_TOKENS]
+    if not tokens:
+        return None
+    return {"search_terms": {"$all": [re.compile("^" + re.escape(token)) for token in tokens]}}
+
+
+async def ensure_crm_search_indexes(db) -> None:
+    """فهارس بحث العملاء ومزامنة بيانات العيادة"""
+    profiles = db.client_profiles
+    await profiles.create_index([("search_terms", pymongo.ASCENDING), ("updated_at", pymongo.DESCENDING)])
+    await profiles.create_index([("assigned_rep_id", pymongo.ASCENDING), ("updated_at", pymongo.DESCENDING)])
+    await profiles.create_index([("clinic_id", pymongo.ASCENDING)])
+
+
+async def sync_client_profile_clinic(db, clinic: Dict[str, Any]) -> int:
+    """تحديث بيانات العيادة المكررة في ملفات العملاء بعد تعديل العيادة"""
+    if not clinic.get("id"):
+        return 0
+    result = await db.client_profiles.update_many({"clinic_id": clinic["id"]}, {"$set": clinic_search_fields(clinic)})
+    return result.modified_count
+
+# ============================================================================
+# CLIENT ANALYTICS - تحليلات العميل: خط $facet لكل مجموعة ونتيجة مخزنة
+# ============================================================================
+
+CLIENT_ANALYTICS_COLLECTION = "client_analytics"
+
+# صلاحية النتيجة المخزنة؛ تنتهي أيضاً عند منتصف الليل ("هذا الشهر" و"أيام منذ آخر زيارة")
+CLIENT_ANALYTICS_TTL = timedelta(hours=6)
+CLIENT_ANALYTICS_MONTHS = 12
+
+
+def client_analytics_expiry(now: datetime) -> datetime:
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return min(now + CLIENT_ANALYTICS_TTL, midnight)
+
+
+def as_datetime(value: Any) -> Optional[datetime]:
+    """تاريخ مخزن كـ datetime أو نص ISO"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is not None:
+            parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+        return parsed
+    return None
+
+
+def months_since(first: Optional[datetime], now: datetime) -> int:
+    """عدد الأشهر من أول سجل حتى الآن (شهر واحد على الأقل) لحساب التكرار الشهري"""
+    if not first:
+        return 1
+    return max(1, (now.year - first.year) * 12 + now.month - first.month + 1)
+
+
+def date_expression(field: str) -> Dict[str, Any]:
+    # created_at محفوظ كـ datetime أو كنص ISO حسب المسار الذي أنشأ المستند
+    return {"$convert": {"input": field, "to": "date", "onError": None, "onNull": None}}
+
+
+def interaction_analytics_pipeline(
+    client_id: str, month_start: datetime, last_month_start: datetime, history_start: datetime
+) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {"client_id": client_id}},
+        {"$project": {"_id": 0, "created": date_expression("$created_at")}},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "this_month": {"$sum": {"$cond": [{"$gte": ["$created", month_start]}, 1, 0]}},
+                "last_month": {"$sum": {"$cond": [
+                    {"$and": [{"$gte": ["$created", last_month_start]}, {"$lt": ["$created", month_start]}]}, 1, 0
+                ]}},
+                "first": {"$min": "$created"},
+            }}],
+            "by_month": [
+                {"$match": {"created": {"$gte": history_start}}},
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m", "date": "$created"}}, "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+        }},
+    ]
+
+
+def visit_analytics_pipeline(client_id: str) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {"clinic_id": client_id}},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "successful": {"$sum": {"$cond": [{"$eq": ["$effective", True]}, 1, 0]}},
+            }}],
+            "last": [{"$sort": {"date": -1}}, {"$limit": 1}, {"$project": {"_id": 0, "date": 1}}],
+        }},
+    ]
+
+
+def order_analytics_pipeline(client_id: str, month_start: datetime) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {"clinic_id": client_id}},
+        {"$project": {
+            "_id": 0,
+            "created": date_expression("$created_at"),
+            "amount": {"$convert": {"input": "$total_amount", "to": "double", "onError": 0.0, "onNull": 0.0}},
+        }},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "value": {"$sum": "$amount"},
+                "this_month": {"$sum": {"$cond": [{"$gte": ["$created", month_start]}, 1, 0]}},
+                "first": {"$min": "$created"},
+                "last": {"$max": "$created"},
+            }}],
+        }},
+    ]
+
+
+async def invalidate_client_analytics(db, client_id: Optional[str]) -> None:
+    """إلغاء تحليلات العميل المخزنة بعد تفاعل أو زيارة أو طلب جديد
+
+    Leaves a tombstone so a computation that started before this call does
+    not write its (now stale) result back.
+    """
+    if not client_id:
+        return
+    now = datetime.utcnow()
+    await db[CLIENT_ANALYTICS_COLLECTION].update_one(
+        {"_id": client_id},
+        {"$set": {"invalidated_at": now, "expires_at": now}, "$unset": {"analytics": ""}},
+        upsert=True
+    )
+
+
+async def ensure_client_analytics_indexes(db) -> None:
+    """حذف التحليلات المنتهية، وفهارس خطوط التجميع لكل عميل"""
+    await db[CLIENT_ANALYTICS_COLLECTION].create_index([("expires_at", pymongo.ASCENDING)], expireAfterSeconds=0)
+    await db.client_interactions.create_index([("client_id", pymongo.ASCENDING), ("created_at", pymongo.DESCENDING)])
+    await db.visits.create_index([("clinic_id", pymongo.ASCENDING), ("date", pymongo.DESCENDING)])
+    await db.orders.create_index([("clinic_id", pymongo.ASCENDING), ("created_at", pymongo.DESCENDING)])
+
+
+# ============================================================================
+# CLIENT HEALTH - نقاط الصحة وعلامات المخاطر (أعمدة NumPy: عميل واحد أو دفعة كاملة)
+# ============================================================================
+
+# مدخلات التقييم؛ القيم المفقودة (لا زيارات) تُمثل بـ NaN
+HEALTH_INPUT_FIELDS = (
+    "days_since_last_visit", "visit_success_rate", "total_orders", "total_order_value",
+    "average_order_value", "interactions_this_month", "orders_this_month",
+)
+
+# علامات المخاطر بالترتيب مع التوصية المقابلة لكل منها
+HEALTH_RISK_FLAGS: Dict[str, str] = {
+    "visit_overdue": "يحتاج إلى زيارة عاجلة - لم تتم زيارته لأكثر من شهر",
+    "low_visit_success": "معدل نجاح الزيارات منخفض - راجع استراتيجية الزيارة",
+    "no_orders": "لم يقم بأي طلبات - ركز على العروض التقديمية",
+    "no_interactions_this_month": "لا توجد تفاعلات هذا الشهر - تواصل فوري مطلوب",
+    "orders_stalled": "عميل نشط لكن لا توجد طلبات هذا الشهر - متابعة مطلوبة",
+}
+
+# أولوية المتابعة حسب نقاط الصحة (الحد الأعلى لكل مستوى) - FollowUpPriority values
+ATTENTION_PRIORITY_BANDS = (("urgent", 25.0), ("high", 50.0), ("medium", 75.0))
+AT_RISK_HEALTH_SCORE = 40.0
+
+
+def health_columns(rows: List[Any]) -> Dict[str, np.ndarray]:
+    """أعمدة التقييم من تحليلات عملاء (ClientAnalytics أو dict)"""
+    rows = [row.dict() if isinstance(row, ClientAnalytics) else row for row in rows]
+    return {
+        field: np.array([np.nan if row.get(field) is None else row[field] for row in rows], dtype=float)
+        for field in HEALTH_INPUT_FIELDS
+    }
+
+
+def health_scores(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """نقاط صحة العلاقة 0-100 لكل عميل"""
+    days = columns["days_since_last_visit"]
+    orders = columns["total_orders"]
+    value = columns["total_order_value"]
+    # المقارنة مع NaN خاطئة دائماً: بدون زيارات = 0 نقطة للحداثة
+    score = (
+        # التفاعل الأخير (30) + معدل نجاح الزيارات (25)
+        np.select([days <= 7, days <= 14, days <= 30], [30.0, 20.0, 10.0], 0.0)
+        + np.nan_to_num(columns["visit_success_rate"]) / 100 * 25
+        # تكرار الطلبات (25) + قيمة الطلبات (20)
+        + np.select([orders > 10, orders > 5, orders > 0], [25.0, 15.0, 10.0], 0.0)
+        + np.select([value > 10000, value > 5000, value > 1000], [20.0, 15.0, 10.0], 0.0)
+    )
+    return np.minimum(score, 100.0)
+
+
+def health_risk_flags(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """قناع منطقي لكل علامة خطر"""
+    return {
+        "visit_overdue": columns["days_since_last_visit"] > 30,
+        "low_visit_success": np.nan_to_num(columns["visit_success_rate"]) < 50,
+        "no_orders": np.nan_to_num(columns["total_orders"]) == 0,
+        "no_interactions_this_month": np.nan_to_num(columns["interactions_this_month"]) == 0,
+        "orders_stalled": (columns["average_order_value"] > 0) & (np.nan_to_num(columns["orders_this_month"]) == 0),
+    }
+
+
+def attention_priorities(scores: np.ndarray) -> np.ndarray:
+    conditions = [scores < upper for _, upper in ATTENTION_PRIORITY_BANDS]
+    return np.select(conditions, [name for name, _ in ATTENTION_PRIORITY_BANDS], "low")
+
+
+def client_health_fields(
+    scores: np.ndarray,
+    flags: Dict[str, np.ndarray],
+    priorities: np.ndarray,
+    index: int,
+    scored_at: datetime
+) -> Dict[str, Any]:
+    """حقول الصحة المخزنة في ملف العميل (للفرز والفلترة بالفهرس)"""
+    risk_flags = [flag for flag, mask in flags.items() if mask[index]]
+    return {
+        "health_score": round(float(scores[index]), 1),
+        "risk_flags": risk_flags,
+        "recommendations": [HEALTH_RISK_FLAGS[flag] for flag in risk_flags],
+        "attention_priority": str(priorities[index]),
+        "health_scored_at": scored_at,
+    }
+
 
 class CRMService:
     def __init__(self, db):
@@ -126,8 +423,8 @@ class CRMService:
             # حساب الإحصائيات الأولية
             await self._calculate_client_metrics(profile)
             
-            # حفظ في قاعدة البيانات
-            await self.db.client_profiles.insert_one(profile.dict())
+            # حفظ في قاعدة البيانات (مع بيانات العيادة للبحث)
+            await self.db.client_profiles.insert_one({**profile.dict(), **clinic_search_fields(clinic)})
             
             self.logger.info(f"Created client profile for clinic {clinic_id}")
             return profile
@@ -186,6 +483,11 @@ class CRMService:
                 **kwargs
             )
             
+            # إضافة المهمة إلى طابور التذكيرات
+            if task.status in OPEN_TASK_STATUSES:
+                for field, value in reminder_fields(task.reminder_date, task.due_date).items():
+                    setattr(task, field, value)
+            
             await self.db.follow_up_tasks.insert_one(task.dict())
             
             self.logger.info(f"Created follow-up task {task.id} for client {client_id}")
@@ -206,10 +508,14 @@ class CRMService:
                 {"_id": 0}
             ).sort("due_date", 1).limit(limit).to_list(limit)
             
-            # إضافة معلومات العميل
+            # إضافة معلومات العميل (استعلام واحد لكل الصفحة)
+            client_ids = list({task["client_id"] for task in tasks})
+            client_names = {
+                client["id"]: client.get("name")
+                async for client in self.db.clinics.find({"id": {"$in": client_ids}}, {"_id": 0, "id": 1, "name": 1})
+            }
             for task in tasks:
-                client = await self.db.clinics.find_one({"id": task["client_id"]}, {"name": 1})
-                task["client_name"] = client.get("name", "غير محدد") if client else "غير محدد"
+                task["client_name"] = client_names.get(task["client_id"]) or "غير محدد"
                 
                 # تنسيق التواريخ
                 for date_field in ["due_date", "reminder_date", "created_at", "completed_at"]:
@@ -240,6 +546,7 @@ class CRMService:
                     }
                 }
             )
+            await cancel_reminder(self.db, task_id)
             
             return result.modified_count > 0
             
@@ -283,40 +590,39 @@ class CRMService:
             if search_filter.tags:
                 query["tags"] = {"$in": search_filter.tags}
             
-            # النص البحثي
+            # نقاط الصحة من التقييم الليلي (فهرس health_score)
+            if search_filter.health_score_max is not None:
+                query["health_score"] = {"$lte": search_filter.health_score_max}
+            
+            if search_filter.risk_flag:
+                query["risk_flags"] = search_filter.risk_flag
+            
+            # النص البحثي: بادئات مرتكزة على مصطلحات العيادة المكررة في ملف العميل (فهرس search_terms)
             if search_filter.search_text:
-                # البحث في العيادات المرتبطة
-                clinic_query = {
-                    "$or": [
-                        {"name": {"$regex": search_filter.search_text, "$options": "i"}},
-                        {"address": {"$regex": search_filter.search_text, "$options": "i"}},
-                        {"phone": {"$regex": search_filter.search_text, "$options": "i"}}
-                    ]
-                }
-                matching_clinics = await self.db.clinics.find(clinic_query, {"id": 1}).to_list(1000)
-                clinic_ids = [clinic["id"] for clinic in matching_clinics]
-                query["clinic_id"] = {"$in": clinic_ids}
+                text_query = search_text_query(search_filter.search_text)
+                if text_query:
+                    query.update(text_query)
             
             # العدد الإجمالي
             total_count = await self.db.client_profiles.count_documents(query)
             
             # الحصول على النتائج
             profiles = await self.db.client_profiles.find(
-                query, {"_id": 0}
-            ).sort("updated_at", -1).skip(search_filter.offset).limit(search_filter.limit).to_list(search_filter.limit)
+                query, {"_id": 0, "search_terms": 0}
+            ).sort(
+                search_filter.sort_by, pymongo.ASCENDING if search_filter.sort_order == "asc" else pymongo.DESCENDING
+            ).skip(search_filter.offset).limit(search_filter.limit).to_list(search_filter.limit)
             
-            # إضافة معلومات العيادة
+            # معلومات العيادة من الحقول المكررة (بدون استعلام لكل صف)
             for profile in profiles:
-                clinic = await self.db.clinics.find_one({"id": profile["clinic_id"]})
-                if clinic:
-                    profile["clinic_info"] = {
-                        "name": clinic.get("name", "غير محدد"),
-                        "address": clinic.get("address", "غير محدد"),
-                        "phone": clinic.get("phone", "غير محدد")
-                    }
+                profile["clinic_info"] = {
+                    "name": profile.pop("clinic_name", None) or "غير محدد",
+                    "address": profile.pop("clinic_address", None) or "غير محدد",
+                    "phone": profile.pop("clinic_phone", None) or "غير محدد"
+                }
                 
                 # تنسيق التواريخ
-                for date_field in ["last_interaction_date", "next_scheduled_interaction", "last_order_date", "created_at", "updated_at"]:
+                for date_field in ["last_interaction_date", "next_scheduled_interaction", "last_order_date", "health_scored_at", "created_at", "updated_at"]:
                     if profile.get(date_field) and isinstance(profile[date_field], datetime):
                         profile[date_field] = profile[date_field].isoformat()
             
@@ -332,81 +638,112 @@ class CRMService:
             return {"profiles": [], "total_count": 0, "has_more": False}
 
     async def get_client_analytics(self, client_id: str) -> ClientAnalytics:
-        """الحصول على تحليلات العميل"""
+        """الحصول على تحليلات العميل (مخزنة حتى تفاعل/زيارة/طلب جديد)"""
         try:
-            # الحصول على معلومات العميل
-            client = await self.db.clinics.find_one({"id": client_id})
-            client_name = client.get("name", "غير محدد") if client else "غير محدد"
-            
-            analytics = ClientAnalytics(
-                client_id=client_id,
-                client_name=client_name
-            )
-            
-            # تحليل التفاعلات
-            total_interactions = await self.db.client_interactions.count_documents({"client_id": client_id})
-            analytics.total_interactions = total_interactions
-            
-            # التفاعلات هذا الشهر
-            month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            month_interactions = await self.db.client_interactions.count_documents({
-                "client_id": client_id,
-                "created_at": {"$gte": month_start}
-            })
-            analytics.interactions_this_month = month_interactions
-            
-            # الشهر الماضي
-            last_month_start = (month_start - timedelta(days=1)).replace(day=1)
-            last_month_interactions = await self.db.client_interactions.count_documents({
-                "client_id": client_id,
-                "created_at": {"$gte": last_month_start, "$lt": month_start}
-            })
-            analytics.interactions_last_month = last_month_interactions
-            
-            # تحليل الزيارات
-            total_visits = await self.db.visits.count_documents({"clinic_id": client_id})
-            successful_visits = await self.db.visits.count_documents({"clinic_id": client_id, "effective": True})
-            analytics.total_visits = total_visits
-            analytics.successful_visits = successful_visits
-            analytics.visit_success_rate = (successful_visits / total_visits * 100) if total_visits > 0 else 0
-            
-            # آخر زيارة
-            last_visit = await self.db.visits.find_one(
-                {"clinic_id": client_id},
-                sort=[("date", -1)]
-            )
-            if last_visit:
-                analytics.last_visit_date = last_visit.get("date")
-                if isinstance(analytics.last_visit_date, datetime):
-                    analytics.days_since_last_visit = (datetime.utcnow() - analytics.last_visit_date).days
-            
-            # تحليل الطلبات
-            orders = await self.db.orders.find({"clinic_id": client_id}).to_list(1000)
-            analytics.total_orders = len(orders)
-            
-            if orders:
-                total_value = sum(order.get("total_amount", 0) for order in orders)
-                analytics.total_order_value = total_value
-                analytics.average_order_value = total_value / len(orders)
-                
-                # طلبات هذا الشهر
-                month_orders = [order for order in orders if order.get("created_at") and order["created_at"] >= month_start]
-                analytics.orders_this_month = len(month_orders)
-            
-            # حساب نقاط الصحة
-            health_score = self._calculate_health_score(analytics)
-            analytics.health_score = health_score
-            
-            # التوصيات
-            recommendations = self._generate_recommendations(analytics)
-            analytics.recommendations = recommendations
-            
-            return analytics
+            return await self._client_analytics(client_id)
             
         except Exception as e:
             self.logger.error(f"Error getting client analytics: {e}")
             return ClientAnalytics(client_id=client_id, client_name="خطأ في البيانات")
 
+    async def _client_analytics(self, client_id: str) -> ClientAnalytics:
+        now = datetime.utcnow()
+        cached = await self.db[CLIENT_ANALYTICS_COLLECTION].find_one({"_id": client_id})
+        if cached and cached.get("analytics") and cached["expires_at"] > now:
+            return ClientAnalytics(**cached["analytics"])
+        
+        analytics = await self._compute_client_analytics(client_id, now)
+        
+        # حساب نقاط الصحة والتوصيات مرة واحدة مع التحليلات
+        columns = health_columns([analytics])
+        scores = health_scores(columns)
+        health = client_health_fields(scores, health_risk_flags(columns), attention_priorities(scores), 0, now)
+        analytics.health_score = float(scores[0])
+        analytics.recommendations = health["recommendations"]
+        
+        # نفس حقول التقييم الليلي في ملف العميل (يبقى الفرز حسب الصحة حديثاً)
+        await self.db.client_profiles.update_one({"clinic_id": client_id}, {"$set": health})
+        
+        # لا تُخزن النتيجة إن أُلغيت أثناء الحساب (بيانات أحدث وصلت بعد بدايته)
+        try:
+            await self.db[CLIENT_ANALYTICS_COLLECTION].update_one(
+                {"_id": client_id, "$or": [
+                    {"invalidated_at": {"$exists": False}}, {"invalidated_at": {"$lt": now}}
+                ]},
+                {"$set": {
+                    "analytics": analytics.dict(),
+                    "computed_at": now,
+                    "expires_at": client_analytics_expiry(now)
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+        return analytics
+
+    async def _compute_client_analytics(self, client_id: str, now: datetime) -> ClientAnalytics:
+        """خط تجميع واحد ($facet) لكل مجموعة، تُنفذ بالتوازي"""
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+        history_start = month_start
+        for _ in range(CLIENT_ANALYTICS_MONTHS - 1):
+            history_start = (history_start - timedelta(days=1)).replace(day=1)
+        
+        clinic, interactions, visits, orders = await asyncio.gather(
+            self.db.clinics.find_one({"id": client_id}, {"_id": 0, "name": 1}),
+            self._facet(self.db.client_interactions, interaction_analytics_pipeline(
+                client_id, month_start, last_month_start, history_start
+            )),
+            self._facet(self.db.visits, visit_analytics_pipeline(client_id)),
+            self._facet(self.db.orders, order_analytics_pipeline(client_id, month_start))
+        )
+        
+        analytics = ClientAnalytics(
+            client_id=client_id,
+            client_name=clinic.get("name", "غير محدد") if clinic else "غير محدد"
+        )
+        
+        # تحليل التفاعلات
+        interaction_totals = (interactions["totals"] or [{}])[0]
+        analytics.total_interactions = interaction_totals.get("total", 0)
+        analytics.interactions_this_month = interaction_totals.get("this_month", 0)
+        analytics.interactions_last_month = interaction_totals.get("last_month", 0)
+        analytics.interactions_by_month = {row["_id"]: row["count"] for row in interactions["by_month"] if row["_id"]}
+        analytics.interaction_frequency = round(
+            analytics.total_interactions / months_since(interaction_totals.get("first"), now), 2
+        )
+        
+        # تحليل الزيارات
+        visit_totals = (visits["totals"] or [{}])[0]
+        analytics.total_visits = visit_totals.get("total", 0)
+        analytics.successful_visits = visit_totals.get("successful", 0)
+        analytics.visit_success_rate = (
+            analytics.successful_visits / analytics.total_visits * 100 if analytics.total_visits > 0 else 0
+        )
+        
+        # آخر زيارة
+        if visits["last"]:
+            analytics.last_visit_date = as_datetime(visits["last"][0].get("date"))
+            if analytics.last_visit_date:
+                analytics.days_since_last_visit = (now - analytics.last_visit_date).days
+        
+        # تحليل الطلبات
+        order_totals = (orders["totals"] or [{}])[0]
+        analytics.total_orders = order_totals.get("count", 0)
+        if analytics.total_orders:
+            analytics.total_order_value = order_totals.get("value", 0.0)
+            analytics.average_order_value = analytics.total_order_value / analytics.total_orders
+            analytics.orders_this_month = order_totals.get("this_month", 0)
+            analytics.last_order_date = order_totals.get("last")
+            analytics.order_frequency = round(analytics.total_orders / months_since(order_totals.get("first"), now), 2)
+        
+        analytics.last_updated = now
+        return analytics
+
+    @staticmethod
+    async def _facet(collection, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return (await collection.aggregate(pipeline).to_list(length=1))[0]
+
     async def get_crm_dashboard(self, rep_id: str = None) -> CRMDashboard:
         """الحصول على لوحة معلومات CRM"""
         try:
@@ -449,15 +786,20 @@ class CRMService:
             # أفضل العملاء
             top_clients = await self.db.client_profiles.find(
                 query,
-                {"_id": 0, "clinic_id": 1, "total_order_value": 1}
+                {"_id": 0, "clinic_id": 1, "clinic_name": 1, "total_order_value": 1}
             ).sort("total_order_value", -1).limit(5).to_list(5)
             
             for client in top_clients:
-                clinic = await self.db.clinics.find_one({"id": client["clinic_id"]}, {"name": 1})
-                client["clinic_name"] = clinic.get("name", "غير محدد") if clinic else "غير محدد"
+                client["clinic_name"] = client.get("clinic_name") or "غير محدد"
             
             dashboard.top_clients = top_clients
             
+            # العملاء المعرضون للخطر: أقل نقاط صحة (محسوبة ليلياً)
+            dashboard.at_risk_clients = await self.db.client_profiles.find(
+                {**query, "health_score": {"$lt": AT_RISK_HEALTH_SCORE}},
+                {"_id": 0, "clinic_id": 1, "clinic_name": 1, "health_score": 1, "risk_flags": 1, "attention_priority": 1}
+            ).sort("health_score", 1).limit(5).to_list(5)
+            
             return dashboard
             
         except Exception as e:
@@ -468,6 +810,8 @@ class CRMService:
     async def _update_client_interaction_summary(self, client_id: str):
         """تحديث ملخص تفاعلات العميل"""
         try:
+            await invalidate_client_analytics(self.db, client_id)
+            
             # عدد التفاعلات
             total_interactions = await self.db.client_interactions.count_documents({"client_id": client_id})
             
@@ -509,75 +853,24 @@ class CRMService:
             self.logger.error(f"Error updating client interaction summary: {e}")
 
     async def _calculate_client_metrics(self, profile: ClientProfile):
-        """حساب مقاييس العميل"""
+        """حساب مقاييس العميل (من تحليلات العميل المخزنة)"""
         try:
-            # إحصائيات الطلبات
-            orders = await self.db.orders.find({"clinic_id": profile.clinic_id}).to_list(1000)
-            
-            profile.total_orders = len(orders)
-            if orders:
-                total_value = sum(order.get("total_amount", 0) for order in orders)
-                profile.total_order_value = total_value
-                profile.average_order_value = total_value / len(orders)
-                
-                # آخر طلب
-                last_order = max(orders, key=lambda x: x.get("created_at", datetime.min))
-                profile.last_order_date = last_order.get("created_at")
+            analytics = await self._client_analytics(profile.clinic_id)
+            
+            profile.total_orders = analytics.total_orders
+            if analytics.total_orders:
+                profile.total_order_value = analytics.total_order_value
+                profile.average_order_value = analytics.average_order_value
+                profile.last_order_date = analytics.last_order_date
             
         except Exception as e:
             self.logger.error(f"Error calculating client metrics: {e}")
 
     def _calculate_health_score(self, analytics: ClientAnalytics) -> float:
         """حساب نقاط صحة العلاقة مع العميل"""
-        score = 0.0
-        
-        # التفاعل الأخير (30 نقطة كحد أقصى)
-        if analytics.days_since_last_visit is not None:
-            if analytics.days_since_last_visit <= 7:
-                score += 30
-            elif analytics.days_since_last_visit <= 14:
-                score += 20
-            elif analytics.days_since_last_visit <= 30:
-                score += 10
-        
-        # معدل نجاح الزيارات (25 نقطة كحد أقصى)
-        score += (analytics.visit_success_rate / 100) * 25
-        
-        # تكرار الطلبات (25 نقطة كحد أقصى)
-        if analytics.total_orders > 10:
-            score += 25
-        elif analytics.total_orders > 5:
-            score += 15
-        elif analytics.total_orders > 0:
-            score += 10
-        
-        # قيمة الطلبات (20 نقطة كحد أقصى)
-        if analytics.total_order_value > 10000:
-            score += 20
-        elif analytics.total_order_value > 5000:
-            score += 15
-        elif analytics.total_order_value > 1000:
-            score += 10
-        
-        return min(score, 100.0)
+        return float(health_scores(health_columns([analytics]))[0])
 
     def _generate_recommendations(self, analytics: ClientAnalytics) -> List[str]:
         """إنتاج توصيات بناءً على التحليلات"""
-        recommendations = []
-        
-        if analytics.days_since_last_visit and analytics.days_since_last_visit > 30:
-            recommendations.append("يحتاج إلى زيارة عاجلة - لم تتم زيارته لأكثر من شهر")
-        
-        if analytics.visit_success_rate < 50:
-            recommendations.append("معدل نجاح الزيارات منخفض - راجع استراتيجية الزيارة")
-        
-        if analytics.total_orders == 0:
-            recommendations.append("لم يقم بأي طلبات - ركز على العروض التقديمية")
-        
-        if analytics.interactions_this_month == 0:
-            recommendations.append("لا توجد تفاعلات هذا الشهر - تواصل فوري مطلوب")
-        
-        if analytics.average_order_value > 0 and analytics.orders_this_month == 0:
-            recommendations.append("عميل نشط لكن لا توجد طلبات هذا الشهر - متابعة مطلوبة")
-        
-        return recommendations
\ No newline at end of file
+        flags = health_risk_flags(health_columns([analytics]))
+        return [message for flag, message in HEALTH_RISK_FLAGS.items() if flags[flag][0]]
\ No newline at end of file
@@ -0,0 +1,438 @@
+# نظام الإدارة الطبية المتكامل - عدادات إحصائيات الديون التزايدية
+# Medical Management System - Incrementally maintained debt statistics counters
+
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+from decimal import Decimal
+import copy
+import logging
+from bson.decimal128 import Decimal128
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne, ReplaceOne
+import pymongo
+
+from services.money_codec import to_decimal, money_amount
+from services.payment_ledger_service import to_bson_value
+
+DEBT_STATISTICS_COLLECTION = "debt_statistics"
+
+# مستند العداد العام، ومستند لكل مندوب بالمعرف rep:<id>
+ALL_SCOPE = "all"
+REP_SCOPE = "rep"
+
+COUNTER_AMOUNTS = ("total_original", "total_outstanding", "total_collected")
+COUNTER_COUNTS = ("total_debts", "overdue_count", "fully_collected_count", "days_overdue_sum")
+
+SETTLED_STATUSES = ("fully_collected", "settled", "paid")
+
+_ZERO = Decimal("0.00")
+
+logger = logging.getLogger(__name__)
+
+
+def calculate_aging_category(due_date: datetime) -> tuple[int, str]:
+    """Calculate aging days and category"""
+    if not due_date:
+        return 0, "current"
+
+    days_overdue = max(0, (datetime.utcnow() - due_date).days)
+
+    if days_overdue <= 0:
+        category = "current"
+    elif days_overdue <= 30:
+        category = "1-30"
+    elif days_overdue <= 60:
+        category = "31-60"
+    elif days_overdue <= 90:
+        category = "61-90"
+    else:
+        category = "90+"
+
+    return days_overdue, category
+
+
+# ============================================================================
+# CONTRIBUTIONS - مساهمة كل دين في العدادات
+# ============================================================================
+
+def _key(value: Any) -> str:
+    # مفاتيح الحقول الفرعية لا تقبل النقاط ولا $ في بدايتها
+    if value is None:
+        return "unknown"
+    value = getattr(value, "value", value)  # Enum → قيمته
+    return str(value).replace(".", "_").lstrip("$") or "unknown"
+
+
+def debt_rep(debt: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """مندوب الدين: المتكامل sales_rep_id، إدارة الديون assigned_to_id، المحاسبة rep_id"""
+    for id_field, name_field in (
+        ("sales_rep_id", "sales_rep_name"), ("assigned_to_id", "assigned_to_name"), ("rep_id", "rep_name")
+    ):
+        if debt.get(id_field):
+            return str(debt[id_field]), debt.get(name_field)
+    return None, None
+
+
+def debt_amounts(debt: Dict[str, Any]) -> Tuple[Decimal, Decimal, Decimal, str]:
+    """(الأصلي، المتبقي، المحصل، الحالة) لأي شكل من أشكال مستند الدين"""
+    original = money_amount(debt.get("original_amount"))
+    if original is None:
+        original = money_amount(debt.get("total_amount")) or money_amount(debt.get("amount")) or _ZERO
+    outstanding = money_amount(debt.get("outstanding_amount"))
+    if outstanding is None:
+        outstanding = money_amount(debt.get("remaining_amount"))
+    status = getattr(debt.get("status"), "value", debt.get("status")) or "unknown"
+    if outstanding is None:
+        outstanding = _ZERO if status in SETTLED_STATUSES else original
+    collected = money_amount(debt.get("paid_amount"))
+    if collected is None:
+        collected = max(original - outstanding, _ZERO)
+    return original, outstanding, collected, str(status)
+
+
+def debt_contribution(debt: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """مساهمة دين واحد في العدادات كحقول $inc مسطحة (كل أشكال مستند الدين)"""
+    if not debt:
+        return {}
+    original, outstanding, collected, status = debt_amounts(debt)
+    days_overdue = int(debt.get("days_overdue") or 0)
+
+    status_key = _key(status)
+    aging_key = _key(debt.get("aging_category") or "none")
+    return {
+        "total_debts": 1,
+        "total_original": original,
+        "total_outstanding": outstanding,
+        "total_collected": collected,
+        "overdue_count": 1 if days_overdue > 0 else 0,
+        "fully_collected_count": 1 if status == "fully_collected" else 0,
+        "days_overdue_sum": days_overdue,
+        f"by_status.{status_key}.count": 1,
+        f"by_status.{status_key}.original": original,
+        f"by_status.{status_key}.outstanding": outstanding,
+        f"by_aging.{aging_key}.count": 1,
+        f"by_aging.{aging_key}.outstanding": outstanding,
+    }
+
+
+def _difference(after: Dict[str, Any], before: Dict[str, Any]) -> Dict[str, Any]:
+    delta: Dict[str, Any] = {}
+    for field in set(after) | set(before):
+        value = after.get(field, 0) - before.get(field, 0)
+        if value:
+            delta[field] = value
+    return delta
+
+
+def _negate(contribution: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: -value for field, value in contribution.items() if value}
+
+
+def debt_statistics_updates(
+    before: Optional[Dict[str, Any]],
+    after: Optional[Dict[str, Any]]
+) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(فلتر، تحديث) لكل مستند عداد يتأثر بانتقال الدين من before إلى after
+
+    ``before=None`` is a creation, ``after=None`` a deletion. A change of rep
+    moves the debt's whole contribution from the old rep's counter to the new one.
+    """
+    before_contribution = debt_contribution(before)
+    after_contribution = debt_contribution(after)
+    now = datetime.utcnow()
+
+    deltas: List[Tuple[str, Optional[str], Optional[str], Dict[str, Any]]] = [
+        (ALL_SCOPE, None, None, _difference(after_contribution, before_contribution))
+    ]
+    before_rep, _ = debt_rep(before or {})
+    after_rep, after_rep_name = debt_rep(after or {})
+    if before_rep == after_rep:
+        if after_rep:
+            deltas.append((REP_SCOPE, after_rep, after_rep_name, deltas[0][3]))
+    else:
+        if before_rep:
+            deltas.append((REP_SCOPE, before_rep, None, _negate(before_contribution)))
+        if after_rep:
+            deltas.append((REP_SCOPE, after_rep, after_rep_name, after_contribution))
+
+    updates = []
+    for scope, rep_id, rep_name, increments in deltas:
+        if not increments:
+            continue
+        counter_id = ALL_SCOPE if scope == ALL_SCOPE else f"{REP_SCOPE}:{rep_id}"
+        fields: Dict[str, Any] = {"updated_at": now}
+        if rep_name:
+            fields["rep_name"] = rep_name
+        updates.append((
+            {"id": counter_id},
+            to_bson_value({
+                "$inc": increments,
+                "$set": fields,
+                "$setOnInsert": {"scope": scope, "rep_id": rep_id, "created_at": now},
+            })
+        ))
+    return updates
+
+
+# ============================================================================
+# WRITE HOOKS - تحديث العدادات مع كتابات الديون
+# ============================================================================
+
+# العدادات تُحدَّث بعد نجاح كتابة الدين وليس داخل معاملتها: كل دين ودفعة يزيدان مستند
+# "all" نفسه، فوضعه داخل المعاملات يجعل الكتابات المتزامنة تتعارض عليه (WriteConflict).
+# فشل التحديث يُسجَّل فقط - reconcile_debt_statistics يصلح الانحراف.
+
+async def apply_debt_statistics_delta(
+    db: AsyncIOMotorDatabase,
+    before: Optional[Dict[str, Any]],
+    after: Optional[Dict[str, Any]]
+) -> None:
+    """تطبيق فرق العدادات بعد حفظ الدين (خارج أي معاملة)"""
+    updates = debt_statistics_updates(before, after)
+    if not updates:
+        return
+    try:
+        await db[DEBT_STATISTICS_COLLECTION].bulk_write(
+            [UpdateOne(filter, update, upsert=True) for filter, update in updates],
+            ordered=False
+        )
+    except Exception as e:
+        logger.error(f"Error updating debt statistics counters (reconcile will repair them): {e}")
+
+
+def stage_debt_statistics_delta(uow, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+    """تحديث العدادات بعد تنفيذ وحدة العمل (UnitOfWork)"""
+    uow.after_commit(lambda: apply_debt_statistics_delta(uow.db, before, after))
+
+
+def debt_before_payment(debt: Dict[str, Any], amount: Any, fields) -> Dict[str, Any]:
+    """حالة الدين قبل الدفعة من الحالة بعدها (الترحيل يحفظ previous_status)"""
+    before = copy.deepcopy(debt)
+    amount = to_decimal(amount)
+    for field, sign in ((fields.remaining_field, 1), (fields.paid_field, -1)):
+        container = before
+        parts = field.split(".")
+        for part in parts[:-1]:
+            container = container.setdefault(part, {})
+        container[parts[-1]] = (money_amount(container.get(parts[-1])) or _ZERO) + sign * amount
+    before[fields.status_field] = debt.get("previous_status", debt.get(fields.status_field))
+    return before
+
+
+def payment_statistics_hook(db: AsyncIOMotorDatabase, amount: Any, fields):
+    """خطاف ما بعد ترحيل الدفعة (after_commit في post_debt_payment)"""
+    async def _hook(debt: Dict[str, Any]) -> None:
+        await apply_debt_statistics_delta(db, debt_before_payment(debt, amount, fields), debt)
+    return _hook
+
+
+async def refresh_debt_aging(db: AsyncIOMotorDatabase) -> int:
+    """تحديث أيام التأخير وفئة التقادم للديون النشطة مع عداداتها
+
+    Aging only moves with the calendar, so this runs once a day (nightly job,
+    or lazily on the first debt request of the day). Returns the number of
+    debts whose aging changed.
+    """
+    changed = 0
+    cursor = db.debts.find({
+        "status": {"$nin": ["fully_collected", "written_off"]},
+        "original_due_date": {"$ne": None}
+    }, {"_id": 0})
+    async for debt in cursor:
+        due_date = debt.get("original_due_date")
+        if isinstance(due_date, str):
+            due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00')).replace(tzinfo=None)
+
+        days_overdue, aging_category = calculate_aging_category(due_date)
+
+        # Update status if now overdue
+        new_status = debt.get("status")
+        if days_overdue > 0 and new_status in ["pending", "assigned"]:
+            new_status = "overdue"
+
+        if (debt.get("days_overdue") != days_overdue or
+            debt.get("aging_category") != aging_category or
+            debt.get("status") != new_status):
+            changes = {
+                "days_overdue": days_overdue,
+                "aging_category": aging_category,
+                "status": new_status,
+            }
+            # الحارس على الحالة السابقة يمنع احتساب انتقال سبقته كتابة أخرى
+            result = await db.debts.update_one(
+                {"id": debt["id"], "status": debt.get("status"), "days_overdue": debt.get("days_overdue"),
+                 "aging_category": debt.get("aging_category")},
+                {"$set": {**changes, "updated_at": datetime.utcnow()}}
+            )
+            if result.modified_count:
+                await apply_debt_statistics_delta(db, debt, {**debt, **changes})
+                changed += 1
+    return changed
+
+
+# ============================================================================
+# READ - قراءة العدادات
+# ============================================================================
+
+def _float(value: Any) -> float:
+    return float(to_decimal(value))
+
+
+def format_debt_statistics(counter: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """مستند العداد → أرقام العرض (مطابقة لشكل /debts/statistics/overview)"""
+    counter = counter or {}
+    total_debts = int(counter.get("total_debts") or 0)
+    total_original = _float(counter.get("total_original"))
+    total_collected = _float(counter.get("total_collected"))
+    overdue_count = int(counter.get("overdue_count") or 0)
+    return {
+        "total_debts": total_debts,
+        "total_outstanding": _float(counter.get("total_outstanding")),
+        "total_original": total_original,
+        "total_collected": total_collected,
+        "collection_rate": round(total_collected / total_original * 100, 2) if total_original > 0 else 0,
+        "overdue_count": overdue_count,
+        "overdue_rate": round(overdue_count / total_debts * 100, 2) if total_debts > 0 else 0,
+        "fully_collected_count": int(counter.get("fully_collected_count") or 0),
+        "average_days_overdue": round(int(counter.get("days_overdue_sum") or 0) / total_debts, 1) if total_debts else 0,
+        "status_distribution": {
+            status: int(entry.get("count") or 0)
+            for status, entry in (counter.get("by_status") or {}).items() if entry.get("count")
+        },
+        "status_amounts": {
+            status: {"original": _float(entry.get("original")), "outstanding": _float(entry.get("outstanding"))}
+            for status, entry in (counter.get("by_status") or {}).items() if entry.get("count")
+        },
+        "aging_distribution": {
+            aging: int(entry.get("count") or 0)
+            for aging, entry in (counter.get("by_aging") or {}).items() if entry.get("count")
+        },
+    }
+
+
+async def get_debt_statistics(db: AsyncIOMotorDatabase, rep_id: Optional[str] = None) -> Dict[str, Any]:
+    """إحصائيات الديون من مستند عداد واحد - O(1) مهما كبر جدول الديون"""
+    counter_id = f"{REP_SCOPE}:{rep_id}" if rep_id else ALL_SCOPE
+    counter = await db[DEBT_STATISTICS_COLLECTION].find_one({"id": counter_id}, {"_id": 0})
+    return format_debt_statistics(counter)
+
+
+async def get_top_collectors(db: AsyncIOMotorDatabase, limit: int = 10) -> List[Dict[str, Any]]:
+    """المناديب الأعلى مستحقات من عداداتهم (فهرس scope + total_outstanding)"""
+    counters = await db[DEBT_STATISTICS_COLLECTION].find(
+        {"scope": REP_SCOPE, "total_debts": {"$gt": 0}},
+        {"_id": 0, "rep_id": 1, "rep_name": 1, "total_outstanding": 1, "total_debts": 1}
+    ).sort("total_outstanding", -1).limit(limit).to_list(length=limit)
+    return [
+        {
+            "rep_name": counter.get("rep_name") or "غير محدد",
+            "rep_id": counter["rep_id"],
+            "total_assigned": _float(counter.get("total_outstanding")),
+            "debt_count": int(counter.get("total_debts") or 0),
+        }
+        for counter in counters
+    ]
+
+
+# ============================================================================
+# RECONCILIATION - المطابقة الليلية مع العد الكامل
+# ============================================================================
+
+def _add(target: Dict[str, Any], contribution: Dict[str, Any]) -> None:
+    for field, value in contribution.items():
+        target[field] = target.get(field, 0) + value
+
+
+def _flatten(document: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat: Dict[str, Any] = {}
+    for field, value in document.items():
+        path = f"{prefix}{field}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+        elif field in COUNTER_AMOUNTS or field in COUNTER_COUNTS or prefix.startswith(("by_status.", "by_aging.")):
+            flat[path] = to_decimal(value) if isinstance(value, (Decimal, Decimal128)) else value
+    return flat
+
+
+def _unflatten(flat: Dict[str, Any]) -> Dict[str, Any]:
+    document: Dict[str, Any] = {}
+    for path, value in flat.items():
+        container = document
+        parts = path.split(".")
+        for part in parts[:-1]:
+            container = container.setdefault(part, {})
+        container[parts[-1]] = value
+    return document
+
+
+async def reconcile_debt_statistics(db: AsyncIOMotorDatabase, repair: bool = True) -> Dict[str, Any]:
+    """مطابقة العدادات مع إعادة عد كاملة لمستندات الديون
+
+    Streams every debt once (projected), folds the same contributions the write
+    hooks apply, and compares them with the stored counters. Mismatching (or
+    missing/orphan) counters are reported and, with ``repair``, replaced.
+    Writes landing mid-run can be overwritten, so schedule it in a quiet window.
+    """
+    expected: Dict[str, Dict[str, Any]] = {}
+    rep_names: Dict[str, Optional[str]] = {}
+    async for debt in db.debts.find({}, {"_id": 0, "items": 0, "payment_history": 0}):
+        contribution = debt_contribution(debt)
+        _add(expected.setdefault(ALL_SCOPE, {}), contribution)
+        rep_id, rep_name = debt_rep(debt)
+        if rep_id:
+            _add(expected.setdefault(f"{REP_SCOPE}:{rep_id}", {}), contribution)
+            rep_names[rep_id] = rep_name or rep_names.get(rep_id)
+
+    stored = {
+        counter["id"]: _flatten(counter)
+        async for counter in db[DEBT_STATISTICS_COLLECTION].find({}, {"_id": 0})
+    }
+
+    mismatches = []
+    for counter_id in set(expected) | set(stored):
+        fresh = {field: value for field, value in expected.get(counter_id, {}).items() if value}
+        current = {field: value for field, value in stored.get(counter_id, {}).items() if value}
+        diff = {
+            field: {"expected": str(fresh.get(field, 0)), "stored": str(current.get(field, 0))}
+            for field in set(fresh) | set(current)
+            if to_decimal(fresh.get(field, 0)) != to_decimal(current.get(field, 0))
+        }
+        if diff:
+            mismatches.append({"id": counter_id, "fields": diff})
+
+    if repair and mismatches:
+        now = datetime.utcnow()
+        operations = []
+        for mismatch in mismatches:
+            counter_id = mismatch["id"]
+            rep_id = counter_id.split(":", 1)[1] if counter_id != ALL_SCOPE else None
+            document = {
+                "id": counter_id,
+                "scope": REP_SCOPE if rep_id else ALL_SCOPE,
+                "rep_id": rep_id,
+                **_unflatten({field: value for field, value in expected.get(counter_id, {}).items()}),
+                "reconciled_at": now,
+                "updated_at": now,
+                "created_at": now,
+            }
+            if rep_id and rep_names.get(rep_id):
+                document["rep_name"] = rep_names[rep_id]
+            operations.append(ReplaceOne({"id": counter_id}, to_bson_value(document), upsert=True))
+        await db[DEBT_STATISTICS_COLLECTION].bulk_write(operations, ordered=False)
+
+    report = {
+        "checked_at": datetime.utcnow(),
+        "counters": len(set(expected) | set(stored)),
+        "mismatches": len(mismatches),
+        "repaired": bool(repair and mismatches),
+        "details": mismatches[:50],
+    }
+    await db.debt_statistics_reconciliations.insert_one(dict(report))
+    return report
+
+
+async def ensure_debt_statistics_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهارس العدادات"""
+    counters = db[DEBT_STATISTICS_COLLECTION]
+    await counters.create_index([("id", pymongo.ASCENDING)], unique=True)
+    await counters.create_index([("scope", pymongo.ASCENDING), ("total_outstanding", pymongo.DESCENDING)])
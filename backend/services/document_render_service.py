@@ -0,0 +1,471 @@
+# نظام الإدارة الطبية المتكامل - خدمة تصيير المستندات (كشوف الحساب والفواتير)
+# Medical Management System - Document rendering: cached templates, process pool, merged batches
+
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterable
+from datetime import datetime, date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from string import Template
+import asyncio
+import html
+import os
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.clinic_balance_service import CLOSED_DEBT_STATUSES
+from services.debt_statistics_service import debt_amounts, debt_rep
+from services.payment_ledger_service import PAYMENT_LEDGER_COLLECTION
+from services.money_codec import money_amount
+
+try:
+    # WeasyPrint يحتاج مكتبات Pango على النظام؛ ImportError أو OSError عند غيابها
+    from weasyprint import HTML as WeasyHTML
+    PDF_RENDERING_AVAILABLE = True
+except (ImportError, OSError):
+    WeasyHTML = None
+    PDF_RENDERING_AVAILABLE = False
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates" / "documents"
+
+# عدد عمليات التصيير (افتراضياً عدد المعالجات) وحجم الدفعة المرسلة لكل عملية
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 0)) or (os.cpu_count() or 1)
+RENDER_CHUNK_SIZE = 25
+
+# تصيير HTML رخيص (~0.2ms للكشف): حتى هذا العدد يُصيَّر داخل الطلب على دفعات مع
+# إفساح حلقة الأحداث بينها، لأن نقل البيانات إلى عملية أخرى يكلف أكثر من التصيير نفسه
+INLINE_RENDER_LIMIT = 100
+
+DOCUMENT_FORMATS = ("html", "pdf")
+MEDIA_TYPES = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+
+# آخر المدفوعات المعروضة في كشف الحساب ونافذة البحث عنها
+STATEMENT_PAYMENTS_LIMIT = 10
+STATEMENT_PAYMENTS_DAYS = 90
+
+COMPANY_INFO = {
+    "company_name": "EP Group",
+    "company_address": "القاهرة، مصر",
+    "company_phone": "+20 123 456 7890",
+    "company_email": "info@epgroup.com",
+}
+
+
+# ============================================================================
+# TEMPLATES - القوالب المترجمة (مرة واحدة لكل عملية)
+# ============================================================================
+
+@lru_cache(maxsize=None)
+def compiled_template(name: str) -> Template:
+    """قالب مترجم من templates/documents، يُقرأ من القرص مرة واحدة لكل عملية"""
+    return Template((TEMPLATES_DIR / f"{name}.html").read_text(encoding="utf-8"))
+
+
+def _text(value: Any) -> str:
+    if value is None or value == "":
+        return "—"
+    return html.escape(str(getattr(value, "value", value)))
+
+
+def _number(value: Any) -> float:
+    """MoneyAmount أو Decimal128 أو رقم مسطح → float"""
+    return float(money_amount(value) or 0)
+
+
+def _amount(value: Any) -> str:
+    return f"{_number(value):,.2f}"
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            return None
+    return None
+
+
+def _day(value: Any) -> str:
+    parsed = _as_datetime(value)
+    return parsed.strftime("%Y-%m-%d") if parsed else "—"
+
+
+def document_head(title: str) -> str:
+    return compiled_template("layout").substitute(title=html.escape(title))
+
+
+def document_tail() -> str:
+    return compiled_template("layout_end").template
+
+
+# ============================================================================
+# RENDERERS - تصيير المستندات (دوال نقية تعمل داخل عمليات التصيير)
+# ============================================================================
+
+def render_statement(payload: Dict[str, Any]) -> str:
+    """كشف حساب عيادة واحدة كقسم HTML (صفحة مطبوعة)"""
+    row_template = compiled_template("debt_statement_row")
+    payment_template = compiled_template("payment_row")
+    clinic = payload.get("clinic", {})
+
+    rows = []
+    totals = [0.0, 0.0, 0.0]
+    for debt in payload.get("debts", []):
+        totals[0] += debt["original"]
+        totals[1] += debt["paid"]
+        totals[2] += debt["outstanding"]
+        rows.append(row_template.substitute(
+            row_class="overdue" if debt.get("days_overdue") else "",
+            debt_number=_text(debt.get("debt_number")),
+            created_at=_day(debt.get("created_at")),
+            due_date=_day(debt.get("due_date")),
+            days_overdue=int(debt.get("days_overdue") or 0),
+            original=_amount(debt["original"]),
+            paid=_amount(debt["paid"]),
+            outstanding=_amount(debt["outstanding"]),
+        ))
+    payments = [
+        payment_template.substitute(
+            payment_date=_day(payment.get("payment_date")),
+            payment_method=_text(payment.get("payment_method")),
+            reference=_text(payment.get("reference")),
+            amount=_amount(payment.get("amount")),
+        )
+        for payment in payload.get("payments", [])
+    ]
+
+    return compiled_template("debt_statement").substitute(
+        **COMPANY_INFO,
+        statement_number=_text(payload.get("statement_number")),
+        as_of=_day(payload.get("as_of")),
+        clinic_name=_text(clinic.get("name")),
+        doctor_name=_text(clinic.get("doctor_name")),
+        clinic_address=_text(clinic.get("address")),
+        clinic_phone=_text(clinic.get("phone")),
+        rep_name=_text(payload.get("rep_name")),
+        debt_rows="".join(rows),
+        debt_count=len(rows),
+        total_original=_amount(totals[0]),
+        total_paid=_amount(totals[1]),
+        total_outstanding=_amount(totals[2]),
+        payment_rows="".join(payments),
+        generated_by=_text(payload.get("generated_by")),
+        generated_at=_text(payload.get("generated_at")),
+    )
+
+
+def render_invoice(payload: Dict[str, Any]) -> str:
+    """فاتورة واحدة كقسم HTML (صفحة مطبوعة)"""
+    line_template = compiled_template("invoice_line")
+    lines = [
+        line_template.substitute(
+            product_name=_text(line.get("product_name")),
+            quantity=f"{_number(line.get('quantity')):g}",
+            unit_price=_amount(line.get("unit_price")),
+            discount=_amount(line.get("discount")),
+            line_total=_amount(line.get("total")),
+        )
+        for line in payload.get("lines", [])
+    ]
+    return compiled_template("invoice").substitute(
+        **COMPANY_INFO,
+        invoice_number=_text(payload.get("invoice_number")),
+        invoice_date=_day(payload.get("invoice_date")),
+        due_date=_day(payload.get("due_date")),
+        status=_text(payload.get("status")),
+        clinic_name=_text(payload.get("clinic_name")),
+        doctor_name=_text(payload.get("doctor_name")),
+        clinic_address=_text(payload.get("clinic_address")),
+        rep_name=_text(payload.get("rep_name")),
+        line_rows="".join(lines),
+        subtotal=_amount(payload.get("subtotal")),
+        discount=_amount(payload.get("discount")),
+        tax=_amount(payload.get("tax")),
+        total=_amount(payload.get("total")),
+        paid=_amount(payload.get("paid")),
+        outstanding=_amount(payload.get("outstanding")),
+        generated_by=_text(payload.get("generated_by")),
+        generated_at=_text(payload.get("generated_at")),
+    )
+
+
+RENDERERS = {"statement": render_statement, "invoice": render_invoice}
+
+
+def render_html_sections(kind: str, payloads: List[Dict[str, Any]]) -> str:
+    """تصيير دفعة مستندات متتالية (الوحدة المرسلة إلى عملية التصيير)"""
+    renderer = RENDERERS[kind]
+    return "".join(renderer(payload) for payload in payloads)
+
+
+def render_pdf(kind: str, payloads: List[Dict[str, Any]], title: str) -> bytes:
+    """ملف PDF واحد مدمج لكل المستندات (صفحة أو أكثر لكل مستند)"""
+    if not PDF_RENDERING_AVAILABLE:
+        raise RuntimeError("PDF rendering requires WeasyPrint, which is not installed")
+    document = document_head(title) + render_html_sections(kind, payloads) + document_tail()
+    return WeasyHTML(string=document, base_url=str(TEMPLATES_DIR)).write_pdf()
+
+
+# ============================================================================
+# PROCESS POOL - مجمع عمليات التصيير خارج حلقة الأحداث
+# ============================================================================
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_render_executor() -> ProcessPoolExecutor:
+    """مجمع العمليات المشترك (يُنشأ عند أول دفعة كبيرة)"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+    return _executor
+
+
+def shutdown_render_executor() -> None:
+    """إيقاف مجمع العمليات عند إغلاق الخادم"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def _chunks(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def stream_documents(
+    kind: str,
+    payloads: List[Dict[str, Any]],
+    format: str = "html",
+    title: str = "EP Group"
+) -> AsyncIterator[bytes]:
+    """ملف واحد مدمج يُبث أثناء التصيير - one merged file, streamed as it renders
+
+    HTML is rendered in chunks and yielded in the original (route) order, so
+    the first pages reach the client while the rest are still rendering. Large
+    batches on multi-core hosts render their chunks in parallel in the process
+    pool; smaller ones, or any batch with a single worker, render inline and
+    yield to the event loop between chunks. PDF layout is the CPU-heavy step
+    and always runs in a worker, as one merged document. Callers check
+    ``PDF_RENDERING_AVAILABLE`` before asking for a PDF, since the response
+    headers are already sent once streaming starts.
+    """
+    loop = asyncio.get_running_loop()
+
+    if format == "pdf":
+        yield await loop.run_in_executor(get_render_executor(), render_pdf, kind, payloads, title)
+        return
+
+    yield document_head(title).encode("utf-8")
+    if len(payloads) <= INLINE_RENDER_LIMIT or RENDER_WORKERS < 2:
+        for chunk in _chunks(payloads, RENDER_CHUNK_SIZE):
+            yield render_html_sections(kind, chunk).encode("utf-8")
+            await asyncio.sleep(0)
+    else:
+        executor = get_render_executor()
+        pending = [
+            loop.run_in_executor(executor, render_html_sections, kind, chunk)
+            for chunk in _chunks(payloads, RENDER_CHUNK_SIZE)
+        ]
+        try:
+            for future in pending:
+                yield (await future).encode("utf-8")
+        finally:
+            # العميل أغلق الاتصال: لا داعي لإكمال بقية الدفعات
+            for future in pending:
+                future.cancel()
+    yield document_tail().encode("utf-8")
+
+
+async def render_documents(
+    kind: str,
+    payloads: List[Dict[str, Any]],
+    format: str = "html",
+    title: str = "EP Group"
+) -> bytes:
+    """الملف المدمج كاملاً (للمستند الواحد أو الاستجابات غير المبثوثة)"""
+    return b"".join([part async for part in stream_documents(kind, payloads, format, title)])
+
+
+# ============================================================================
+# PAYLOADS - تحميل بيانات المستندات من قاعدة البيانات
+# ============================================================================
+
+def _debt_line(debt: Dict[str, Any], as_of: datetime) -> Dict[str, Any]:
+    original, outstanding, collected, _ = debt_amounts(debt)
+    due = _as_datetime(debt.get("due_date") or debt.get("original_due_date"))
+    return {
+        "debt_number": debt.get("debt_number"),
+        "created_at": _as_datetime(debt.get("created_at") or debt.get("creation_date")),
+        "due_date": due,
+        "days_overdue": max(0, (as_of - due).days) if due else 0,
+        "original": float(original),
+        "paid": float(collected),
+        "outstanding": float(outstanding),
+    }
+
+
+async def load_clinic_statements(
+    db: AsyncIOMotorDatabase,
+    clinic_ids: List[str],
+    as_of: Optional[datetime] = None,
+    scope: Optional[Dict[str, Any]] = None,
+    generated_by: Optional[str] = None,
+    open_only: bool = True
+) -> List[Dict[str, Any]]:
+    """بيانات كشوف الحساب لقائمة عيادات بترتيبها - three queries for the whole batch
+
+    Clinics, their open debts and their recent ledger payments are each read
+    with one ``$in`` query. ``scope`` is the caller's role filter on debts
+    (e.g. the rep they are assigned to); with a scope, ``clinic_ids`` is first
+    narrowed to clinics that have a debt in it, so clinic details and payments
+    of other clinics are never read. Settled debts are dropped from the lines
+    (their outstanding is zero) unless ``open_only=False`` (single-debt prints).
+    Clinics that are neither in ``clinics`` nor have debts are skipped; the
+    others keep the order of ``clinic_ids`` (the route order).
+    """
+    as_of = as_of or datetime.utcnow()
+    clinic_ids = list(dict.fromkeys(clinic_ids))
+    if scope:
+        allowed = set(await db.debts.distinct("clinic_id", {**scope, "clinic_id": {"$in": clinic_ids}}))
+        clinic_ids = [clinic_id for clinic_id in clinic_ids if clinic_id in allowed]
+        if not clinic_ids:
+            return []
+
+    clinics = {
+        clinic["id"]: clinic
+        async for clinic in db.clinics.find(
+            {"id": {"$in": clinic_ids}},
+            {"_id": 0, "id": 1, "name": 1, "clinic_name": 1, "doctor_name": 1, "address": 1, "phone": 1}
+        )
+    }
+
+    debt_filter: Dict[str, Any] = {**(scope or {}), "clinic_id": {"$in": clinic_ids}}
+    if open_only:
+        debt_filter["status"] = {"$nin": list(CLOSED_DEBT_STATUSES)}
+    debts: Dict[str, List[Dict[str, Any]]] = {}
+    async for debt in db.debts.find(debt_filter, {"_id": 0, "payments": 0, "audit_trail": 0}).sort("created_at", 1):
+        debts.setdefault(debt["clinic_id"], []).append(debt)
+
+    payments = {
+        row["_id"]: row["payments"]
+        async for row in db[PAYMENT_LEDGER_COLLECTION].aggregate([
+            {"$match": {
+                "clinic_id": {"$in": clinic_ids},
+                "posted_at": {"$gte": as_of - timedelta(days=STATEMENT_PAYMENTS_DAYS)}
+            }},
+            {"$sort": {"posted_at": -1}},
+            {"$group": {"_id": "$clinic_id", "payments": {"$push": {
+                "payment_date": {"$ifNull": ["$payment_date", "$posted_at"]},
+                "payment_method": "$payment_method",
+                "reference": "$reference_number",
+                "amount": "$amount",
+            }}}},
+            {"$project": {"payments": {"$slice": ["$payments", STATEMENT_PAYMENTS_LIMIT]}}}
+        ])
+    }
+
+    generated_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+    statements = []
+    for clinic_id in clinic_ids:
+        clinic = clinics.get(clinic_id)
+        clinic_debts = debts.get(clinic_id, [])
+        if clinic is None and not clinic_debts:
+            continue
+        source = clinic or clinic_debts[0]
+        lines = [_debt_line(debt, as_of) for debt in clinic_debts]
+        statements.append({
+            "statement_number": f"ST-{as_of:%Y%m%d}-{clinic_id[:8]}",
+            "as_of": as_of,
+            "clinic": {
+                "name": source.get("name") or source.get("clinic_name"),
+                "doctor_name": source.get("doctor_name"),
+                "address": source.get("address") or source.get("clinic_address"),
+                "phone": source.get("phone") or source.get("clinic_phone"),
+            },
+            "rep_name": next((debt_rep(debt)[1] for debt in clinic_debts if debt_rep(debt)[1]), None),
+            "debts": [line for line in lines if line["outstanding"] > 0 or not open_only],
+            "payments": [
+                {**payment, "amount": _number(payment.get("amount"))}
+                for payment in payments.get(clinic_id, [])
+            ],
+            "generated_by": generated_by,
+            "generated_at": generated_at,
+        })
+    return statements
+
+
+async def load_invoice_documents(
+    db: AsyncIOMotorDatabase,
+    invoice_ids: List[str],
+    scope: Optional[Dict[str, Any]] = None,
+    generated_by: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """بيانات الفواتير بترتيب المعرفات (الفاتورة المسطحة والمتكاملة) ضمن نطاق الدور"""
+    invoice_ids = list(dict.fromkeys(invoice_ids))
+    invoices = {
+        invoice["id"]: invoice
+        async for invoice in db.invoices.find(
+            {**(scope or {}), "id": {"$in": invoice_ids}}, {"_id": 0, "audit_trail": 0}
+        )
+    }
+
+    generated_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+    documents = []
+    for invoice_id in invoice_ids:
+        invoice = invoices.get(invoice_id)
+        if invoice is None:
+            continue
+        total = _number(invoice.get("total_amount"))
+        paid = _number(invoice.get("paid_amount"))
+        outstanding = invoice.get("outstanding_amount")
+        documents.append({
+            "invoice_number": invoice.get("invoice_number"),
+            "invoice_date": invoice.get("invoice_date") or invoice.get("issue_date") or invoice.get("created_at"),
+            "due_date": invoice.get("due_date"),
+            "status": invoice.get("status"),
+            "clinic_name": invoice.get("clinic_name"),
+            "doctor_name": invoice.get("doctor_name"),
+            "clinic_address": invoice.get("clinic_address"),
+            "rep_name": invoice.get("sales_rep_name"),
+            "lines": [
+                {
+                    "product_name": line.get("product_name"),
+                    "quantity": _number(line.get("quantity")),
+                    "unit_price": _number(line.get("unit_price")),
+                    "discount": _number(line.get("discount_amount")),
+                    "total": _number(line.get("total") or line.get("line_total")),
+                }
+                for line in invoice.get("items") or invoice.get("line_items") or []
+            ],
+            "subtotal": _number(invoice.get("subtotal") or invoice.get("subtotal_amount")),
+            "discount": _number(invoice.get("discount_amount")),
+            "tax": _number(invoice.get("tax_amount")),
+            "total": total,
+            "paid": paid,
+            "outstanding": _number(outstanding) if outstanding is not None else max(total - paid, 0.0),
+            "generated_by": generated_by,
+            "generated_at": generated_at,
+        })
+    return documents
+
+
+async def rep_route_clinic_ids(db: AsyncIOMotorDatabase, rep_id: str, day: date) -> List[str]:
+    """عيادات المسار المخطط للمندوب في يوم ما بترتيب مواعيد الزيارات"""
+    visits = db.rep_visits.find(
+        {
+            "medical_rep_id": rep_id,
+            "status": "planned",
+            "scheduled_date": {
+                "$gte": datetime.combine(day, datetime.min.time()).isoformat(),
+                "$lte": datetime.combine(day, datetime.max.time()).isoformat()
+            }
+        },
+        {"_id": 0, "clinic_id": 1}
+    ).sort("scheduled_date", 1)
+    return list(dict.fromkeys([visit["clinic_id"] async for visit in visits if visit.get("clinic_id")]))
@@ -5,8 +5,8 @@ from typing import List, Dict, Any, Optional, Union
 from datetime import datetime, date, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 import uuid
-import asyncio
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 
 from models.financial_models import (
     IntegratedInvoice, IntegratedDebtRecord, DebtPaymentRecord,
@@ -15,6 +15,33 @@ from models.financial_models import (
     FinancialConfig, AgingAnalysis, FinancialSummary,
     InvoiceLineItem
 )
+from services.aging_service import get_aging_report
+from services.money_codec import to_decimal
+from services.payment_ledger_service import (
+    DebtBalanceFields, post_debt_payment, PAYMENT_LEDGER_COLLECTION
+)
+from services.clinic_balance_service import (
+    stage_clinic_balance_delta, payment_balance_hook, get_clinic_balance
+)
+from services.unit_of_work import UnitOfWork, UnitOfWorkConflict
+from services.debt_statistics_service import stage_debt_statistics_delta, payment_statistics_hook
+from services.kpi_engine import get_period_kpis
+from services.financial_timeseries_service import get_collection_trends
+
+# حقول الرصيد في سجل الدين المتكامل (مبالغ Decimal128 داخل MoneyAmount)
+INTEGRATED_DEBT_BALANCE_FIELDS = DebtBalanceFields(
+    paid_field="paid_amount.amount",
+    remaining_field="outstanding_amount.amount",
+    settled_status=DebtStatus.COLLECTED.value,
+    partial_status=DebtStatus.PARTIALLY_COLLECTED.value,
+    decimal=True,
+    settled_fields={"settlement_date": "$last_payment_date"}
+)
+
+# حالات الفواتير المؤهلة للتأكيد والتحويل الجماعي
+BULK_CONVERTIBLE_INVOICE_STATUSES = [
+    InvoiceStatus.PENDING, InvoiceStatus.CONFIRMED, InvoiceStatus.PARTIALLY_PAID, InvoiceStatus.OVERDUE
+]
 
 class IntegratedFinancialService:
     """خدمة النظام المالي المتكامل - Integrated Financial Service"""
@@ -29,36 +56,40 @@ class IntegratedFinancialService:
     
     async def generate_document_number(self, document_type: str) -> str:
         """إنشاء رقم مستند تلقائي - Generate automatic document number"""
+        return (await self.reserve_document_numbers(document_type, 1))[0]
+    
+    async def reserve_document_numbers(self, document_type: str, count: int) -> List[str]:
+        """حجز عدة أرقام متتالية بكتابة واحدة - Reserve a block of document numbers
+
+        Numbers are reserved outside any unit of work: the sequence document is
+        shared by every writer, so keeping it out of the transactions avoids
+        write conflicts that would abort whole batches. A unit that fails after
+        reserving leaves a gap in the numbering.
+        """
         config = self.config.AUTO_NUMBERING.get(document_type)
         if not config:
             raise ValueError(f"نوع المستند غير مدعوم: {document_type}")
         
-        # البحث عن آخر رقم مستند
-        last_doc = await self.db.document_sequences.find_one(
-            {"document_type": document_type}
+        # حجز الأرقام التالية ذرياً (آمن مع الطلبات المتزامنة)
+        sequence = await self.db.document_sequences.find_one_and_update(
+            {"document_type": document_type},
+            {
+                "$inc": {"last_number": count},
+                "$set": {"updated_at": datetime.utcnow()},
+                "$setOnInsert": {"created_at": datetime.utcnow()}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
+        last_number = sequence["last_number"]
         
-        if last_doc:
-            next_number = last_doc["last_number"] + 1
-            await self.db.document_sequences.update_one(
-                {"document_type": document_type},
-                {"$set": {"last_number": next_number, "updated_at": datetime.utcnow()}}
-            )
-        else:
-            next_number = 1
-            await self.db.document_sequences.insert_one({
-                "document_type": document_type,
-                "last_number": next_number,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            })
-        
-        # تنسيق الرقم
+        # تنسيق الأرقام
         prefix = config["prefix"]
         digits = config["digits"]
-        formatted_number = f"{prefix}-{next_number:0{digits}d}"
-        
-        return formatted_number
+        return [
+            f"{prefix}-{number:0{digits}d}"
+            for number in range(last_number - count + 1, last_number + 1)
+        ]
     
     # ============================================================================
     # INVOICE MANAGEMENT - إدارة الفواتير
@@ -109,7 +140,7 @@ class IntegratedFinancialService:
         
         # إنشاء الفاتورة
         invoice = IntegratedInvoice(
-            invoice_number=await self.generate_document_number("invoices"),
+            invoice_number="",  # يُحجز قبل وحدة العمل (generate_document_number)
             clinic_id=clinic_id,
             clinic_name=clinic.get("name", ""),
             clinic_address=clinic.get("address"),
@@ -140,8 +171,10 @@ class IntegratedFinancialService:
         )
         invoice.audit_trail.append(audit)
         
-        # حفظ الفاتورة
-        await self.db.invoices.insert_one(invoice.dict())
+        # حجز الرقم ثم حفظ الفاتورة
+        invoice.invoice_number = await self.generate_document_number("invoices")
+        async with UnitOfWork(self.db, "create_invoice") as uow:
+            uow.insert_one("invoices", invoice.dict())
         
         return invoice
     
@@ -154,7 +187,27 @@ class IntegratedFinancialService:
         if invoice_data["status"] != InvoiceStatus.PENDING:
             raise ValueError("لا يمكن تأكيد هذه الفاتورة")
         
-        # تحديث حالة الفاتورة
+        user = await self.db.users.find_one({"id": confirmed_by})
+        
+        # تحديث الفاتورة ورصيد العيادة الجاري كوحدة واحدة
+        try:
+            async with UnitOfWork(self.db, "confirm_invoice") as uow:
+                self._stage_invoice_confirmation(uow, invoice_data, confirmed_by, user)
+        except UnitOfWorkConflict:
+            raise ValueError("لا يمكن تأكيد هذه الفاتورة")
+        
+        # جلب الفاتورة المحدثة
+        updated_invoice_data = await self.db.invoices.find_one({"id": invoice_id})
+        return IntegratedInvoice(**updated_invoice_data)
+    
+    def _stage_invoice_confirmation(
+        self,
+        uow: UnitOfWork,
+        invoice_data: Dict[str, Any],
+        confirmed_by: str,
+        user: Optional[Dict[str, Any]]
+    ) -> None:
+        """تسجيل كتابات تأكيد الفاتورة في وحدة العمل"""
         update_data = {
             "status": InvoiceStatus.CONFIRMED,
             "approved_by": confirmed_by,
@@ -162,8 +215,6 @@ class IntegratedFinancialService:
             "updated_at": datetime.utcnow()
         }
         
-        # إضافة مسار تدقيق
-        user = await self.db.users.find_one({"id": confirmed_by})
         audit = AuditTrail(
             action="invoice_confirmed",
             user_id=confirmed_by,
@@ -173,17 +224,20 @@ class IntegratedFinancialService:
             after_values={"status": InvoiceStatus.CONFIRMED}
         )
         
-        await self.db.invoices.update_one(
-            {"id": invoice_id},
+        # شرط الحالة يمنع احتساب الفاتورة مرتين عند التأكيد المتزامن
+        uow.update_one(
+            "invoices",
+            {"id": invoice_data["id"], "status": InvoiceStatus.PENDING},
             {
                 "$set": update_data,
                 "$push": {"audit_trail": audit.dict()}
-            }
+            },
+            require_match=True
+        )
+        stage_clinic_balance_delta(
+            uow, invoice_data.get("clinic_id"),
+            invoiced=to_decimal((invoice_data.get("total_amount") or {}).get("amount"))
         )
-        
-        # جلب الفاتورة المحدثة
-        updated_invoice_data = await self.db.invoices.find_one({"id": invoice_id})
-        return IntegratedInvoice(**updated_invoice_data)
     
     async def convert_invoice_to_debt(
         self, 
@@ -198,18 +252,43 @@ class IntegratedFinancialService:
         if not invoice_data:
             raise ValueError("الفاتورة غير موجودة")
         
-        invoice = IntegratedInvoice(**invoice_data)
+        user = await self.db.users.find_one({"id": converted_by})
         
-        # التحقق من إمكانية التحويل
-        if invoice.status == InvoiceStatus.CONVERTED_TO_DEBT:
+        # رقم الدين يُحجز أولاً، ثم الفاتورة + الدين + المعاملة + رصيد العيادة في وحدة واحدة
+        error = self._conversion_error(IntegratedInvoice(**invoice_data))
+        if error:
+            raise ValueError(error)
+        debt_number = await self.generate_document_number("debts")
+        try:
+            async with UnitOfWork(self.db, "convert_invoice_to_debt") as uow:
+                debt_record = await self._stage_invoice_conversion(
+                    uow, invoice_data, converted_by, user, collection_start_date, debt_number
+                )
+        except UnitOfWorkConflict:
             raise ValueError("الفاتورة محولة بالفعل إلى دين")
         
-        if not invoice.outstanding_amount or invoice.outstanding_amount.amount <= 0:
-            raise ValueError("لا يوجد مبلغ مستحق للتحويل إلى دين")
+        return debt_record
+    
+    async def _stage_invoice_conversion(
+        self,
+        uow: UnitOfWork,
+        invoice_data: Dict[str, Any],
+        converted_by: str,
+        user: Optional[Dict[str, Any]],
+        collection_start_date: Optional[date] = None,
+        debt_number: str = ""
+    ) -> IntegratedDebtRecord:
+        """تسجيل كتابات تحويل الفاتورة إلى دين في وحدة العمل (رقم الدين محجوز مسبقاً)"""
+        invoice = IntegratedInvoice(**invoice_data)
+        
+        # التحقق من إمكانية التحويل
+        error = self._conversion_error(invoice)
+        if error:
+            raise ValueError(error)
         
         # إنشاء سجل الدين
         debt_record = IntegratedDebtRecord(
-            debt_number=await self.generate_document_number("debts"),
+            debt_number=debt_number,
             invoice_id=invoice.id,
             invoice_number=invoice.invoice_number,
             clinic_id=invoice.clinic_id,
@@ -228,11 +307,11 @@ class IntegratedFinancialService:
         )
         
         # إضافة مسار التدقيق
-        user = await self.db.users.find_one({"id": converted_by})
+        user_name = user.get("full_name", "") if user else ""
         audit = AuditTrail(
             action="converted_from_invoice",
             user_id=converted_by,
-            user_name=user.get("full_name", "") if user else "",
+            user_name=user_name,
             timestamp=datetime.utcnow(),
             after_values={
                 "invoice_id": invoice.id,
@@ -241,21 +320,19 @@ class IntegratedFinancialService:
         )
         debt_record.audit_trail.append(audit)
         
-        # حفظ سجل الدين
-        await self.db.debts.insert_one(debt_record.dict())
-        
-        # تحديث حالة الفاتورة
+        # تحديث حالة الفاتورة (محمي: لا تحويل مزدوج)
         invoice_audit = AuditTrail(
             action="converted_to_debt",
             user_id=converted_by,
-            user_name=user.get("full_name", "") if user else "",
+            user_name=user_name,
             timestamp=datetime.utcnow(),
             before_values={"status": invoice.status},
             after_values={"status": InvoiceStatus.CONVERTED_TO_DEBT}
         )
         
-        await self.db.invoices.update_one(
-            {"id": invoice_id},
+        uow.update_one(
+            "invoices",
+            {"id": invoice.id, "status": {"$ne": InvoiceStatus.CONVERTED_TO_DEBT}},
             {
                 "$set": {
                     "status": InvoiceStatus.CONVERTED_TO_DEBT,
@@ -263,11 +340,133 @@ class IntegratedFinancialService:
                     "updated_at": datetime.utcnow()
                 },
                 "$push": {"audit_trail": invoice_audit.dict()}
-            }
+            },
+            require_match=True
         )
         
+        # حفظ سجل الدين ومعاملة إنشائه
+        self._stage_debt_creation(uow, debt_record, user_name, invoice_id=invoice.id)
+        
         return debt_record
     
+    @staticmethod
+    def _conversion_error(invoice: IntegratedInvoice) -> Optional[str]:
+        """سبب عدم إمكانية تحويل الفاتورة إلى دين (None إذا كانت قابلة للتحويل)"""
+        if invoice.status == InvoiceStatus.CONVERTED_TO_DEBT:
+            return "الفاتورة محولة بالفعل إلى دين"
+        if not invoice.outstanding_amount or invoice.outstanding_amount.amount <= 0:
+            return "لا يوجد مبلغ مستحق للتحويل إلى دين"
+        return None
+    
+    async def bulk_confirm_and_convert(
+        self,
+        invoice_ids: List[str],
+        processed_by: str,
+        chunk_size: int = 50,
+        collection_start_date: Optional[date] = None
+    ) -> Dict[str, Any]:
+        """تأكيد وتحويل مجموعة فواتير إلى ديون على دفعات - month-end processing
+
+        Pending invoices are confirmed and every eligible invoice is converted to
+        a debt. Each chunk is committed as one unit of work; a chunk that fails
+        as a whole (e.g. an invoice changed concurrently) is retried invoice by
+        invoice so one bad invoice does not hold back the rest.
+        """
+        invoice_ids = list(dict.fromkeys(invoice_ids))  # إزالة التكرار مع الحفاظ على الترتيب
+        user = await self.db.users.find_one({"id": processed_by})
+        results: List[Dict[str, Any]] = []
+        
+        for start in range(0, len(invoice_ids), chunk_size):
+            chunk_ids = invoice_ids[start:start + chunk_size]
+            invoices = {
+                invoice_data["id"]: invoice_data
+                async for invoice_data in self.db.invoices.find({"id": {"$in": chunk_ids}})
+            }
+            try:
+                results.extend(await self._confirm_and_convert_chunk(
+                    chunk_ids, invoices, processed_by, user, collection_start_date
+                ))
+            except Exception:
+                # إعادة المحاولة فاتورة بفاتورة لعزل الفاتورة المسببة للفشل
+                for invoice_id in chunk_ids:
+                    try:
+                        fresh = await self.db.invoices.find_one({"id": invoice_id})
+                        results.extend(await self._confirm_and_convert_chunk(
+                            [invoice_id], {invoice_id: fresh} if fresh else {},
+                            processed_by, user, collection_start_date
+                        ))
+                    except Exception as e:
+                        results.append({"invoice_id": invoice_id, "success": False, "error": str(e)})
+        
+        converted = [result for result in results if result["success"]]
+        return {
+            "requested": len(invoice_ids),
+            "converted": len(converted),
+            "failed": len(results) - len(converted),
+            "total_debt_amount": float(sum(
+                (Decimal(str(result["outstanding_amount"])) for result in converted), Decimal("0.00")
+            )),
+            "results": results
+        }
+    
+    async def _confirm_and_convert_chunk(
+        self,
+        invoice_ids: List[str],
+        invoices: Dict[str, Dict[str, Any]],
+        processed_by: str,
+        user: Optional[Dict[str, Any]],
+        collection_start_date: Optional[date]
+    ) -> List[Dict[str, Any]]:
+        """دفعة واحدة: كل فواتيرها الصالحة في وحدة عمل واحدة"""
+        results: List[Dict[str, Any]] = []
+        staged: List[Dict[str, Any]] = []
+        eligible: List[Dict[str, Any]] = []
+        
+        for invoice_id in invoice_ids:
+            invoice_data = invoices.get(invoice_id)
+            if not invoice_data:
+                results.append({"invoice_id": invoice_id, "success": False, "error": "الفاتورة غير موجودة"})
+                continue
+            
+            status = invoice_data.get("status")
+            if status not in BULK_CONVERTIBLE_INVOICE_STATUSES:
+                results.append({"invoice_id": invoice_id, "success": False, "error": f"حالة الفاتورة لا تسمح بالتحويل: {status}"})
+                continue
+            
+            error = self._conversion_error(IntegratedInvoice(**invoice_data))
+            if error:
+                results.append({"invoice_id": invoice_id, "success": False, "error": error})
+                continue
+            eligible.append(invoice_data)
+        
+        if not eligible:
+            return results
+        
+        # أرقام ديون الدفعة كلها بكتابة واحدة خارج المعاملة
+        debt_numbers = await self.reserve_document_numbers("debts", len(eligible))
+        
+        async with UnitOfWork(self.db, "bulk_confirm_and_convert") as uow:
+            for invoice_data, debt_number in zip(eligible, debt_numbers):
+                invoice_id = invoice_data["id"]
+                status = invoice_data.get("status")
+                if status == InvoiceStatus.PENDING:
+                    self._stage_invoice_confirmation(uow, invoice_data, processed_by, user)
+                    invoice_data = {**invoice_data, "status": InvoiceStatus.CONFIRMED}
+                
+                debt_record = await self._stage_invoice_conversion(
+                    uow, invoice_data, processed_by, user, collection_start_date, debt_number
+                )
+                staged.append({
+                    "invoice_id": invoice_id,
+                    "invoice_number": invoice_data.get("invoice_number"),
+                    "success": True,
+                    "debt_id": debt_record.id,
+                    "debt_number": debt_record.debt_number,
+                    "outstanding_amount": float(debt_record.outstanding_amount.amount)
+                })
+        
+        return results + staged
+    
     # ============================================================================
     # DEBT MANAGEMENT - إدارة الديون
     # ============================================================================
@@ -294,7 +493,7 @@ class IntegratedFinancialService:
         
         # إنشاء سجل الدين
         debt_record = IntegratedDebtRecord(
-            debt_number=await self.generate_document_number("debts"),
+            debt_number="",  # يُحجز قبل وحدة العمل (generate_document_number)
             invoice_id="",  # دين مباشر بدون فاتورة
             invoice_number="",
             clinic_id=clinic_id,
@@ -329,11 +528,42 @@ class IntegratedFinancialService:
         )
         debt_record.audit_trail.append(audit)
         
-        # حفظ سجل الدين
-        await self.db.debts.insert_one(debt_record.dict())
+        # حجز الرقم، ثم حفظ الدين ومعاملته ورصيد العيادة كوحدة واحدة
+        debt_record.debt_number = await self.generate_document_number("debts")
+        async with UnitOfWork(self.db, "create_direct_debt") as uow:
+            self._stage_debt_creation(uow, debt_record, audit.user_name)
         
         return debt_record
     
+    def _stage_debt_creation(
+        self,
+        uow: UnitOfWork,
+        debt_record: IntegratedDebtRecord,
+        created_by_name: str,
+        invoice_id: Optional[str] = None
+    ) -> None:
+        """تسجيل الدين ومعاملة إنشائه وفرق رصيد العيادة وعدادات الإحصائيات في وحدة العمل"""
+        transaction = FinancialTransaction(
+            transaction_number=debt_record.debt_number,
+            transaction_type=TransactionType.DEBT_CREATE,
+            invoice_id=invoice_id or None,
+            debt_id=debt_record.id,
+            amount=debt_record.outstanding_amount,
+            description=f"إنشاء الدين {debt_record.debt_number}",
+            processed_by=debt_record.created_by,
+            processed_by_name=created_by_name
+        )
+        
+        uow.insert_one("debts", debt_record.dict())
+        uow.insert_one("financial_transactions", transaction.dict())
+        stage_clinic_balance_delta(
+            uow, debt_record.clinic_id,
+            outstanding=debt_record.outstanding_amount.amount,
+            due_date=debt_record.due_date,
+            open_debts=1
+        )
+        stage_debt_statistics_delta(uow, None, debt_record.dict())
+    
     async def process_debt_payment(
         self,
         debt_id: str,
@@ -344,27 +574,29 @@ class IntegratedFinancialService:
         reference_number: Optional[str] = None,
         notes: Optional[str] = None
     ) -> Dict[str, Any]:
-        """معالجة دفعة دين - Process debt payment"""
-        
-        # جلب سجل الدين
-        debt_data = await self.db.debts.find_one({"id": debt_id})
-        if not debt_data:
-            raise ValueError("سجل الدين غير موجود")
-        
-        debt_record = IntegratedDebtRecord(**debt_data)
+        """معالجة دفعة دين - Process debt payment
+
+        The balance update is a single conditional write guarded by
+        ``outstanding >= amount`` and the payment goes to the append-only ledger,
+        so concurrent payments on the same debt cannot be lost or over-collect.
+        """
         
         # التحقق من صحة المبلغ
         if amount <= 0:
             raise ValueError("مبلغ الدفعة يجب أن يكون أكبر من صفر")
         
-        if amount > debt_record.outstanding_amount.amount:
-            raise ValueError("مبلغ الدفعة أكبر من المبلغ المتبقي")
+        # جلب بيانات الدين الأساسية فقط (الرصيد يُتحقق منه ذرياً عند الترحيل)
+        debt_data = await self.db.debts.find_one(
+            {"id": debt_id}, {"_id": 0, "id": 1, "debt_number": 1, "clinic_id": 1}
+        )
+        if not debt_data:
+            raise ValueError("سجل الدين غير موجود")
         
         # إنشاء سجل الدفعة
         payment_record = DebtPaymentRecord(
             payment_number=await self.generate_document_number("payments"),
             debt_id=debt_id,
-            debt_number=debt_record.debt_number,
+            debt_number=debt_data.get("debt_number", ""),
             amount=MoneyAmount(amount=amount, currency="EGP"),
             payment_date=payment_date or date.today(),
             payment_method=payment_method,
@@ -375,7 +607,7 @@ class IntegratedFinancialService:
         )
         
         # الحصول على معلومات المعالج
-        user = await self.db.users.find_one({"id": processed_by})
+        user = await self.db.users.find_one({"id": processed_by}, {"_id": 0, "full_name": 1})
         if user:
             payment_record.processed_by_name = user.get("full_name", "")
         
@@ -392,9 +624,6 @@ class IntegratedFinancialService:
         )
         payment_record.audit_trail.append(audit)
         
-        # تحديث سجل الدين
-        debt_record.add_payment(payment_record)
-        
         # إنشاء معاملة مالية
         transaction = FinancialTransaction(
             transaction_number=await self.generate_document_number("payments"),
@@ -402,21 +631,42 @@ class IntegratedFinancialService:
             debt_id=debt_id,
             payment_id=payment_record.id,
             amount=payment_record.amount,
-            description=f"دفعة على الدين {debt_record.debt_number}",
+            description=f"دفعة على الدين {payment_record.debt_number}",
             reference=reference_number,
             processed_by=processed_by,
             processed_by_name=payment_record.processed_by_name
         )
         
-        # حفظ البيانات
-        await asyncio.gather(
-            self.db.debts.update_one(
-                {"id": debt_id},
-                {"$set": debt_record.dict()}
+        payment_datetime = datetime.combine(payment_record.payment_date, datetime.min.time())
+        
+        # ترحيل ذري: تحديث الرصيد + الدفتر + الدفعة + المعاملة (في معاملة واحدة إن أمكن)
+        updated_debt = await post_debt_payment(
+            self.db,
+            {"id": debt_id},
+            amount,
+            INTEGRATED_DEBT_BALANCE_FIELDS,
+            ledger_entry={
+                **payment_record.dict(),
+                "currency": payment_record.amount.currency,
+                "source": "integrated_financial"
+            },
+            set_fields={
+                "last_payment_date": payment_datetime,
+                "updated_at": datetime.utcnow()
+            },
+            related_inserts=(
+                ("payments", payment_record.dict()),
+                ("financial_transactions", transaction.dict())
+            ),
+            on_posted=payment_balance_hook(
+                self.db, amount, INTEGRATED_DEBT_BALANCE_FIELDS.settled_status, payment_datetime
             ),
-            self.db.payments.insert_one(payment_record.dict()),
-            self.db.financial_transactions.insert_one(transaction.dict())
+            after_commit=payment_statistics_hook(self.db, amount, INTEGRATED_DEBT_BALANCE_FIELDS)
         )
+        if updated_debt is None:
+            raise ValueError("مبلغ الدفعة أكبر من المبلغ المتبقي")
+        
+        debt_record = IntegratedDebtRecord(**updated_debt)
         
         # تحديث الفاتورة المرتبطة إذا وجدت
         if debt_record.invoice_id:
@@ -447,12 +697,12 @@ class IntegratedFinancialService:
         # حساب المبلغ المدفوع الجديد
         current_paid = invoice_data.get("paid_amount", {})
         if isinstance(current_paid, dict):
-            current_paid_amount = Decimal(str(current_paid.get("amount", "0.00")))
+            current_paid_amount = to_decimal(current_paid.get("amount"))
         else:
             current_paid_amount = Decimal("0.00")
         
         new_paid_amount = current_paid_amount + payment_record.amount.amount
-        new_outstanding = Decimal(str(invoice_data["total_amount"]["amount"])) - new_paid_amount
+        new_outstanding = to_decimal(invoice_data["total_amount"]["amount"]) - new_paid_amount
         
         # تحديد الحالة الجديدة
         if new_outstanding <= Decimal("0.01"):
@@ -466,11 +716,11 @@ class IntegratedFinancialService:
             {
                 "$set": {
                     "paid_amount": {
-                        "amount": float(new_paid_amount),
+                        "amount": new_paid_amount,
                         "currency": "EGP"
                     },
                     "outstanding_amount": {
-                        "amount": float(new_outstanding),
+                        "amount": new_outstanding,
                         "currency": "EGP"
                     },
                     "status": new_status,
@@ -486,94 +736,36 @@ class IntegratedFinancialService:
     async def generate_aging_analysis(
         self, 
         clinic_ids: Optional[List[str]] = None,
-        as_of_date: Optional[date] = None
+        as_of_date: Optional[date] = None,
+        refresh_snapshot: bool = False
     ) -> List[AgingAnalysis]:
-        """إنشاء تقرير تقادم الديون - Generate aging analysis"""
-        
-        if as_of_date is None:
-            as_of_date = date.today()
-        
-        # تحديد العيادات المطلوبة
-        if clinic_ids:
-            clinic_filter = {"clinic_id": {"$in": clinic_ids}}
-        else:
-            clinic_filter = {}
-        
-        # جلب الديون النشطة
-        debts_cursor = self.db.debts.find({
-            **clinic_filter,
-            "status": {"$in": [DebtStatus.OUTSTANDING, DebtStatus.PARTIALLY_COLLECTED]}
-        })
-        
-        # تجميع البيانات حسب العيادة
-        clinic_aging = {}
+        """إنشاء تقرير تقادم الديون - Generate aging analysis
+
+        Buckets are summed on the server ($dateDiff + $group, Decimal128); an
+        explicit ``as_of_date`` is served from its stored snapshot.
+        """
+        rows = await get_aging_report(
+            self.db, "integrated",
+            as_of_date=as_of_date,
+            clinic_ids=clinic_ids,
+            refresh=refresh_snapshot
+        )
         
-        async for debt_data in debts_cursor:
-            debt = IntegratedDebtRecord(**debt_data)
-            clinic_id = debt.clinic_id
-            
-            if clinic_id not in clinic_aging:
-                clinic_aging[clinic_id] = {
-                    "clinic_name": debt.clinic_name,
-                    "total_outstanding": Decimal("0.00"),
-                    "current": Decimal("0.00"),
-                    "days_30": Decimal("0.00"),
-                    "days_60": Decimal("0.00"),
-                    "days_90": Decimal("0.00"),
-                    "over_90": Decimal("0.00")
-                }
-            
-            # حساب تقادم الدين
-            aging = debt.calculate_aging()
-            outstanding = debt.outstanding_amount.amount
-            
-            clinic_aging[clinic_id]["total_outstanding"] += outstanding
-            
-            # تصنيف حسب العمر
-            if aging["days_overdue"] <= 0:
-                clinic_aging[clinic_id]["current"] += outstanding
-            elif aging["days_overdue"] <= 30:
-                clinic_aging[clinic_id]["days_30"] += outstanding
-            elif aging["days_overdue"] <= 60:
-                clinic_aging[clinic_id]["days_60"] += outstanding
-            elif aging["days_overdue"] <= 90:
-                clinic_aging[clinic_id]["days_90"] += outstanding
-            else:
-                clinic_aging[clinic_id]["over_90"] += outstanding
-        
-        # تحويل إلى قائمة AgingAnalysis
-        aging_analysis = []
-        for clinic_id, data in clinic_aging.items():
-            # تحديد مستوى المخاطرة
-            total = data["total_outstanding"]
-            if data["over_90"] > total * Decimal("0.5"):  # أكثر من 50% فوق 90 يوم
-                risk_level = "critical"
-                recommended_action = "إجراءات تحصيل عاجلة"
-            elif data["days_90"] > total * Decimal("0.3"):  # أكثر من 30% فوق 60 يوم
-                risk_level = "high"
-                recommended_action = "متابعة حثيثة للتحصيل"
-            elif data["days_60"] > total * Decimal("0.4"):  # أكثر من 40% فوق 30 يوم
-                risk_level = "medium"
-                recommended_action = "متابعة منتظمة"
-            else:
-                risk_level = "low"
-                recommended_action = "مراقبة عادية"
-            
-            analysis = AgingAnalysis(
-                clinic_id=clinic_id,
-                clinic_name=data["clinic_name"],
-                total_outstanding=MoneyAmount(amount=data["total_outstanding"], currency="EGP"),
-                current=MoneyAmount(amount=data["current"], currency="EGP"),
-                days_30=MoneyAmount(amount=data["days_30"], currency="EGP"),
-                days_60=MoneyAmount(amount=data["days_60"], currency="EGP"),
-                days_90=MoneyAmount(amount=data["days_90"], currency="EGP"),
-                over_90=MoneyAmount(amount=data["over_90"], currency="EGP"),
-                risk_level=risk_level,
-                recommended_action=recommended_action
+        return [
+            AgingAnalysis(
+                clinic_id=row["clinic_id"],
+                clinic_name=row["clinic_name"],
+                total_outstanding=MoneyAmount(amount=row["total_outstanding"], currency="EGP"),
+                current=MoneyAmount(amount=row["current"], currency="EGP"),
+                days_30=MoneyAmount(amount=row["days_30"], currency="EGP"),
+                days_60=MoneyAmount(amount=row["days_60"], currency="EGP"),
+                days_90=MoneyAmount(amount=row["days_90"], currency="EGP"),
+                over_90=MoneyAmount(amount=row["over_90"], currency="EGP"),
+                risk_level=row["risk_level"],
+                recommended_action=row["recommended_action"]
             )
-            aging_analysis.append(analysis)
-        
-        return sorted(aging_analysis, key=lambda x: x.total_outstanding.amount, reverse=True)
+            for row in rows
+        ]
     
     async def generate_financial_summary(
         self, 
@@ -595,6 +787,7 @@ class IntegratedFinancialService:
         if clinic_ids:
             clinic_filter = {"clinic_id": {"$in": clinic_ids}}
         
+        # المبالغ مخزنة Decimal128 - الجمع يتم بدقة كاملة على الخادم بدون $toDouble
         # جلب إحصائيات الفواتير
         invoice_pipeline = [
             {"$match": {**date_filter, **clinic_filter}},
@@ -602,9 +795,9 @@ class IntegratedFinancialService:
                 "$group": {
                     "_id": None,
                     "total_count": {"$sum": 1},
-                    "total_amount": {"$sum": {"$toDouble": "$total_amount.amount"}},
-                    "paid_amount": {"$sum": {"$toDouble": "$paid_amount.amount"}},
-                    "outstanding_amount": {"$sum": {"$toDouble": "$outstanding_amount.amount"}}
+                    "total_amount": {"$sum": "$total_amount.amount"},
+                    "paid_amount": {"$sum": "$paid_amount.amount"},
+                    "outstanding_amount": {"$sum": "$outstanding_amount.amount"}
                 }
             }
         ]
@@ -619,9 +812,9 @@ class IntegratedFinancialService:
                 "$group": {
                     "_id": None,
                     "total_count": {"$sum": 1},
-                    "original_amount": {"$sum": {"$toDouble": "$original_amount.amount"}},
-                    "paid_amount": {"$sum": {"$toDouble": "$paid_amount.amount"}},
-                    "outstanding_amount": {"$sum": {"$toDouble": "$outstanding_amount.amount"}}
+                    "original_amount": {"$sum": "$original_amount.amount"},
+                    "paid_amount": {"$sum": "$paid_amount.amount"},
+                    "outstanding_amount": {"$sum": "$outstanding_amount.amount"}
                 }
             }
         ]
@@ -636,7 +829,7 @@ class IntegratedFinancialService:
                 "$group": {
                     "_id": None,
                     "total_count": {"$sum": 1},
-                    "total_amount": {"$sum": {"$toDouble": "$amount.amount"}}
+                    "total_amount": {"$sum": "$amount.amount"}
                 }
             }
         ]
@@ -645,20 +838,19 @@ class IntegratedFinancialService:
         payment_data = payment_stats[0] if payment_stats else {}
         
         # حساب المؤشرات المالية
-        total_invoiced = Decimal(str(invoice_data.get("total_amount", 0)))
-        total_collected = Decimal(str(payment_data.get("total_amount", 0)))
+        total_invoiced = to_decimal(invoice_data.get("total_amount"))
+        total_collected = to_decimal(payment_data.get("total_amount"))
         
         collection_rate = Decimal("0.00")
         if total_invoiced > 0:
             collection_rate = (total_collected / total_invoiced * 100).quantize(Decimal("0.01"))
         
-        # حساب متوسط وقت التحصيل
-        average_collection_time = await self._calculate_average_collection_time(
-            start_date, end_date, clinic_ids
-        )
-        
-        # حساب معدل التأخير
-        overdue_rate = await self._calculate_overdue_rate(clinic_ids)
+        # متوسط وقت التحصيل ومعدل التأخير من مرور واحد متجه على ديون الفترة
+        debt_kpis = (await get_period_kpis(
+            self.db, "integrated", start_date, end_date, clinic_ids=clinic_ids, breakdown_limit=0
+        ))["kpis"]
+        average_collection_time = round(debt_kpis["average_collection_days"] or 0)
+        overdue_rate = Decimal(str(debt_kpis["overdue_rate"])).quantize(Decimal("0.01"))
         
         return FinancialSummary(
             period_start=start_date,
@@ -666,24 +858,24 @@ class IntegratedFinancialService:
             total_invoices_count=invoice_data.get("total_count", 0),
             total_invoices_amount=MoneyAmount(amount=total_invoiced, currency="EGP"),
             paid_invoices_amount=MoneyAmount(
-                amount=Decimal(str(invoice_data.get("paid_amount", 0))), 
+                amount=to_decimal(invoice_data.get("paid_amount")), 
                 currency="EGP"
             ),
             outstanding_invoices_amount=MoneyAmount(
-                amount=Decimal(str(invoice_data.get("outstanding_amount", 0))), 
+                amount=to_decimal(invoice_data.get("outstanding_amount")), 
                 currency="EGP"
             ),
             total_debts_count=debt_data.get("total_count", 0),
             total_debts_amount=MoneyAmount(
-                amount=Decimal(str(debt_data.get("original_amount", 0))), 
+                amount=to_decimal(debt_data.get("original_amount")), 
                 currency="EGP"
             ),
             collected_debts_amount=MoneyAmount(
-                amount=Decimal(str(debt_data.get("paid_amount", 0))), 
+                amount=to_decimal(debt_data.get("paid_amount")), 
                 currency="EGP"
             ),
             outstanding_debts_amount=MoneyAmount(
-                amount=Decimal(str(debt_data.get("outstanding_amount", 0))), 
+                amount=to_decimal(debt_data.get("outstanding_amount")), 
                 currency="EGP"
             ),
             total_payments_count=payment_data.get("total_count", 0),
@@ -693,40 +885,19 @@ class IntegratedFinancialService:
             overdue_rate=overdue_rate
         )
     
-    async def _calculate_average_collection_time(
-        self, 
-        start_date: date, 
-        end_date: date,
-        clinic_ids: Optional[List[str]] = None
-    ) -> int:
-        """حساب متوسط وقت التحصيل"""
-        # هذا حساب مبسط - يمكن تطويره أكثر
-        return 25  # متوسط 25 يوم كمثال
-    
-    async def _calculate_overdue_rate(self, clinic_ids: Optional[List[str]] = None) -> Decimal:
-        """حساب معدل التأخير"""
-        # فلتر العيادات
-        clinic_filter = {}
-        if clinic_ids:
-            clinic_filter = {"clinic_id": {"$in": clinic_ids}}
-        
-        # عد الديون المتأخرة
-        today = datetime.utcnow()
-        total_debts = await self.db.debts.count_documents({
-            **clinic_filter,
-            "status": {"$in": [DebtStatus.OUTSTANDING, DebtStatus.PARTIALLY_COLLECTED]}
-        })
-        
-        overdue_debts = await self.db.debts.count_documents({
-            **clinic_filter,
-            "status": {"$in": [DebtStatus.OUTSTANDING, DebtStatus.PARTIALLY_COLLECTED]},
-            "due_date": {"$lt": today}
-        })
-        
-        if total_debts == 0:
-            return Decimal("0.00")
-        
-        return (Decimal(str(overdue_debts)) / Decimal(str(total_debts)) * 100).quantize(Decimal("0.01"))
+    async def get_collection_trends(
+        self,
+        dimension: str = "all",
+        key: Optional[str] = None,
+        days: int = 90,
+        window: int = 30,
+        alpha: float = 0.3,
+        horizon: int = 30
+    ) -> Dict[str, Any]:
+        """اتجاهات التحصيل و DSO وتوقع التدفق النقدي من السلاسل اليومية المحسوبة مسبقاً"""
+        return await get_collection_trends(
+            self.db, dimension=dimension, key=key, days=days, window=window, alpha=alpha, horizon=horizon
+        )
     
     # ============================================================================
     # UTILITY METHODS - طرق مساعدة
@@ -735,25 +906,10 @@ class IntegratedFinancialService:
     async def get_clinic_financial_status(self, clinic_id: str) -> Dict[str, Any]:
         """الحصول على الحالة المالية للعيادة - Get clinic financial status"""
         
-        # جلب الديون النشطة
-        debts_cursor = self.db.debts.find({
-            "clinic_id": clinic_id,
-            "status": {"$in": [DebtStatus.OUTSTANDING, DebtStatus.PARTIALLY_COLLECTED]}
-        })
-        
-        total_outstanding = Decimal("0.00")
-        overdue_amount = Decimal("0.00")
-        debt_count = 0
-        
-        today = date.today()
-        
-        async for debt_data in debts_cursor:
-            debt = IntegratedDebtRecord(**debt_data)
-            total_outstanding += debt.outstanding_amount.amount
-            debt_count += 1
-            
-            if debt.due_date < today:
-                overdue_amount += debt.outstanding_amount.amount
+        # الرصيد الجاري للعيادة (قراءة مستند واحد بدل مسح كل الديون)
+        balance = await get_clinic_balance(self.db, clinic_id)
+        total_outstanding = balance["outstanding"]
+        overdue_amount = balance["overdue"]
         
         # تحديد حالة الائتمان
         if total_outstanding >= Decimal(str(self.config.DEBT_LIMITS["block_threshold"])):
@@ -770,7 +926,10 @@ class IntegratedFinancialService:
             "clinic_id": clinic_id,
             "total_outstanding": float(total_outstanding),
             "overdue_amount": float(overdue_amount),
-            "debt_count": debt_count,
+            "debt_count": balance["open_debts"],
+            "total_invoiced": float(balance["invoiced"]),
+            "total_collected": float(balance["collected"]),
+            "last_payment_date": balance["last_payment_date"],
             "credit_status": credit_status,
             "risk_level": risk_level,
             "credit_limit_used": float(total_outstanding),
@@ -801,15 +960,23 @@ class IntegratedFinancialService:
                     "calculated_total": float(calculated_total.amount)
                 })
         
+        # مجاميع دفتر المدفوعات لكل دين (استعلام واحد)
+        ledger_totals = {
+            row["_id"]: to_decimal(row["total"])
+            async for row in self.db[PAYMENT_LEDGER_COLLECTION].aggregate([
+                {"$group": {"_id": "$debt_id", "total": {"$sum": {"$toDecimal": "$amount"}}}}
+            ])
+        }
+        
         # فحص تطابق مجاميع الديون
         debts_cursor = self.db.debts.find({})
         async for debt_data in debts_cursor:
             debt = IntegratedDebtRecord(**debt_data)
             
-            # حساب إجمالي المدفوعات
+            # حساب إجمالي المدفوعات (القديمة المضمنة + دفتر المدفوعات)
             total_payments = sum(
                 payment.amount.amount for payment in debt.payments
-            )
+            ) + ledger_totals.get(debt.id, Decimal("0.00"))
             
             expected_outstanding = debt.original_amount.amount - total_payments
             actual_outstanding = debt.outstanding_amount.amount
@@ -0,0 +1,319 @@
+# نظام الإدارة الطبية المتكامل - السلاسل الزمنية اليومية للتحصيل والتوقعات
+# Medical Management System - Daily outstanding/collected/new-debt series, DSO and cash-in forecast
+
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import math
+import numpy as np
+import pandas as pd
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+import pymongo
+
+from services.money_codec import to_decimal, money_expression
+from services.payment_ledger_service import PAYMENT_LEDGER_COLLECTION, to_bson_value
+from services.clinic_balance_service import CLOSED_DEBT_STATUSES
+
+FINANCIAL_DAILY_SERIES_COLLECTION = "financial_daily_series"
+
+# الأبعاد المدعومة؛ "all" سلسلة واحدة للشركة كلها بالمفتاح "all"
+SERIES_DIMENSIONS = ("all", "clinic", "rep", "area")
+ALL_KEY = "all"
+
+SERIES_FIELDS = ("new_debt", "collected", "outstanding")
+
+_ZERO = Decimal("0.00")
+
+
+# ============================================================================
+# SOURCE AGGREGATIONS - تجميع المصادر حسب اليوم
+# ============================================================================
+
+def _day(field: str) -> Dict[str, Any]:
+    """اليوم YYYY-MM-DD من تاريخ مخزن كـ date أو نص ISO"""
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": {"$convert": {
+        "input": f"${field}", "to": "date", "onError": None, "onNull": None
+    }}}}
+
+
+def _since(field: str, start: date) -> Dict[str, Any]:
+    # الحقول مخزنة أحياناً كنص ISO وأحياناً كتاريخ؛ المقارنة في BSON مقيدة بالنوع فيُغطى الاثنان بالفهرس
+    start_dt = datetime.combine(start, datetime.min.time())
+    return {"$or": [{field: {"$gte": start_dt}}, {field: {"$gte": start.isoformat()}}]}
+
+
+_DIMENSION_KEYS = {
+    "clinic": "$clinic_id",
+    # الدين المتكامل يحمل sales_rep_id، ودين نظام إدارة الديون assigned_to_id
+    "rep": {"$ifNull": ["$sales_rep_id", "$assigned_to_id"]},
+    "area": "$area_id",
+}
+
+
+async def _new_debt_by_day(db: AsyncIOMotorDatabase, start: date) -> List[Dict[str, Any]]:
+    return await db.debts.aggregate([
+        {"$match": {**_since("created_at", start), "status": {"$nin": CLOSED_DEBT_STATUSES}}},
+        {"$group": {
+            "_id": {"day": _day("created_at"), **_DIMENSION_KEYS},
+            "amount": {"$sum": {"$ifNull": [money_expression("original_amount"), money_expression("amount")]}},
+        }},
+    ]).to_list(length=None)
+
+
+async def _debt_payments_by_day(db: AsyncIOMotorDatabase, start: date) -> List[Dict[str, Any]]:
+    """دفعات الديون المرحلة في دفتر الدفعات، مع المندوب والمنطقة من الدين"""
+    return await db[PAYMENT_LEDGER_COLLECTION].aggregate([
+        {"$match": {"posted_at": {"$gte": datetime.combine(start, datetime.min.time())}}},
+        {"$lookup": {"from": "debts", "localField": "debt_id", "foreignField": "id", "as": "_debt"}},
+        {"$set": {
+            "sales_rep_id": {"$arrayElemAt": ["$_debt.sales_rep_id", 0]},
+            "assigned_to_id": {"$arrayElemAt": ["$_debt.assigned_to_id", 0]},
+            "area_id": {"$arrayElemAt": ["$_debt.area_id", 0]},
+        }},
+        {"$group": {
+            "_id": {"day": _day("posted_at"), **_DIMENSION_KEYS},
+            "amount": {"$sum": {"$convert": {"input": "$amount", "to": "decimal", "onError": 0, "onNull": 0}}},
+        }},
+    ]).to_list(length=None)
+
+
+async def _clinic_collections_by_day(db: AsyncIOMotorDatabase, start: date) -> List[Dict[str, Any]]:
+    """تحصيلات العيادات المعتمدة (لا تمس أرصدة الديون)"""
+    return await db.collections.aggregate([
+        {"$match": {**_since("approved_at", start), "status": "approved"}},
+        {"$group": {
+            "_id": {"day": _day("approved_at"), "clinic": "$clinic_id", "rep": "$collected_by"},
+            "amount": {"$sum": {"$convert": {"input": "$amount", "to": "decimal", "onError": 0, "onNull": 0}}},
+        }},
+    ]).to_list(length=None)
+
+
+async def _current_outstanding(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+    return await db.debts.aggregate([
+        {"$match": {"status": {"$nin": CLOSED_DEBT_STATUSES}}},
+        {"$group": {
+            "_id": _DIMENSION_KEYS,
+            "amount": {"$sum": {"$ifNull": [
+                money_expression("outstanding_amount"),
+                {"$ifNull": [money_expression("remaining_amount"), money_expression("amount")]}
+            ]}},
+        }},
+    ]).to_list(length=None)
+
+
+def _fold(rows: List[Dict[str, Any]], totals: Dict[Tuple[str, str], Dict[str, Decimal]], by_day: bool) -> None:
+    """توزيع صفوف (يوم، عيادة، مندوب، منطقة) على كل الأبعاد"""
+    for row in rows:
+        group = row["_id"]
+        day = group.get("day") if by_day else None
+        if by_day and not day:
+            continue
+        amount = to_decimal(row.get("amount"))
+        if not amount:
+            continue
+        for dimension in SERIES_DIMENSIONS:
+            key = ALL_KEY if dimension == "all" else group.get(dimension)
+            if not key:
+                continue
+            bucket = totals.setdefault((dimension, str(key)), {})
+            bucket[day] = bucket.get(day, _ZERO) + amount
+
+
+# ============================================================================
+# REFRESH - تحديث السلاسل المحسوبة مسبقاً
+# ============================================================================
+
+async def refresh_daily_series(
+    db: AsyncIOMotorDatabase,
+    days: int = 3,
+    as_of: Optional[date] = None
+) -> int:
+    """إعادة حساب آخر ``days`` يوماً من السلاسل لكل الأبعاد
+
+    New debt and collections are summed per day from the source documents. The
+    end-of-day outstanding is walked back from today's open balances
+    (``outstanding[d-1] = outstanding[d] - new_debt[d] + debt_payments[d]``), so
+    days before a write-off or cancellation are slightly understated. Run it
+    nightly with a short window, and once with a long one to backfill. Returns
+    the number of series points written.
+    """
+    as_of = as_of or date.today()
+    start = as_of - timedelta(days=days - 1)
+    day_keys = [(start + timedelta(days=offset)).isoformat() for offset in range(days)]
+
+    new_debt: Dict[Tuple[str, str], Dict[str, Decimal]] = {}
+    debt_payments: Dict[Tuple[str, str], Dict[str, Decimal]] = {}
+    clinic_collections: Dict[Tuple[str, str], Dict[str, Decimal]] = {}
+    outstanding_now: Dict[Tuple[str, str], Dict[str, Decimal]] = {}
+    _fold(await _new_debt_by_day(db, start), new_debt, by_day=True)
+    _fold(await _debt_payments_by_day(db, start), debt_payments, by_day=True)
+    _fold(await _clinic_collections_by_day(db, start), clinic_collections, by_day=True)
+    _fold(await _current_outstanding(db), outstanding_now, by_day=False)
+
+    now = datetime.utcnow()
+    operations = []
+    series_keys = set(new_debt) | set(debt_payments) | set(clinic_collections) | set(outstanding_now)
+    for series_key in series_keys:
+        dimension, key = series_key
+        created = new_debt.get(series_key, {})
+        paid = debt_payments.get(series_key, {})
+        collected_elsewhere = clinic_collections.get(series_key, {})
+        outstanding = outstanding_now.get(series_key, {}).get(None, _ZERO)
+
+        # من اليوم إلى الخلف: الرصيد في نهاية كل يوم
+        for day in reversed(day_keys):
+            point = {
+                "new_debt": created.get(day, _ZERO),
+                "collected": paid.get(day, _ZERO) + collected_elsewhere.get(day, _ZERO),
+                "outstanding": max(outstanding, _ZERO),
+                "updated_at": now,
+            }
+            operations.append(UpdateOne(
+                {"dimension": dimension, "key": key, "day": day},
+                {"$set": to_bson_value(point)},
+                upsert=True
+            ))
+            outstanding = outstanding - created.get(day, _ZERO) + paid.get(day, _ZERO)
+
+    for chunk_start in range(0, len(operations), 1000):
+        await db[FINANCIAL_DAILY_SERIES_COLLECTION].bulk_write(
+            operations[chunk_start:chunk_start + 1000], ordered=False
+        )
+    return len(operations)
+
+
+# ============================================================================
+# READ + METRICS - قراءة السلاسل وحساب المؤشرات
+# ============================================================================
+
+async def load_series_frame(
+    db: AsyncIOMotorDatabase,
+    dimension: str,
+    key: str,
+    start: date,
+    end: date
+) -> pd.DataFrame:
+    """سلسلة يومية كاملة للفترة (الأيام الناقصة: تدفق صفر ورصيد اليوم السابق)"""
+    points = await db[FINANCIAL_DAILY_SERIES_COLLECTION].find(
+        {"dimension": dimension, "key": key, "day": {"$gte": start.isoformat(), "$lte": end.isoformat()}},
+        {"_id": 0, "day": 1, **{field: 1 for field in SERIES_FIELDS}}
+    ).sort("day", 1).to_list(length=None)
+
+    frame = pd.DataFrame.from_records(
+        [{"day": point["day"], **{field: float(to_decimal(point.get(field))) for field in SERIES_FIELDS}}
+         for point in points],
+        columns=["day", *SERIES_FIELDS]
+    )
+    index = pd.Index([day.isoformat() for day in pd.date_range(start, end, freq="D").date], name="day")
+    frame = frame.set_index("day").reindex(index)
+    frame[["new_debt", "collected"]] = frame[["new_debt", "collected"]].fillna(0.0)
+    frame["outstanding"] = frame["outstanding"].ffill().fillna(0.0)
+    return frame
+
+
+def _none_if_nan(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(value) else round(float(value), 2) for value in values]
+
+
+def compute_collection_metrics(
+    frame: pd.DataFrame,
+    window: int = 30,
+    alpha: float = 0.3,
+    horizon: int = 30
+) -> Dict[str, Any]:
+    """DSO والتحصيل المتحرك وتوقع التدفق النقدي بالتنعيم الأسي البسيط
+
+    * DSO = end-of-day outstanding / new debt over the trailing ``window`` days × window
+    * collection rate = collected / new debt over the same trailing window (%)
+    * forecast: simple exponential smoothing of daily collections; the level is
+      the flat daily forecast, with a ±1.96σ band from one-step-ahead errors.
+    """
+    new_debt = frame["new_debt"].to_numpy()
+    collected = frame["collected"].to_numpy()
+    outstanding = frame["outstanding"].to_numpy()
+
+    rolling_new = frame["new_debt"].rolling(window, min_periods=1).sum().to_numpy()
+    rolling_collected = frame["collected"].rolling(window, min_periods=1).sum().to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dso = np.where(rolling_new > 0, outstanding / rolling_new * window, np.nan)
+        collection_rate = np.where(rolling_new > 0, rolling_collected / rolling_new * 100, np.nan)
+
+    level = frame["collected"].ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    errors = collected[1:] - level[:-1]
+    sigma = float(errors.std(ddof=1)) if errors.size > 1 else 0.0
+    daily = float(level[-1]) if level.size else 0.0
+
+    last_day = date.fromisoformat(frame.index[-1]) if len(frame) else date.today()
+    forecast = [
+        {
+            "day": (last_day + timedelta(days=step)).isoformat(),
+            "expected": round(daily, 2),
+            "cumulative": round(daily * step, 2),
+            "lower": round(max(daily * step - 1.96 * sigma * math.sqrt(step), 0.0), 2),
+            "upper": round(daily * step + 1.96 * sigma * math.sqrt(step), 2),
+        }
+        for step in range(1, horizon + 1)
+    ]
+
+    series = [
+        {"day": day, "new_debt": round(float(n), 2), "collected": round(float(c), 2),
+         "outstanding": round(float(o), 2), "dso": d, "collection_rate": r}
+        for day, n, c, o, d, r in zip(
+            frame.index, new_debt, collected, outstanding, _none_if_nan(dso), _none_if_nan(collection_rate)
+        )
+    ]
+
+    return {
+        "window": window,
+        "series": series,
+        "current": {
+            "outstanding": round(float(outstanding[-1]), 2) if outstanding.size else 0.0,
+            "dso": series[-1]["dso"] if series else None,
+            "collection_rate": series[-1]["collection_rate"] if series else None,
+        },
+        "forecast": {
+            "method": "simple_exponential_smoothing",
+            "alpha": alpha,
+            "horizon_days": horizon,
+            "daily_level": round(daily, 2),
+            "expected_cash_in": round(daily * horizon, 2),
+            "points": forecast,
+        },
+    }
+
+
+async def get_collection_trends(
+    db: AsyncIOMotorDatabase,
+    dimension: str = "all",
+    key: Optional[str] = None,
+    days: int = 90,
+    window: int = 30,
+    alpha: float = 0.3,
+    horizon: int = 30,
+    as_of: Optional[date] = None
+) -> Dict[str, Any]:
+    """اتجاهات التحصيل من السلاسل المحسوبة مسبقاً (قراءة واحدة مفهرسة)"""
+    if dimension not in SERIES_DIMENSIONS:
+        raise ValueError(f"بعد غير مدعوم: {dimension}")
+    key = ALL_KEY if dimension == "all" else key
+    if not key:
+        raise ValueError("يجب تحديد المفتاح (معرف العيادة/المندوب/المنطقة)")
+
+    end = as_of or date.today()
+    # نقرأ نافذة إضافية حتى تكتمل المجاميع المتحركة لأول يوم معروض
+    frame = await load_series_frame(db, dimension, key, end - timedelta(days=days + window - 1), end)
+    metrics = compute_collection_metrics(frame, window=window, alpha=alpha, horizon=horizon)
+    metrics["series"] = metrics["series"][-days:]
+    return {"dimension": dimension, "key": key, "start_date": metrics["series"][0]["day"],
+            "end_date": end.isoformat(), **metrics}
+
+
+async def ensure_financial_series_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهارس السلاسل اليومية ومصادر التحديث"""
+    await db[FINANCIAL_DAILY_SERIES_COLLECTION].create_index(
+        [("dimension", pymongo.ASCENDING), ("key", pymongo.ASCENDING), ("day", pymongo.ASCENDING)],
+        unique=True
+    )
+    await db.debts.create_index([("created_at", pymongo.ASCENDING)])
+    await db.collections.create_index([("approved_at", pymongo.ASCENDING)])
@@ -0,0 +1,211 @@
+# نظام الإدارة الطبية المتكامل - جدولة تذكيرات مهام المتابعة
+# Medical Management System - Follow-up reminder scheduler: indexed due-date queue + find_one_and_update leases
+
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+import pymongo
+from pymongo import ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.notification_service import NotificationService
+
+# فترة الاستطلاع عندما لا توجد تذكيرات مستحقة، وعدد التذكيرات في كل دفعة
+FOLLOW_UP_POLL_SECONDS = float(os.environ.get("FOLLOW_UP_POLL_SECONDS", 15))
+FOLLOW_UP_BATCH_SIZE = 100
+
+# مدة الحجز: تذكير لم يُؤكَّد خلالها (عامل توقف) يعود مستحقاً لأي عامل آخر
+FOLLOW_UP_LEASE = timedelta(seconds=float(os.environ.get("FOLLOW_UP_LEASE_SECONDS", 120)))
+
+# إعادة المحاولة بعد فشل الإرسال: دقيقة ثم ضعفها في كل مرة
+FOLLOW_UP_MAX_ATTEMPTS = 5
+FOLLOW_UP_RETRY_BACKOFF = timedelta(minutes=1)
+
+OPEN_TASK_STATUSES = ("pending", "in_progress")
+
+# scheduled → sent | failed | cancelled؛ فقط scheduled موجود في فهرس الطابور
+REMINDER_STATUSES = ("scheduled", "sent", "failed", "cancelled")
+
+REMINDER_QUEUE_INDEX = "reminder_queue"
+
+TASK_REMINDER_PROJECTION = {
+    "_id": 1, "id": 1, "client_id": 1, "assigned_to": 1, "title": 1, "priority": 1, "status": 1,
+    "due_date": 1, "remind_at": 1, "reminder_attempts": 1, "lease_owner": 1,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def reminder_fields(reminder_date: Optional[datetime], due_date: datetime) -> Dict[str, Any]:
+    """حقول الطابور لمهمة جديدة: التذكير في تاريخ التذكير أو تاريخ الاستحقاق"""
+    return {
+        "remind_at": reminder_date or due_date,
+        "reminder_status": "scheduled",
+        "reminder_attempts": 0,
+    }
+
+
+async def ensure_follow_up_queue_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهرس جزئي للتذكيرات المجدولة فقط، وفهرس المهام المعلقة لكل مستخدم"""
+    tasks = db.follow_up_tasks
+    await tasks.create_index(
+        [("remind_at", pymongo.ASCENDING)],
+        name=REMINDER_QUEUE_INDEX,
+        partialFilterExpression={"reminder_status": "scheduled"}
+    )
+    await tasks.create_index([("assigned_to", pymongo.ASCENDING), ("status", pymongo.ASCENDING), ("due_date", pymongo.ASCENDING)])
+    await tasks.create_index([("id", pymongo.ASCENDING)])
+
+
+async def claim_due_reminder(
+    db: AsyncIOMotorDatabase,
+    worker_id: str,
+    now: Optional[datetime] = None
+) -> Optional[Dict[str, Any]]:
+    """حجز أقدم تذكير مستحق ذرياً
+
+    The lease is the queue position itself: ``remind_at`` moves to the end of
+    the lease, so the claimed task leaves the due range for every other
+    worker and comes back on its own if this worker never acknowledges it.
+    Uses only the partial ``remind_at`` index (no scan of sent/completed tasks).
+    """
+    now = now or datetime.utcnow()
+    return await db.follow_up_tasks.find_one_and_update(
+        {"reminder_status": "scheduled", "remind_at": {"$lte": now}},
+        {
+            "$set": {"remind_at": now + FOLLOW_UP_LEASE, "lease_owner": worker_id, "leased_at": now},
+            "$inc": {"reminder_attempts": 1},
+        },
+        sort=[("remind_at", pymongo.ASCENDING)],
+        projection=TASK_REMINDER_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _settle(db: AsyncIOMotorDatabase, task: Dict[str, Any], update: Dict[str, Any]) -> bool:
+    """إنهاء الحجز فقط إن كان ما زال لهذا العامل (لم تنتهِ مدته ويحجزه غيره)"""
+    update.setdefault("$unset", {}).update({"lease_owner": "", "leased_at": ""})
+    result = await db.follow_up_tasks.update_one(
+        {"_id": task["_id"], "lease_owner": task["lease_owner"], "remind_at": task["remind_at"]},
+        update
+    )
+    return result.modified_count == 1
+
+
+async def cancel_reminder(db: AsyncIOMotorDatabase, task_id: str) -> None:
+    """إخراج مهمة مكتملة من الطابور"""
+    await db.follow_up_tasks.update_one(
+        {"id": task_id, "reminder_status": "scheduled"},
+        {"$set": {"reminder_status": "cancelled"}, "$unset": {"lease_owner": "", "leased_at": ""}}
+    )
+
+
+# ============================================================================
+# SCHEDULER - حلقة الاستطلاع داخل الخادم
+# ============================================================================
+
+class FollowUpScheduler:
+    """إرسال تذكيرات مهام المتابعة المستحقة عبر خدمة الإشعارات
+
+    Safe to run in every server process: each reminder is claimed by exactly
+    one worker at a time. Delivery is at-least-once - a worker that stops
+    after creating the notification but before acknowledging it leaves the
+    reminder to be sent again when the lease ends.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        notification_service: Optional[NotificationService] = None,
+        worker_id: Optional[str] = None,
+        poll_seconds: float = FOLLOW_UP_POLL_SECONDS,
+        batch_size: int = FOLLOW_UP_BATCH_SIZE
+    ) -> None:
+        self.db = db
+        self.notification_service = notification_service or NotificationService(db)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """حجز وإرسال دفعة من التذكيرات المستحقة"""
+        now = now or datetime.utcnow()
+        claimed: List[Dict[str, Any]] = []
+        while len(claimed) < self.batch_size:
+            task = await claim_due_reminder(self.db, self.worker_id, now)
+            if task is None:
+                break
+            claimed.append(task)
+
+        counts = {"claimed": len(claimed), "sent": 0, "retried": 0, "failed": 0, "cancelled": 0, "lost": 0}
+        if not claimed:
+            return counts
+
+        # أسماء العملاء للدفعة كاملة (استعلام واحد)
+        client_ids = list({task["client_id"] for task in claimed})
+        client_names = {
+            clinic["id"]: clinic.get("name")
+            async for clinic in self.db.clinics.find({"id": {"$in": client_ids}}, {"_id": 0, "id": 1, "name": 1})
+        }
+
+        outcomes = await asyncio.gather(*(
+            self._fire(task, client_names.get(task["client_id"]) or "غير محدد") for task in claimed
+        ))
+        for outcome in outcomes:
+            counts[outcome] += 1
+        return counts
+
+    async def _fire(self, task: Dict[str, Any], client_name: str) -> str:
+        now = datetime.utcnow()
+        if task.get("status") not in OPEN_TASK_STATUSES:
+            settled = await _settle(self.db, task, {"$set": {"reminder_status": "cancelled"}})
+            return "cancelled" if settled else "lost"
+
+        notification = await self.notification_service.trigger_follow_up_reminder(task, client_name)
+        if notification is not None:
+            settled = await _settle(self.db, task, {"$set": {
+                "reminder_status": "sent", "reminder_sent_at": now, "reminder_notification_id": notification.id
+            }})
+            return "sent" if settled else "lost"
+
+        attempts = task.get("reminder_attempts", 1)
+        if attempts >= FOLLOW_UP_MAX_ATTEMPTS:
+            settled = await _settle(self.db, task, {"$set": {"reminder_status": "failed", "reminder_failed_at": now}})
+            return "failed" if settled else "lost"
+        retry_at = now + FOLLOW_UP_RETRY_BACKOFF * (2 ** (attempts - 1))
+        settled = await _settle(self.db, task, {"$set": {"remind_at": retry_at}})
+        return "retried" if settled else "lost"
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                counts = await self.run_once()
+                if counts["claimed"]:
+                    logger.info(f"Follow-up reminders: {counts}")
+                # دفعة كاملة = قد توجد تذكيرات مستحقة أخرى؛ تابع بدون انتظار
+                if counts["claimed"] >= self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error running follow-up reminders: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,208 @@
+# نظام الإدارة الطبية المتكامل - خدمة المواقع الجغرافية للعيادات
+# Medical Management System - Clinic geospatial service (GeoJSON location + $geoNear)
+
+from typing import List, Dict, Any, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import pymongo
+
+# مجموعات العيادات التي تحمل حقل location بصيغة GeoJSON
+CLINIC_GEO_COLLECTIONS = ("clinics", "enhanced_clinics")
+
+# مصادر الإحداثيات القديمة لكل مجموعة بالترتيب المفضل
+COORDINATE_SOURCES = {
+    "clinics": (
+        ("clinic_latitude", "clinic_longitude"),
+        ("latitude", "longitude"),
+    ),
+    "enhanced_clinics": (
+        ("admin_approved_location.latitude", "admin_approved_location.longitude"),
+        ("location_data.latitude", "location_data.longitude"),
+    ),
+}
+
+MAX_NEAR_RADIUS_KM = 200.0
+
+# فهرس 2dsphere جزئي: العيادات القديمة التي تحفظ location كنص عنوان لا تمنع بناءه؛
+# الاستعلامات الجغرافية تضيف نفس الشرط حتى يستخدم المخطط الفهرس الجزئي
+GEO_INDEX_FILTER = {"location.type": "Point"}
+
+# نصف قطر الأرض الذي يستخدمه MongoDB في حساب المسافات الكروية ($geoNear / $centerSphere)
+MONGO_EARTH_RADIUS_KM = 6378.1
+
+
+def _get_path(document: Dict[str, Any], path: str) -> Any:
+    value: Any = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def to_geojson_point(latitude: Any, longitude: Any) -> Optional[Dict[str, Any]]:
+    """تحويل إحداثيات إلى نقطة GeoJSON - returns None for missing/invalid coordinates"""
+    try:
+        lat = float(latitude)
+        lon = float(longitude)
+    except (TypeError, ValueError):
+        return None
+
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    if lat == 0.0 and lon == 0.0:
+        # قيمة افتراضية من نماذج التسجيل وليست موقعاً حقيقياً
+        return None
+
+    # GeoJSON يستخدم ترتيب [longitude, latitude]
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def extract_coordinates(document: Dict[str, Any], collection: str = "clinics") -> Optional[Tuple[float, float]]:
+    """استخراج (latitude, longitude) من مستند عيادة بأي من صيغ الحقول المعروفة"""
+    location = document.get("location")
+    if isinstance(location, dict) and location.get("type") == "Point":
+        lon, lat = location["coordinates"]
+        return lat, lon
+
+    for lat_path, lon_path in COORDINATE_SOURCES.get(collection, ()):
+        point = to_geojson_point(_get_path(document, lat_path), _get_path(document, lon_path))
+        if point:
+            lon, lat = point["coordinates"]
+            return lat, lon
+
+    return None
+
+
+def build_location_field(document: Dict[str, Any], collection: str = "clinics") -> Optional[Dict[str, Any]]:
+    """بناء حقل location لمستند عيادة قبل الحفظ"""
+    coordinates = extract_coordinates(document, collection)
+    if not coordinates:
+        return None
+    return to_geojson_point(*coordinates)
+
+
+def location_backfill_pipeline(collection: str) -> List[Dict[str, Any]]:
+    """خط تحديث (pipeline update) يحسب location من الحقول القديمة على الخادم"""
+    def as_double(path: str) -> Dict[str, Any]:
+        return {"$convert": {"input": f"${path}", "to": "double", "onError": None, "onNull": None}}
+
+    lat_expr: Any = None
+    lon_expr: Any = None
+    for lat_path, lon_path in reversed(COORDINATE_SOURCES[collection]):
+        lat_expr = {"$ifNull": [as_double(lat_path), lat_expr]}
+        lon_expr = {"$ifNull": [as_double(lon_path), lon_expr]}
+
+    valid = {"$and": [
+        {"$ne": ["$$lat", None]}, {"$ne": ["$$lon", None]},
+        {"$gte": ["$$lat", -90]}, {"$lte": ["$$lat", 90]},
+        {"$gte": ["$$lon", -180]}, {"$lte": ["$$lon", 180]},
+        {"$or": [{"$ne": ["$$lat", 0]}, {"$ne": ["$$lon", 0]}]}
+    ]}
+
+    return [
+        # نقل أي نص عنوان قديم محفوظ في location قبل استبداله بـ GeoJSON
+        {"$set": {"legacy_location_text": {"$cond": [
+            {"$eq": [{"$type": "$location"}, "string"]}, "$location", "$legacy_location_text"
+        ]}}},
+        {"$set": {"location": {"$let": {
+            "vars": {"lat": lat_expr, "lon": lon_expr},
+            "in": {"$cond": [
+                valid,
+                {"type": "Point", "coordinates": ["$$lon", "$$lat"]},
+                # الإبقاء على نقطة GeoJSON موجودة مسبقاً، وحذف أي قيمة أخرى
+                {"$cond": [{"$eq": [{"$type": "$location"}, "object"]}, "$location", "$$REMOVE"]}
+            ]}
+        }}}}
+    ]
+
+
+async def ensure_geo_indexes(db: AsyncIOMotorDatabase) -> None:
+    """إنشاء فهارس 2dsphere الجزئية على حقل location (نقاط GeoJSON فقط)"""
+    for collection in CLINIC_GEO_COLLECTIONS:
+        existing = (await db[collection].index_information()).get("location_2dsphere")
+        if existing and existing.get("partialFilterExpression") != GEO_INDEX_FILTER:
+            # فهرس سابق بلا الشرط الجزئي: يُعاد بناؤه بالخيارات الجديدة
+            await db[collection].drop_index("location_2dsphere")
+        await db[collection].create_index(
+            [("location", pymongo.GEOSPHERE)],
+            name="location_2dsphere",
+            partialFilterExpression=GEO_INDEX_FILTER
+        )
+
+
+async def ensure_registration_log_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهارس تقرير دقة التسجيل - filter/sort registration logs on stored accuracy"""
+    logs = db.admin_registration_logs
+    await logs.create_index([("registration_accuracy", pymongo.ASCENDING), ("created_at", pymongo.DESCENDING)])
+    await logs.create_index([("distance_between_locations_km", pymongo.DESCENDING)])
+    await logs.create_index([("line_id", pymongo.ASCENDING), ("created_at", pymongo.DESCENDING)])
+    await logs.create_index([("created_at", pymongo.DESCENDING)])
+
+
+def user_clinic_scope(current_user: Dict[str, Any]) -> Dict[str, Any]:
+    """نطاق العيادات المسموح به حسب دور المستخدم (نفس قواعد available-for-user)"""
+    if current_user.get("role") == "medical_rep":
+        user_id = current_user.get("id")
+        return {"$or": [
+            {"assigned_rep_id": user_id},
+            {"available_reps": {"$in": [user_id]}},
+            {"backup_rep_ids": {"$in": [user_id]}}
+        ]}
+
+    # مدير الخط/المنطقة والإدارة يرون جميع العيادات (تُضيّق بفلاتر line_id/area_id)
+    return {}
+
+
+async def find_clinics_near(
+    db: AsyncIOMotorDatabase,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    query: Optional[Dict[str, Any]] = None,
+    limit: int = 50,
+    collection: str = "enhanced_clinics",
+    projection: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """البحث عن أقرب العيادات باستخدام $geoNear - results are ordered by distance
+
+    Each returned document carries ``distance_km``. ``query`` is applied inside
+    ``$geoNear`` so role scoping and filters use the 2dsphere index together.
+    """
+    point = to_geojson_point(latitude, longitude)
+    if point is None:
+        raise ValueError("إحداثيات غير صالحة")
+
+    pipeline: List[Dict[str, Any]] = [
+        {"$geoNear": {
+            "near": point,
+            "distanceField": "distance_m",
+            "maxDistance": min(radius_km, MAX_NEAR_RADIUS_KM) * 1000.0,
+            "spherical": True,
+            "query": {**(query or {}), **GEO_INDEX_FILTER},
+        }},
+        {"$limit": limit},
+        {"$set": {"distance_km": {"$round": [{"$divide": ["$distance_m", 1000]}, 3]}}},
+        {"$project": projection or {"_id": 0, "distance_m": 0}},
+    ]
+
+    return await db[collection].aggregate(pipeline).to_list(length=limit)
+
+
+def clinics_within_query(
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    query: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """نفس نطاق find_clinics_near كفلتر $geoWithin (يصلح لـ count_documents بخلاف $near)"""
+    point = to_geojson_point(latitude, longitude)
+    if point is None:
+        raise ValueError("إحداثيات غير صالحة")
+    return {
+        **(query or {}),
+        **GEO_INDEX_FILTER,
+        "location": {"$geoWithin": {"$centerSphere": [
+            point["coordinates"], min(radius_km, MAX_NEAR_RADIUS_KM) / MONGO_EARTH_RADIUS_KM
+        ]}},
+    }
+
@@ -0,0 +1,102 @@
+# نظام الإدارة الطبية المتكامل - أدوات الحساب الجغرافي المتجهة
+# Medical Management System - NumPy-vectorized geo utilities (haversine, bearing, bounding box)
+
+from typing import Any, Dict, Tuple, Union
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+ArrayLike = Union[float, np.ndarray, list]
+
+# حدود تصنيف دقة التسجيل (المسافة بين موقع العيادة وموقع المسجل بالكيلومتر)
+REGISTRATION_ACCURACY_THRESHOLDS_KM = {
+    "high": 0.1,
+    "medium": 1.0,
+}
+
+
+def _as_float_array(values: ArrayLike) -> np.ndarray:
+    """تحويل القيم إلى مصفوفة أعداد عشرية - None يصبح NaN"""
+    # المسار السريع: مصفوفات رقمية (مسارات GPS) وأعداد مفردة لا تحتاج فحص None لكل عنصر
+    if isinstance(values, np.ndarray) and values.dtype.kind in "fiu":
+        return values.astype(np.float64, copy=False)
+    if isinstance(values, (int, float, np.number)):
+        return np.float64(values)
+    return np.asarray(
+        [np.nan if value is None else value for value in np.atleast_1d(np.asarray(values, dtype=object))],
+        dtype=np.float64
+    ).reshape(np.shape(values))
+
+
+def haversine_km(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> np.ndarray:
+    """مسافة الدائرة العظمى بالكيلومتر لكل زوج نقاط (متجهة وتدعم البث)
+
+    Missing coordinates (None/NaN) yield NaN for that row.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(_as_float_array(v)) for v in (lat1, lon1, lat2, lon2))
+    d_lat = lat2 - lat1
+    d_lon = lon2 - lon1
+    a = np.sin(d_lat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bearing_deg(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> np.ndarray:
+    """الاتجاه الابتدائي من النقطة الأولى إلى الثانية بالدرجات (0-360، الشمال = 0)"""
+    lat1, lon1, lat2, lon2 = (np.radians(_as_float_array(v)) for v in (lat1, lon1, lat2, lon2))
+    d_lon = lon2 - lon1
+    x = np.sin(d_lon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(d_lon)
+    return (np.degrees(np.arctan2(x, y)) + 360.0) % 360.0
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """مربع الإحاطة (min_lat, min_lon, max_lat, max_lon) لدائرة نصف قطرها radius_km
+
+    Useful as a cheap index pre-filter before an exact haversine check.
+    """
+    lat = np.radians(latitude)
+    angular = radius_km / EARTH_RADIUS_KM
+    min_lat = lat - angular
+    max_lat = lat + angular
+
+    if min_lat <= -np.pi / 2 or max_lat >= np.pi / 2:
+        # الدائرة تشمل أحد القطبين - كل خطوط الطول
+        return (
+            float(np.degrees(max(min_lat, -np.pi / 2))), -180.0,
+            float(np.degrees(min(max_lat, np.pi / 2))), 180.0
+        )
+
+    d_lon = np.arcsin(np.sin(angular) / np.cos(lat))
+    min_lon = np.radians(longitude) - d_lon
+    max_lon = np.radians(longitude) + d_lon
+    return (
+        float(np.degrees(min_lat)), float((np.degrees(min_lon) + 540.0) % 360.0 - 180.0),
+        float(np.degrees(max_lat)), float((np.degrees(max_lon) + 540.0) % 360.0 - 180.0)
+    )
+
+
+def bounding_box_query(field_prefix: str, latitude: float, longitude: float, radius_km: float) -> Dict[str, Any]:
+    """فلتر Mongo لمربع الإحاطة على حقول latitude/longitude"""
+    min_lat, min_lon, max_lat, max_lon = bounding_box(latitude, longitude, radius_km)
+    query: Dict[str, Any] = {f"{field_prefix}latitude": {"$gte": min_lat, "$lte": max_lat}}
+    if min_lon <= max_lon:
+        query[f"{field_prefix}longitude"] = {"$gte": min_lon, "$lte": max_lon}
+    else:
+        # المربع يعبر خط التاريخ الدولي
+        query["$or"] = [
+            {f"{field_prefix}longitude": {"$gte": min_lon}},
+            {f"{field_prefix}longitude": {"$lte": max_lon}}
+        ]
+    return query
+
+
+def classify_registration_accuracy(distance_km: ArrayLike) -> np.ndarray:
+    """تصنيف دقة التسجيل حسب المسافة: high (< 100م)، medium (< 1كم)، low (غير ذلك أو غير معروف)"""
+    distance = _as_float_array(distance_km)
+    known = ~np.isnan(distance)
+    return np.select(
+        [known & (distance < REGISTRATION_ACCURACY_THRESHOLDS_KM["high"]),
+         known & (distance < REGISTRATION_ACCURACY_THRESHOLDS_KM["medium"])],
+        ["high", "medium"],
+        default="low"
+    )
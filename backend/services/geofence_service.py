@@ -0,0 +1,216 @@
+# نظام الإدارة الطبية المتكامل - التحقق من موقع تسجيل الدخول للزيارة (السياج الجغرافي)
+# Medical Management System - Visit check-in geofence: in-memory clinic coordinates + verdicts
+
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from datetime import datetime
+import asyncio
+import os
+import time
+
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.geo_service import CLINIC_GEO_COLLECTIONS, COORDINATE_SOURCES, extract_coordinates
+from services.geo_utils import haversine_km
+
+# نطاق السياج حول العيادة، والمسافة التي بعدها يُعتبر التسجيل خارج العيادة
+GEOFENCE_RADIUS_M = float(os.environ.get("GEOFENCE_RADIUS_M", 150))
+GEOFENCE_NEARBY_M = float(os.environ.get("GEOFENCE_NEARBY_M", 500))
+
+# inside ≤ النطاق < nearby ≤ حد القرب < outside؛ unknown: لا إحداثيات للعيادة أو للمندوب
+GEOFENCE_VERDICTS = ("inside", "nearby", "outside", "unknown")
+SUSPICIOUS_VERDICTS = ("outside",)
+
+# إعادة تحميل الفهرس كاملاً في الخلفية (تعديلات العيادات من عمليات أخرى)
+CLINIC_INDEX_MAX_AGE_SECONDS = 600
+
+CLINIC_COORDINATE_PROJECTION = {
+    "_id": 0, "id": 1, "location": 1,
+    **{path: 1 for sources in COORDINATE_SOURCES.values() for pair in sources for path in pair}
+}
+
+
+def geofence_verdict(distance: Optional[float]) -> str:
+    if distance is None:
+        return "unknown"
+    if distance <= GEOFENCE_RADIUS_M:
+        return "inside"
+    if distance <= GEOFENCE_NEARBY_M:
+        return "nearby"
+    return "outside"
+
+
+# ============================================================================
+# CLINIC INDEX - إحداثيات العيادات في الذاكرة
+# ============================================================================
+
+class ClinicGeoIndex:
+    """فهرس إحداثيات العيادات في الذاكرة - clinic id → (latitude, longitude)
+
+    Loaded once on first use, then kept current by ``update``/``remove`` from
+    the clinic write paths of this process and reloaded in the background
+    every ``CLINIC_INDEX_MAX_AGE_SECONDS`` for writes made elsewhere. A clinic
+    that is not in the index yet is read once from MongoDB and cached.
+    Clinics without coordinates are cached as ``None``.
+    """
+
+    def __init__(self, collections: Tuple[str, ...] = CLINIC_GEO_COLLECTIONS) -> None:
+        self.collections = collections
+        self._coordinates: Dict[str, Optional[Tuple[float, float]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._coordinates)
+
+    async def load(self, db: AsyncIOMotorDatabase) -> int:
+        """تحميل كل العيادات من قاعدة البيانات"""
+        clinics = []
+        for collection in self.collections:
+            async for clinic in db[collection].find({}, CLINIC_COORDINATE_PROJECTION).batch_size(5000):
+                clinics.append((clinic, collection))
+        return self.replace_all(clinics)
+
+    def replace_all(self, clinics: Iterable[Tuple[Dict[str, Any], str]]) -> int:
+        """استبدال الفهرس كاملاً (المجموعة الأولى لها الأولوية عند تكرار المعرف)"""
+        coordinates: Dict[str, Optional[Tuple[float, float]]] = {}
+        for clinic, collection in clinics:
+            if clinic.get("id") and clinic["id"] not in coordinates:
+                coordinates[clinic["id"]] = extract_coordinates(clinic, collection)
+        # الاستبدال مرة واحدة: القراءات المتزامنة ترى الفهرس القديم أو الجديد كاملاً
+        self._coordinates = coordinates
+        self._loaded_at = time.monotonic()
+        return len(coordinates)
+
+    def update(self, clinic: Dict[str, Any], collection: str = "clinics") -> None:
+        """تحديث عيادة بعد إنشائها أو تعديل موقعها"""
+        if clinic.get("id"):
+            self._coordinates[clinic["id"]] = extract_coordinates(clinic, collection)
+
+    def remove(self, clinic_id: str) -> None:
+        """حذف عيادة من الفهرس بعد حذفها (القراءة التالية تعود إلى قاعدة البيانات)"""
+        self._coordinates.pop(clinic_id, None)
+
+    def get(self, clinic_id: str) -> Optional[Tuple[float, float]]:
+        """الإحداثيات المحملة فقط (بدون قراءة من قاعدة البيانات)"""
+        return self._coordinates.get(clinic_id)
+
+    async def coordinates(self, db: AsyncIOMotorDatabase, clinic_id: str) -> Optional[Tuple[float, float]]:
+        if self._loaded_at is None:
+            async with self._lock:
+                if self._loaded_at is None:
+                    await self.load(db)
+        elif (time.monotonic() - self._loaded_at > CLINIC_INDEX_MAX_AGE_SECONDS
+              and (self._refresh_task is None or self._refresh_task.done())):
+            self._refresh_task = asyncio.create_task(self.load(db))
+
+        if clinic_id not in self._coordinates:
+            for collection in self.collections:
+                clinic = await db[collection].find_one({"id": clinic_id}, CLINIC_COORDINATE_PROJECTION)
+                if clinic:
+                    self.update(clinic, collection)
+                    break
+        return self._coordinates.get(clinic_id)
+
+
+clinic_geo_index = ClinicGeoIndex()
+
+
+async def check_geofence(
+    db: AsyncIOMotorDatabase,
+    clinic_id: Optional[str],
+    latitude: Optional[float],
+    longitude: Optional[float]
+) -> Dict[str, Any]:
+    """المسافة بين موقع المندوب والعيادة والحكم عليها - stored on the visit as-is"""
+    clinic_point = await clinic_geo_index.coordinates(db, clinic_id) if clinic_id else None
+    distance = None
+    if clinic_point is not None and latitude is not None and longitude is not None:
+        distance = round(float(haversine_km(clinic_point[0], clinic_point[1], latitude, longitude)) * 1000, 1)
+    return {
+        "verdict": geofence_verdict(distance),
+        "distance_m": distance,
+        "radius_m": GEOFENCE_RADIUS_M,
+        "checked_at": datetime.utcnow().isoformat(),
+    }
+
+
+def visit_geofence_fields(check_in: Optional[Dict[str, Any]], check_out: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """حقول الزيارة المفهرسة: أسوأ حكم وأبعد مسافة بين الدخول والخروج"""
+    checks = [check for check in (check_in, check_out) if check]
+    known = [check for check in checks if check["verdict"] != "unknown"]
+    worst = max(known or checks, key=lambda check: GEOFENCE_VERDICTS.index(check["verdict"]))
+    return {
+        "geofence_verdict": worst["verdict"],
+        "geofence_distance_m": max((check["distance_m"] for check in known), default=None),
+    }
+
+
+async def ensure_geofence_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهرس تقرير الزيارات المشبوهة: الحكم ثم وقت تسجيل الدخول"""
+    await db.rep_visits.create_index(
+        [("geofence_verdict", pymongo.ASCENDING), ("actual_start_time", pymongo.DESCENDING)],
+        partialFilterExpression={"geofence_verdict": {"$exists": True}}
+    )
+
+
+# ============================================================================
+# REPORT - تقرير الزيارات المشبوهة
+# ============================================================================
+
+SUSPICIOUS_VISIT_PROJECTION = {
+    "_id": 0, "id": 1, "medical_rep_id": 1, "clinic_id": 1, "status": 1,
+    "scheduled_date": 1, "actual_start_time": 1, "actual_end_time": 1, "duration_minutes": 1,
+    "check_in_location": 1, "geofence": 1, "geofence_verdict": 1, "geofence_distance_m": 1,
+}
+
+
+async def find_suspicious_visits(
+    db: AsyncIOMotorDatabase,
+    start: datetime,
+    end: datetime,
+    verdicts: Tuple[str, ...] = SUSPICIOUS_VERDICTS,
+    rep_id: Optional[str] = None,
+    limit: int = 500,
+    skip: int = 0
+) -> Dict[str, Any]:
+    """الزيارات خارج السياج في فترة (الأبعد أولاً) مع ملخص لكل مندوب"""
+    query: Dict[str, Any] = {
+        "geofence_verdict": {"$in": list(verdicts)},
+        "actual_start_time": {"$gte": start.isoformat(), "$lt": end.isoformat()},
+    }
+    if rep_id:
+        query["medical_rep_id"] = rep_id
+
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": query},
+        {"$facet": {
+            "visits": [
+                {"$sort": {"geofence_distance_m": -1, "actual_start_time": -1}},
+                {"$skip": skip},
+                {"$limit": limit},
+                {"$project": SUSPICIOUS_VISIT_PROJECTION},
+            ],
+            "by_rep": [
+                {"$group": {
+                    "_id": "$medical_rep_id",
+                    "visits": {"$sum": 1},
+                    "max_distance_m": {"$max": "$geofence_distance_m"},
+                    "avg_distance_m": {"$avg": "$geofence_distance_m"},
+                }},
+                {"$sort": {"visits": -1}},
+                {"$project": {
+                    "_id": 0, "rep_id": "$_id", "visits": 1, "max_distance_m": 1,
+                    "avg_distance_m": {"$round": ["$avg_distance_m", 1]},
+                }},
+            ],
+            "total": [{"$count": "count"}],
+        }},
+    ]
+    result = (await db.rep_visits.aggregate(pipeline).to_list(length=1))[0]
+    return {
+        "total": result["total"][0]["count"] if result["total"] else 0,
+        "visits": result["visits"],
+        "by_rep": result["by_rep"],
+    }
@@ -0,0 +1,367 @@
+# نظام الإدارة الطبية المتكامل - تحليلات حركة المندوب (التوقفات والمسافة ومدة البقاء)
+# Medical Management System - Rep movement analytics: stops, distance travelled and dwell time
+
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, date, timedelta
+import bisect
+import math
+
+import numpy as np
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+from services.geo_service import CLINIC_GEO_COLLECTIONS, GEO_INDEX_FILTER
+from services.geo_utils import haversine_km
+from services.gps_track_service import (
+    GPS_ANALYTICS_COLLECTION, segment_distances_m, load_tracks, analytics_cache_id, analytics_expiry
+)
+
+# يُعاد الحساب عند تغيير الخوارزمية أو الحدود
+ANALYTICS_VERSION = 1
+
+# تصنيف الحركة حسب السرعة (متر/ثانية): أقل من 3.6 كم/س متوقف، أقل من 9 كم/س مشي، وإلا قيادة
+MOVEMENT_TYPES = ("stationary", "walking", "driving")
+STATIONARY_SPEED_MS = 1.0
+WALKING_SPEED_MS = 2.5
+SPEED_MEDIAN_WINDOW = 5
+
+# التوقف: نقاط متوقفة متتالية لمدة 5 دقائق على الأقل؛ توقفان متقاربان يفصلهما انقطاع قصير يُدمجان
+STOP_RADIUS_M = 75.0
+MIN_STOP_DURATION = timedelta(minutes=5)
+MAX_STOP_GAP = timedelta(minutes=3)
+
+# مطابقة التوقف بالعيادات القريبة
+CLINIC_MATCH_RADIUS_M = 150.0
+MAX_NEARBY_CLINICS = 3
+
+# التحقق من الزيارات: مدة بقاء فعلية لا تقل عن نصف المدة المسجلة (ولا عن 5 دقائق)
+MIN_VERIFIED_DWELL_RATIO = 0.5
+
+
+async def ensure_gps_analytics_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهارس التحليلات المخزنة: الإلغاء لكل مستخدم/يوم وحذفها مع انتهاء احتفاظ النقاط"""
+    analytics = db[GPS_ANALYTICS_COLLECTION]
+    await analytics.create_index([("user_id", pymongo.ASCENDING), ("day", pymongo.ASCENDING)])
+    await analytics.create_index([("expires_at", pymongo.ASCENDING)], expireAfterSeconds=0)
+
+
+# ============================================================================
+# ENGINE - حساب متجه على مصفوفة المسار [t_ms, lat, lng]
+# ============================================================================
+
+def segment_metrics(track: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """المسافة (م) والمدة (ث) والسرعة (م/ث) لكل مقطع
+
+    The speed is smoothed with a 5-segment median so jittery fixes during a
+    stop are not classified as movement.
+    """
+    distances = segment_distances_m(track)
+    seconds = np.diff(track[:, 0]) / 1000.0
+    speeds = distances / np.maximum(seconds, 1.0)
+    if len(speeds) >= SPEED_MEDIAN_WINDOW:
+        half = SPEED_MEDIAN_WINDOW // 2
+        padded = np.concatenate((np.repeat(speeds[:1], half), speeds, np.repeat(speeds[-1:], half)))
+        speeds = np.median(np.lib.stride_tricks.sliding_window_view(padded, SPEED_MEDIAN_WINDOW), axis=1)
+    return distances, seconds, speeds
+
+
+def classify_movement(speeds: np.ndarray) -> np.ndarray:
+    """رمز نوع الحركة لكل مقطع: فهرس في ``MOVEMENT_TYPES``"""
+    return np.searchsorted([STATIONARY_SPEED_MS, WALKING_SPEED_MS], speeds, side="right")
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """فترات القيم الصحيحة المتتالية ``[start, end)``"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def detect_stops(track: np.ndarray, codes: np.ndarray) -> List[Dict[str, Any]]:
+    """التوقفات ومدة البقاء - runs of stationary points merged across short gaps
+
+    A point is stationary when the segment arriving at it is (the first point
+    takes its outgoing segment). Runs closer than ``STOP_RADIUS_M`` separated by
+    less than ``MAX_STOP_GAP`` are one stop; stops shorter than
+    ``MIN_STOP_DURATION`` are dropped.
+    """
+    if len(track) < 2:
+        return []
+    stationary = np.concatenate((codes[:1], codes)) == 0
+    timestamps, latitudes, longitudes = track[:, 0], track[:, 1], track[:, 2]
+
+    merged: List[List[int]] = []
+    for start, end in _runs(stationary):
+        if merged:
+            previous_start, previous_end = merged[-1]
+            gap_ms = timestamps[start] - timestamps[previous_end - 1]
+            apart = haversine_km(
+                latitudes[previous_start:previous_end].mean(), longitudes[previous_start:previous_end].mean(),
+                latitudes[start:end].mean(), longitudes[start:end].mean()
+            ) * 1000
+            if gap_ms <= MAX_STOP_GAP.total_seconds() * 1000 and apart <= STOP_RADIUS_M:
+                merged[-1][1] = end
+                continue
+        merged.append([start, end])
+
+    stops = []
+    min_duration_ms = MIN_STOP_DURATION.total_seconds() * 1000
+    for start, end in merged:
+        dwell_ms = timestamps[end - 1] - timestamps[start]
+        if dwell_ms < min_duration_ms:
+            continue
+        latitude, longitude = float(latitudes[start:end].mean()), float(longitudes[start:end].mean())
+        spread = haversine_km(latitude, longitude, latitudes[start:end], longitudes[start:end]) * 1000
+        stops.append({
+            "started_at": datetime.utcfromtimestamp(timestamps[start] / 1000),
+            "ended_at": datetime.utcfromtimestamp(timestamps[end - 1] / 1000),
+            "dwell_minutes": round(float(dwell_ms) / 60000, 1),
+            "latitude": round(latitude, 6),
+            "longitude": round(longitude, 6),
+            "radius_m": round(float(spread.max()), 1),
+            "points": end - start,
+            "nearby_clinics": [],
+        })
+    return stops
+
+
+def movement_segments(track: np.ndarray, codes: np.ndarray) -> List[List[Any]]:
+    """ترميز طولي لأنواع الحركة ``[t_start_ms, t_end_ms, type]`` لتصنيف أي نقطة لاحقاً"""
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1, [len(codes)])).tolist()
+    return [
+        [int(track[start, 0]), int(track[end, 0]), MOVEMENT_TYPES[int(codes[start])]]
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def analyze_track(track: np.ndarray) -> Dict[str, Any]:
+    """تحليل مسار يوم واحد - distance, time per movement type, stops
+
+    ``distance_km`` sums the moving segments only, so GPS jitter while parked
+    at a clinic does not add distance.
+    """
+    empty_minutes = {movement: 0.0 for movement in MOVEMENT_TYPES}
+    if len(track) < 2:
+        return {
+            "points_count": int(len(track)),
+            "started_at": datetime.utcfromtimestamp(track[0, 0] / 1000) if len(track) else None,
+            "ended_at": datetime.utcfromtimestamp(track[-1, 0] / 1000) if len(track) else None,
+            "distance_km": 0.0,
+            "movement_minutes": empty_minutes,
+            "stops": [],
+            "segments": [],
+        }
+
+    distances, seconds, speeds = segment_metrics(track)
+    codes = classify_movement(speeds)
+    minutes = np.bincount(codes, weights=seconds, minlength=len(MOVEMENT_TYPES)) / 60.0
+    segments = movement_segments(track, codes)
+    return {
+        "points_count": int(len(track)),
+        "started_at": datetime.utcfromtimestamp(track[0, 0] / 1000),
+        "ended_at": datetime.utcfromtimestamp(track[-1, 0] / 1000),
+        "distance_km": round(float(distances[codes > 0].sum()) / 1000, 3),
+        "max_speed_kmh": round(float(speeds.max()) * 3.6, 1),
+        "movement_minutes": {movement: round(float(value), 1) for movement, value in zip(MOVEMENT_TYPES, minutes)},
+        "stops": detect_stops(track, codes),
+        "segments": segments,
+    }
+
+
+def match_stops_to_clinics(stops: List[Dict[str, Any]], clinics: List[Dict[str, Any]]) -> None:
+    """إضافة أقرب العيادات لكل توقف (مصفوفة مسافات توقفات × عيادات في خطوة واحدة)"""
+    if not stops or not clinics:
+        return
+    stop_points = np.array([[stop["latitude"], stop["longitude"]] for stop in stops])
+    clinic_points = np.array([[clinic["latitude"], clinic["longitude"]] for clinic in clinics])
+    distances = haversine_km(
+        stop_points[:, None, 0], stop_points[:, None, 1], clinic_points[None, :, 0], clinic_points[None, :, 1]
+    ) * 1000
+    for stop, row in zip(stops, distances):
+        nearest = np.argsort(row)[:MAX_NEARBY_CLINICS]
+        stop["nearby_clinics"] = [
+            {"clinic_id": clinics[index]["id"], "name": clinics[index]["name"], "distance_m": round(float(row[index]), 1)}
+            for index in nearest.tolist() if row[index] <= CLINIC_MATCH_RADIUS_M
+        ]
+
+
+async def load_clinics_near_stops(db: AsyncIOMotorDatabase, stops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """العيادات داخل المستطيل المحيط بالتوقفات (استعلام واحد لكل مجموعة على فهرس 2dsphere)"""
+    if not stops:
+        return []
+    latitudes = [stop["latitude"] for stop in stops]
+    longitudes = [stop["longitude"] for stop in stops]
+    margin_lat = CLINIC_MATCH_RADIUS_M / 111_320.0
+    margin_lng = margin_lat / max(math.cos(math.radians(max(map(abs, latitudes)))), 0.01)
+    south, north = min(latitudes) - margin_lat, max(latitudes) + margin_lat
+    west, east = min(longitudes) - margin_lng, max(longitudes) + margin_lng
+    box = {"type": "Polygon", "coordinates": [[
+        [west, south], [east, south], [east, north], [west, north], [west, south]
+    ]]}
+
+    clinics: Dict[str, Dict[str, Any]] = {}
+    for collection in CLINIC_GEO_COLLECTIONS:
+        cursor = db[collection].find(
+            {**GEO_INDEX_FILTER, "location": {"$geoWithin": {"$geometry": box}}},
+            {"_id": 0, "id": 1, "name": 1, "clinic_name": 1, "location": 1}
+        )
+        async for clinic in cursor:
+            if clinic.get("id") and clinic["id"] not in clinics:
+                longitude, latitude = clinic["location"]["coordinates"]
+                clinics[clinic["id"]] = {
+                    "id": clinic["id"],
+                    "name": clinic.get("name") or clinic.get("clinic_name"),
+                    "latitude": latitude,
+                    "longitude": longitude,
+                }
+    return list(clinics.values())
+
+
+# ============================================================================
+# CACHE - التحليلات المخزنة لكل مندوب/يوم
+# ============================================================================
+
+async def get_rep_day_analytics(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    day: date,
+    refresh: bool = False
+) -> Dict[str, Any]:
+    """تحليلات يوم المندوب - computed once from the raw points, then served from the cache
+
+    ``ingest_points`` replaces the cached document with a tombstone when
+    points arrive for that day, so the next read recomputes it. The result is
+    only stored if nothing newer (tombstone or computation) is there.
+    """
+    analytics = db[GPS_ANALYTICS_COLLECTION]
+    cache_id = analytics_cache_id(user_id, day.isoformat())
+    if not refresh:
+        cached = await analytics.find_one({"_id": cache_id, "version": ANALYTICS_VERSION})
+        if cached:
+            cached.pop("_id", None)
+            cached["cached"] = True
+            return cached
+
+    computed_at = datetime.utcnow()
+    start = datetime.combine(day, datetime.min.time())
+    tracks = await load_tracks(db, [user_id], start, start + timedelta(days=1))
+    result = analyze_track(tracks.get(user_id, np.empty((0, 3))))
+    match_stops_to_clinics(result["stops"], await load_clinics_near_stops(db, result["stops"]))
+
+    document = {
+        "user_id": user_id,
+        "day": day.isoformat(),
+        "version": ANALYTICS_VERSION,
+        **result,
+        "computed_at": computed_at,
+        "expires_at": analytics_expiry(day.isoformat()),
+    }
+    # نقاط وصلت بعد بداية الحساب تركت إلغاءً أحدث منه: النتيجة لا تُخزن (مفتاح مكرر عند upsert)
+    try:
+        await analytics.replace_one(
+            {
+                "_id": cache_id,
+                "invalidated_at": {"$not": {"$gte": computed_at}},
+                "computed_at": {"$not": {"$gt": computed_at}},
+            },
+            document,
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass
+    document.pop("_id", None)
+    document["cached"] = False
+    return document
+
+
+def point_annotations(analytics: Dict[str, Any], recorded_at: datetime) -> Dict[str, Any]:
+    """نوع الحركة والتوقف لنقطة خام من تحليلات يومها"""
+    t = (recorded_at - datetime(1970, 1, 1)).total_seconds() * 1000
+    movement_type = None
+    segments = analytics.get("segments") or []
+    index = bisect.bisect_right([segment[0] for segment in segments], t) - 1
+    if index >= 0 and t <= segments[index][1]:
+        movement_type = segments[index][2]
+
+    for stop in analytics.get("stops") or []:
+        if stop["started_at"] <= recorded_at <= stop["ended_at"]:
+            return {
+                "movement_type": "stationary",
+                "duration_at_location": int(round(stop["dwell_minutes"])),
+                "nearby_clinics": stop["nearby_clinics"],
+            }
+    return {"movement_type": movement_type, "duration_at_location": None, "nearby_clinics": None}
+
+
+# ============================================================================
+# VISIT VERIFICATION - مطابقة الزيارات المسجلة بمدة البقاء الفعلية
+# ============================================================================
+
+def _visit_minutes(visit: Dict[str, Any]) -> Optional[float]:
+    if visit.get("actual_start_time") and visit.get("actual_end_time"):
+        started = datetime.fromisoformat(str(visit["actual_start_time"]).replace("Z", "+00:00"))
+        ended = datetime.fromisoformat(str(visit["actual_end_time"]).replace("Z", "+00:00"))
+        return round((ended - started).total_seconds() / 60, 1)
+    duration = visit.get("visit_duration_minutes") or visit.get("duration_minutes")
+    return float(duration) if duration else None
+
+
+async def verify_rep_visits(db: AsyncIOMotorDatabase, user_id: str, day: date) -> Dict[str, Any]:
+    """مقارنة زيارات اليوم بالتوقفات عند العيادة نفسها
+
+    Each visit gets ``gps_dwell_minutes`` (sum of stops matched to its clinic)
+    and a status: ``verified``, ``short`` (stopped there, but for less than
+    ``MIN_VERIFIED_DWELL_RATIO`` of the recorded duration), ``no_stop`` or
+    ``no_gps`` when the rep has no track that day.
+    """
+    analytics = await get_rep_day_analytics(db, user_id, day)
+    day_start = datetime.combine(day, datetime.min.time())
+    visits = await db.rep_visits.find(
+        {"$or": [
+            {"medical_rep_id": user_id, "scheduled_date": {
+                "$gte": day_start.isoformat(), "$lt": (day_start + timedelta(days=1)).isoformat()
+            }},
+            {"representative_id": user_id, "visit_date": day.isoformat()},
+        ]},
+        {"_id": 0}
+    ).to_list(length=None)
+
+    dwell_by_clinic: Dict[str, float] = {}
+    for stop in analytics["stops"]:
+        for clinic in stop["nearby_clinics"]:
+            dwell_by_clinic[clinic["clinic_id"]] = dwell_by_clinic.get(clinic["clinic_id"], 0.0) + stop["dwell_minutes"]
+
+    min_dwell = MIN_STOP_DURATION.total_seconds() / 60
+    results = []
+    for visit in visits:
+        recorded = _visit_minutes(visit)
+        dwell = round(dwell_by_clinic.get(visit.get("clinic_id"), 0.0), 1)
+        if analytics["points_count"] == 0:
+            status = "no_gps"
+        elif dwell == 0:
+            status = "no_stop"
+        elif dwell < max(min_dwell, (recorded or 0) * MIN_VERIFIED_DWELL_RATIO):
+            status = "short"
+        else:
+            status = "verified"
+        results.append({
+            "visit_id": visit.get("id"),
+            "clinic_id": visit.get("clinic_id"),
+            "clinic_name": visit.get("clinic_name"),
+            "status_recorded": visit.get("status") or visit.get("visit_status"),
+            "recorded_minutes": recorded,
+            "gps_dwell_minutes": dwell,
+            "verification": status,
+        })
+
+    return {
+        "user_id": user_id,
+        "day": day.isoformat(),
+        "distance_km": analytics["distance_km"],
+        "stops_count": len(analytics["stops"]),
+        "visits": results,
+        "summary": {
+            status: sum(1 for result in results if result["verification"] == status)
+            for status in ("verified", "short", "no_stop", "no_gps")
+        },
+    }
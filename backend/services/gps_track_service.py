@@ -0,0 +1,366 @@
+# نظام الإدارة الطبية المتكامل - مخزن مسارات GPS (سلاسل زمنية مع تبسيط المسار)
+# Medical Management System - GPS track store: time-series collection, batched ingest, downsampling
+
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import math
+import os
+
+import numpy as np
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from services.geo_service import to_geojson_point
+from services.geo_utils import EARTH_RADIUS_KM, haversine_km
+
+GPS_TRACKS_COLLECTION = "gps_tracks"
+
+# تحليلات الحركة المخزنة لكل مندوب/يوم (تُلغى عند وصول نقاط جديدة لذلك اليوم)
+GPS_ANALYTICS_COLLECTION = "gps_track_analytics"
+
+# مدة الاحتفاظ بالنقاط (تُحذف تلقائياً بعدها)
+GPS_RETENTION_DAYS = int(os.environ.get("GPS_RETENTION_DAYS", 90))
+
+# حدود الدفعة الواحدة من التطبيق: عدد النقاط، وأقدم نقطة مخزنة على الجهاز دون اتصال
+MAX_BATCH_POINTS = 2000
+MAX_POINT_AGE = timedelta(days=7)
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# أقصى مدة لاستعلام المسارات، والتسامح الافتراضي لتبسيط Douglas-Peucker بالأمتار
+MAX_TRACK_RANGE = timedelta(days=7)
+DEFAULT_TOLERANCE_M = 15.0
+
+# التجميع الافتراضي داخل قاعدة البيانات: عدد النقاط المستهدف للطلب كله، وأقل عدد لكل مسار،
+# وأطول فترة (حد المسار في الواجهة)
+TRACK_POINT_BUDGET = 5000
+MIN_POINTS_PER_TRACK = 200
+MAX_BUCKET_SECONDS = 3600
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+
+# حقول القياس الاختيارية المخزنة مع كل نقطة
+MEASUREMENT_FIELDS = ("accuracy", "speed", "heading", "altitude")
+
+
+async def ensure_gps_track_collection(db: AsyncIOMotorDatabase) -> None:
+    """إنشاء مجموعة السلاسل الزمنية (MongoDB 5.0+) مع الاحتفاظ المحدد
+
+    Points are bucketed per ``user_id`` (the metaField) by ``recorded_at``, and
+    expire after ``GPS_RETENTION_DAYS``. On servers without time-series support
+    a regular collection with the same compound index and a TTL index is used.
+    """
+    retention = GPS_RETENTION_DAYS * 86400
+    existing = await db.list_collections(filter={"name": GPS_TRACKS_COLLECTION}).to_list(length=1)
+    if not existing:
+        try:
+            await db.create_collection(
+                GPS_TRACKS_COLLECTION,
+                timeseries={"timeField": "recorded_at", "metaField": "user_id", "granularity": "seconds"},
+                expireAfterSeconds=retention
+            )
+        except CollectionInvalid:
+            pass  # أنشأها عامل آخر
+        except OperationFailure:
+            # خادم لا يدعم السلاسل الزمنية: مجموعة عادية
+            pass
+        existing = await db.list_collections(filter={"name": GPS_TRACKS_COLLECTION}).to_list(length=1)
+
+    tracks = db[GPS_TRACKS_COLLECTION]
+    if existing and existing[0].get("options", {}).get("timeseries"):
+        if existing[0]["options"].get("expireAfterSeconds") != retention:
+            await db.command("collMod", GPS_TRACKS_COLLECTION, expireAfterSeconds=retention)
+    else:
+        await tracks.create_index([("recorded_at", pymongo.ASCENDING)], expireAfterSeconds=retention)
+    await tracks.create_index([("user_id", pymongo.ASCENDING), ("recorded_at", pymongo.ASCENDING)])
+
+
+# ============================================================================
+# INGEST - إدخال دفعات النقاط
+# ============================================================================
+
+def analytics_cache_id(user_id: str, day: str) -> str:
+    return f"{user_id}:{day}"
+
+
+def analytics_expiry(day: str) -> datetime:
+    """التحليلات المخزنة تُحذف مع انتهاء احتفاظ نقاط يومها"""
+    return datetime.fromisoformat(day) + timedelta(days=GPS_RETENTION_DAYS + 1)
+
+
+def _point_document(
+    user_id: str,
+    point: Dict[str, Any],
+    received_at: datetime,
+    activity_id: Optional[str]
+) -> Optional[Dict[str, Any]]:
+    location = to_geojson_point(point.get("latitude"), point.get("longitude"))
+    recorded_at = point.get("timestamp") or received_at
+    if location is None or not isinstance(recorded_at, datetime):
+        return None
+    if recorded_at.tzinfo is not None:
+        recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if not (received_at - MAX_POINT_AGE <= recorded_at <= received_at + MAX_CLOCK_SKEW):
+        return None
+
+    document = {"user_id": user_id, "recorded_at": recorded_at, "location": location, "received_at": received_at}
+    for field in MEASUREMENT_FIELDS:
+        if point.get(field) is not None:
+            document[field] = float(point[field])
+    if activity_id:
+        document["activity_id"] = activity_id
+    return document
+
+
+async def ingest_points(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    points: Iterable[Dict[str, Any]],
+    activity_id: Optional[str] = None
+) -> Dict[str, int]:
+    """إدخال دفعة نقاط لمستخدم في عملية كتابة واحدة
+
+    Points with invalid coordinates, or timestamps older than ``MAX_POINT_AGE``
+    or ahead of the server clock, are rejected; repeated timestamps within the
+    batch are kept once. Cached movement analytics of the touched days are
+    replaced by a tombstone (``invalidated_at``), so a computation that started
+    before these points arrived cannot write its stale result back. Returns the
+    accepted/rejected/duplicate counts.
+    """
+    received_at = datetime.utcnow()
+    documents: Dict[datetime, Dict[str, Any]] = {}
+    total = rejected = 0
+    for point in points:
+        total += 1
+        document = _point_document(user_id, point, received_at, activity_id)
+        if document is None:
+            rejected += 1
+        else:
+            documents.setdefault(document["recorded_at"], document)
+
+    if documents:
+        await db[GPS_TRACKS_COLLECTION].insert_many(
+            sorted(documents.values(), key=lambda document: document["recorded_at"]), ordered=False
+        )
+        days = sorted({recorded_at.date().isoformat() for recorded_at in documents})
+        await db[GPS_ANALYTICS_COLLECTION].bulk_write([
+            pymongo.ReplaceOne(
+                {"_id": analytics_cache_id(user_id, day)},
+                {"user_id": user_id, "day": day, "invalidated_at": received_at, "expires_at": analytics_expiry(day)},
+                upsert=True
+            )
+            for day in days
+        ], ordered=False)
+    return {"accepted": len(documents), "rejected": rejected, "duplicates": total - rejected - len(documents)}
+
+
+# ============================================================================
+# DOWNSAMPLING - تبسيط المسار
+# ============================================================================
+
+def _project(track: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """إسقاط متساوي المسافات حول خط العرض المتوسط (أمتار) - accurate at city scale"""
+    latitude = np.radians(track[:, 1])
+    longitude = np.radians(track[:, 2])
+    x = longitude * math.cos(float(latitude.mean())) * EARTH_RADIUS_M
+    y = latitude * EARTH_RADIUS_M
+    return x, y
+
+
+def simplify_track(track: np.ndarray, tolerance_m: float = DEFAULT_TOLERANCE_M) -> np.ndarray:
+    """تبسيط Douglas-Peucker - keeps every point farther than ``tolerance_m`` from the simplified line
+
+    ``track`` is an ``(n, 3)`` array of ``[t_ms, lat, lng]`` ordered by time.
+    The recursion is an explicit stack and each split computes its distances
+    for the whole span in one vectorized step.
+    """
+    count = len(track)
+    if count < 3 or tolerance_m <= 0:
+        return track
+
+    x, y = _project(track)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = math.hypot(dx, dy)
+        if length == 0.0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / length
+        index = int(distances.argmax())
+        if distances[index] > tolerance_m:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return track[keep]
+
+
+def segment_distances_m(track: np.ndarray) -> np.ndarray:
+    """طول كل مقطع بين نقطتين متتاليتين بالأمتار (``n - 1`` قيمة)"""
+    return haversine_km(track[:-1, 1], track[:-1, 2], track[1:, 1], track[1:, 2]) * 1000
+
+
+def track_distance_km(track: np.ndarray) -> float:
+    """طول المسار (haversine بين النقاط المتتالية)"""
+    if len(track) < 2:
+        return 0.0
+    return float(segment_distances_m(track).sum() / 1000)
+
+
+# ============================================================================
+# QUERIES - قراءة المسارات
+# ============================================================================
+
+def _track_pipeline(
+    user_ids: Optional[List[str]],
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int
+) -> List[Dict[str, Any]]:
+    match: Dict[str, Any] = {"recorded_at": {"$gte": start, "$lt": end}}
+    if user_ids:
+        match["user_id"] = {"$in": user_ids}
+    point = {
+        "t": {"$toLong": "$recorded_at"},
+        "lat": {"$arrayElemAt": ["$location.coordinates", 1]},
+        "lng": {"$arrayElemAt": ["$location.coordinates", 0]},
+    }
+    pipeline: List[Dict[str, Any]] = [{"$match": match}, {"$sort": {"user_id": 1, "recorded_at": 1}}]
+    if bucket_seconds > 0:
+        # أول نقطة في كل فترة زمنية لكل مستخدم (يتم داخل قاعدة البيانات قبل النقل)
+        pipeline += [
+            {"$group": {
+                "_id": {
+                    "user_id": "$user_id",
+                    "bucket": {"$floor": {"$divide": [{"$toLong": "$recorded_at"}, bucket_seconds * 1000]}}
+                },
+                **{field: {"$first": expression} for field, expression in point.items()}
+            }},
+            {"$project": {"_id": 0, "user_id": "$_id.user_id", "t": 1, "lat": 1, "lng": 1}},
+            {"$sort": {"user_id": 1, "t": 1}}
+        ]
+    else:
+        pipeline.append({"$project": {"_id": 0, "user_id": 1, **point}})
+    return pipeline
+
+
+async def default_bucket_seconds(
+    db: AsyncIOMotorDatabase,
+    user_ids: Optional[List[str]],
+    start: datetime,
+    end: datetime
+) -> int:
+    """فترة التجميع الافتراضية بحيث يبقى الطلب في حدود ``TRACK_POINT_BUDGET`` نقطة
+
+    A short single-rep range stays raw (0). Full days and multi-rep or
+    company-wide views get one point per bucket inside MongoDB, sized from the
+    number of tracks in the range.
+    """
+    if user_ids is None:
+        user_count = len(await db[GPS_TRACKS_COLLECTION].distinct(
+            "user_id", {"recorded_at": {"$gte": start, "$lt": end}}
+        ))
+    else:
+        user_count = len(user_ids)
+    per_track = max(TRACK_POINT_BUDGET // max(user_count, 1), MIN_POINTS_PER_TRACK)
+    seconds = math.ceil((end - start).total_seconds() / per_track)
+    return min(seconds, MAX_BUCKET_SECONDS) if seconds > 1 else 0
+
+
+async def load_tracks(
+    db: AsyncIOMotorDatabase,
+    user_ids: Optional[List[str]],
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int = 0
+) -> Dict[str, np.ndarray]:
+    """مسار كل مستخدم كمصفوفة ``[t_ms, lat, lng]`` مرتبة زمنياً (كل المستخدمين إن لم تُحدد)"""
+    rows: Dict[str, List[Tuple[int, float, float]]] = {}
+    cursor = db[GPS_TRACKS_COLLECTION].aggregate(
+        _track_pipeline(user_ids, start, end, bucket_seconds), allowDiskUse=True, batchSize=10000
+    )
+    async for row in cursor:
+        rows.setdefault(row["user_id"], []).append((row["t"], row["lat"], row["lng"]))
+
+    tracks = {}
+    for user_id, points in rows.items():
+        track = np.asarray(points, dtype=np.float64)
+        # إعادة إرسال نفس الدفعة دون مفتاح عدم تكرار: نقطة واحدة لكل توقيت
+        unique = np.concatenate(([True], np.diff(track[:, 0]) > 0))
+        tracks[user_id] = track[unique]
+    return tracks
+
+
+def summarize_tracks(tracks: Dict[str, np.ndarray], tolerance_m: float) -> List[Dict[str, Any]]:
+    return [summarize_track(user_id, track, tolerance_m) for user_id, track in sorted(tracks.items())]
+
+
+def summarize_track(user_id: str, track: np.ndarray, tolerance_m: float) -> Dict[str, Any]:
+    simplified = simplify_track(track, tolerance_m)
+    return {
+        "user_id": user_id,
+        "raw_points": int(len(track)),
+        "points_count": int(len(simplified)),
+        # على المسار المبسط: اهتزاز GPS أثناء التوقف (أقل من التسامح) لا يُحسب مسافة
+        "distance_km": round(track_distance_km(simplified), 3),
+        "started_at": datetime.utcfromtimestamp(track[0, 0] / 1000) if len(track) else None,
+        "ended_at": datetime.utcfromtimestamp(track[-1, 0] / 1000) if len(track) else None,
+        # [وقت بالمللي ثانية، خط العرض، خط الطول]
+        "points": [[int(t), round(lat, 6), round(lng, 6)] for t, lat, lng in simplified.tolist()],
+    }
+
+
+async def get_tracks(
+    db: AsyncIOMotorDatabase,
+    user_ids: Optional[List[str]],
+    start: datetime,
+    end: datetime,
+    tolerance_m: float = DEFAULT_TOLERANCE_M,
+    bucket_seconds: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """مسارات مبسطة للعرض على الخريطة - downsampled tracks for one or many users
+
+    ``bucket_seconds`` first keeps one point per time bucket inside MongoDB
+    (less data transferred for company-wide views; ``None`` picks it with
+    ``default_bucket_seconds``, 0 reads every point); Douglas-Peucker with
+    ``tolerance_m`` then drops points that do not change the drawn line. The
+    simplification runs in the default thread pool, off the event loop.
+    """
+    if end <= start:
+        raise ValueError("نهاية الفترة يجب أن تكون بعد بدايتها")
+    if end - start > MAX_TRACK_RANGE:
+        raise ValueError(f"أقصى فترة للمسارات {MAX_TRACK_RANGE.days} أيام")
+
+    if bucket_seconds is None:
+        bucket_seconds = await default_bucket_seconds(db, user_ids, start, end)
+    tracks = await load_tracks(db, user_ids, start, end, bucket_seconds)
+    return await asyncio.get_running_loop().run_in_executor(None, summarize_tracks, tracks, tolerance_m)
+
+
+async def get_recent_points(
+    db: AsyncIOMotorDatabase,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    """أحدث النقاط الخام (الأحدث أولاً) - raw points for audit views"""
+    query: Dict[str, Any] = {}
+    if user_id:
+        query["user_id"] = user_id
+    if start or end:
+        query["recorded_at"] = {
+            **({"$gte": start} if start else {}),
+            **({"$lte": end} if end else {})
+        }
+    cursor = db[GPS_TRACKS_COLLECTION].find(query).sort("recorded_at", -1).skip(offset).limit(limit)
+    return await cursor.to_list(length=limit)
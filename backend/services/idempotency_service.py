@@ -0,0 +1,280 @@
+# نظام الإدارة الطبية المتكامل - مفاتيح عدم التكرار لطلبات الكتابة
+# Medical Management System - Idempotency-Key handling for payment, invoice and visit writes
+
+from typing import Any, Dict, List, Optional, Pattern, Sequence, Tuple
+from datetime import datetime, timedelta
+import hashlib
+import re
+
+import jwt
+import pymongo
+from bson.binary import Binary
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+
+# مدة الاحتفاظ بالاستجابة المخزنة (تُحذف بفهرس TTL)
+IDEMPOTENCY_TTL = timedelta(hours=24)
+
+# طلب قيد التنفيذ أقدم من هذا يُعتبر منقطعاً (انهيار الخادم) ويمكن لإعادة المحاولة تولّيه
+IDEMPOTENCY_LOCK = timedelta(seconds=60)
+
+MAX_KEY_LENGTH = 255
+MAX_STORED_BODY = 1024 * 1024
+
+# ترويسات الاستجابة التي تُعاد مع الاستجابة المخزنة
+STORED_HEADERS = (b"content-type", b"content-disposition", b"location")
+
+# طلبات الكتابة التي يعيد المندوب إرسالها عند انقطاع الشبكة (ودفعات نقاط GPS)
+IDEMPOTENT_ROUTES: Tuple[Tuple[str, str], ...] = (
+    ("POST", r"/api/(financial/)?debts/[^/]+/payments"),
+    ("POST", r"/api/payments/process"),
+    ("POST", r"/api/(financial/|enhanced-professional-accounting/)?invoices"),
+    ("POST", r"/api/visits/(create|check-in|complete)?"),
+    ("POST", r"/api/gps/points"),
+)
+
+
+def compile_routes(routes: Sequence[Tuple[str, str]]) -> List[Tuple[str, Pattern]]:
+    return [(method.upper(), re.compile(pattern + r"/?")) for method, pattern in routes]
+
+
+def request_fingerprint(method: str, path: str, query: bytes, body: bytes) -> str:
+    """بصمة الطلب: نفس المفتاح مع طلب مختلف خطأ من العميل وليس إعادة محاولة"""
+    digest = hashlib.sha256()
+    for part in (method.encode("latin-1"), path.encode("utf-8"), query, body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+async def ensure_idempotency_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهرس TTL لحذف المفاتيح المنتهية"""
+    await db[IDEMPOTENCY_COLLECTION].create_index([("expires_at", pymongo.ASCENDING)], expireAfterSeconds=0)
+
+
+# ============================================================================
+# STORE - سجل المفتاح: قيد التنفيذ ← مكتمل (أو يُحذف عند الفشل)
+# ============================================================================
+
+async def claim_idempotency_key(
+    db: AsyncIOMotorDatabase,
+    record_id: str,
+    fingerprint: str,
+    method: str,
+    path: str
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """حجز المفتاح قبل التنفيذ - reserve a key before running the handler
+
+    Returns ``("execute", None)`` when this request owns the key, ``("replay",
+    record)`` for a completed earlier request, ``("in_progress", record)``
+    while another attempt is still running and ``("mismatch", record)`` when
+    the key was used for a different request.
+    """
+    collection = db[IDEMPOTENCY_COLLECTION]
+    for _ in range(2):
+        now = datetime.utcnow()
+        try:
+            await collection.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "method": method,
+                "path": path,
+                "state": "processing",
+                "locked_until": now + IDEMPOTENCY_LOCK,
+                "created_at": now,
+                "expires_at": now + IDEMPOTENCY_TTL
+            })
+            return "execute", None
+        except DuplicateKeyError:
+            record = await collection.find_one({"_id": record_id})
+            if record is None:
+                continue  # حُذف بعد فشل المحاولة السابقة - أعد الحجز
+            if record["fingerprint"] != fingerprint:
+                return "mismatch", record
+            if record["state"] == "completed":
+                return "replay", record
+            # محاولة سابقة منقطعة: تولّي المفتاح إن انتهت مهلة قفلها
+            taken = await collection.find_one_and_update(
+                {"_id": record_id, "state": "processing", "locked_until": {"$lte": now}},
+                {"$set": {"locked_until": now + IDEMPOTENCY_LOCK}},
+                return_document=ReturnDocument.AFTER
+            )
+            return ("execute", None) if taken else ("in_progress", record)
+    return "in_progress", None
+
+
+async def complete_idempotency_key(
+    db: AsyncIOMotorDatabase,
+    record_id: str,
+    status_code: int,
+    headers: List[Tuple[bytes, bytes]],
+    body: bytes
+) -> None:
+    """تخزين الاستجابة لإعادتها لأي إعادة محاولة لاحقة"""
+    await db[IDEMPOTENCY_COLLECTION].update_one(
+        {"_id": record_id},
+        {"$set": {
+            "state": "completed",
+            "status_code": status_code,
+            "headers": [[key.decode("latin-1"), value.decode("latin-1")] for key, value in headers],
+            "body": Binary(body),
+            "completed_at": datetime.utcnow()
+        }, "$unset": {"locked_until": ""}}
+    )
+
+
+async def release_idempotency_key(db: AsyncIOMotorDatabase, record_id: str) -> None:
+    """فشل التنفيذ (5xx أو استثناء): حذف المفتاح حتى تُنفَّذ إعادة المحاولة فعلياً"""
+    await db[IDEMPOTENCY_COLLECTION].delete_one({"_id": record_id, "state": "processing"})
+
+
+# ============================================================================
+# MIDDLEWARE - طبقة ASGI حول مسارات الكتابة
+# ============================================================================
+
+class IdempotencyMiddleware:
+    """إعادة الاستجابة المخزنة لطلبات الكتابة المكررة - Idempotency-Key replay
+
+    Applies to the ``routes`` allow-list only, and only when the client sends an
+    ``Idempotency-Key`` header. Keys are scoped to the authenticated user (the
+    bearer token is verified here; requests without a valid token pass through
+    and are rejected by the handler). The first request runs the handler and its
+    response is stored against ``sha256(method, path, query, body)``; retries
+    with the same key get that response back with ``Idempotent-Replayed: true``
+    without running the handler again. Responses with a 5xx status or an
+    exception release the key so the retry really executes.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        db: AsyncIOMotorDatabase,
+        secret_key: str,
+        algorithm: str = "HS256",
+        routes: Sequence[Tuple[str, str]] = IDEMPOTENT_ROUTES
+    ) -> None:
+        self.app = app
+        self.db = db
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.routes = compile_routes(routes)
+
+    def applies(self, method: str, path: str) -> bool:
+        return any(method == route_method and pattern.fullmatch(path) for route_method, pattern in self.routes)
+
+    def principal(self, headers: Dict[bytes, bytes]) -> Optional[str]:
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if not authorization.lower().startswith("bearer "):
+            return None
+        try:
+            payload = jwt.decode(authorization[7:].strip(), self.secret_key, algorithms=[self.algorithm])
+        except jwt.PyJWTError:
+            return None
+        return payload.get("user_id") or payload.get("sub") or payload.get("username")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.applies(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        key = headers.get(IDEMPOTENCY_HEADER, b"").decode("latin-1").strip()
+        principal = self.principal(headers) if key else None
+        if not key or principal is None:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await JSONResponse(
+                {"detail": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"}, status_code=400
+            )(scope, receive, send)
+            return
+
+        # قراءة جسم الطلب كاملاً لحساب البصمة، ثم تمريره للمعالج كما هو
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        record_id = f"{principal}:{key}"
+        fingerprint = request_fingerprint(scope["method"], scope["path"], scope.get("query_string", b""), body)
+        outcome, record = await claim_idempotency_key(self.db, record_id, fingerprint, scope["method"], scope["path"])
+
+        if outcome == "replay":
+            await self.replay(record, send)
+            return
+        if outcome == "mismatch":
+            await JSONResponse(
+                {"detail": "Idempotency-Key was already used for a different request"}, status_code=422
+            )(scope, receive, send)
+            return
+        if outcome == "in_progress":
+            await JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still being processed"},
+                status_code=409, headers={"Retry-After": "1"}
+            )(scope, receive, send)
+            return
+
+        await self.execute(scope, body, receive, send, record_id)
+
+    async def execute(self, scope: Scope, body: bytes, receive: Receive, send: Send, record_id: str) -> None:
+        body_sent = False
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # بعد تسليم الجسم المخزن: انتظار قطع الاتصال الحقيقي من الخادم
+            return await receive()
+
+        status_code = 500
+        response_headers: List[Tuple[bytes, bytes]] = []
+        response_body: List[bytes] = []
+        stored_size = 0
+        completed = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_headers, stored_size, completed
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = [
+                    (name, value) for name, value in message.get("headers", []) if name.lower() in STORED_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                stored_size += len(chunk)
+                if stored_size <= MAX_STORED_BODY:
+                    response_body.append(chunk)
+                completed = not message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, send_wrapper)
+        except Exception:
+            await release_idempotency_key(self.db, record_id)
+            raise
+
+        if completed and status_code < 500 and stored_size <= MAX_STORED_BODY:
+            await complete_idempotency_key(self.db, record_id, status_code, response_headers, b"".join(response_body))
+        else:
+            await release_idempotency_key(self.db, record_id)
+
+    async def replay(self, record: Dict[str, Any], send: Send) -> None:
+        body = bytes(record.get("body") or b"")
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record.get("headers", [])]
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        headers.append((REPLAYED_HEADER, b"true"))
+        await send({"type": "http.response.start", "status": record["status_code"], "headers": headers})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
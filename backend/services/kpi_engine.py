@@ -0,0 +1,318 @@
+# نظام الإدارة الطبية المتكامل - محرك مؤشرات الأداء المالية (pandas/NumPy)
+# Medical Management System - Vectorized financial KPI engine for period reports
+
+from typing import List, Dict, Any, Optional
+from datetime import datetime, date
+import numpy as np
+import pandas as pd
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.money_codec import money_expression
+from services.debt_statistics_service import SETTLED_STATUSES
+
+MS_PER_DAY = 86_400_000
+EPOCH = date(1970, 1, 1)
+
+# تسامح التقريب عند اعتبار المبلغ مسدداً
+SETTLED_TOLERANCE = 0.005
+
+PERCENTILES = (50, 75, 90, 95)
+
+KPI_COLUMNS = [
+    "amount", "paid", "outstanding", "issue_ms", "due_ms", "settled_ms",
+    "record_type", "is_receivable", "status", "clinic_id", "clinic_name", "rep_id", "rep_name",
+]
+
+
+def _double(expression: Any) -> Dict[str, Any]:
+    return {"$convert": {"input": expression, "to": "double", "onError": 0.0, "onNull": 0.0}}
+
+
+def _epoch_ms(expression: Any) -> Dict[str, Any]:
+    """تاريخ (date أو نص ISO) → ميلي ثانية منذ 1970، أو null"""
+    return {"$toLong": {"$convert": {"input": expression, "to": "date", "onError": None, "onNull": None}}}
+
+
+def _first_money(*fields: str, default: Any = None) -> Dict[str, Any]:
+    """أول حقل مبلغ موجود بأي من الشكلين (MoneyAmount أو مسطح)"""
+    expression = default
+    for field in reversed(fields):
+        expression = {"$ifNull": [money_expression(field), expression]}
+    return expression
+
+
+# مبالغ الدين بشكليه على الخادم - نفس قراءة debt_amounts في عدادات الديون:
+# الأصلي ← original/total/amount، المتبقي ← outstanding/remaining (صفر للمسدد)، المحصل ← paid أو الفرق
+_DEBT_ORIGINAL = _first_money("original_amount", "total_amount", "amount", default=0)
+_DEBT_OUTSTANDING = {"$let": {
+    "vars": {"original": _DEBT_ORIGINAL},
+    "in": _first_money("outstanding_amount", "remaining_amount", default={
+        "$cond": [{"$in": ["$status", list(SETTLED_STATUSES)]}, 0, "$$original"]
+    }),
+}}
+_DEBT_PAID = {"$let": {
+    "vars": {"original": _DEBT_ORIGINAL, "outstanding": _DEBT_OUTSTANDING},
+    "in": _first_money("paid_amount", default={
+        "$max": [{"$subtract": ["$$original", "$$outstanding"]}, 0]
+    }),
+}}
+
+
+# مصادر البيانات: كل مصدر يُسقط إلى نفس الأعمدة في استعلام واحد
+KPI_SOURCES: Dict[str, Dict[str, Any]] = {
+    # النظام المالي الموحد: فواتير/ديون (مستحقات) ودفعات/تحصيلات في مجموعة واحدة، التواريخ نصوص ISO
+    "unified": {
+        "collection": "unified_financial_records",
+        "period_field": "issue_date",
+        "period_as_iso": True,
+        "collected_from": "collection_rows",
+        "project": {
+            "amount": _double("$net_amount"),
+            "paid": _double("$paid_amount"),
+            "outstanding": _double("$outstanding_amount"),
+            "issue_ms": _epoch_ms("$issue_date"),
+            "due_ms": _epoch_ms("$due_date"),
+            "settled_ms": _epoch_ms("$completion_date"),
+            "record_type": 1,
+            "is_receivable": {"$in": ["$record_type", ["invoice", "debt"]]},
+            "status": 1,
+            "clinic_id": 1,
+            "clinic_name": 1,
+            "rep_id": "$sales_rep_id",
+            "rep_name": "$sales_rep_name",
+        },
+    },
+    # مجموعة الديون: مبالغ MoneyAmount أو مسطحة (remaining_amount ...) تُوحَّد في الإسقاط،
+    # وتاريخ السداد الكامل settlement_date
+    "integrated": {
+        "collection": "debts",
+        "period_field": "created_at",
+        "period_as_iso": False,
+        "collected_from": "paid",
+        "project": {
+            "amount": _double(_DEBT_ORIGINAL),
+            "paid": _double(_DEBT_PAID),
+            "outstanding": _double(_DEBT_OUTSTANDING),
+            "issue_ms": _epoch_ms("$created_at"),
+            "due_ms": _epoch_ms("$due_date"),
+            "settled_ms": _epoch_ms("$settlement_date"),
+            "record_type": {"$literal": "debt"},
+            "is_receivable": {"$literal": True},
+            "status": 1,
+            "clinic_id": 1,
+            "clinic_name": 1,
+            "rep_id": "$sales_rep_id",
+            "rep_name": "$sales_rep_name",
+        },
+    },
+}
+
+
+def period_match(
+    source: str,
+    start_date: date,
+    end_date: date,
+    clinic_ids: Optional[List[str]] = None,
+    rep_ids: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """فلتر الفترة والعيادات والمناديب لمصدر معين"""
+    config = KPI_SOURCES[source]
+    if config["period_as_iso"]:
+        period = {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}
+    else:
+        period = {
+            "$gte": datetime.combine(start_date, datetime.min.time()),
+            "$lte": datetime.combine(end_date, datetime.max.time()),
+        }
+    match: Dict[str, Any] = {config["period_field"]: period}
+    if clinic_ids:
+        match["clinic_id"] = {"$in": clinic_ids}
+    if rep_ids:
+        match["sales_rep_id"] = {"$in": rep_ids}
+    return match
+
+
+async def load_kpi_frame(
+    db: AsyncIOMotorDatabase,
+    source: str,
+    match: Dict[str, Any]
+) -> pd.DataFrame:
+    """سحب إسقاط عمودي بمؤشر واحد - one cursor, numeric columns typed on the server"""
+    config = KPI_SOURCES[source]
+    cursor = db[config["collection"]].aggregate(
+        [{"$match": match}, {"$project": {"_id": 0, **config["project"]}}],
+        batchSize=10_000
+    )
+    return kpi_frame_from_rows(await cursor.to_list(length=None))
+
+
+def kpi_frame_from_rows(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """بناء إطار الأعمدة من صفوف الإسقاط"""
+    frame = pd.DataFrame.from_records(rows, columns=KPI_COLUMNS)
+    for column in ("amount", "paid", "outstanding"):
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").fillna(0.0).astype(np.float64)
+    for column in ("issue_ms", "due_ms", "settled_ms"):
+        # null → NaN، والأيام منذ 1970 كأعداد عشرية
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(np.float64) / MS_PER_DAY
+    frame = frame.rename(columns={"issue_ms": "issue_day", "due_ms": "due_day", "settled_ms": "settled_day"})
+    frame["is_receivable"] = frame["is_receivable"].fillna(False).astype(bool)
+    for column in ("record_type", "status", "clinic_id", "clinic_name", "rep_id", "rep_name"):
+        frame[column] = frame[column].astype("category")
+    return frame
+
+
+def _percentiles(values: np.ndarray) -> Dict[str, Optional[float]]:
+    if values.size == 0:
+        return {f"p{p}": None for p in PERCENTILES}
+    points = np.percentile(values, PERCENTILES)
+    return {f"p{p}": round(float(value), 2) for p, value in zip(PERCENTILES, points)}
+
+
+def _rate(numerator: float, denominator: float) -> float:
+    return round(numerator / denominator * 100, 2) if denominator > 0 else 0.0
+
+
+def _derive_columns(frame: pd.DataFrame, as_of: date, collected_from: str) -> pd.DataFrame:
+    """أعمدة مشتقة متجهة: تحصيل، متأخر، أيام التحصيل والتأخير"""
+    as_of_day = float((as_of - EPOCH).days)
+    receivable = frame["is_receivable"].to_numpy()
+    amount = frame["amount"].to_numpy()
+    outstanding = frame["outstanding"].to_numpy()
+    due_day = frame["due_day"].to_numpy()
+
+    is_open = receivable & (outstanding > SETTLED_TOLERANCE)
+    with np.errstate(invalid="ignore"):
+        is_overdue = is_open & ((due_day < as_of_day) | (frame["status"].to_numpy() == "overdue"))
+        collection_days = frame["settled_day"].to_numpy() - frame["issue_day"].to_numpy()
+    collection_days = np.where(receivable & (collection_days >= 0), collection_days, np.nan)
+
+    if collected_from == "collection_rows":
+        collected = np.where(receivable, 0.0, amount)
+    else:
+        collected = np.where(receivable, frame["paid"].to_numpy(), 0.0)
+
+    return frame.assign(
+        invoiced=np.where(receivable, amount, 0.0),
+        collected=collected,
+        open_outstanding=np.where(is_open, outstanding, 0.0),
+        overdue_amount=np.where(is_overdue, outstanding, 0.0),
+        is_open=is_open,
+        is_overdue=is_overdue,
+        collection_days=collection_days,
+        days_overdue=np.where(is_overdue, as_of_day - due_day, np.nan),
+    )
+
+
+def _breakdown(derived: pd.DataFrame, key: str, name: str, limit: Optional[int]) -> List[Dict[str, Any]]:
+    """تجميع حسب العيادة/المندوب مرتباً بالمستحق (limit=None للكل، 0 بدون تفصيل)"""
+    if derived.empty or limit == 0:
+        return []
+    grouped = derived.groupby(key, observed=True, sort=False).agg(
+        name=(name, "first"),
+        records=("amount", "size"),
+        invoiced=("invoiced", "sum"),
+        collected=("collected", "sum"),
+        outstanding=("open_outstanding", "sum"),
+        overdue_amount=("overdue_amount", "sum"),
+        open_count=("is_open", "sum"),
+        overdue_count=("is_overdue", "sum"),
+        average_collection_days=("collection_days", "mean"),
+    )
+    invoiced = grouped["invoiced"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        grouped["collection_rate"] = np.where(invoiced > 0, grouped["collected"].to_numpy() / invoiced * 100, 0.0)
+    grouped = grouped.sort_values("outstanding", ascending=False) if limit is None else grouped.nlargest(limit, "outstanding")
+
+    money = ["invoiced", "collected", "outstanding", "overdue_amount", "collection_rate", "average_collection_days"]
+    grouped[money] = grouped[money].round(2)
+    grouped = grouped.astype({"open_count": int, "overdue_count": int, "records": int})
+    grouped = grouped.astype(object).where(pd.notna(grouped), None)
+    return [{"id": index, **row} for index, row in zip(grouped.index.astype(str), grouped.to_dict("records"))]
+
+
+def _by_type(derived: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """عدد ومجموع كل نوع سجل"""
+    if derived.empty:
+        return {}
+    grouped = derived.groupby("record_type", observed=True).agg(
+        count=("amount", "size"), total_amount=("amount", "sum"), outstanding_amount=("outstanding", "sum")
+    )
+    return {
+        str(record_type): {
+            "count": int(row["count"]),
+            "total_amount": round(float(row["total_amount"]), 2),
+            "outstanding_amount": round(float(row["outstanding_amount"]), 2),
+        }
+        for record_type, row in grouped.to_dict("index").items()
+    }
+
+
+def compute_period_kpis(
+    frame: pd.DataFrame,
+    as_of: Optional[date] = None,
+    collected_from: str = "paid",
+    breakdown_limit: Optional[int] = 20
+) -> Dict[str, Any]:
+    """كل مؤشرات الفترة وتفصيلها لكل مندوب وعيادة - fully vectorized"""
+    as_of = as_of or date.today()
+    derived = _derive_columns(frame, as_of, collected_from)
+
+    invoiced = float(derived["invoiced"].sum())
+    collected = float(derived["collected"].sum())
+    outstanding = float(derived["open_outstanding"].sum())
+    overdue_amount = float(derived["overdue_amount"].sum())
+    open_count = int(derived["is_open"].sum())
+    overdue_count = int(derived["is_overdue"].sum())
+
+    collection_days = derived["collection_days"].to_numpy()
+    collection_days = collection_days[~np.isnan(collection_days)]
+    days_overdue = derived["days_overdue"].to_numpy()
+    days_overdue = days_overdue[~np.isnan(days_overdue)]
+    receivable_amounts = derived["amount"].to_numpy()[derived["is_receivable"].to_numpy()]
+
+    return {
+        "as_of": as_of.isoformat(),
+        "records": int(len(derived)),
+        "totals": {
+            "invoiced": round(invoiced, 2),
+            "collected": round(collected, 2),
+            "outstanding": round(outstanding, 2),
+            "overdue_amount": round(overdue_amount, 2),
+            "open_count": open_count,
+            "overdue_count": overdue_count,
+        },
+        "kpis": {
+            "collection_rate": _rate(collected, invoiced),
+            "outstanding_ratio": _rate(outstanding, invoiced),
+            "overdue_rate": _rate(overdue_count, open_count),
+            "overdue_amount_rate": _rate(overdue_amount, outstanding),
+            "overdue_percentage": _rate(overdue_amount, invoiced),
+            "average_collection_days": round(float(collection_days.mean()), 2) if collection_days.size else None,
+            "settled_count": int(collection_days.size),
+        },
+        "percentiles": {
+            "collection_days": _percentiles(collection_days),
+            "days_overdue": _percentiles(days_overdue),
+            "receivable_amount": _percentiles(receivable_amounts),
+        },
+        "by_type": _by_type(derived),
+        "by_rep": _breakdown(derived, "rep_id", "rep_name", breakdown_limit),
+        "by_clinic": _breakdown(derived, "clinic_id", "clinic_name", breakdown_limit),
+    }
+
+
+async def get_period_kpis(
+    db: AsyncIOMotorDatabase,
+    source: str,
+    start_date: date,
+    end_date: date,
+    clinic_ids: Optional[List[str]] = None,
+    rep_ids: Optional[List[str]] = None,
+    as_of: Optional[date] = None,
+    breakdown_limit: Optional[int] = 20
+) -> Dict[str, Any]:
+    """مؤشرات الفترة لمصدر معين (unified/integrated)"""
+    frame = await load_kpi_frame(db, source, period_match(source, start_date, end_date, clinic_ids, rep_ids))
+    return compute_period_kpis(
+        frame, as_of=as_of, collected_from=KPI_SOURCES[source]["collected_from"], breakdown_limit=breakdown_limit
+    )
@@ -0,0 +1,186 @@
+# نظام الإدارة الطبية المتكامل - تحليلات تسجيل الدخول: عدادات بالساعة لكل مستخدم
+# Medical Management System - Login analytics: per-user hourly buckets for attendance, sessions and geography
+
+from typing import List, Dict, Any, Optional
+from datetime import datetime, date, timedelta
+
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.activity_store import HOUR_KEY_FORMAT, hour_bucket, stat_key
+
+LOGIN_HOURLY_COLLECTION = "login_stats_hourly"
+
+# أقصى مدى لتقارير التحليلات (بالأيام)
+LOGIN_ANALYTICS_MAX_DAYS = 366
+
+
+def parse_login_time(value: Any) -> Optional[datetime]:
+    """login_time كـ datetime بتوقيت UTC بدون منطقة (السجلات القديمة نص ISO)"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value - value.utcoffset()
+        return value.replace(tzinfo=None)
+    if isinstance(value, str) and value:
+        try:
+            return parse_login_time(datetime.fromisoformat(value.replace("Z", "+00:00")))
+        except ValueError:
+            return None
+    return None
+
+
+def login_bucket_id(user_id: str, hour: datetime) -> str:
+    return f"{user_id}|{hour.strftime(HOUR_KEY_FORMAT)}"
+
+
+def login_hour_operations(login_logs: List[Dict[str, Any]]) -> List[pymongo.UpdateOne]:
+    """تحديث واحد لكل (مستخدم، ساعة) في الدفعة: العدد وأول/آخر دخول والمدن والدول"""
+    buckets: Dict[str, Dict[str, Any]] = {}
+    for log in login_logs:
+        login_time = parse_login_time(log.get("login_time"))
+        if not log.get("user_id") or login_time is None:
+            continue
+        hour = hour_bucket(login_time)
+        bucket = buckets.setdefault(login_bucket_id(log["user_id"], hour), {
+            "log": log, "hour": hour, "first": login_time, "last": login_time, "inc": {"count": 0},
+        })
+        bucket["first"] = min(bucket["first"], login_time)
+        bucket["last"] = max(bucket["last"], login_time)
+        for field in ("count",
+                      f"cities.{stat_key(log.get('city') or 'Unknown')}",
+                      f"countries.{stat_key(log.get('country') or 'Unknown')}"):
+            bucket["inc"][field] = bucket["inc"].get(field, 0) + 1
+
+    return [
+        pymongo.UpdateOne(
+            {"_id": bucket_id},
+            {
+                "$inc": bucket["inc"],
+                "$min": {"first_login": bucket["first"]},
+                "$max": {"last_login": bucket["last"]},
+                "$setOnInsert": {
+                    "user_id": bucket["log"]["user_id"], "username": bucket["log"].get("username"),
+                    "full_name": bucket["log"].get("full_name"), "role": bucket["log"].get("role"),
+                    "hour": bucket["hour"],
+                },
+            },
+            upsert=True
+        )
+        for bucket_id, bucket in buckets.items()
+    ]
+
+
+async def ensure_login_analytics_indexes(db: AsyncIOMotorDatabase) -> None:
+    await db.login_logs.create_index([("user_id", pymongo.ASCENDING), ("login_time", pymongo.DESCENDING)])
+    await db.login_logs.create_index([("login_time", pymongo.DESCENDING)])
+
+    hourly = db[LOGIN_HOURLY_COLLECTION]
+    await hourly.create_index([("hour", pymongo.ASCENDING), ("user_id", pymongo.ASCENDING)])
+    await hourly.create_index([("user_id", pymongo.ASCENDING), ("hour", pymongo.ASCENDING)])
+
+
+# ============================================================================
+# READ - الحضور اليومي والجلسات والتوزيع الجغرافي
+# ============================================================================
+
+def utc_offset(hours: int) -> str:
+    return f"{'+' if hours >= 0 else '-'}{abs(hours):02d}:00"
+
+
+def _bucket_match(start: date, end: date, utc_offset_hours: int, user_id: Optional[str]) -> Dict[str, Any]:
+    """الأيام المحلية [start, end] كمدى ساعات UTC (الإزاحة بساعات كاملة تطابق حدود العدادات)"""
+    shift = timedelta(hours=utc_offset_hours)
+    match: Dict[str, Any] = {"hour": {
+        "$gte": datetime.combine(start, datetime.min.time()) - shift,
+        "$lt": datetime.combine(end + timedelta(days=1), datetime.min.time()) - shift,
+    }}
+    if user_id:
+        match["user_id"] = user_id
+    return match
+
+
+def _local_day(utc_offset_hours: int) -> Dict[str, Any]:
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": "$hour", "timezone": utc_offset(utc_offset_hours)}}
+
+
+async def get_daily_attendance(
+    db: AsyncIOMotorDatabase,
+    start: date,
+    end: date,
+    user_id: Optional[str] = None,
+    utc_offset_hours: int = 0
+) -> List[Dict[str, Any]]:
+    """أول وآخر دخول لكل مستخدم في كل يوم (من العدادات بالساعة)"""
+    pipeline = [
+        {"$match": _bucket_match(start, end, utc_offset_hours, user_id)},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": _local_day(utc_offset_hours)},
+            "username": {"$first": "$username"},
+            "full_name": {"$first": "$full_name"},
+            "role": {"$first": "$role"},
+            "first_login": {"$min": "$first_login"},
+            "last_login": {"$max": "$last_login"},
+            "logins": {"$sum": "$count"},
+        }},
+        {"$sort": {"_id.day": 1, "first_login": 1}},
+    ]
+    return [
+        {
+            "date": row["_id"]["day"], "user_id": row["_id"]["user_id"], "username": row.get("username"),
+            "full_name": row.get("full_name"), "role": row.get("role"),
+            "first_login": row["first_login"], "last_login": row["last_login"], "logins": row["logins"],
+        }
+        async for row in db[LOGIN_HOURLY_COLLECTION].aggregate(pipeline)
+    ]
+
+
+async def get_sessions_per_day(
+    db: AsyncIOMotorDatabase,
+    start: date,
+    end: date,
+    user_id: Optional[str] = None,
+    utc_offset_hours: int = 0
+) -> List[Dict[str, Any]]:
+    """عدد الجلسات (عمليات الدخول) والمستخدمين المختلفين لكل يوم"""
+    pipeline = [
+        {"$match": _bucket_match(start, end, utc_offset_hours, user_id)},
+        {"$group": {
+            "_id": _local_day(utc_offset_hours),
+            "sessions": {"$sum": "$count"},
+            "users": {"$addToSet": "$user_id"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    return [
+        {"date": row["_id"], "sessions": row["sessions"], "active_users": len(row["users"])}
+        async for row in db[LOGIN_HOURLY_COLLECTION].aggregate(pipeline)
+    ]
+
+
+def _distribution(field: str) -> List[Dict[str, Any]]:
+    return [
+        {"$project": {"entry": {"$objectToArray": {"$ifNull": [f"${field}", {}]}}}},
+        {"$unwind": "$entry"},
+        {"$group": {"_id": "$entry.k", "count": {"$sum": "$entry.v"}}},
+        {"$sort": {"count": -1}},
+    ]
+
+
+async def get_login_geography(
+    db: AsyncIOMotorDatabase,
+    start: date,
+    end: date,
+    user_id: Optional[str] = None,
+    utc_offset_hours: int = 0
+) -> Dict[str, Any]:
+    """توزيع عمليات الدخول حسب المدينة والدولة"""
+    pipeline = [
+        {"$match": _bucket_match(start, end, utc_offset_hours, user_id)},
+        {"$facet": {"cities": _distribution("cities"), "countries": _distribution("countries")}},
+    ]
+    result = await db[LOGIN_HOURLY_COLLECTION].aggregate(pipeline).to_list(length=1)
+    facets = result[0] if result else {"cities": [], "countries": []}
+    return {
+        "cities": [{"city": row["_id"], "count": row["count"]} for row in facets["cities"]],
+        "countries": [{"country": row["_id"], "count": row["count"]} for row in facets["countries"]],
+    }
@@ -0,0 +1,303 @@
+# نظام الإدارة الطبية المتكامل - تدقيق تسجيل الدخول: طابور في الذاكرة + كاتب دفعات في الخلفية + عدادات
+# Medical Management System - Login audit pipeline: in-process queue, batched background writer, login counters
+
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+import asyncio
+import logging
+import os
+import uuid
+
+import pymongo
+from pymongo.errors import BulkWriteError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from services.activity_store import record_activities, DUPLICATE_KEY
+from services.login_analytics_service import LOGIN_HOURLY_COLLECTION, login_hour_operations
+
+LOGIN_LOGS_COLLECTION = "login_logs"
+LOGIN_STATS_COLLECTION = "login_stats"
+LOGIN_TOTAL_KEY = "total"
+
+# حجم الدفعة وأقصى انتظار قبل كتابتها، وسعة الطابور (عند الامتلاء تُكتب الأحداث مباشرة)
+LOGIN_AUDIT_BATCH_SIZE = 200
+LOGIN_AUDIT_FLUSH_SECONDS = float(os.environ.get("LOGIN_AUDIT_FLUSH_SECONDS", 1))
+LOGIN_AUDIT_QUEUE_SIZE = 10000
+
+# إعادة محاولة دفعة فشلت كتابتها: عدد المحاولات والانتظار الأول (يتضاعف بعد كل فشل)
+LOGIN_AUDIT_RETRY_ATTEMPTS = 5
+LOGIN_AUDIT_RETRY_SECONDS = 0.5
+
+# الكتابات التابعة لإدراج سجلات الدخول (تُعاد كل منها وحدها عند فشلها)
+LOGIN_FOLLOW_UP_WRITES = ("counters", "activities", "hourly")
+
+logger = logging.getLogger(__name__)
+
+
+def login_user_key(username: str) -> str:
+    return f"user:{username}"
+
+
+def build_login_event(
+    user_info: Dict[str, Any],
+    geolocation: Optional[Dict[str, Any]] = None,
+    device_info: Optional[str] = None,
+    ip_address: Optional[str] = None
+) -> Dict[str, Any]:
+    """سجل الدخول ونشاط الدخول المقابل (نفس الحقول التي كان يكتبها مسار الدخول)"""
+    now = datetime.utcnow()
+    login_id = str(uuid.uuid4())
+    login_log = {
+        # _id = id: إعادة كتابة الدفعة لا تكرر السجل
+        "_id": login_id,
+        "id": login_id,
+        "user_id": user_info["id"],
+        "username": user_info["username"],
+        "full_name": user_info["full_name"],
+        "role": user_info["role"],
+        "login_time": now,
+        "device_info": device_info or "Unknown Device",
+        "ip_address": ip_address or "Unknown IP",
+        "geolocation": geolocation or {},
+        "session_id": str(uuid.uuid4()),
+        "login_method": "web_portal",
+        "is_active_session": True
+    }
+
+    # إضافة معلومات الموقع إذا كانت متوفرة
+    if geolocation:
+        login_log.update({
+            "latitude": geolocation.get("latitude"),
+            "longitude": geolocation.get("longitude"),
+            "location_accuracy": geolocation.get("accuracy"),
+            "location_timestamp": geolocation.get("timestamp"),
+            "city": geolocation.get("city", "Unknown"),
+            "country": geolocation.get("country", "Unknown"),
+            "address": geolocation.get("address", "")
+        })
+
+    activity = {
+        "_id": str(uuid.uuid4()),
+        "activity_type": "login",
+        "description": f"تسجيل دخول للنظام - {user_info['role']}",
+        "user_id": user_info["id"],
+        "user_name": user_info["full_name"] or user_info["username"],
+        "user_role": user_info["role"],
+        "ip_address": ip_address or "Unknown IP",
+        "location": f"{geolocation.get('city', 'Unknown')}, {geolocation.get('country', 'Unknown')}" if geolocation else "Unknown Location",
+        "device_info": device_info or "Unknown Device",
+        "details": f"جلسة جديدة: {login_log['session_id'][:8]}...",
+        "geolocation": geolocation,
+        "timestamp": now.isoformat(),
+        "created_at": now.isoformat(),
+        "recorded_at": now
+    }
+    return {"login_log": login_log, "activity": activity}
+
+
+async def insert_login_logs(db: AsyncIOMotorDatabase, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """insert_many لسجلات الدخول؛ يعيد الأحداث التي أُدرج سجلها الآن فقط
+
+    A log already present (a retried batch) is skipped, so its login is never
+    counted twice by the follow-up writes.
+    """
+    if not events:
+        return []
+    try:
+        await db[LOGIN_LOGS_COLLECTION].insert_many([event["login_log"] for event in events], ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY for error in errors):
+            raise
+        written = {error["index"] for error in errors}
+        events = [event for index, event in enumerate(events) if index not in written]
+    return events
+
+
+def _login_stats_operations(login_logs: List[Dict[str, Any]]) -> List[pymongo.UpdateOne]:
+    per_user: Dict[str, Dict[str, Any]] = {}
+    for log in login_logs:
+        counter = per_user.setdefault(log["username"], {"count": 0, "last_login": log["login_time"]})
+        counter["count"] += 1
+        counter["last_login"] = max(counter["last_login"], log["login_time"])
+
+    return [
+        pymongo.UpdateOne({"_id": LOGIN_TOTAL_KEY}, {"$inc": {"count": len(login_logs)}}, upsert=True)
+    ] + [
+        pymongo.UpdateOne(
+            {"_id": login_user_key(username)},
+            {"$inc": {"count": counter["count"]}, "$max": {"last_login": counter["last_login"]},
+             "$setOnInsert": {"username": username}},
+            upsert=True
+        )
+        for username, counter in per_user.items()
+    ]
+
+
+async def write_login_follow_ups(
+    db: AsyncIOMotorDatabase,
+    events: List[Dict[str, Any]],
+    pending: Tuple[str, ...] = LOGIN_FOLLOW_UP_WRITES
+) -> Dict[str, Exception]:
+    """كتابات ما بعد إدراج السجلات: العدادات، الأنشطة، وعدادات الساعات
+
+    Runs the ``pending`` writes concurrently and returns the ones that failed
+    with their errors, so a retry repeats only those (none of them is safe to
+    apply twice).
+    """
+    if not events:
+        return {}
+    login_logs = [event["login_log"] for event in events]
+    writes = {
+        "counters": lambda: db[LOGIN_STATS_COLLECTION].bulk_write(_login_stats_operations(login_logs), ordered=False),
+        "activities": lambda: record_activities(db, [event["activity"] for event in events]),
+        "hourly": lambda: db[LOGIN_HOURLY_COLLECTION].bulk_write(login_hour_operations(login_logs), ordered=False),
+    }
+    if not login_hour_operations(login_logs):
+        pending = tuple(name for name in pending if name != "hourly")
+    results = await asyncio.gather(*(writes[name]() for name in pending), return_exceptions=True)
+    return {name: result for name, result in zip(pending, results) if isinstance(result, Exception)}
+
+
+async def write_login_events(db: AsyncIOMotorDatabase, events: List[Dict[str, Any]]) -> None:
+    """كتابة دفعة: insert_many لسجلات الدخول، دفعة الأنشطة، و$inc واحد لكل مستخدم ولكل (مستخدم، ساعة)
+
+    Only events whose login log is newly inserted are counted. Raises the
+    first follow-up error after all of them ran; the background writer instead
+    retries the failed follow-ups alone (``LoginAuditPipeline``).
+    """
+    failed = await write_login_follow_ups(db, await insert_login_logs(db, events))
+    if failed:
+        raise next(iter(failed.values()))
+
+
+async def get_login_counts(db: AsyncIOMotorDatabase, username: Optional[str] = None) -> Dict[str, Any]:
+    """إحصائيات الدخول من العدادات (بدون count_documents على login_logs)"""
+    keys = [LOGIN_TOTAL_KEY] + ([login_user_key(username)] if username else [])
+    counters = {
+        counter["_id"]: counter
+        async for counter in db[LOGIN_STATS_COLLECTION].find({"_id": {"$in": keys}})
+    }
+    stats: Dict[str, Any] = {"total_logins": counters.get(LOGIN_TOTAL_KEY, {}).get("count", 0)}
+    if username:
+        user_counter = counters.get(login_user_key(username), {})
+        stats.update({
+            "username": username,
+            "user_logins": user_counter.get("count", 0),
+            "last_login": user_counter.get("last_login"),
+        })
+    return stats
+
+
+# ============================================================================
+# PIPELINE - الطابور وكاتب الخلفية
+# ============================================================================
+
+class LoginAuditPipeline:
+    """تسجيل أحداث الدخول خارج مسار الاستجابة
+
+    ``submit`` only builds the event and puts it on an in-process queue; the
+    background writer drains it in batches of up to ``batch_size`` or every
+    ``flush_seconds``, so a burst of logins costs a few bulk writes instead of
+    several round trips per login. ``stop`` flushes what is still queued.
+    A batch whose write fails is retried up to ``LOGIN_AUDIT_RETRY_ATTEMPTS``
+    times with doubling waits before it is dropped; once its login logs are
+    inserted, only the follow-up writes that failed are retried. Events queued
+    when the process is killed are lost - the login itself has already
+    succeeded, this is audit data.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        batch_size: int = LOGIN_AUDIT_BATCH_SIZE,
+        flush_seconds: float = LOGIN_AUDIT_FLUSH_SECONDS,
+        max_queue: int = LOGIN_AUDIT_QUEUE_SIZE
+    ) -> None:
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def submit(
+        self,
+        user_info: Dict[str, Any],
+        geolocation: Optional[Dict[str, Any]] = None,
+        device_info: Optional[str] = None,
+        ip_address: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """إضافة حدث دخول للطابور (كتابة مباشرة إذا لم يعمل الكاتب أو امتلأ الطابور)"""
+        event = build_login_event(user_info, geolocation, device_info, ip_address)
+        if self.running:
+            try:
+                self._queue.put_nowait(event)
+                return event
+            except asyncio.QueueFull:
+                pass
+        # فشل التسجيل لا يُفشل الدخول
+        try:
+            await write_login_events(self.db, [event])
+        except Exception as e:
+            logger.error(f"Error writing login audit event for {user_info.get('username')}: {e}")
+        return event
+
+    async def _next_batch(self) -> List[Optional[Dict[str, Any]]]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_seconds
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write_with_retry(self, events: List[Dict[str, Any]]) -> None:
+        # بعد نجاح إدراج السجلات تُعاد الكتابات التابعة التي فشلت فقط (العدادات ليست قابلة للتكرار)
+        delay = LOGIN_AUDIT_RETRY_SECONDS
+        inserted: Optional[List[Dict[str, Any]]] = None
+        pending = LOGIN_FOLLOW_UP_WRITES
+        for attempt in range(1, LOGIN_AUDIT_RETRY_ATTEMPTS + 1):
+            try:
+                if inserted is None:
+                    inserted = await insert_login_logs(self.db, events)
+                failed = await write_login_follow_ups(self.db, inserted, pending)
+                if not failed:
+                    return
+                pending = tuple(failed)
+                error: Exception = next(iter(failed.values()))
+            except Exception as e:
+                error = e
+            if attempt == LOGIN_AUDIT_RETRY_ATTEMPTS:
+                logger.error(f"Dropping {len(events)} login audit events after {attempt} attempts ({', '.join(pending)}): {error}")
+                return
+            logger.warning(f"Error writing {len(events)} login audit events (attempt {attempt}), retrying: {error}")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            await self._write_with_retry([event for event in batch if event is not None])
+            # None = إشارة الإيقاف بعد كتابة ما قبلها
+            if batch[-1] is None:
+                return
+
+    def start(self) -> None:
+        if not self.running:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.running:
+            await self._queue.put(None)
+            await self._task
+        self._task = None
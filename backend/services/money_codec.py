@@ -0,0 +1,137 @@
+# نظام الإدارة الطبية المتكامل - طبقة ترميز المبالغ المالية (Decimal128)
+# Medical Management System - BSON codec layer storing money as Decimal128
+
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+from bson.codec_options import CodecOptions, TypeCodec, TypeEncoder, TypeRegistry
+from bson.decimal128 import Decimal128
+
+
+class DecimalCodec(TypeCodec):
+    """Decimal ⇄ Decimal128 - المبالغ تُحفظ وتُقرأ بدقة كاملة"""
+    python_type = Decimal
+    bson_type = Decimal128
+
+    def transform_python(self, value: Decimal) -> Decimal128:
+        return Decimal128(value)
+
+    def transform_bson(self, value: Decimal128) -> Decimal:
+        return value.to_decimal()
+
+
+class DateEncoder(TypeEncoder):
+    """date → datetime (منتصف الليل) - حقول التاريخ في النماذج المالية"""
+    python_type = date
+
+    def transform_python(self, value: date) -> datetime:
+        return datetime(value.year, value.month, value.day)
+
+
+MONEY_TYPE_REGISTRY = TypeRegistry([DecimalCodec(), DateEncoder()])
+MONEY_CODEC_OPTIONS = CodecOptions(type_registry=MONEY_TYPE_REGISTRY)
+
+# حقول MoneyAmount ({amount, currency}) في كل مجموعة مالية
+MONEY_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "invoices": (
+        "subtotal_amount", "discount_amount", "tax_amount",
+        "total_amount", "paid_amount", "outstanding_amount",
+    ),
+    "debts": ("original_amount", "paid_amount", "outstanding_amount"),
+    "payments": ("amount",),
+    "financial_transactions": ("amount",),
+}
+
+# حقول MoneyAmount داخل بنود الفاتورة
+LINE_ITEM_MONEY_FIELDS: Tuple[str, ...] = (
+    "unit_price", "discount_amount", "line_subtotal", "line_tax_amount", "line_total",
+)
+
+
+def to_decimal(value: Any) -> Decimal:
+    """تحويل نتيجة تجميع (Decimal/Decimal128/رقم/None) إلى Decimal"""
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    if value is None:
+        return Decimal("0.00")
+    return Decimal(str(value))
+
+
+# ============================================================================
+# DUAL-SHAPE READERS - قراءة المبالغ بالشكلين
+# ============================================================================
+# MoneyAmount fields ({amount, currency}) are migrated to Decimal128 by
+# scripts/migrate_money_decimal128.py. The flat balances written by the debt
+# management and payment paths (remaining_amount, original_amount,
+# paid_amount, amount on simple debts ...) stay plain numbers, because the
+# code that updates them does float arithmetic. Reports that read debts of
+# either shape go through these two readers rather than their own shims.
+
+def money_amount(value: Any) -> Optional[Decimal]:
+    """مبلغ MoneyAmount أو رقم مسطح أو نص كـ Decimal؛ None إن لم يوجد أو تعذر تحويله"""
+    if isinstance(value, dict):
+        value = value.get("amount")
+    if value is None or value == "":
+        return None
+    try:
+        return to_decimal(value)
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def money_expression(field: str) -> Dict[str, Any]:
+    """تعبير تجميع: قيمة الحقل كـ decimal سواء كان MoneyAmount أو رقماً مسطحاً (null إن لم يوجد)"""
+    return {"$convert": {
+        "input": {"$cond": [
+            {"$eq": [{"$type": f"${field}"}, "object"]}, f"${field}.amount", f"${field}"
+        ]},
+        "to": "decimal", "onError": None, "onNull": None
+    }}
+
+
+def _money_to_decimal128(path: str) -> Dict[str, Any]:
+    """تعبير: تحويل {amount} داخل MoneyAmount إلى Decimal128 مع إبقاء غير القابل للتحويل"""
+    amount = f"{path}.amount"
+    return {"$cond": [
+        {"$eq": [{"$type": path}, "object"]},
+        {"$mergeObjects": [path, {"amount": {"$convert": {
+            "input": amount, "to": "decimal", "onError": amount, "onNull": amount
+        }}}]},
+        path
+    ]}
+
+
+def money_migration_filter(collection: str) -> Dict[str, Any]:
+    """المستندات التي ما زالت تحوي مبالغ بغير Decimal128"""
+    conditions: List[Dict[str, Any]] = [
+        {f"{field}.amount": {"$exists": True, "$not": {"$type": "decimal"}}}
+        for field in MONEY_FIELDS[collection]
+    ]
+    if collection == "invoices":
+        conditions.extend(
+            {f"line_items.{field}.amount": {"$exists": True, "$not": {"$type": "decimal"}}}
+            for field in LINE_ITEM_MONEY_FIELDS
+        )
+    return {"$or": conditions}
+
+
+def money_migration_pipeline(collection: str) -> List[Dict[str, Any]]:
+    """خط تحديث يحوّل كل مبالغ MoneyAmount في المستند إلى Decimal128 (idempotent)"""
+    stage: Dict[str, Any] = {
+        field: _money_to_decimal128(f"${field}") for field in MONEY_FIELDS[collection]
+    }
+    if collection == "invoices":
+        stage["line_items"] = {"$cond": [
+            {"$isArray": "$line_items"},
+            {"$map": {
+                "input": "$line_items",
+                "as": "item",
+                "in": {"$mergeObjects": ["$$item", {
+                    field: _money_to_decimal128(f"$$item.{field}") for field in LINE_ITEM_MONEY_FIELDS
+                }]}
+            }},
+            "$line_items"
+        ]}
+    return [{"$set": stage}]
@@ -308,6 +308,24 @@ class NotificationService:
         except Exception as e:
             self.logger.error(f"Error triggering visit reminder: {e}")
 
+    async def trigger_follow_up_reminder(self, task: Dict[str, Any], client_name: str) -> Optional[Notification]:
+        """تذكير مهمة متابعة مستحقة (None عند الفشل ليعيد المجدول المحاولة)"""
+        try:
+            due_date = task.get("due_date")
+            due_text = due_date.strftime("%Y-%m-%d %H:%M") if isinstance(due_date, datetime) else str(due_date or "")
+            return await self.create_notification(NotificationCreate(
+                title=f"تذكير مهمة متابعة - {task.get('title')}",
+                message=f"مهمة المتابعة للعميل {client_name} مستحقة في {due_text}",
+                type=NotificationType.TASK_DUE,
+                priority=task.get("priority") or NotificationPriority.MEDIUM,
+                recipient_id=task["assigned_to"],
+                metadata={"task_id": task.get("id"), "client_id": task.get("client_id")},
+                action_url=f"/crm/tasks?task_id={task.get('id')}"
+            ))
+        except Exception as e:
+            self.logger.error(f"Error triggering follow-up reminder: {e}")
+            return None
+
     async def trigger_stock_alert(self, product_data: Dict[str, Any], stock_level: str):
         """تنبيهات المخزون"""
         try:
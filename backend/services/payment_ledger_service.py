@@ -0,0 +1,264 @@
+# نظام الإدارة الطبية المتكامل - دفتر المدفوعات وترحيل الدفعات الذري
+# Medical Management System - Append-only payment ledger and atomic debt payment posting
+
+from typing import List, Dict, Any, Optional, Tuple, Union, Callable, Awaitable, TypeVar
+from datetime import datetime, date
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+import pymongo
+
+# مجموعة دفتر المدفوعات (إضافة فقط - لا تعديل ولا حذف)
+PAYMENT_LEDGER_COLLECTION = "debt_payment_ledger"
+
+# تسامح التقريب عند اعتبار الدين محصلاً بالكامل
+SETTLEMENT_TOLERANCE = 0.01
+
+Amount = Union[Decimal, float, int]
+T = TypeVar("T")
+
+# مستند مرتبط: قاموس ثابت أو دالة تبنيه من الدين بعد الترحيل
+RelatedDocument = Union[Dict[str, Any], Callable[[Dict[str, Any]], Dict[str, Any]]]
+
+# ذاكرة دعم المعاملات لكل اتصال (replica set / sharded cluster)
+_transaction_support: Dict[int, bool] = {}
+
+
+class DebtBalanceFields:
+    """وصف حقول الرصيد في مستند الدين - where a debt shape keeps its balances
+
+    ``decimal=True`` stores the balances as Decimal128 and converts the current
+    value with ``$toDecimal`` so legacy string/double values are still handled.
+    """
+
+    def __init__(
+        self,
+        paid_field: str,
+        remaining_field: str,
+        settled_status: str,
+        partial_status: str,
+        status_field: str = "status",
+        decimal: bool = False,
+        settled_fields: Optional[Dict[str, Any]] = None
+    ):
+        self.paid_field = paid_field
+        self.remaining_field = remaining_field
+        self.settled_status = settled_status
+        self.partial_status = partial_status
+        self.status_field = status_field
+        self.decimal = decimal
+        self.settled_fields = settled_fields or {}
+
+    def value(self, amount: Amount) -> Union[Decimal128, float]:
+        return Decimal128(str(amount)) if self.decimal else float(amount)
+
+    def _current(self, field: str) -> Dict[str, Any]:
+        current = {"$ifNull": [f"${field}", 0]}
+        return {"$toDecimal": current} if self.decimal else current
+
+    def guard(self, amount: Amount) -> Dict[str, Any]:
+        """شرط الترحيل: المتبقي >= المبلغ"""
+        if self.decimal:
+            return {"$expr": {"$gte": [self._current(self.remaining_field), self.value(amount)]}}
+        return {self.remaining_field: {"$gte": self.value(amount)}}
+
+    def pipeline(self, amount: Amount, set_fields: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """تحديث ذري على الخادم: زيادة المدفوع وإنقاص المتبقي ثم اشتقاق الحالة
+
+        Equivalent to ``$inc`` on both balances; a pipeline is used so the status
+        is derived from the new remaining balance in the same single-document write.
+        The status before the payment is kept in ``previous_status``.
+        """
+        value = self.value(amount)
+        stages: List[Dict[str, Any]] = [
+            {"$set": {
+                self.paid_field: {"$add": [self._current(self.paid_field), value]},
+                self.remaining_field: {"$subtract": [self._current(self.remaining_field), value]},
+                # الحالة قبل الدفعة لخطافات ما بعد الترحيل (عدادات الإحصائيات)
+                "previous_status": f"${self.status_field}",
+                **(set_fields or {})
+            }}
+        ]
+
+        settled = {"$lte": [f"${self.remaining_field}", self.value(SETTLEMENT_TOLERANCE)]}
+        derived = {self.status_field: {"$cond": [settled, self.settled_status, self.partial_status]}}
+        for field, settled_value in self.settled_fields.items():
+            derived[field] = {"$cond": [settled, settled_value, f"${field}"]}
+        stages.append({"$set": derived})
+        return stages
+
+    def reversal(self, amount: Amount) -> List[Dict[str, Any]]:
+        """عكس ترحيل سابق: إرجاع الرصيدين واستعادة الحالة السابقة
+
+        Used to compensate a payment whose ledger write failed. The status is
+        restored from ``previous_status`` (kept by :meth:`pipeline`) instead of
+        being re-derived, and ``previous_status`` itself is left untouched.
+        """
+        value = self.value(amount)
+        was_settled = {"$eq": ["$previous_status", self.settled_status]}
+        restored: Dict[str, Any] = {
+            self.paid_field: {"$subtract": [self._current(self.paid_field), value]},
+            self.remaining_field: {"$add": [self._current(self.remaining_field), value]},
+            self.status_field: "$previous_status"
+        }
+        # حقول التسوية لم تكن موجودة قبل الدفعة ما لم يكن الدين مسددًا أصلًا
+        for field in self.settled_fields:
+            restored[field] = {"$cond": [was_settled, f"${field}", "$$REMOVE"]}
+        return [{"$set": restored}]
+
+    def remaining(self, debt: Dict[str, Any]) -> Any:
+        value: Any = debt
+        for part in self.remaining_field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+
+
+def to_bson_value(value: Any) -> Any:
+    """تحويل القيم غير المدعومة في BSON - Decimal → Decimal128, date → datetime"""
+    if isinstance(value, Decimal):
+        return Decimal128(str(value))
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, dict):
+        return {key: to_bson_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_bson_value(item) for item in value]
+    return value
+
+
+async def supports_transactions(db: AsyncIOMotorDatabase) -> bool:
+    """هل يدعم الخادم المعاملات متعددة المستندات؟ (replica set أو mongos)"""
+    key = id(db.client)
+    if key not in _transaction_support:
+        try:
+            hello = await db.client.admin.command("hello")
+            _transaction_support[key] = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+        except Exception:
+            _transaction_support[key] = False
+    return _transaction_support[key]
+
+
+async def run_in_transaction(db: AsyncIOMotorDatabase, callback: Callable[[Any], Awaitable[T]]) -> T:
+    """تنفيذ ``callback(session)`` في معاملة مع إعادة المحاولة عند التعارض
+
+    ``with_transaction`` re-runs the callback on ``TransientTransactionError``
+    (e.g. a WriteConflict on a hot document) and retries the commit on
+    ``UnknownTransactionCommitResult``, so the callback must only write through
+    ``session`` and must not have side effects outside the transaction.
+    """
+    async with await db.client.start_session() as session:
+        return await session.with_transaction(callback)
+
+
+async def ensure_payment_ledger_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهارس دفتر المدفوعات"""
+    ledger = db[PAYMENT_LEDGER_COLLECTION]
+    await ledger.create_index([("id", pymongo.ASCENDING)], unique=True)
+    await ledger.create_index([("debt_id", pymongo.ASCENDING), ("posted_at", pymongo.DESCENDING)])
+    await ledger.create_index([("clinic_id", pymongo.ASCENDING), ("posted_at", pymongo.DESCENDING)])
+    await ledger.create_index([("posted_at", pymongo.DESCENDING)])
+
+
+async def post_debt_payment(
+    db: AsyncIOMotorDatabase,
+    debt_filter: Dict[str, Any],
+    amount: Amount,
+    fields: DebtBalanceFields,
+    ledger_entry: Dict[str, Any],
+    set_fields: Optional[Dict[str, Any]] = None,
+    related_inserts: Tuple[Tuple[str, RelatedDocument], ...] = (),
+    on_posted: Optional[Callable[[Dict[str, Any], Any], Awaitable[None]]] = None,
+    after_commit: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+) -> Optional[Dict[str, Any]]:
+    """ترحيل دفعة على دين بشكل ذري - post a payment against a debt
+
+    The debt is updated with a single conditional write guarded by
+    ``remaining >= amount``, so concurrent collectors can never over-collect or
+    lose a payment. The ledger entry and ``related_inserts`` are written in the
+    same multi-document transaction when the deployment supports it, as is
+    ``on_posted(debt, session)`` (e.g. the clinic running balance); the
+    transaction is retried on write conflicts. ``after_commit(debt)`` runs once
+    the payment is saved, outside the transaction (shared counters such as the
+    debt statistics). On a standalone server the debt update is reversed if the
+    ledger write fails. A ``related_inserts`` document may be a callable that
+    builds it from the updated debt.
+
+    Returns the updated debt, or ``None`` when no debt matched the filter and
+    guard (not found, out of scope, or amount above the remaining balance).
+    """
+    guard = {**debt_filter, **fields.guard(amount)}
+    update = fields.pipeline(amount, set_fields)
+    ledger = db[PAYMENT_LEDGER_COLLECTION]
+
+    async def _update(session=None) -> Optional[Dict[str, Any]]:
+        return await db.debts.find_one_and_update(
+            guard, update,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    async def _record(debt: Dict[str, Any], session=None) -> None:
+        entry = to_bson_value({
+            "debt_number": debt.get("debt_number"),
+            "clinic_id": debt.get("clinic_id"),
+            **ledger_entry,
+            "debt_id": debt.get("id"),
+            "amount": fields.value(amount),
+            "remaining_after": fields.remaining(debt),
+            "posted_at": datetime.utcnow()
+        })
+        await ledger.insert_one(entry, session=session)
+
+    async def _related(debt: Dict[str, Any], session=None) -> None:
+        for collection, document in related_inserts:
+            document = document(debt) if callable(document) else document
+            await db[collection].insert_one(to_bson_value(document), session=session)
+        if on_posted is not None:
+            await on_posted(debt, session)
+
+    async def _post(session) -> Optional[Dict[str, Any]]:
+        debt = await _update(session)
+        if debt is not None:
+            await _record(debt, session)
+            await _related(debt, session)
+        return debt
+
+    if await supports_transactions(db):
+        debt = await run_in_transaction(db, _post)
+    else:
+        # خادم مستقل: تحديث الدين ذري بحد ذاته، والدفتر يُكتب بعده مع تعويض عند الفشل
+        debt = await _update()
+        if debt is None:
+            return None
+        try:
+            await _record(debt)
+        except Exception:
+            await db.debts.update_one({"id": debt.get("id")}, fields.reversal(amount))
+            raise
+        await _related(debt)
+
+    if debt is not None and after_commit is not None:
+        await after_commit(debt)
+    return debt
+
+
+async def get_debt_payments(
+    db: AsyncIOMotorDatabase,
+    debt_id: str,
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """مدفوعات الدين من الدفتر (الأحدث أولاً)"""
+    return await db[PAYMENT_LEDGER_COLLECTION].find(
+        {"debt_id": debt_id}, {"_id": 0}
+    ).sort("posted_at", -1).limit(limit).to_list(length=limit)
+
+
+async def count_debt_payments(db: AsyncIOMotorDatabase, debt_ids: List[str]) -> Dict[str, int]:
+    """عدد مدفوعات كل دين من الدفتر في استعلام واحد"""
+    counts = await db[PAYMENT_LEDGER_COLLECTION].aggregate([
+        {"$match": {"debt_id": {"$in": debt_ids}}},
+        {"$group": {"_id": "$debt_id", "count": {"$sum": 1}}}
+    ]).to_list(length=None)
+    return {row["_id"]: row["count"] for row in counts}
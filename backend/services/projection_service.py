@@ -0,0 +1,112 @@
+# نظام الإدارة الطبية المتكامل - خدمة إسقاط الحقول للقوائم
+# Medical Management System - Sparse fieldsets / Mongo projection helpers
+
+from typing import Dict, Any, Iterable, Optional, Set
+
+# ============================================================================
+# PUBLIC FIELD MAPS - خرائط الحقول العامة لكل قائمة
+# ============================================================================
+# كل خريطة تربط اسم الحقل في الاستجابة بمواصفة الإسقاط في Mongo.
+# القيمة 1 تعني الحقل كما هو، والقيمة النصية "$field" تعني اسماً مستعاراً
+# يحسبه الخادم (MongoDB 4.4+) بدلاً من تكرار البيانات في المستند.
+
+CLINIC_LIST_FIELDS: Dict[str, Any] = {
+    "id": 1,
+    "name": 1,
+    "clinic_name": "$name",
+    "doctor_name": 1,
+    "phone": 1,
+    "email": 1,
+    "address": 1,
+    "classification": 1,
+    "credit_classification": 1,
+    "is_active": 1,
+    "status": 1,
+    "line_id": 1,
+    "area_id": 1,
+    "clinic_latitude": 1,
+    "clinic_longitude": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "registered_by": 1,
+    "registration_number": 1,
+}
+
+PRODUCT_LIST_FIELDS: Dict[str, Any] = {
+    "id": 1,
+    "name": 1,
+    "code": 1,
+    "brand": 1,
+    "description": 1,
+    "price": 1,
+    "cost": 1,
+    "unit": 1,
+    "stock_quantity": 1,
+    "minimum_stock": 1,
+    "maximum_stock": 1,
+    "is_active": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "created_by": 1,
+    "updated_by": 1,
+    "expiry_date": 1,
+    "batch_number": 1,
+    "supplier_info": 1,
+    "medical_category": 1,
+    "requires_prescription": 1,
+}
+
+USER_LIST_FIELDS: Dict[str, Any] = {
+    "id": 1,
+    "username": 1,
+    "full_name": 1,
+    "role": 1,
+    "email": 1,
+    "phone": 1,
+    "is_active": 1,
+    "line_id": 1,
+    "area_id": 1,
+    "manager_id": 1,
+    "created_at": 1,
+    "last_login": 1,
+}
+
+
+def parse_fields_param(fields: Optional[str], allowed: Iterable[str]) -> Optional[Set[str]]:
+    """تحليل معامل fields= - Parse a comma separated ``fields=`` query value.
+
+    Returns ``None`` when the client did not ask for a sparse fieldset, so the
+    caller keeps returning the full list shape. Unknown names raise
+    ``ValueError`` which routes turn into a 400 response.
+    """
+    if fields is None or not fields.strip():
+        return None
+
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"حقول غير مدعومة: {', '.join(sorted(unknown))}")
+
+    return requested
+
+
+def build_projection(
+    field_map: Dict[str, Any],
+    requested: Optional[Set[str]] = None,
+    required: Iterable[str] = ()
+) -> Dict[str, Any]:
+    """بناء إسقاط Mongo - Build a Mongo projection for the requested fields.
+
+    ``required`` names are always projected (e.g. fields needed to compute a
+    derived value) even if the client did not request them; callers strip
+    them from the response afterwards when needed.
+    """
+    names = set(field_map) if requested is None else set(requested)
+    names.update(required)
+
+    projection: Dict[str, Any] = {"_id": 0}
+    for name in names:
+        if name in field_map:
+            projection[name] = field_map[name]
+
+    return projection
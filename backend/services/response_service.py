@@ -0,0 +1,174 @@
+# نظام الإدارة الطبية المتكامل - خط معالجة الاستجابات (JSON سريع + ضغط)
+# Medical Management System - Response pipeline: orjson rendering and gzip/brotli compression
+
+from typing import Any, Dict, List, Optional, Tuple
+from decimal import Decimal
+import gzip
+
+import orjson
+from bson import Decimal128, ObjectId
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# ============================================================================
+# FAST JSON SERIALIZATION - تسلسل JSON سريع
+# ============================================================================
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def orjson_default(value: Any) -> Any:
+    """تحويل الأنواع غير المدعومة في orjson بنفس صيغة النماذج
+
+    Matches what backend/models emit: ``MoneyAmount`` encodes ``Decimal`` as a
+    float, Mongo ``Decimal128`` values are money too, and ids are strings.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def render_json(content: Any) -> bytes:
+    """تسلسل المحتوى إلى JSON بايت - Serialize content with orjson"""
+    return orjson.dumps(content, default=orjson_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """استجابة JSON مبنية على orjson - default response class for the API
+
+    Handlers that return this class directly also skip FastAPI's
+    ``jsonable_encoder`` pass, which is worth doing for the heaviest lists.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
+
+# ============================================================================
+# COMPRESSION MIDDLEWARE - ضغط الاستجابات
+# ============================================================================
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """اختيار خوارزمية الضغط من ترويسة Accept-Encoding (br مفضل على gzip)"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br",) if BROTLI_AVAILABLE else ()) + ("gzip",):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """ضغط gzip/brotli للاستجابات الكبيرة - negotiated compression above a size threshold
+
+    Small bodies and streamed responses (exports, PDFs) are passed through
+    untouched; only complete bodies of at least ``minimum_size`` bytes with a
+    compressible content type are encoded.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers: List[Tuple[bytes, bytes]] = list(start_message.get("headers", []))
+            header_map: Dict[bytes, bytes] = {key.lower(): value for key, value in headers}
+            content_type = header_map.get(b"content-type", b"").decode("latin-1")
+
+            if (
+                message.get("more_body", False)
+                or b"content-encoding" in header_map
+                or len(body) < self.minimum_size
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                # بث أو استجابة صغيرة - تمرير بدون ضغط
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = self.compress(body, encoding)
+            headers = [(key, value) for key, value in headers if key.lower() != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+            vary = header_map.get(b"vary")
+            if vary is None:
+                headers.append((b"vary", b"Accept-Encoding"))
+            elif b"accept-encoding" not in vary.lower():
+                headers = [(key, value) for key, value in headers if key.lower() != b"vary"]
+                headers.append((b"vary", vary + b", Accept-Encoding"))
+
+            start_message["headers"] = headers
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
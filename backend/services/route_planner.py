@@ -0,0 +1,275 @@
+# نظام الإدارة الطبية المتكامل - محرك تخطيط مسار الزيارات اليومية
+# Medical Management System - Daily visit route planner (nearest neighbour + 2-opt)
+
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+from services.geo_utils import haversine_km
+
+# أوزان الأولوية: الأولوية الأعلى تجعل العيادة "أقرب" في مرحلة البناء
+PRIORITY_FACTORS = {
+    "high": 0.5,
+    "normal": 1.0,
+    "low": 1.5,
+}
+
+# ترتيب إسقاط الزيارات عند عدم كفاية وقت اليوم (الأقل أولوية يُسقط أولاً)
+PRIORITY_RANK = {"high": 0, "normal": 1, "low": 2}
+
+DEFAULT_SERVICE_MINUTES = 30
+DEFAULT_SPEED_KMH = 30.0
+DEFAULT_ROAD_FACTOR = 1.3  # تحويل المسافة المستقيمة إلى مسافة طرق تقريبية
+
+
+def build_distance_matrix(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """مصفوفة المسافات (كم) بين كل النقاط - broadcasting haversine"""
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    return haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+class RoutePlanner:
+    """مخطط مسار الزيارات - Visit route optimizer
+
+    Nodes are laid out as ``[start, stop_1 .. stop_n, end]``. Without a start
+    location the start node is virtual (zero distance to every stop), and
+    unless the rep returns to the start the end node is virtual as well, so
+    the same 2-opt move set handles open and closed routes.
+
+    Time windows and the working day are hard constraints; priorities steer
+    the construction phase and decide which stops are dropped when the day
+    cannot fit all of them.
+    """
+
+    def __init__(
+        self,
+        speed_kmh: float = DEFAULT_SPEED_KMH,
+        road_factor: float = DEFAULT_ROAD_FACTOR,
+        max_iterations: int = 500
+    ):
+        self.speed_kmh = speed_kmh
+        self.road_factor = road_factor
+        self.max_iterations = max_iterations
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+
+    def _prepare(
+        self,
+        stops: List[Dict[str, Any]],
+        start: Optional[Tuple[float, float]],
+        return_to_start: bool
+    ) -> None:
+        n = len(stops)
+        lat = np.array([float(stop["latitude"]) for stop in stops])
+        lon = np.array([float(stop["longitude"]) for stop in stops])
+
+        distances = np.zeros((n + 2, n + 2))
+        if start is not None:
+            lat_all = np.concatenate(([start[0]], lat))
+            lon_all = np.concatenate(([start[1]], lon))
+            distances[:n + 1, :n + 1] = build_distance_matrix(lat_all, lon_all) * self.road_factor
+            if return_to_start:
+                distances[n + 1, :n + 1] = distances[0, :n + 1]
+                distances[:n + 1, n + 1] = distances[:n + 1, 0]
+        else:
+            distances[1:n + 1, 1:n + 1] = build_distance_matrix(lat, lon) * self.road_factor
+
+        self.n = n
+        self.distances = distances
+        self.travel_minutes = distances / self.speed_kmh * 60.0
+        self.service = np.zeros(n + 2)
+        self.window_start = np.full(n + 2, -np.inf)
+        self.window_end = np.full(n + 2, np.inf)
+        self.priorities = ["normal"] * (n + 2)
+
+        for index, stop in enumerate(stops, start=1):
+            self.service[index] = float(stop.get("service_minutes") or DEFAULT_SERVICE_MINUTES)
+            if stop.get("window_start") is not None:
+                self.window_start[index] = float(stop["window_start"])
+            if stop.get("window_end") is not None:
+                self.window_end[index] = float(stop["window_end"])
+            priority = stop.get("priority") or "normal"
+            self.priorities[index] = priority if priority in PRIORITY_FACTORS else "normal"
+
+    def _schedule(self, path: List[int], day_start: float, day_end: float) -> Optional[np.ndarray]:
+        """محاكاة اليوم على مسار - returns arrival minutes per path position or None if infeasible"""
+        arrivals = np.empty(len(path))
+        time = day_start
+        previous = path[0]
+        arrivals[0] = time
+        for position in range(1, len(path)):
+            node = path[position]
+            time += self.travel_minutes[previous, node]
+            if time > self.window_end[node]:
+                return None
+            arrivals[position] = time
+            time = max(time, self.window_start[node]) + self.service[node]
+            previous = node
+        if time > day_end:
+            return None
+        return arrivals
+
+    # ------------------------------------------------------------------
+    # Construction - nearest neighbour with windows and priorities
+    # ------------------------------------------------------------------
+
+    def _nearest_neighbour(self, day_start: float, day_end: float) -> Tuple[List[int], List[int]]:
+        end = self.n + 1
+        unvisited = set(range(1, self.n + 1))
+        path = [0]
+        time = day_start
+        current = 0
+
+        while unvisited:
+            candidates = np.fromiter(unvisited, dtype=np.int64)
+            arrival = time + self.travel_minutes[current, candidates]
+            begin = np.maximum(arrival, self.window_start[candidates])
+            finish = begin + self.service[candidates]
+            feasible = (
+                (arrival <= self.window_end[candidates])
+                & (finish + self.travel_minutes[candidates, end] <= day_end)
+            )
+            if not feasible.any():
+                break
+
+            factors = np.array([PRIORITY_FACTORS[self.priorities[node]] for node in candidates])
+            score = np.where(feasible, (begin - time) * factors, np.inf)
+            chosen = int(candidates[int(np.argmin(score))])
+
+            time = float(finish[candidates == chosen][0])
+            path.append(chosen)
+            unvisited.discard(chosen)
+            current = chosen
+
+        path.append(end)
+        return path, sorted(unvisited, key=lambda node: PRIORITY_RANK[self.priorities[node]])
+
+    def _insert_remaining(self, path: List[int], remaining: List[int], day_start: float, day_end: float) -> Tuple[List[int], List[int]]:
+        """إدراج أرخص للزيارات التي لم تتسع في مرحلة البناء (حسب الأولوية)"""
+        unscheduled = []
+        for node in remaining:
+            best_cost, best_position = np.inf, None
+            for position in range(1, len(path)):
+                before, after = path[position - 1], path[position]
+                cost = (self.distances[before, node] + self.distances[node, after]
+                        - self.distances[before, after])
+                if cost < best_cost:
+                    candidate = path[:position] + [node] + path[position:]
+                    if self._schedule(candidate, day_start, day_end) is not None:
+                        best_cost, best_position = cost, position
+            if best_position is None:
+                unscheduled.append(node)
+            else:
+                path = path[:best_position] + [node] + path[best_position:]
+        return path, unscheduled
+
+    # ------------------------------------------------------------------
+    # Improvement - 2-opt with vectorized move evaluation
+    # ------------------------------------------------------------------
+
+    def _two_opt(self, path: List[int], day_start: float, day_end: float) -> List[int]:
+        route = np.array(path)
+        m = len(route)
+        if m < 4:
+            return path
+
+        # كل أزواج (i, j) بحيث 1 <= i < j <= m-2 (عكس المقطع route[i..j])
+        i_index, j_index = np.triu_indices(m - 2, k=1)
+        i_index = i_index + 1
+        j_index = j_index + 1
+
+        for _ in range(self.max_iterations):
+            a, b = route[i_index - 1], route[i_index]
+            c, d = route[j_index], route[j_index + 1]
+            delta = (self.distances[a, c] + self.distances[b, d]
+                     - self.distances[a, b] - self.distances[c, d])
+
+            improving = np.flatnonzero(delta < -1e-9)
+            if improving.size == 0:
+                break
+
+            applied = False
+            for move in improving[np.argsort(delta[improving])]:
+                i, j = i_index[move], j_index[move]
+                candidate = np.concatenate((route[:i], route[i:j + 1][::-1], route[j + 1:]))
+                if self._schedule(candidate.tolist(), day_start, day_end) is not None:
+                    route = candidate
+                    applied = True
+                    break
+            if not applied:
+                break
+
+        return route.tolist()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def plan(
+        self,
+        stops: List[Dict[str, Any]],
+        start: Optional[Tuple[float, float]] = None,
+        day_start_minutes: float = 9 * 60,
+        day_end_minutes: float = 18 * 60,
+        return_to_start: bool = False
+    ) -> Dict[str, Any]:
+        """حساب ترتيب الزيارات الأمثل لليوم
+
+        ``stops`` items need ``id``, ``latitude`` and ``longitude``; optional
+        ``service_minutes``, ``priority`` (high/normal/low) and
+        ``window_start``/``window_end`` in minutes from midnight.
+        ``input_order_distance_km`` is the distance of the same scheduled stops
+        visited in input order, so it compares ordering only (dropped stops are
+        in ``unscheduled``).
+        """
+        if not stops:
+            return {"route": [], "unscheduled": [], "total_distance_km": 0.0,
+                    "total_travel_minutes": 0.0, "input_order_distance_km": 0.0}
+
+        self._prepare(stops, start, return_to_start and start is not None)
+
+        path, remaining = self._nearest_neighbour(day_start_minutes, day_end_minutes)
+        path, unscheduled = self._insert_remaining(path, remaining, day_start_minutes, day_end_minutes)
+        path = self._two_opt(path, day_start_minutes, day_end_minutes)
+
+        arrivals = self._schedule(path, day_start_minutes, day_end_minutes)
+        route = []
+        total_km = 0.0
+        total_minutes = 0.0
+        for position in range(1, len(path) - 1):
+            node = path[position]
+            previous = path[position - 1]
+            leg_km = float(self.distances[previous, node])
+            leg_minutes = float(self.travel_minutes[previous, node])
+            arrival = float(arrivals[position])
+            begin = max(arrival, float(self.window_start[node]))
+            total_km += leg_km
+            total_minutes += leg_minutes
+            route.append({
+                **stops[node - 1],
+                "sequence": position,
+                "travel_km": round(leg_km, 3),
+                "travel_minutes": round(leg_minutes, 1),
+                "arrival_minute": round(arrival, 1),
+                "wait_minutes": round(begin - arrival, 1),
+                "departure_minute": round(begin + float(self.service[node]), 1),
+            })
+
+        return_km = float(self.distances[path[-2], path[-1]])
+        total_km += return_km
+        total_minutes += float(self.travel_minutes[path[-2], path[-1]])
+
+        # نفس العيادات المجدولة بترتيب الإدخال (المحذوفة لا تدخل المقارنة)
+        input_path = [path[0]] + sorted(path[1:-1]) + [path[-1]]
+        input_km = float(sum(self.distances[x, y] for x, y in zip(input_path, input_path[1:])))
+
+        return {
+            "route": route,
+            "unscheduled": [stops[node - 1] for node in unscheduled],
+            "total_distance_km": round(total_km, 3),
+            "total_travel_minutes": round(total_minutes, 1),
+            "return_distance_km": round(return_km, 3),
+            "input_order_distance_km": round(input_km, 3),
+        }
@@ -0,0 +1,238 @@
+# نظام الإدارة الطبية المتكامل - وحدة العمل للكتابات المالية المتعددة
+# Medical Management System - Unit of work over Motor sessions with an outbox fallback
+
+from typing import List, Dict, Any, Callable, Awaitable
+from datetime import datetime, timedelta
+import os
+import socket
+import uuid
+from bson import json_util
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import pymongo
+
+from services.payment_ledger_service import supports_transactions, to_bson_value
+
+UNIT_OF_WORK_OUTBOX_COLLECTION = "unit_of_work_outbox"
+
+# الوحدات المعلقة الأحدث من هذا قد تكون قيد التطبيق في عملية أخرى
+OUTBOX_REPLAY_GRACE = timedelta(minutes=5)
+
+# مدة حجز الوحدة أثناء إعادة تطبيقها؛ عملية توقفت أثناء الإعادة تترك الوحدة لغيرها بعدها
+OUTBOX_REPLAY_LEASE = timedelta(minutes=5)
+
+
+class UnitOfWorkConflict(ValueError):
+    """شرط كتابة محمية لم يتحقق (مثلاً الفاتورة تغيرت حالتها) - the whole unit is abandoned"""
+
+
+class UnitOfWork:
+    """وحدة عمل: تجميع كتابات عدة مستندات وتنفيذها كوحدة واحدة
+
+    Writes are staged with ``insert_one``/``update_one`` and applied on exit:
+
+        number = await next_number()  # خارج الوحدة
+        async with UnitOfWork(db, "convert_invoice_to_debt") as uow:
+            uow.update_one("invoices", {...}, {...}, require_match=True)
+            uow.insert_one("debts", debt)
+
+    On a replica set they run in one multi-document transaction, retried as a
+    whole on transient errors (write conflicts on hot documents such as clinic
+    balances); since every write is staged, the retry simply re-applies the
+    staged list. Reads and shared counters such as document number sequences
+    belong outside the unit; ``after_commit`` callbacks (debt statistics
+    counters) run once the unit is applied. On a standalone
+    server (dev) the staged writes are first persisted to an outbox document and
+    then applied in order with their progress recorded, so ``replay_outbox`` can
+    finish a unit interrupted by a crash. In outbox mode guarded updates
+    (``require_match``) are checked before anything is written.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, name: str):
+        self.db = db
+        self.name = name
+        self.id = str(uuid.uuid4())
+        self.operations: List[Dict[str, Any]] = []
+        self.callbacks: List[Callable[[], Awaitable[None]]] = []
+        self.session = None
+        self.transactional = False
+
+    async def __aenter__(self) -> "UnitOfWork":
+        self.transactional = await supports_transactions(self.db)
+        if self.transactional:
+            self.session = await self.db.client.start_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        try:
+            if exc_type is None:
+                await self.commit()
+        finally:
+            if self.session is not None:
+                await self.session.end_session()
+        if exc_type is None:
+            for callback in self.callbacks:
+                await callback()
+
+    # ------------------------------------------------------------------
+    # تسجيل الكتابات
+    # ------------------------------------------------------------------
+
+    def insert_one(self, collection: str, document: Dict[str, Any]) -> None:
+        """إدراج مستند (idempotent عبر حقل id عند إعادة التشغيل)"""
+        self.operations.append({"op": "insert", "collection": collection, "document": to_bson_value(document)})
+
+    def update_one(
+        self,
+        collection: str,
+        filter: Dict[str, Any],
+        update: Any,
+        upsert: bool = False,
+        require_match: bool = False
+    ) -> None:
+        """تحديث مستند؛ ``require_match`` يلغي الوحدة إن لم يطابق أي مستند"""
+        self.operations.append({
+            "op": "update",
+            "collection": collection,
+            "filter": to_bson_value(filter),
+            "update": to_bson_value(update),
+            "upsert": upsert,
+            "require_match": require_match,
+        })
+
+    def after_commit(self, callback: Callable[[], Awaitable[None]]) -> None:
+        """تشغيل ``callback`` بعد تنفيذ الوحدة بنجاح (خارج المعاملة، مرة واحدة)"""
+        self.callbacks.append(callback)
+
+    # ------------------------------------------------------------------
+    # التنفيذ
+    # ------------------------------------------------------------------
+
+    async def commit(self) -> None:
+        """تنفيذ الكتابات المسجلة"""
+        if not self.operations:
+            return
+
+        if self.transactional:
+            async def _apply_all(session) -> None:
+                for operation in self.operations:
+                    await apply_operation(self.db, operation, session)
+
+            # with_transaction يعيد تطبيق القائمة كاملة عند TransientTransactionError
+            await self.session.with_transaction(_apply_all)
+            return
+
+        # خادم مستقل: فحص الشروط، ثم حفظ الوحدة في صندوق الصادر، ثم التطبيق بالترتيب
+        for operation in self.operations:
+            if operation.get("require_match") and not await self.db[operation["collection"]].count_documents(
+                operation["filter"], limit=1
+            ):
+                raise UnitOfWorkConflict("تغيرت البيانات أثناء العملية، يرجى المحاولة مرة أخرى")
+
+        outbox = self.db[UNIT_OF_WORK_OUTBOX_COLLECTION]
+        await outbox.insert_one({
+            "id": self.id,
+            "name": self.name,
+            # العمليات تحوي مفاتيح $ ونقاط، لذا تُحفظ كـ Extended JSON
+            "operations": json_util.dumps(self.operations),
+            "applied": 0,
+            "status": "pending",
+            "created_at": datetime.utcnow()
+        })
+        await _apply_outbox_entry(self.db, self.id, self.operations, 0)
+
+
+async def apply_operation(db: AsyncIOMotorDatabase, operation: Dict[str, Any], session=None) -> bool:
+    """تطبيق عملية واحدة؛ يعيد False إذا لم يتحقق شرط التحديث المحمي"""
+    collection = db[operation["collection"]]
+    if operation["op"] == "insert":
+        document = operation["document"]
+        if "id" not in document:
+            await collection.insert_one(dict(document), session=session)
+            return True
+        try:
+            await collection.update_one(
+                {"id": document["id"]}, {"$setOnInsert": document}, upsert=True, session=session
+            )
+        except DuplicateKeyError:
+            pass  # أُدرج مسبقاً (إعادة تشغيل)
+        return True
+
+    result = await collection.update_one(
+        operation["filter"], operation["update"], upsert=operation.get("upsert", False), session=session
+    )
+    if operation.get("require_match") and result.matched_count == 0 and not result.upserted_id:
+        if session is not None:
+            raise UnitOfWorkConflict("تغيرت البيانات أثناء العملية، يرجى المحاولة مرة أخرى")
+        return False
+    return True
+
+
+async def _apply_outbox_entry(
+    db: AsyncIOMotorDatabase,
+    entry_id: str,
+    operations: List[Dict[str, Any]],
+    start: int,
+    replaying: bool = False
+) -> None:
+    outbox = db[UNIT_OF_WORK_OUTBOX_COLLECTION]
+    for index in range(start, len(operations)):
+        matched = await apply_operation(db, operations[index])
+        if not matched and not replaying:
+            # سباق بعد الفحص المسبق: تُترك الوحدة للمراجعة مع موضع التوقف
+            await outbox.update_one({"id": entry_id}, {"$set": {"status": "conflict", "applied": index}})
+            raise UnitOfWorkConflict("تغيرت البيانات أثناء العملية، يرجى المحاولة مرة أخرى")
+        await outbox.update_one({"id": entry_id}, {"$set": {"applied": index + 1}})
+    await outbox.update_one(
+        {"id": entry_id},
+        {"$set": {"status": "applied", "applied_at": datetime.utcnow()}, "$unset": {"lease_owner": "", "lease_until": ""}}
+    )
+
+
+async def replay_outbox(db: AsyncIOMotorDatabase) -> int:
+    """إكمال الوحدات المنقطعة في صندوق الصادر (عند بدء التشغيل)
+
+    Runs in every server process at startup, so each entry is claimed with
+    ``find_one_and_update`` (status ``replaying`` plus a lease) before it is
+    applied: two workers never replay the same unit. A worker that dies while
+    replaying leaves the entry to be claimed again once its lease ends.
+    Inserts are idempotent and ``$set`` updates are naturally so; a ``$inc``
+    staged in a unit can be applied twice only if the process died between that
+    write and its progress mark.
+    """
+    outbox = db[UNIT_OF_WORK_OUTBOX_COLLECTION]
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    replayed = 0
+    while True:
+        now = datetime.utcnow()
+        entry = await outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "created_at": {"$lt": now - OUTBOX_REPLAY_GRACE}},
+                {"status": "replaying", "lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": "replaying", "lease_owner": worker_id, "lease_until": now + OUTBOX_REPLAY_LEASE}},
+            sort=[("created_at", pymongo.ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if entry is None:
+            return replayed
+        # شرط الحماية غير المتحقق عند الإعادة يعني أن العملية طُبقت قبل الانقطاع
+        operations = json_util.loads(entry["operations"])
+        await _apply_outbox_entry(db, entry["id"], operations, entry.get("applied", 0), replaying=True)
+        replayed += 1
+
+
+async def ensure_unit_of_work_indexes(db: AsyncIOMotorDatabase) -> None:
+    """فهارس صندوق الصادر"""
+    outbox = db[UNIT_OF_WORK_OUTBOX_COLLECTION]
+    await outbox.create_index([("id", pymongo.ASCENDING)], unique=True)
+    await outbox.create_index([("status", pymongo.ASCENDING), ("created_at", pymongo.ASCENDING)])
+    await outbox.create_index(
+        [("lease_until", pymongo.ASCENDING)], partialFilterExpression={"status": "replaying"}
+    )
+    # الوحدات المطبقة تُحذف بعد أسبوع
+    await outbox.create_index(
+        [("applied_at", pymongo.ASCENDING)], expireAfterSeconds=7 * 24 * 3600,
+        partialFilterExpression={"status": "applied"}
+    )
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+اختبار الضغط للدفعات المتزامنة على نفس الدين
+Concurrent payment posting stress test for POST /api/debts/{debt_id}/payments
+
+Fires many payments at the same debt in parallel. Together they are worth twice
+the remaining balance, so with atomic conditional posting exactly half must be
+accepted, the rest rejected with 400, and the final balance must equal the
+starting balance minus the accepted payments (no lost updates, no over-collection).
+"""
+
+import requests
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuration
+BACKEND_URL = "https://medmanage-pro-1.preview.emergentagent.com/api"
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "admin123"
+
+CONCURRENT_PAYMENTS = 40
+
+class ConcurrentDebtPaymentTester:
+    def __init__(self):
+        self.session = requests.Session()
+        self.jwt_token = None
+        self.test_results = []
+        self.start_time = time.time()
+        self.debt = None
+
+    def log_test(self, test_name, success, response_time, details):
+        """تسجيل نتيجة الاختبار"""
+        self.test_results.append({
+            "test": test_name,
+            "success": success,
+            "response_time": response_time,
+            "details": details,
+            "timestamp": datetime.now().isoformat()
+        })
+
+        status = "✅ SUCCESS" if success else "❌ FAILED"
+        print(f"{status} | {test_name} | {response_time:.2f}ms | {details}")
+
+    def login_admin(self):
+        """1) تسجيل دخول admin/admin123"""
+        print("\n🔐 Step 1: Admin Login")
+        print("=" * 50)
+
+        start_time = time.time()
+        try:
+            response = self.session.post(
+                f"{BACKEND_URL}/auth/login",
+                json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD},
+                timeout=10
+            )
+            response_time = (time.time() - start_time) * 1000
+
+            if response.status_code == 200:
+                self.jwt_token = response.json().get("access_token")
+                if self.jwt_token:
+                    self.session.headers.update({"Authorization": f"Bearer {self.jwt_token}"})
+                    self.log_test("Admin Login", True, response_time, "Token received")
+                    return True
+            self.log_test("Admin Login", False, response_time, f"HTTP {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            self.log_test("Admin Login", False, (time.time() - start_time) * 1000, f"Exception: {str(e)}")
+            return False
+
+    def find_open_debt(self):
+        """2) اختيار دين له رصيد متبقٍ"""
+        print("\n📋 Step 2: Find a Debt With Remaining Balance")
+        print("=" * 50)
+
+        start_time = time.time()
+        try:
+            response = self.session.get(f"{BACKEND_URL}/debts", params={"limit": 100}, timeout=15)
+            response_time = (time.time() - start_time) * 1000
+
+            if response.status_code != 200:
+                self.log_test("Find Open Debt", False, response_time, f"HTTP {response.status_code}")
+                return False
+
+            debts = [
+                debt for debt in response.json().get("debts", [])
+                if isinstance(debt.get("remaining_amount"), (int, float)) and debt["remaining_amount"] >= 1
+            ]
+            if not debts:
+                self.log_test("Find Open Debt", False, response_time, "No debt with a remaining balance")
+                return False
+
+            self.debt = max(debts, key=lambda debt: debt["remaining_amount"])
+            self.log_test(
+                "Find Open Debt", True, response_time,
+                f"{self.debt.get('debt_number')} remaining {self.debt['remaining_amount']}"
+            )
+            return True
+        except Exception as e:
+            self.log_test("Find Open Debt", False, (time.time() - start_time) * 1000, f"Exception: {str(e)}")
+            return False
+
+    def _ledger_count(self):
+        response = self.session.get(f"{BACKEND_URL}/debts/{self.debt['id']}", timeout=15)
+        data = response.json()
+        return len(data.get("payments", [])), data.get("debt", {})
+
+    def _post_payment(self, amount):
+        started = time.time()
+        response = requests.post(
+            f"{BACKEND_URL}/debts/{self.debt['id']}/payments",
+            json={
+                "debt_id": self.debt["id"],
+                "amount": amount,
+                "payment_method": "cash",
+                "collected_by": "stress-test",
+                "notes": "concurrent posting stress test"
+            },
+            headers={"Authorization": f"Bearer {self.jwt_token}"},
+            timeout=30
+        )
+        return response.status_code, (time.time() - started) * 1000
+
+    def test_concurrent_payments(self):
+        """3) إرسال دفعات متزامنة قيمتها ضعف الرصيد المتبقي"""
+        print(f"\n⚡ Step 3: {CONCURRENT_PAYMENTS} Concurrent Payments")
+        print("=" * 50)
+
+        ledger_before, debt_before = self._ledger_count()
+        remaining_before = debt_before.get("remaining_amount", self.debt["remaining_amount"])
+        expected_accepted = CONCURRENT_PAYMENTS // 2
+        amount = round(remaining_before / expected_accepted, 2)
+        # التقريب قد يجعل دفعة إضافية غير مقبولة - الحد الأعلى المقبول
+        max_accepted = min(CONCURRENT_PAYMENTS, int(remaining_before // amount))
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=CONCURRENT_PAYMENTS) as pool:
+            results = list(pool.map(self._post_payment, [amount] * CONCURRENT_PAYMENTS))
+        response_time = (time.time() - start_time) * 1000
+
+        accepted = sum(1 for status_code, _ in results if status_code == 200)
+        rejected = sum(1 for status_code, _ in results if status_code == 400)
+        errors = CONCURRENT_PAYMENTS - accepted - rejected
+        latencies = sorted(latency for _, latency in results)
+
+        self.log_test(
+            "Concurrent Posting - Accepted Count",
+            accepted == max_accepted and errors == 0,
+            response_time,
+            f"accepted {accepted} (expected {max_accepted}), rejected {rejected}, errors {errors}, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.0f}ms"
+        )
+
+        ledger_after, debt_after = self._ledger_count()
+        expected_remaining = round(remaining_before - accepted * amount, 2)
+        actual_remaining = round(debt_after.get("remaining_amount", -1), 2)
+        self.log_test(
+            "Concurrent Posting - No Lost Updates",
+            abs(actual_remaining - expected_remaining) <= 0.01 and actual_remaining >= 0,
+            0,
+            f"remaining {remaining_before} → {actual_remaining} (expected {expected_remaining})"
+        )
+        self.log_test(
+            "Concurrent Posting - Ledger Entries",
+            ledger_after - ledger_before == accepted,
+            0,
+            f"ledger entries +{ledger_after - ledger_before} for {accepted} accepted payments"
+        )
+
+        return all(result["success"] for result in self.test_results[-3:])
+
+    def generate_final_report(self):
+        """التقرير النهائي"""
+        print("\n" + "=" * 70)
+        print("📊 CONCURRENT DEBT PAYMENT STRESS TEST REPORT")
+        print("=" * 70)
+
+        passed = sum(1 for result in self.test_results if result["success"])
+        total = len(self.test_results)
+        print(f"Tests passed: {passed}/{total} ({(passed / total * 100) if total else 0:.1f}%)")
+        print(f"Total time: {time.time() - self.start_time:.2f}s")
+
+        for result in self.test_results:
+            status = "✅" if result["success"] else "❌"
+            print(f"{status} {result['test']}: {result['details']}")
+
+        return passed == total
+
+def main():
+    tester = ConcurrentDebtPaymentTester()
+
+    success = tester.login_admin()
+    if success and not tester.find_open_debt():
+        success = False
+    if success and not tester.test_concurrent_payments():
+        success = False
+
+    final_success = tester.generate_final_report()
+    return success and final_success
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
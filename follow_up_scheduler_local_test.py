@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+اختبار محلي لجدولة تذكيرات مهام المتابعة
+Local-only test harness for backend/services/follow_up_scheduler.py
+
+Runs against a LOCAL MongoDB (MONGO_URL, default mongodb://localhost:27017)
+in a scratch database that is dropped afterwards - never against the shared
+preview backend. Checks that:
+  1. several scheduler workers running at once send every due reminder exactly once,
+  2. future, completed and already-sent tasks are not notified,
+  3. a reminder claimed by a worker that died is sent after its lease ends,
+  4. failed sends are retried with backoff and marked failed after the last attempt.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from services.notification_service import NotificationService
+from services.follow_up_scheduler import (
+    FollowUpScheduler, claim_due_reminder, ensure_follow_up_queue_indexes, reminder_fields,
+    FOLLOW_UP_LEASE, FOLLOW_UP_MAX_ATTEMPTS
+)
+
+# Configuration
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+SCRATCH_DB = "follow_up_scheduler_local_test"
+
+DUE_TASKS = 500
+WORKERS = 4
+
+
+class FailingNotificationService(NotificationService):
+    """خدمة إشعارات تفشل دائماً (لاختبار إعادة المحاولة)"""
+
+    async def trigger_follow_up_reminder(self, task, client_name):
+        return None
+
+
+class FollowUpSchedulerTester:
+    def __init__(self, db):
+        self.db = db
+        self.test_results = []
+        self.now = datetime.utcnow()
+
+    def log_test(self, test_name, success, response_time, details):
+        """تسجيل نتيجة الاختبار"""
+        self.test_results.append({
+            "test": test_name,
+            "success": success,
+            "response_time": response_time,
+            "details": details,
+            "timestamp": datetime.now().isoformat()
+        })
+
+        status = "✅ SUCCESS" if success else "❌ FAILED"
+        print(f"{status} | {test_name} | {response_time:.2f}ms | {details}")
+
+    def task(self, task_id, remind_at, status="pending", reminder_status=None):
+        document = {
+            "id": task_id, "client_id": "clinic-1", "assigned_to": f"rep-{task_id}", "created_by": "admin",
+            "title": f"متابعة {task_id}", "priority": "high", "status": status, "due_date": remind_at,
+            **reminder_fields(None, remind_at),
+        }
+        if reminder_status:
+            document["reminder_status"] = reminder_status
+        return document
+
+    async def notifications_for(self, task_ids):
+        counts = {}
+        async for notification in self.db.notifications.find({"metadata.task_id": {"$in": task_ids}}):
+            task_id = notification["metadata"]["task_id"]
+            counts[task_id] = counts.get(task_id, 0) + 1
+        return counts
+
+    async def drain(self, scheduler, now):
+        while (await scheduler.run_once(now))["claimed"]:
+            pass
+
+    async def test_concurrent_workers(self):
+        """1+2) عدة عمال: كل تذكير مستحق مرة واحدة فقط، ولا شيء غيره"""
+        print("\n⏰ Step 1: Concurrent workers")
+        print("=" * 50)
+
+        due = [self.task(f"due-{i}", self.now - timedelta(minutes=i % 90)) for i in range(DUE_TASKS)]
+        future = [self.task(f"future-{i}", self.now + timedelta(hours=1 + i)) for i in range(50)]
+        completed = [self.task(f"done-{i}", self.now - timedelta(minutes=5), status="completed") for i in range(20)]
+        sent = [self.task(f"sent-{i}", self.now - timedelta(days=1), reminder_status="sent") for i in range(20)]
+        await self.db.follow_up_tasks.insert_many(due + future + completed + sent)
+        await self.db.clinics.insert_one({"id": "clinic-1", "name": "عيادة الاختبار"})
+
+        schedulers = [FollowUpScheduler(self.db, worker_id=f"worker-{i}", batch_size=25) for i in range(WORKERS)]
+        start_time = time.time()
+        await asyncio.gather(*(self.drain(scheduler, self.now) for scheduler in schedulers))
+        response_time = (time.time() - start_time) * 1000
+
+        due_counts = await self.notifications_for([task["id"] for task in due])
+        duplicates = sum(1 for count in due_counts.values() if count > 1)
+        missing = DUE_TASKS - len(due_counts)
+        self.log_test("Due reminders sent exactly once", duplicates == 0 and missing == 0, response_time,
+                      f"{len(due_counts)}/{DUE_TASKS} notified, {duplicates} duplicated, {WORKERS} workers")
+
+        others = await self.notifications_for([task["id"] for task in future + completed + sent])
+        cancelled = await self.db.follow_up_tasks.count_documents(
+            {"id": {"$in": [task["id"] for task in completed]}, "reminder_status": "cancelled"}
+        )
+        self.log_test("Future/completed/sent tasks not notified", not others and cancelled == len(completed), 0,
+                      f"{sum(others.values())} unexpected notifications, {cancelled} completed tasks cancelled")
+
+    async def test_lease_expiry(self):
+        """3) عامل توقف بعد الحجز: التذكير يُرسل بعد انتهاء مدة الحجز"""
+        print("\n🔒 Step 2: Lease expiry")
+        print("=" * 50)
+
+        await self.db.follow_up_tasks.insert_one(self.task("crashed", self.now - timedelta(minutes=1)))
+        claimed = await claim_due_reminder(self.db, "dead-worker", self.now)
+
+        scheduler = FollowUpScheduler(self.db, worker_id="survivor")
+        during_lease = await scheduler.run_once(self.now + FOLLOW_UP_LEASE / 2)
+        start_time = time.time()
+        after_lease = await scheduler.run_once(self.now + FOLLOW_UP_LEASE + timedelta(seconds=1))
+        response_time = (time.time() - start_time) * 1000
+
+        counts = await self.notifications_for(["crashed"])
+        success = (claimed is not None and claimed["id"] == "crashed"
+                   and during_lease["claimed"] == 0 and after_lease["sent"] == 1 and counts.get("crashed") == 1)
+        self.log_test("Reminder re-sent after lease expiry", success, response_time,
+                      f"during lease {during_lease['claimed']} claimed, after lease {after_lease}")
+
+    async def test_retry_and_failure(self):
+        """4) فشل الإرسال: إعادة محاولة مع تأخير ثم failed"""
+        print("\n🔁 Step 3: Retry and failure")
+        print("=" * 50)
+
+        await self.db.follow_up_tasks.insert_one(self.task("flaky", self.now - timedelta(minutes=1)))
+        scheduler = FollowUpScheduler(self.db, notification_service=FailingNotificationService(self.db), worker_id="flaky")
+
+        start_time = time.time()
+        outcomes = []
+        for _ in range(FOLLOW_UP_MAX_ATTEMPTS):
+            task = await self.db.follow_up_tasks.find_one({"id": "flaky"})
+            counts = await scheduler.run_once(task["remind_at"] + timedelta(seconds=1))
+            outcomes.append(next(name for name in ("retried", "failed") if counts[name]))
+        response_time = (time.time() - start_time) * 1000
+
+        task = await self.db.follow_up_tasks.find_one({"id": "flaky"})
+        expected = ["retried"] * (FOLLOW_UP_MAX_ATTEMPTS - 1) + ["failed"]
+        success = outcomes == expected and task["reminder_status"] == "failed" and "lease_owner" not in task
+        self.log_test("Failed sends retried then marked failed", success, response_time,
+                      f"outcomes {outcomes}, final status {task['reminder_status']}")
+
+    async def run_all_tests(self):
+        print("🚀 Follow-up reminder scheduler - local test harness")
+        await ensure_follow_up_queue_indexes(self.db)
+        await self.test_concurrent_workers()
+        await self.test_lease_expiry()
+        await self.test_retry_and_failure()
+
+        passed = sum(1 for result in self.test_results if result["success"])
+        print("\n" + "=" * 50)
+        print(f"📊 {passed}/{len(self.test_results)} tests passed")
+        return passed == len(self.test_results)
+
+
+async def main():
+    if urlparse(MONGO_URL).hostname not in ("localhost", "127.0.0.1", "::1"):
+        sys.exit(f"❌ This harness only runs against a local MongoDB, got {MONGO_URL}")
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    await client.drop_database(SCRATCH_DB)
+    try:
+        tester = FollowUpSchedulerTester(client[SCRATCH_DB])
+        success = await tester.run_all_tests()
+    finally:
+        await client.drop_database(SCRATCH_DB)
+        client.close()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
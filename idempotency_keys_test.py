@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+اختبار مفاتيح عدم التكرار لدفعات الديون
+Idempotency-Key test for POST /api/debts/{debt_id}/payments
+
+Simulates a rep on a flaky connection: the same payment is retried many times,
+partly in parallel, with one Idempotency-Key. Exactly one ledger entry may be
+written; parallel retries get the stored response or 409 (still processing),
+later retries get the identical response with ``Idempotent-Replayed: true``,
+and reusing the key for a different amount is rejected with 422.
+"""
+
+import requests
+import time
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuration
+BACKEND_URL = "https://medmanage-pro-1.preview.emergentagent.com/api"
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "admin123"
+
+PARALLEL_RETRIES = 10
+PAYMENT_AMOUNT = 1.0
+
+class IdempotencyKeyTester:
+    def __init__(self):
+        self.session = requests.Session()
+        self.jwt_token = None
+        self.test_results = []
+        self.start_time = time.time()
+        self.debt = None
+
+    def log_test(self, test_name, success, response_time, details):
+        """تسجيل نتيجة الاختبار"""
+        self.test_results.append({
+            "test": test_name,
+            "success": success,
+            "response_time": response_time,
+            "details": details,
+            "timestamp": datetime.now().isoformat()
+        })
+
+        status = "✅ SUCCESS" if success else "❌ FAILED"
+        print(f"{status} | {test_name} | {response_time:.2f}ms | {details}")
+
+    def login_admin(self):
+        """1) تسجيل دخول admin/admin123"""
+        print("\n🔐 Step 1: Admin Login")
+        print("=" * 50)
+
+        start_time = time.time()
+        try:
+            response = self.session.post(
+                f"{BACKEND_URL}/auth/login",
+                json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD},
+                timeout=10
+            )
+            response_time = (time.time() - start_time) * 1000
+
+            if response.status_code == 200:
+                self.jwt_token = response.json().get("access_token")
+                if self.jwt_token:
+                    self.session.headers.update({"Authorization": f"Bearer {self.jwt_token}"})
+                    self.log_test("Admin Login", True, response_time, "Token received")
+                    return True
+            self.log_test("Admin Login", False, response_time, f"HTTP {response.status_code}: {response.text}")
+            return False
+        except Exception as e:
+            self.log_test("Admin Login", False, (time.time() - start_time) * 1000, f"Exception: {str(e)}")
+            return False
+
+    def find_open_debt(self):
+        """2) اختيار دين له رصيد متبقٍ"""
+        print("\n📋 Step 2: Find a Debt With Remaining Balance")
+        print("=" * 50)
+
+        start_time = time.time()
+        try:
+            response = self.session.get(f"{BACKEND_URL}/debts", params={"limit": 100}, timeout=15)
+            response_time = (time.time() - start_time) * 1000
+
+            if response.status_code != 200:
+                self.log_test("Find Open Debt", False, response_time, f"HTTP {response.status_code}")
+                return False
+
+            debts = [
+                debt for debt in response.json().get("debts", [])
+                if isinstance(debt.get("remaining_amount"), (int, float)) and debt["remaining_amount"] >= 2 * PAYMENT_AMOUNT
+            ]
+            if not debts:
+                self.log_test("Find Open Debt", False, response_time, "No debt with a remaining balance")
+                return False
+
+            self.debt = debts[0]
+            self.log_test(
+                "Find Open Debt", True, response_time,
+                f"{self.debt.get('debt_number')} remaining {self.debt['remaining_amount']}"
+            )
+            return True
+        except Exception as e:
+            self.log_test("Find Open Debt", False, (time.time() - start_time) * 1000, f"Exception: {str(e)}")
+            return False
+
+    def _ledger_count(self):
+        response = self.session.get(f"{BACKEND_URL}/debts/{self.debt['id']}", timeout=15)
+        data = response.json()
+        return len(data.get("payments", [])), data.get("debt", {})
+
+    def _post_payment(self, key, amount=PAYMENT_AMOUNT):
+        return requests.post(
+            f"{BACKEND_URL}/debts/{self.debt['id']}/payments",
+            json={
+                "debt_id": self.debt["id"],
+                "amount": amount,
+                "payment_method": "cash",
+                "collected_by": "idempotency-test",
+                "notes": "idempotency key retry test"
+            },
+            headers={"Authorization": f"Bearer {self.jwt_token}", "Idempotency-Key": key},
+            timeout=30
+        )
+
+    def test_retried_payment(self):
+        """3) إعادة إرسال نفس الدفعة بنفس المفتاح"""
+        print(f"\n🔁 Step 3: One Payment Retried {PARALLEL_RETRIES + 1} Times With One Key")
+        print("=" * 50)
+
+        key = str(uuid.uuid4())
+        ledger_before, debt_before = self._ledger_count()
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=PARALLEL_RETRIES) as pool:
+            responses = list(pool.map(lambda _: self._post_payment(key), range(PARALLEL_RETRIES)))
+        response_time = (time.time() - start_time) * 1000
+
+        accepted = [response for response in responses if response.status_code == 200]
+        in_progress = sum(1 for response in responses if response.status_code == 409)
+        self.log_test(
+            "Parallel Retries - Single Execution",
+            len(accepted) + in_progress == PARALLEL_RETRIES and len({r.text for r in accepted}) == 1,
+            response_time,
+            f"200: {len(accepted)} (one distinct body expected), 409 in progress: {in_progress}"
+        )
+
+        start_time = time.time()
+        retry = self._post_payment(key)
+        self.log_test(
+            "Late Retry - Replayed Response",
+            retry.status_code == 200 and retry.headers.get("Idempotent-Replayed") == "true"
+            and (not accepted or retry.text == accepted[0].text),
+            (time.time() - start_time) * 1000,
+            f"HTTP {retry.status_code}, Idempotent-Replayed: {retry.headers.get('Idempotent-Replayed')}"
+        )
+
+        ledger_after, debt_after = self._ledger_count()
+        self.log_test(
+            "Ledger - One Entry",
+            ledger_after - ledger_before == 1
+            and abs(debt_before["remaining_amount"] - debt_after["remaining_amount"] - PAYMENT_AMOUNT) <= 0.01,
+            0,
+            f"ledger entries +{ledger_after - ledger_before}, remaining "
+            f"{debt_before.get('remaining_amount')} → {debt_after.get('remaining_amount')}"
+        )
+
+        start_time = time.time()
+        mismatch = self._post_payment(key, amount=2 * PAYMENT_AMOUNT)
+        self.log_test(
+            "Key Reuse - Different Request Rejected",
+            mismatch.status_code == 422,
+            (time.time() - start_time) * 1000,
+            f"HTTP {mismatch.status_code}"
+        )
+
+        return all(result["success"] for result in self.test_results[-4:])
+
+    def generate_final_report(self):
+        """التقرير النهائي"""
+        print("\n" + "=" * 70)
+        print("📊 IDEMPOTENCY KEY TEST REPORT")
+        print("=" * 70)
+
+        passed = sum(1 for result in self.test_results if result["success"])
+        total = len(self.test_results)
+        print(f"Tests passed: {passed}/{total} ({(passed / total * 100) if total else 0:.1f}%)")
+        print(f"Total time: {time.time() - self.start_time:.2f}s")
+
+        for result in self.test_results:
+            status = "✅" if result["success"] else "❌"
+            print(f"{status} {result['test']}: {result['details']}")
+
+        return passed == total
+
+def main():
+    tester = IdempotencyKeyTester()
+
+    success = tester.login_admin()
+    if success and not tester.find_open_debt():
+        success = False
+    if success and not tester.test_retried_payment():
+        success = False
+
+    final_success = tester.generate_final_report()
+    return success and final_success
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)